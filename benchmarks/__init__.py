@@ -0,0 +1,3 @@
+"""
+Offline benchmarking tools for LambdaTrip Lambda functions
+"""
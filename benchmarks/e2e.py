@@ -0,0 +1,263 @@
+"""
+Offline end-to-end benchmark for both Lambda handlers.
+
+Starts local stub servers for every upstream (Vision, Google geocode/weather,
+maps.co, RestCountries, Smart Traveller, S3, Bedrock), replays the sample
+events and any JSON-lines request logs through ``lambda_handler`` and writes
+latency percentiles, throughput and upstream call counts per stage to a JSON
+file that can be compared across commits.
+
+Usage:
+    python -m benchmarks.e2e --iterations 20 --output bench_results/e2e.json
+    python -m benchmarks.e2e --profiles benchmarks/scenarios/slow_countries.json
+    python -m benchmarks.e2e --compare bench_results/e2e.json --max-regression 0.2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from .harness import (
+    EVENTS_DIR,
+    FakeLambdaContext,
+    ensure_src_on_path,
+    load_events,
+    load_handlers,
+    response_status,
+    result_header,
+    summarize_latencies,
+    write_results,
+)
+from .stubs import StubUpstreams, load_profiles
+
+# Functions wrapped to report latency per pipeline stage: (module, attribute, stage)
+STAGES = {
+    "image_processor": [
+        ("image_app", "analyze_image_with_vision", "vision"),
+        ("image_app", "extract_info_from_landmark", "geocode"),
+        ("image_app", "get_weather", "weather"),
+        ("image_app", "get_country_info", "country_info"),
+    ],
+    "landmark_analyzer": [
+        ("landmark_app", "analyze_with_bedrock", "bedrock"),
+        ("landmark_app", "generate_recommendations", "recommendations"),
+    ],
+}
+
+
+class StageTimer:
+    """
+    Temporarily wrap handler module functions to record per-stage latency.
+    """
+
+    def __init__(self, modules: Dict[str, Any], stages: List[tuple]):
+        self.modules = modules
+        self.stages = stages
+        self.samples = {stage: [] for _, _, stage in stages}
+        self._originals = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        for module_name, attribute, stage in self.stages:
+            module = self.modules[module_name]
+            original = getattr(module, attribute)
+            self._originals.append((module, attribute, original))
+            setattr(module, attribute, self._wrap(original, stage))
+        return self
+
+    def __exit__(self, *exc):
+        for module, attribute, original in reversed(self._originals):
+            setattr(module, attribute, original)
+        self._originals = []
+
+    def _wrap(self, func, stage):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    self.samples[stage].append(elapsed)
+        return timed
+
+
+def run_phase(handler, events: List[Dict[str, Any]], iterations: int, concurrency: int,
+              timeout_ms: int) -> Dict[str, Any]:
+    """
+    Replay ``events`` ``iterations`` times through ``handler``.
+    """
+    work = [event for _ in range(iterations) for event in events]
+    latencies = []
+    status_codes = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def invoke(event):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            status = response_status(handler(json.loads(json.dumps(event)), FakeLambdaContext(timeout_ms)))
+        except Exception:
+            status = 599
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+            if status >= 500:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    if concurrency <= 1:
+        for event in work:
+            invoke(event)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(invoke, work))
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "requests": len(work),
+        "errors": errors,
+        "error_rate": round(errors / len(work), 4) if work else 0.0,
+        "status_codes": status_codes,
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(work) / wall, 3) if wall > 0 else None,
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    profiles = load_profiles(args.profiles, seed=args.seed)
+    stubs = StubUpstreams(profiles).start()
+    try:
+        stubs.install()
+        if args.skip_s3:
+            os.environ["ENVIRONMENT"] = "local"
+        else:
+            os.environ["ENVIRONMENT"] = "benchmark"
+        image_app, landmark_app = load_handlers()
+        stubs.install_handlers(image_app, landmark_app)
+        modules = {"image_app": image_app, "landmark_app": landmark_app}
+        handlers = {
+            "image_processor": image_app.lambda_handler,
+            "landmark_analyzer": landmark_app.lambda_handler,
+        }
+
+        event_globs = args.events or [os.path.join(EVENTS_DIR, "*.json")]
+        events = load_events(event_globs, args.requests or [])
+        by_route = {}
+        for route, event in events:
+            by_route.setdefault(route, []).append(event)
+
+        results = result_header("e2e", {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "timeout_ms": args.timeout_ms,
+            "events": event_globs,
+            "requests": args.requests or [],
+            "profiles": {name: stubs[name].profile.to_dict() for name in stubs.upstreams},
+        })
+        results["phases"] = {}
+
+        for route in ("image_processor", "landmark_analyzer"):
+            route_events = by_route.get(route)
+            if not route_events:
+                continue
+            if args.warmup:
+                run_phase(handlers[route], route_events, args.warmup, 1, args.timeout_ms)
+            stubs.reset_stats()
+            with StageTimer(modules, STAGES[route]) as timer:
+                phase = run_phase(handlers[route], route_events, args.iterations, args.concurrency, args.timeout_ms)
+            phase["stages"] = {stage: summarize_latencies(samples) for stage, samples in timer.samples.items()}
+            phase["upstream_calls"] = {}
+            for name, stats in stubs.stats().items():
+                if stats["calls"]:
+                    phase["upstream_calls"][name] = {
+                        "calls": stats["calls"],
+                        "failures": stats["failures"],
+                        "calls_per_request": round(stats["calls"] / phase["requests"], 3),
+                        "server_latency_ms": summarize_latencies(stats["latencies_ms"]),
+                    }
+            results["phases"][route] = phase
+        return results
+    finally:
+        stubs.stop()
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Return human-readable regressions of tail latency beyond ``max_regression``.
+    """
+    regressions = []
+    for route, phase in current.get("phases", {}).items():
+        base = baseline.get("phases", {}).get(route)
+        if not base:
+            continue
+        for key in ("p50", "p95", "p99"):
+            now, before = phase["latency_ms"].get(key), base["latency_ms"].get(key)
+            if now is None or not before:
+                continue
+            change = (now - before) / before
+            print(f"  {route} {key}: {before:.1f}ms -> {now:.1f}ms ({change:+.1%})")
+            if change > max_regression:
+                regressions.append(f"{route} {key} regressed {change:+.1%}")
+    return regressions
+
+
+def print_summary(results: Dict[str, Any]) -> None:
+    print(f"LambdaTrip e2e benchmark @ {results.get('commit')}")
+    for route, phase in results["phases"].items():
+        latency = phase["latency_ms"]
+        print(f"\n{route}: {phase['requests']} requests, {phase['throughput_rps']} req/s, "
+              f"errors {phase['errors']}")
+        print(f"  latency p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+        for stage, stats in phase["stages"].items():
+            if stats["count"]:
+                print(f"  stage {stage:<16} p50={stats['p50']}ms p99={stats['p99']}ms calls={stats['count']}")
+        for name, stats in phase["upstream_calls"].items():
+            print(f"  upstream {name:<16} calls={stats['calls']} failures={stats['failures']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for LambdaTrip handlers")
+    parser.add_argument("--events", action="append", help="Glob of sample event files (default: events/*.json)")
+    parser.add_argument("--requests", action="append", help="JSON-lines request log to replay")
+    parser.add_argument("--profiles", help="JSON file with per-upstream latency/failure profiles")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--timeout-ms", type=int, default=60000, help="Simulated Lambda timeout")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--skip-s3", action="store_true", help="Run with ENVIRONMENT=local (no S3 writes)")
+    parser.add_argument("--output", default="bench_results/e2e.json")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    ensure_src_on_path()
+    results = run_benchmark(args)
+    print_summary(results)
+    write_results(args.output, results)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nComparison against {args.compare} ({baseline.get('commit')}):")
+        regressions = compare_results(results, baseline, args.max_regression)
+        if regressions:
+            for regression in regressions:
+                print(f"  REGRESSION: {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Realistic inputs for the hot-path microbenchmarks.
+
+Shapes mirror what the handlers see in production: Vision label annotations,
+the analysis_data handed from image_processor to landmark_analyzer, and
+Bedrock completions ranging from clean JSON to large or malformed output.
+"""
+
+import json
+
+from .stubs import DEFAULT_BEDROCK_ANALYSIS
+
+ANALYSIS_DATA = {
+    "landmark": {
+        "name": "Eiffel Tower",
+        "description": "Eiffel Tower",
+        "confidence": 0.93,
+        "location": {"lat": 48.8584, "lng": 2.2945, "city": "Paris", "country": "France", "country_code": "FR"},
+    },
+    "weather": {
+        "location": {"city": "Paris", "country": "France", "coordinates": {"lat": 48.8584, "lng": 2.2945}},
+        "temperature": {"current": 18.4, "feels_like": 17.2, "min": None, "max": None},
+        "conditions": "Partly cloudy",
+        "humidity": 65,
+        "wind_speed": 11,
+        "timestamp": 1718000000.0,
+        "condition": "PARTLY_CLOUDY",
+        "condition_text": "Partly cloudy",
+        "precipitation_chance": 10,
+        "is_daytime": True,
+        "uv_index": 3,
+    },
+    "country_info": {
+        "name": {"common": "France", "official": "French Republic"},
+        "capital": ["Paris"],
+        "region": "Europe",
+        "subregion": "Western Europe",
+        "population": 67391582,
+        "currencies": [{"name": "Euro", "symbol": "€"}],
+        "languages": {"fra": "French"},
+        "flags": {"png": "https://flagcdn.com/w320/fr.png", "svg": "https://flagcdn.com/fr.svg"},
+        "timezones": ["UTC-10:00", "UTC-09:30", "UTC-09:00", "UTC-08:00", "UTC-04:00", "UTC-03:00",
+                      "UTC+01:00", "UTC+02:00", "UTC+03:00", "UTC+04:00", "UTC+05:00", "UTC+10:00",
+                      "UTC+11:00", "UTC+12:00"],
+        "area": 551695,
+        "borders": ["AND", "BEL", "DEU", "ITA", "LUX", "MCO", "ESP", "CHE"],
+    },
+    "image_url": "https://upload.wikimedia.org/wikipedia/commons/thumb/8/85/Tour_Eiffel_Wikimedia_Commons_%28cropped%29.jpg/1200px-Tour_Eiffel_Wikimedia_Commons_%28cropped%29.jpg",
+}
+
+TRAVEL_ANALYSIS = DEFAULT_BEDROCK_ANALYSIS
+
+BEDROCK_CLEAN = json.dumps(DEFAULT_BEDROCK_ANALYSIS, indent=2)
+
+BEDROCK_FENCED = "```json\n" + BEDROCK_CLEAN + "\n```"
+
+# Trailing commas and smart quotes, which parse_bedrock_response repairs
+BEDROCK_REPAIRABLE = (
+    "Here is the analysis:\n"
+    + BEDROCK_CLEAN.replace('"best_visit_time"', '“best_visit_time”').replace("]", ",]")
+)
+
+# Truncated mid-object (max_tokens reached): falls through to the text summary
+BEDROCK_TRUNCATED = BEDROCK_CLEAN[: len(BEDROCK_CLEAN) // 2]
+
+# Prose with no JSON at all
+BEDROCK_PROSE = (
+    "The Eiffel Tower is one of the most recognisable structures in the world. "
+    "Visitors should plan ahead, buy tickets online and expect queues in summer. " * 20
+)
+
+# A long but valid completion close to the 3000 token limit
+BEDROCK_LARGE = json.dumps(dict(
+    DEFAULT_BEDROCK_ANALYSIS,
+    insights=[f"Insight {i}: " + "detail " * 30 for i in range(40)],
+    travel_tips=[f"Tip {i}: " + "advice " * 30 for i in range(40)],
+), indent=2)
+
+BEDROCK_OUTPUTS = {
+    "clean": BEDROCK_CLEAN,
+    "fenced": BEDROCK_FENCED,
+    "repairable": BEDROCK_REPAIRABLE,
+    "truncated": BEDROCK_TRUNCATED,
+    "prose": BEDROCK_PROSE,
+    "large": BEDROCK_LARGE,
+}
+
+VISION_LABELS_MATCH_LATE = [
+    {"description": "Sky", "score": 0.98},
+    {"description": "Cloud", "score": 0.96},
+    {"description": "Daytime", "score": 0.93},
+    {"description": "Blue", "score": 0.9},
+    {"description": "Tree", "score": 0.88},
+    {"description": "Plant", "score": 0.86},
+    {"description": "Urban design", "score": 0.84},
+    {"description": "Metropolis", "score": 0.82},
+    {"description": "Spire", "score": 0.8},
+    {"description": "Tower", "score": 0.78},
+]
+
+VISION_LABELS_NO_MATCH = [
+    {"description": "Cat", "score": 0.98},
+    {"description": "Whiskers", "score": 0.96},
+    {"description": "Carnivore", "score": 0.93},
+    {"description": "Felidae", "score": 0.9},
+    {"description": "Small to medium-sized cats", "score": 0.88},
+    {"description": "Snout", "score": 0.86},
+    {"description": "Fur", "score": 0.84},
+    {"description": "Paw", "score": 0.82},
+    {"description": "Tail", "score": 0.8},
+    {"description": "Eye", "score": 0.78},
+]
+
+COUNTRY_NAMES = {
+    "exact_early": "Australia",
+    "exact_late": "Zimbabwe",
+    "code": "FR",
+    "unknown": "Atlantis",
+}
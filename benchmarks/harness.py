@@ -0,0 +1,162 @@
+"""
+Shared helpers for the LambdaTrip benchmark and load-test tools
+"""
+
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+EVENTS_DIR = os.path.join(REPO_ROOT, "events")
+
+ROUTES = {
+    "/analyze-image": "image_processor",
+    "/analyze-landmark": "landmark_analyzer",
+}
+
+
+def ensure_src_on_path() -> None:
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+
+
+class FakeLambdaContext:
+    """
+    Minimal stand-in for the Lambda context object.
+    """
+
+    def __init__(self, timeout_ms: int = 60000, function_name: str = "benchmark"):
+        self.function_name = function_name
+        self.aws_request_id = f"bench-{time.time_ns()}"
+        self._deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+
+def load_handlers():
+    """
+    Import both handler modules from ``src/``. Call after the environment is set up.
+    """
+    ensure_src_on_path()
+    import image_processor.app as image_app
+    import landmark_analyzer.app as landmark_app
+    return image_app, landmark_app
+
+
+def route_for(event: Dict[str, Any]) -> Optional[str]:
+    """
+    Work out which handler an event belongs to.
+    """
+    path = event.get("path")
+    if path:
+        return ROUTES.get(path)
+    body = event.get("body", event)
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(body, dict):
+        return None
+    if "image_url" in body:
+        return "image_processor"
+    if "analysis_data" in body or "s3_key" in body:
+        return "landmark_analyzer"
+    return None
+
+
+def load_events(event_globs: Iterable[str], request_logs: Iterable[str] = ()) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Load sample events and JSON-lines request logs as ``(route, event)`` pairs.
+
+    Request log lines may be full API Gateway events or bare request bodies.
+    Events for endpoints without a handler are dropped.
+    """
+    events = []
+    for pattern in event_globs:
+        for path in sorted(glob.glob(pattern)):
+            with open(path) as f:
+                event = json.load(f)
+            route = route_for(event)
+            if route:
+                events.append((route, event))
+
+    for path in request_logs:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                event = record if "body" in record or "path" in record else {"body": record}
+                route = route_for(event)
+                if route:
+                    events.append((route, event))
+    return events
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize_latencies(values_ms: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values_ms)
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def response_status(response: Any) -> int:
+    if isinstance(response, dict):
+        return int(response.get("statusCode", 200))
+    return 200
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def result_header(tool: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tool": tool,
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "config": config,
+    }
+
+
+def write_results(path: str, results: Dict[str, Any]) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
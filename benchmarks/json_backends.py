@@ -0,0 +1,117 @@
+"""
+Per-request JSON cost: the stdlib calls the handlers used to make versus
+``shared.json_codec`` with whichever backend is installed.
+
+One image request plus the landmark request that follows it parses two
+event bodies and a Bedrock response envelope, and serializes two S3
+artifacts, two results index entries and two response bodies. This times
+that work both ways and reports the CPU saved per request pair.
+
+Usage:
+    python -m benchmarks.json_backends
+    python -m benchmarks.json_backends --output bench_results/json.json
+    JSON_BACKEND=stdlib python -m benchmarks.json_backends   # codec without orjson
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import fixtures
+from .harness import ensure_src_on_path, result_header, write_results
+from .micro import measure
+
+
+def request_documents() -> Dict[str, Any]:
+    analysis_data = fixtures.ANALYSIS_DATA
+    final_result = {
+        "landmark": analysis_data["landmark"],
+        "weather": analysis_data["weather"],
+        "country_info": analysis_data["country_info"],
+        "analysis": fixtures.TRAVEL_ANALYSIS,
+        "image_url": analysis_data["image_url"],
+        "timestamp": "2024-01-01T00:00:00",
+    }
+    return {
+        "image_event": json.dumps({"image_url": analysis_data["image_url"]}),
+        "landmark_event": json.dumps({"analysis_data": analysis_data}),
+        "bedrock_envelope": json.dumps({
+            "content": [{"type": "text", "text": fixtures.BEDROCK_CLEAN}],
+            "usage": {"input_tokens": 850, "output_tokens": 420},
+        }).encode("utf-8"),
+        "analysis_data": analysis_data,
+        "final_result": final_result,
+        "image_body": {"landmark_detected": analysis_data["landmark"]["name"], "analysis_data": analysis_data,
+                       "s3_key": "landmark_analysis/20240101_000000_analysis.json", "degraded": [],
+                       "timestamp": "2024-01-01T00:00:00"},
+        "landmark_body": dict(final_result, s3_key="landmark_analysis/20240101_000000_final.json", degraded=[]),
+    }
+
+
+def steps(loads: Callable, dumps: Callable, dumps_s3: Callable, docs: Dict[str, Any]) -> List[Tuple[str, Callable]]:
+    return [
+        ("parse_image_event", lambda: loads(docs["image_event"])),
+        ("s3_analysis_data", lambda: dumps_s3(docs["analysis_data"])),
+        ("index_analysis_data", lambda: dumps(docs["analysis_data"])),
+        ("image_response", lambda: dumps(docs["image_body"])),
+        ("parse_landmark_event", lambda: loads(docs["landmark_event"])),
+        ("parse_bedrock_envelope", lambda: loads(docs["bedrock_envelope"])),
+        ("s3_final_result", lambda: dumps_s3(docs["final_result"])),
+        ("index_final_result", lambda: dumps(docs["final_result"])),
+        ("landmark_response", lambda: dumps(docs["landmark_body"])),
+    ]
+
+
+def run(min_time: float = 0.05, repeat: int = 5) -> Dict[str, Any]:
+    ensure_src_on_path()
+    from shared import json_codec
+
+    docs = request_documents()
+    variants = {
+        "stdlib": steps(json.loads, lambda obj: json.dumps(obj, separators=(",", ":")),
+                        lambda obj: json.dumps(obj, indent=2).encode("utf-8"), docs),
+        f"json_codec[{json_codec.BACKEND}]": steps(json_codec.loads, json_codec.dumps,
+                                                   lambda obj: json_codec.dumps_bytes(obj, indent=2), docs),
+    }
+    results = {}
+    for variant, variant_steps in variants.items():
+        per_step = {name: measure(func, min_time=min_time, repeat=repeat)["ns_per_call"] for name, func in variant_steps}
+        results[variant] = {"steps_ns": per_step, "request_ns": round(sum(per_step.values()), 1)}
+    baseline, codec = (results[name]["request_ns"] for name in variants)
+    return {
+        "backend": json_codec.BACKEND,
+        "variants": results,
+        "saved_ns_per_request": round(baseline - codec, 1),
+        "saved_ratio": round(1 - codec / baseline, 3) if baseline else 0.0,
+    }
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    variants = list(results["variants"])
+    print(f"{'step':<26}" + "".join(f"{name:>24}" for name in variants))
+    for step in results["variants"][variants[0]]["steps_ns"]:
+        print(f"{step:<26}" + "".join(f"{results['variants'][name]['steps_ns'][step]:>21.0f} ns" for name in variants))
+    print(f"{'per request pair':<26}" + "".join(f"{results['variants'][name]['request_ns']:>21.0f} ns" for name in variants))
+    print(f"\nSaved per request pair: {results['saved_ns_per_request'] / 1000:.1f} us ({results['saved_ratio']:.0%})")
+    if results["backend"] == "stdlib":
+        print("orjson is not installed; install it to measure the native backend")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Per-request JSON cost by backend")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds per timing repeat")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Also write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    results = result_header("json_backends", {"min_time": args.min_time, "repeat": args.repeat})
+    results.update(run(args.min_time, args.repeat))
+    print_results(results)
+    if args.output:
+        write_results(args.output, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
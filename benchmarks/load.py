@@ -0,0 +1,342 @@
+"""
+Concurrent load-test driver for the Lambda handlers with upstream fault injection.
+
+Requests arrive open-loop (Poisson) at a configurable rate and run on a
+bounded worker pool, either in-process against ``lambda_handler``, over a
+local HTTP shim that wraps the handlers like API Gateway, or against the
+asyncio service (``src/service``) with Vision micro-batching. Upstream stub
+latency, hangs and error codes come from a scenario file and can change at
+set points in the run, so degradation and recovery show up in the
+time-bucketed report.
+
+Scenario file:
+    {
+      "duration_s": 60, "arrival_rate": 20, "concurrency": 16,
+      "mix": {"image_processor": 0.7, "landmark_analyzer": 0.3},
+      "upstreams": {"restcountries": {"latency": {"distribution": "fixed", "ms": 50}}},
+      "phases": [
+        {"at_s": 20, "upstreams": {"restcountries": {"hang_ms": 12000}}},
+        {"at_s": 40, "upstreams": {"restcountries": {"latency": {"distribution": "fixed", "ms": 50}}}}
+      ]
+    }
+
+Usage:
+    python -m benchmarks.load --scenario benchmarks/scenarios/restcountries_slow.json
+    python -m benchmarks.load --scenario ... --mode http --rate 50 --concurrency 32
+    python -m benchmarks.load --scenario ... --mode service --rate 200 --concurrency 64
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from .harness import (
+    EVENTS_DIR,
+    ROUTES,
+    FakeLambdaContext,
+    ensure_src_on_path,
+    load_events,
+    load_handlers,
+    response_status,
+    result_header,
+    summarize_latencies,
+    write_results,
+)
+from .stubs import UPSTREAMS, StubUpstreams, UpstreamProfile
+
+
+class HandlerShim:
+    """
+    Local HTTP front end that turns POSTs into API Gateway proxy events.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable], timeout_ms: int = 60000):
+        self.handlers = handlers
+        self.timeout_ms = timeout_ms
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "HandlerShim":
+        threading.Thread(target=self._server.serve_forever, name="handler-shim", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        shim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length).decode("utf-8") if length else ""
+                route = ROUTES.get(self.path)
+                if not route:
+                    self._reply(404, {"error": "not found"})
+                    return
+                event = {"httpMethod": "POST", "path": self.path, "headers": dict(self.headers), "body": body}
+                try:
+                    response = shim.handlers[route](event, FakeLambdaContext(shim.timeout_ms))
+                except Exception as e:
+                    self._reply(502, {"error": str(e)})
+                    return
+                payload = response.get("body", "")
+                self._reply(response_status(response), payload)
+
+            def _reply(self, status, payload):
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                data = data.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class LoadRecorder:
+    """
+    Thread-safe collection of request outcomes bucketed by arrival time.
+    """
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def record(self, route: str, scheduled_at: float, started_at: float, finished_at: float, status: int) -> None:
+        with self._lock:
+            self.samples.append((route, scheduled_at, started_at, finished_at, status))
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = list(self.samples)
+        buckets = {}
+        for route, scheduled, started, finished, status in samples:
+            bucket = buckets.setdefault(int(scheduled // self.interval_s), {"latencies": [], "errors": 0, "routes": {}})
+            bucket["latencies"].append((finished - scheduled) * 1000)
+            bucket["routes"][route] = bucket["routes"].get(route, 0) + 1
+            if status >= 500 or status == 0:
+                bucket["errors"] += 1
+
+        timeline = []
+        for index in sorted(buckets):
+            bucket = buckets[index]
+            count = len(bucket["latencies"])
+            timeline.append({
+                "t_start_s": round(index * self.interval_s, 3),
+                "requests": count,
+                "throughput_rps": round(count / self.interval_s, 3),
+                "error_rate": round(bucket["errors"] / count, 4) if count else 0.0,
+                "latency_ms": summarize_latencies(bucket["latencies"]),
+                "routes": bucket["routes"],
+            })
+
+        per_route = {}
+        for route in sorted({sample[0] for sample in samples}):
+            route_samples = [s for s in samples if s[0] == route]
+            statuses = {}
+            for sample in route_samples:
+                statuses[str(sample[4])] = statuses.get(str(sample[4]), 0) + 1
+            errors = sum(1 for s in route_samples if s[4] >= 500 or s[4] == 0)
+            per_route[route] = {
+                "requests": len(route_samples),
+                "error_rate": round(errors / len(route_samples), 4),
+                "status_codes": statuses,
+                "latency_ms": summarize_latencies([(s[3] - s[1]) * 1000 for s in route_samples]),
+                "queue_ms": summarize_latencies([(s[2] - s[1]) * 1000 for s in route_samples]),
+            }
+
+        span = max((s[3] for s in samples), default=0.0)
+        errors = sum(1 for s in samples if s[4] >= 500 or s[4] == 0)
+        return {
+            "overall": {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / span, 3) if span else None,
+                "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+                "latency_ms": summarize_latencies([(s[3] - s[1]) * 1000 for s in samples]),
+            },
+            "routes": per_route,
+            "timeline": timeline,
+        }
+
+
+def apply_upstreams(stubs: StubUpstreams, upstreams: Dict[str, Any], seed: Optional[int]) -> None:
+    """
+    Replace stub profiles; keys missing from a phase keep the scenario baseline.
+    """
+    for index, name in enumerate(UPSTREAMS):
+        if name in upstreams:
+            current = stubs[name].profile.to_dict()
+            current.update(upstreams[name])
+            stubs[name].profile = UpstreamProfile.from_dict(current, seed=None if seed is None else seed + index)
+
+
+def run_load(scenario: Dict[str, Any], mode: str = "inprocess", seed: Optional[int] = 1234,
+             interval_s: float = 5.0, timeout_ms: int = 60000) -> Dict[str, Any]:
+    duration_s = float(scenario.get("duration_s", 30))
+    rate = float(scenario.get("arrival_rate", 10))
+    concurrency = int(scenario.get("concurrency", 8))
+    mix = scenario.get("mix") or {"image_processor": 0.5, "landmark_analyzer": 0.5}
+    phases = sorted(scenario.get("phases", []), key=lambda phase: phase.get("at_s", 0))
+
+    stubs = StubUpstreams().start()
+    shim = None
+    service = None
+    try:
+        apply_upstreams(stubs, scenario.get("upstreams", {}), seed)
+        stubs.install()
+        os.environ.setdefault("ENVIRONMENT", "local")
+        image_app, landmark_app = load_handlers()
+        stubs.install_handlers(image_app, landmark_app)
+        handlers = {
+            "image_processor": image_app.lambda_handler,
+            "landmark_analyzer": landmark_app.lambda_handler,
+        }
+
+        events = {}
+        for route, event in load_events([os.path.join(EVENTS_DIR, "*.json")], scenario.get("requests", [])):
+            events.setdefault(route, []).append(event)
+        routes = [route for route in mix if events.get(route)]
+        weights = [mix[route] for route in routes]
+        paths = {route: path for path, route in ROUTES.items()}
+
+        if mode in ("http", "service"):
+            if mode == "service":
+                from service.app import BackgroundService
+                service = BackgroundService(host="127.0.0.1", port=0, workers=concurrency,
+                                            request_timeout_ms=timeout_ms).start()
+                base_url = service.url
+            else:
+                shim = HandlerShim(handlers, timeout_ms).start()
+                base_url = shim.url
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+            session.mount("http://", adapter)
+
+        recorder = LoadRecorder(interval_s)
+        rng = random.Random(seed)
+        start = time.monotonic()
+
+        def invoke(route: str, event: Dict[str, Any], scheduled: float) -> None:
+            started = time.monotonic() - start
+            try:
+                if mode in ("http", "service"):
+                    body = event.get("body", {})
+                    response = session.post(
+                        f"{base_url}{paths[route]}",
+                        data=body if isinstance(body, str) else json.dumps(body),
+                        timeout=timeout_ms / 1000.0,
+                    )
+                    status = response.status_code
+                else:
+                    status = response_status(handlers[route](json.loads(json.dumps(event)), FakeLambdaContext(timeout_ms)))
+            except Exception:
+                status = 0
+            recorder.record(route, scheduled, started, time.monotonic() - start, status)
+
+        phase_index = 0
+        next_arrival = 0.0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while next_arrival < duration_s:
+                while phase_index < len(phases) and phases[phase_index].get("at_s", 0) <= next_arrival:
+                    apply_upstreams(stubs, phases[phase_index].get("upstreams", {}), seed)
+                    phase_index += 1
+                delay = next_arrival - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                route = rng.choices(routes, weights=weights)[0]
+                event = rng.choice(events[route])
+                pool.submit(invoke, route, event, next_arrival)
+                next_arrival += rng.expovariate(rate) if rate > 0 else duration_s
+
+        report = recorder.report()
+        report["upstream_calls"] = {
+            name: {"calls": stats["calls"], "failures": stats["failures"]}
+            for name, stats in stubs.stats().items() if stats["calls"]
+        }
+        if service:
+            from shared.micro_batch import batcher_stats
+            report["batches"] = batcher_stats()
+        return report
+    finally:
+        if shim:
+            shim.stop()
+        if service:
+            service.stop()
+        stubs.stop()
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    overall = report["overall"]
+    print(f"overall: {overall['requests']} requests, {overall['throughput_rps']} req/s, "
+          f"error rate {overall['error_rate']:.1%}, p50={overall['latency_ms']['p50']}ms "
+          f"p99={overall['latency_ms']['p99']}ms")
+    print(f"\n{'t(s)':>6} {'req':>5} {'rps':>7} {'err':>6} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for bucket in report["timeline"]:
+        latency = bucket["latency_ms"]
+        print(f"{bucket['t_start_s']:>6.0f} {bucket['requests']:>5} {bucket['throughput_rps']:>7.1f} "
+              f"{bucket['error_rate']:>6.1%} {latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f}")
+    for name, stats in report["upstream_calls"].items():
+        print(f"  upstream {name:<16} calls={stats['calls']} failures={stats['failures']}")
+    for name, stats in report.get("batches", {}).items():
+        print(f"  batcher {name:<17} batches={stats['batches']} items={stats['items']} mean size={stats['mean_size']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test LambdaTrip handlers with upstream fault injection")
+    parser.add_argument("--scenario", help="Scenario JSON file")
+    parser.add_argument("--mode", choices=["inprocess", "http", "service"], default="inprocess")
+    parser.add_argument("--duration", type=float, help="Override scenario duration_s")
+    parser.add_argument("--rate", type=float, help="Override scenario arrival_rate (requests/s)")
+    parser.add_argument("--concurrency", type=int, help="Override scenario concurrency")
+    parser.add_argument("--interval", type=float, default=5.0, help="Report bucket width in seconds")
+    parser.add_argument("--timeout-ms", type=int, default=60000, help="Simulated Lambda timeout")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="bench_results/load.json")
+    args = parser.parse_args(argv)
+
+    scenario = {}
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = json.load(f)
+    if args.duration is not None:
+        scenario["duration_s"] = args.duration
+    if args.rate is not None:
+        scenario["arrival_rate"] = args.rate
+    if args.concurrency is not None:
+        scenario["concurrency"] = args.concurrency
+
+    ensure_src_on_path()
+    report = run_load(scenario, args.mode, args.seed, args.interval, args.timeout_ms)
+    results = result_header("load", {"scenario": scenario, "mode": args.mode, "interval_s": args.interval})
+    results.update(report)
+    print_report(report)
+    write_results(args.output, results)
+    print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Microbenchmarks with regression gates for the pure hot-path functions.
+
+Each case is timed with ``timeit`` (best of several repeats) and its peak
+allocation per call is measured with ``tracemalloc``. Timings are also
+normalised against a fixed calibration loop so a baseline recorded on one
+machine remains a useful gate on another.
+
+Usage:
+    python -m benchmarks.micro                       # compare with the stored baseline
+    python -m benchmarks.micro --update-baseline     # record a new baseline
+    python -m benchmarks.micro --filter parse_bedrock --threshold 0.3
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import fixtures
+from .harness import REPO_ROOT, ensure_src_on_path, result_header, write_results
+
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, "benchmarks", "baselines", "micro.json")
+
+
+def build_cases() -> List[Tuple[str, Callable[[], Any]]]:
+    """
+    Return ``(name, zero-argument callable)`` pairs for every benchmark case.
+    """
+    ensure_src_on_path()
+    import image_processor.app as image_app
+    import landmark_analyzer.app as landmark_app
+    from shared import api_helpers
+    from shared.models import AnalysisData
+
+    # The handlers parse the hand-off once and pass the records around
+    analysis_data = AnalysisData.from_wire(fixtures.ANALYSIS_DATA)
+    travel_analysis = landmark_app.as_analysis(fixtures.TRAVEL_ANALYSIS)
+    final_body = {
+        "landmark_name": analysis_data.landmark.name,
+        "analysis": fixtures.TRAVEL_ANALYSIS,
+        "recommendations": landmark_app.generate_recommendations(analysis_data, travel_analysis),
+        "s3_key": "landmark_analysis/20240101_000000_final.json",
+        "timestamp": "2024-01-01T00:00:00",
+    }
+    image_body = {
+        "landmark_detected": analysis_data.landmark.name,
+        "analysis_data": fixtures.ANALYSIS_DATA,
+        "s3_key": "landmark_analysis/20240101_000000_analysis.json",
+        "timestamp": "2024-01-01T00:00:00",
+    }
+
+    cases = []
+    for label, text in fixtures.BEDROCK_OUTPUTS.items():
+        cases.append((f"parse_bedrock_response[{label}]", lambda text=text: landmark_app.parse_bedrock_response(text)))
+    cases += [
+        ("generate_recommendations", lambda: landmark_app.generate_recommendations(analysis_data, travel_analysis)),
+        ("create_analysis_prompt", lambda: landmark_app.create_analysis_prompt(analysis_data)),
+        ("extract_location_from_labels[match_late]",
+         lambda: image_app.extract_location_from_labels(fixtures.VISION_LABELS_MATCH_LATE)),
+        ("extract_location_from_labels[no_match]",
+         lambda: image_app.extract_location_from_labels(fixtures.VISION_LABELS_NO_MATCH)),
+        ("format_weather_summary", lambda: api_helpers.format_weather_summary(analysis_data.weather)),
+        ("models.from_wire[analysis_data]", lambda: AnalysisData.from_wire(fixtures.ANALYSIS_DATA)),
+        ("models.to_dict[analysis_data]", lambda: analysis_data.to_dict()),
+        ("json_body[image_processor]", lambda: json.dumps(image_body)),
+        ("json_body[landmark_analyzer]", lambda: json.dumps(final_body)),
+        ("json_s3[analysis_data]", lambda: json.dumps(fixtures.ANALYSIS_DATA, indent=2)),
+    ]
+    for label, country in fixtures.COUNTRY_NAMES.items():
+        cases.append((f"map_country_to_smart_traveller_code[{label}]",
+                      lambda country=country: api_helpers.map_country_to_smart_traveller_code(country)))
+    return cases
+
+
+def _calibration_workload():
+    total = 0
+    table = {}
+    for i in range(2000):
+        total += i * i
+        table[i & 255] = total
+    return total
+
+
+def measure(func: Callable[[], Any], min_time: float = 0.05, repeat: int = 5) -> Dict[str, float]:
+    """
+    Time ``func`` and measure its peak allocation for one call.
+    """
+    timer = timeit.Timer(func)
+    # autorange doubles as a warm-up pass before the measured repeats
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2)) if min_time < 0.2 else number
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    func()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"ns_per_call": round(best * 1e9, 1), "peak_alloc_bytes": max(peak - before, 0)}
+
+
+def run(filter_text: Optional[str] = None, min_time: float = 0.05, repeat: int = 5) -> Dict[str, Any]:
+    calibration = measure(_calibration_workload, min_time=min_time, repeat=repeat)["ns_per_call"]
+    results = {}
+    for name, func in build_cases():
+        if filter_text and filter_text not in name:
+            continue
+        stats = measure(func, min_time=min_time, repeat=repeat)
+        stats["normalized"] = round(stats["ns_per_call"] / calibration, 6)
+        results[name] = stats
+    return {"calibration_ns": calibration, "cases": results}
+
+
+def check_regressions(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+                      alloc_threshold: float, confirm: int = 2, min_time: float = 0.05,
+                      repeat: int = 5) -> List[str]:
+    """
+    Compare normalised time and peak allocation per case against the baseline.
+
+    A case that looks slower is re-measured up to ``confirm`` times and only
+    fails when every attempt exceeds the threshold, which filters out noise
+    from shared CI runners.
+    """
+    failures = []
+    base_cases = baseline.get("cases", {})
+    cases = dict(build_cases()) if confirm else {}
+    for name, stats in current["cases"].items():
+        base = base_cases.get(name)
+        if not base:
+            continue
+        time_change = stats["normalized"] / base["normalized"] - 1 if base["normalized"] else 0.0
+        attempts = 0
+        while time_change > threshold and attempts < confirm and name in cases:
+            attempts += 1
+            calibration = measure(_calibration_workload, min_time=min_time, repeat=repeat)["ns_per_call"]
+            retry = measure(cases[name], min_time=min_time, repeat=repeat)["ns_per_call"] / calibration
+            time_change = min(time_change, retry / base["normalized"] - 1)
+        base_alloc = base.get("peak_alloc_bytes") or 0
+        alloc_change = (stats["peak_alloc_bytes"] - base_alloc) / base_alloc if base_alloc else 0.0
+        flag = ""
+        if time_change > threshold:
+            failures.append(f"{name}: time {time_change:+.1%} (threshold {threshold:.0%})")
+            flag = "  <-- SLOWER"
+        if alloc_change > alloc_threshold:
+            failures.append(f"{name}: peak allocation {alloc_change:+.1%} (threshold {alloc_threshold:.0%})")
+            flag += "  <-- MORE MEMORY"
+        print(f"  {name:<55} time {time_change:+7.1%}  alloc {alloc_change:+7.1%}{flag}")
+    return failures
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"calibration: {results['calibration_ns']:.0f} ns")
+    for name, stats in results["cases"].items():
+        print(f"  {name:<55} {stats['ns_per_call']:>12.1f} ns  {stats['peak_alloc_bytes']:>9} B peak")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks for LambdaTrip")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed normalised slowdown (0.25 = 25%%)")
+    parser.add_argument("--alloc-threshold", type=float, default=0.5, help="Allowed peak allocation growth")
+    parser.add_argument("--filter", help="Only run cases whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds per timing repeat")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--confirm", type=int, default=2, help="Re-measure a slow case this many times before failing")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    args = parser.parse_args(argv)
+
+    run_results = run(args.filter, args.min_time, args.repeat)
+    results = result_header("micro", {"threshold": args.threshold, "alloc_threshold": args.alloc_threshold})
+    results.update(run_results)
+    print_results(results)
+
+    if args.output:
+        write_results(args.output, results)
+
+    if args.update_baseline:
+        write_results(args.baseline, results)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print(f"\nAgainst baseline {baseline.get('commit')}:")
+    failures = check_regressions(results, baseline, args.threshold, args.alloc_threshold,
+                                 args.confirm, args.min_time, args.repeat)
+    if failures:
+        print("\nRegressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
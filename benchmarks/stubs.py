@@ -0,0 +1,546 @@
+"""
+Local stub servers for every upstream the LambdaTrip functions call.
+
+Each upstream runs on its own ThreadingHTTPServer bound to 127.0.0.1 with an
+ephemeral port, returns canned but realistic payloads, and can be configured
+with a latency distribution and a failure rate. Call counts and server-side
+latencies are recorded so benchmarks can report upstream usage per stage.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+UPSTREAMS = (
+    "vision",
+    "google_geocode",
+    "google_weather",
+    "maps_co",
+    "restcountries",
+    "smart_traveller",
+    "s3",
+    "bedrock",
+)
+
+# Vision image URIs containing these markers get no landmark / a per-image fetch error /
+# a transient per-image error
+NO_LANDMARK_MARKER = "no-landmark"
+UNREACHABLE_MARKER = "unreachable"
+VISION_BUSY_MARKER = "vision-busy"
+
+# Text the Vision stub "reads" from every OCR'd page, followed by the page number
+STUB_OCR_TEXT = "Stub OCR text for page"
+
+DEFAULT_LANDMARK = {
+    "name": "Eiffel Tower",
+    "mid": "/m/02j81",
+    "city": "Paris",
+    "country": "France",
+    "country_code": "FR",
+    "lat": 48.8584,
+    "lng": 2.2945,
+}
+
+DEFAULT_BEDROCK_ANALYSIS = {
+    "summary": "The Eiffel Tower is a wrought-iron lattice tower in Paris and a global icon of France.",
+    "insights": [
+        "Completed in 1889 for the World's Fair",
+        "Most visited paid monument in the world",
+        "Spring and early autumn offer mild weather",
+        "France uses the Euro and French is widely spoken",
+    ],
+    "travel_tips": [
+        "Book summit tickets online in advance",
+        "Visit at sunset for the light show",
+        "Watch for pickpockets in crowded areas",
+        "Greet staff with 'Bonjour' before asking questions",
+    ],
+    "best_visit_time": "April to June or September to October",
+    "safety_rating": "4 - Generally safe with petty theft in tourist areas",
+    "cultural_highlights": "Parisian cafe culture, art museums and architecture",
+    "travel_advisory": {
+        "level": "Exercise normal precautions",
+        "summary": "France is generally safe for travel",
+        "recommendations": ["Stay aware of your surroundings", "Keep valuables secure"],
+    },
+}
+
+
+class UpstreamProfile:
+    """
+    Latency distribution and failure behaviour for a single stub upstream.
+
+    Latency spec keys:
+        distribution: "fixed", "uniform", "normal" or "lognormal"
+        ms:           value for "fixed"
+        min_ms/max_ms: bounds for "uniform"
+        mean_ms/stddev_ms: parameters for "normal"
+        median_ms/sigma:   parameters for "lognormal"
+    """
+
+    def __init__(self, latency: Optional[Dict[str, Any]] = None, failure_rate: float = 0.0,
+                 failure_status: int = 503, retry_after: Optional[int] = None,
+                 hang_ms: Optional[float] = None, seed: Optional[int] = None):
+        self.latency = latency or {"distribution": "fixed", "ms": 0}
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.hang_ms = hang_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], seed: Optional[int] = None) -> "UpstreamProfile":
+        return cls(
+            latency=data.get("latency"),
+            failure_rate=float(data.get("failure_rate", 0.0)),
+            failure_status=int(data.get("failure_status", 503)),
+            retry_after=data.get("retry_after"),
+            hang_ms=data.get("hang_ms"),
+            seed=seed,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "failure_rate": self.failure_rate,
+            "failure_status": self.failure_status,
+            "retry_after": self.retry_after,
+            "hang_ms": self.hang_ms,
+        }
+
+    def sample_latency_ms(self) -> float:
+        spec = self.latency
+        kind = spec.get("distribution", "fixed")
+        with self._lock:
+            if kind == "uniform":
+                value = self._random.uniform(spec.get("min_ms", 0), spec.get("max_ms", 0))
+            elif kind == "normal":
+                value = self._random.gauss(spec.get("mean_ms", 0), spec.get("stddev_ms", 0))
+            elif kind == "lognormal":
+                median = max(spec.get("median_ms", 1), 1e-3)
+                value = median * self._random.lognormvariate(0, spec.get("sigma", 0.5))
+            else:
+                value = spec.get("ms", 0)
+        return max(float(value), 0.0)
+
+    def should_fail(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+
+class StubUpstream:
+    """
+    A single upstream stub: HTTP server, profile and call statistics.
+    """
+
+    def __init__(self, name: str, profile: Optional[UpstreamProfile] = None):
+        self.name = name
+        self.profile = profile or UpstreamProfile()
+        self.calls = 0
+        self.failures = 0
+        self.latencies_ms = []
+        self.objects = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubUpstream":
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"stub-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.failures = 0
+            self.latencies_ms = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "latencies_ms": list(self.latencies_ms),
+            }
+
+    def _record(self, latency_ms: float, failed: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if failed:
+                self.failures += 1
+            self.latencies_ms.append(latency_ms)
+
+
+def _make_handler(upstream: StubUpstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_HEAD(self):
+            self._dispatch("HEAD")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def _dispatch(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            profile = upstream.profile
+            delay_ms = profile.sample_latency_ms()
+            if profile.hang_ms:
+                delay_ms = max(delay_ms, profile.hang_ms)
+            if delay_ms:
+                time.sleep(delay_ms / 1000.0)
+
+            if profile.should_fail():
+                upstream._record(delay_ms, True)
+                headers = {}
+                if profile.retry_after is not None:
+                    headers["Retry-After"] = str(profile.retry_after)
+                self._send(profile.failure_status, {"error": f"stub {upstream.name} failure"}, headers)
+                return
+
+            status, payload, headers = _respond(upstream, method, self.path, body, self.headers)
+            upstream._record(delay_ms, status >= 500)
+            self._send(status, payload, headers)
+
+        def _send(self, status, payload, headers=None):
+            if isinstance(payload, (bytes, bytearray)):
+                data = bytes(payload)
+                content_type = "application/octet-stream"
+            else:
+                data = json.dumps(payload).encode("utf-8")
+                content_type = "application/json"
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(data)
+
+    return Handler
+
+
+def _respond(upstream: StubUpstream, method: str, path: str, body: bytes, request_headers=None):
+    """
+    Build the canned response for an upstream request.
+    """
+    parsed = urlparse(path)
+    query = parse_qs(parsed.query)
+    landmark = DEFAULT_LANDMARK
+    name = upstream.name
+
+    if name == "vision":
+        request = json.loads(body or b"{}")
+        responses = []
+        if parsed.path.endswith("files:annotate"):
+            for item in request.get("requests", [{}]):
+                pages = item.get("pages") or [1]
+                responses.append({
+                    "responses": [
+                        {"fullTextAnnotation": {"text": f"{STUB_OCR_TEXT} {page}"}, "context": {"pageNumber": page}}
+                        for page in pages
+                    ],
+                    "totalPages": len(pages),
+                })
+            return 200, {"responses": responses}, {}
+        for item in request.get("requests", [{}]):
+            features = {feature.get("type") for feature in item.get("features", [])}
+            if "DOCUMENT_TEXT_DETECTION" in features:
+                responses.append({"fullTextAnnotation": {"text": f"{STUB_OCR_TEXT} 1"}})
+                continue
+            image_uri = item.get("image", {}).get("source", {}).get("imageUri", "")
+            if NO_LANDMARK_MARKER in image_uri:
+                responses.append({"labelAnnotations": [{"description": "Cat", "score": 0.98}]})
+                continue
+            if UNREACHABLE_MARKER in image_uri:
+                responses.append({"error": {"code": 7, "message": "We can not access the URL currently."}})
+                continue
+            if VISION_BUSY_MARKER in image_uri:
+                responses.append({"error": {"code": 14, "message": "The service is currently unavailable."}})
+                continue
+            responses.append({
+                "landmarkAnnotations": [{
+                    "mid": landmark["mid"],
+                    "description": landmark["name"],
+                    "score": 0.93,
+                    "locations": [{"latLng": {"latitude": landmark["lat"], "longitude": landmark["lng"]}}],
+                }],
+                "labelAnnotations": [
+                    {"description": "Tower", "score": 0.97},
+                    {"description": "Landmark", "score": 0.95},
+                ],
+            })
+        return 200, {"responses": responses}, {}
+
+    if name == "google_geocode":
+        return 200, {
+            "status": "OK",
+            "results": [{
+                "formatted_address": f"{landmark['city']}, {landmark['country']}",
+                "address_components": [
+                    {"long_name": landmark["city"], "short_name": landmark["city"], "types": ["locality"]},
+                    {"long_name": landmark["country"], "short_name": landmark["country_code"], "types": ["country"]},
+                ],
+                "geometry": {"location": {"lat": landmark["lat"], "lng": landmark["lng"]}},
+            }],
+        }, {}
+
+    if name == "google_weather":
+        return 200, {
+            "temperature": {"degrees": 18.4, "unit": "CELSIUS"},
+            "feelsLikeTemperature": {"degrees": 17.2, "unit": "CELSIUS"},
+            "weatherCondition": {"type": "PARTLY_CLOUDY", "description": {"text": "Partly cloudy"}},
+            "relativeHumidity": 65,
+            "wind": {"speed": {"value": 11, "unit": "KILOMETERS_PER_HOUR"}},
+            "precipitation": {"probability": {"percent": 10}},
+            "isDaytime": True,
+            "uvIndex": 3,
+        }, {}
+
+    if name == "maps_co":
+        return 200, [{
+            "display_name": f"{landmark['name']}, Avenue Anatole France, {landmark['city']}, Ile-de-France, 75007, {landmark['country']}",
+            "lat": str(landmark["lat"]),
+            "lon": str(landmark["lng"]),
+            "address": {
+                "city": landmark["city"],
+                "country": landmark["country"],
+                "country_code": landmark["country_code"].lower(),
+            },
+        }], {}
+
+    if name == "restcountries":
+        country = unquote(parsed.path.rstrip("/").rsplit("/", 1)[-1]) or landmark["country"]
+        return 200, [{
+            "name": {"common": country, "official": f"Republic of {country}"},
+            "capital": [landmark["city"]],
+            "region": "Europe",
+            "subregion": "Western Europe",
+            "population": 67391582,
+            "currencies": {"EUR": {"name": "Euro", "symbol": "€"}},
+            "languages": {"fra": "French"},
+            "flags": {"png": "https://flagcdn.com/w320/fr.png", "svg": "https://flagcdn.com/fr.svg"},
+            "timezones": ["UTC+01:00"],
+            "area": 551695,
+            "borders": ["AND", "BEL", "DEU", "ITA", "LUX", "MCO", "ESP", "CHE"],
+        }], {}
+
+    if name == "smart_traveller":
+        code = (query.get("country") or [landmark["country_code"]])[0]
+        return 200, {
+            "country": code,
+            "level": "Exercise a high degree of caution",
+            "summary": "Exercise a high degree of caution due to the threat of terrorism.",
+            "details": "",
+            "last_updated": "2024-01-01",
+            "advice": ["Monitor the media", "Follow the advice of local authorities"],
+        }, {}
+
+    if name == "s3":
+        key = unquote(parsed.path)
+        if method == "GET" and "list-type" in query:
+            return 200, _list_objects(upstream, key.strip("/"), query), {}
+        if method == "PUT":
+            if (request_headers or {}).get("If-None-Match") == "*" and key in upstream.objects:
+                return 412, b"", {}
+            upstream.objects[key] = body
+            return 200, b"", {"ETag": '"stub"'}
+        if key in upstream.objects:
+            return 200, upstream.objects[key], {}
+        return 404, b"", {}
+
+    if name == "bedrock":
+        text = json.dumps(DEFAULT_BEDROCK_ANALYSIS)
+        return 200, {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 850, "output_tokens": 420},
+        }, {}
+
+    return 404, {"error": f"unknown stub upstream {name}"}, {}
+
+
+def _list_objects(upstream: StubUpstream, bucket: str, query: Dict[str, Any]) -> bytes:
+    """
+    ListObjectsV2 response over the stored objects of one bucket.
+    """
+    prefix = query.get("prefix", [""])[0]
+    after = query.get("continuation-token", query.get("start-after", [""]))[0]
+    max_keys = int(query.get("max-keys", ["1000"])[0])
+    root = f"/{bucket}/"
+    keys = sorted(path[len(root):] for path in upstream.objects if path.startswith(root))
+    keys = [key for key in keys if key.startswith(prefix) and key > after]
+    page, truncated = keys[:max_keys], len(keys) > max_keys
+    contents = "".join(
+        f"<Contents><Key>{escape(key)}</Key><Size>{len(upstream.objects[root + key])}</Size>"
+        f"<LastModified>2025-01-01T00:00:00.000Z</LastModified><ETag>&quot;stub&quot;</ETag></Contents>"
+        for key in page
+    )
+    token = f"<NextContinuationToken>{escape(page[-1])}</NextContinuationToken>" if truncated else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+        f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+        f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{str(truncated).lower()}</IsTruncated>{contents}{token}"
+        "</ListBucketResult>"
+    ).encode("utf-8")
+
+
+class StubUpstreams:
+    """
+    Start and stop the full set of stub upstreams, and point the process at them.
+
+    Module-level URL constants in the handlers are patched in place, and the
+    boto3 S3/Bedrock endpoints are redirected through the service-specific
+    ``AWS_ENDPOINT_URL_*`` environment variables.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, UpstreamProfile]] = None):
+        profiles = profiles or {}
+        self.upstreams = {name: StubUpstream(name, profiles.get(name)) for name in UPSTREAMS}
+
+    def __getitem__(self, name: str) -> StubUpstream:
+        return self.upstreams[name]
+
+    def start(self) -> "StubUpstreams":
+        for upstream in self.upstreams.values():
+            upstream.start()
+        return self
+
+    def stop(self) -> None:
+        for upstream in self.upstreams.values():
+            upstream.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self) -> None:
+        for upstream in self.upstreams.values():
+            upstream.reset_stats()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: upstream.stats() for name, upstream in self.upstreams.items()}
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Environment variables to set before the handler modules are imported.
+        """
+        return {
+            "GOOGLE_VISION_API_KEY": "stub-key",
+            "GOOGLE_WEATHER_API_KEY": "stub-key",
+            "GOOGLE_GEOCODING_API_KEY": "stub-key",
+            "GEOCODE_API_KEY": "stub-key",
+            "S3_BUCKET": "stub-bucket",
+            "AWS_ACCESS_KEY_ID": "stub",
+            "AWS_SECRET_ACCESS_KEY": "stub",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "AWS_ENDPOINT_URL_S3": self["s3"].url,
+            "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": self["bedrock"].url,
+            # The stubs (image host included) listen on loopback
+            "IMAGE_FETCH_ALLOW_PRIVATE": "true",
+        }
+
+    def install(self) -> None:
+        """
+        Point the environment and the already-importable shared modules at the stubs.
+        """
+        os.environ.update(self.environment())
+        # Stubs have no quota: disable client-side rate limits unless set explicitly
+        for name in ("maps_co", "google_geocode", "google_weather", "google_vision"):
+            os.environ.setdefault(f"RATE_LIMIT_{name.upper()}", "0")
+        from shared import api_helpers, geocoding, image_ingest
+        from shared.rate_limit import reset_limiters
+        from shared.upstream_timeouts import reset_upstream_timeouts
+        reset_limiters()
+        # Latency learned against earlier stubs or profiles does not apply to these
+        reset_upstream_timeouts()
+        api_helpers.GOOGLE_WEATHER_URL = f"{self['google_weather'].url}/v1/currentConditions:lookup"
+        api_helpers.RESTCOUNTRIES_BASE_URL = f"{self['restcountries'].url}/v3.1"
+        api_helpers.SMART_TRAVELLER_BASE_URL = f"{self['smart_traveller'].url}/api/"
+        api_helpers.GOOGLE_WEATHER_API_KEY = "stub-key"
+        geocoding.GOOGLE_GEOCODE_URL = f"{self['google_geocode'].url}/maps/api/geocode/json"
+        geocoding.GEOCODE_MAPS_CO_URL = f"{self['maps_co'].url}/search"
+        geocoding.GOOGLE_GEOCODING_API_KEY = "stub-key"
+        geocoding.GEOCODE_API_KEY = "stub-key"
+        image_ingest.IMAGE_FETCH_ALLOW_PRIVATE = True
+
+    def install_handlers(self, image_app, landmark_app) -> None:
+        """
+        Patch handler module globals that were bound at import time.
+        """
+        from shared.aws_clients import reset_clients
+        image_app.GOOGLE_VISION_URL = f"{self['vision'].url}/v1/images:annotate"
+        image_app.GOOGLE_VISION_API_KEY = "stub-key"
+        # Cached S3 and Bedrock clients would still target older stubs
+        reset_clients()
+
+    def install_itinerary(self, itinerary_app) -> None:
+        """
+        Drop the itinerary analyzer's cached clients so they target these stubs.
+        """
+        from shared.aws_clients import reset_clients
+        reset_clients()
+
+    def install_text_extractor(self, text_app) -> None:
+        """
+        Point the text extractor at the Vision stub.
+        """
+        from shared.aws_clients import reset_clients
+        text_app.GOOGLE_VISION_URL = f"{self['vision'].url}/v1/images:annotate"
+        text_app.GOOGLE_VISION_FILES_URL = f"{self['vision'].url}/v1/files:annotate"
+        text_app.GOOGLE_VISION_API_KEY = "stub-key"
+        reset_clients()
+
+
+def load_profiles(path: Optional[str], seed: Optional[int] = None) -> Dict[str, UpstreamProfile]:
+    """
+    Load per-upstream profiles from a JSON file of the form
+    ``{"upstreams": {"restcountries": {"latency": {...}, "failure_rate": 0.1}}}``.
+    """
+    if not path:
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    upstreams = data.get("upstreams", data)
+    profiles = {}
+    for index, name in enumerate(UPSTREAMS):
+        if name in upstreams:
+            profile_seed = None if seed is None else seed + index
+            profiles[name] = UpstreamProfile.from_dict(upstreams[name], seed=profile_seed)
+    return profiles
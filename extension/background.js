@@ -351,10 +351,12 @@ async function analyzeLandmarkImage(imageUrl) {
   try {
     
     // First API call to analyze the image
+    // Full profile: analysis_data is forwarded whole to /analyze-landmark below
     const imageResponse = await fetch(`${API_BASE_URL}/analyze-image`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Accept': 'application/json',
       },
       body: JSON.stringify({
         image_url: imageUrl
@@ -368,10 +370,11 @@ async function analyzeLandmarkImage(imageUrl) {
     const imageData = await imageResponse.json();  
     
     // Second API call to get landmark analysis
-    const landmarkResponse = await fetch(`${API_BASE_URL}/analyze-landmark`, {
+    const landmarkResponse = await fetch(`${API_BASE_URL}/analyze-landmark?profile=compact`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Accept': 'application/json',
       },
       body: JSON.stringify({
         analysis_data: imageData.analysis_data
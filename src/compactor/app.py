@@ -0,0 +1,61 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+# Import shared utilities
+from shared import json_codec
+from shared.compaction import S3Storage, compact_day
+from shared.metrics import put_metric
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Output format of compacted parts (ndjson, or parquet when pyarrow is bundled)
+COMPACTION_FORMAT = os.getenv("COMPACTION_FORMAT", "ndjson")
+
+# Remove per-request objects once they are compacted instead of waiting for expiry
+COMPACTION_DELETE_SOURCES = os.getenv("COMPACTION_DELETE_SOURCES", "false").lower() == "true"
+
+def lambda_handler(event, context):
+    """
+    Scheduled Lambda function that compacts one day of per-request results
+
+    Compacts yesterday (UTC) unless the event names a day: {"date": "YYYY-MM-DD"}
+    """
+    try:
+        event = event or {}
+        date = event.get('date') or (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
+        s3_bucket = os.getenv('S3_BUCKET')
+        if not s3_bucket:
+            raise ValueError("S3_BUCKET is not configured")
+
+        manifests = compact_day(
+            S3Storage(s3_bucket),
+            date,
+            fmt=event.get('format') or COMPACTION_FORMAT,
+            delete_sources=bool(event.get('delete_sources', COMPACTION_DELETE_SOURCES))
+        )
+        for kind, manifest in manifests.items():
+            put_metric("CompactedRecords", manifest["records"], dimensions={"Kind": kind})
+            put_metric("CompactedParts", len(manifest["parts"]), dimensions={"Kind": kind})
+
+        return {
+            "statusCode": 200,
+            "body": json_codec.dumps({
+                "date": date,
+                "records": {kind: manifest["records"] for kind, manifest in manifests.items()},
+                "parts": {kind: len(manifest["parts"]) for kind, manifest in manifests.items()},
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        }
+
+    except Exception as e:
+        logger.error(f"Error compacting results: {str(e)}")
+        return {
+            "statusCode": 500,
+            "body": json_codec.dumps({
+                "error": str(e),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        }
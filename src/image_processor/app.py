@@ -1,5 +1,3 @@
-import boto3
-import json
 import logging
 import os
 import requests
@@ -8,7 +6,37 @@ from urllib.parse import urlparse
 from typing import Dict, Optional
 
 # Import shared utilities
+from shared import api_helpers, geocoding, json_codec
 from shared.api_helpers import get_weather, get_country_info, geocode_city_country
+from shared.aws_clients import get_s3_client
+from shared.cache import TTLCache
+from shared.deadline import Deadline, stage_timeout
+from shared.http_client import get_session, preconnect
+from shared.idempotency import run_idempotent
+from shared.image_ingest import (
+    ImageFetchError,
+    ImageURLRejected,
+    ingest_image,
+    normalize_image_url,
+)
+from shared.landmark_kb import lookup_landmark
+from shared.metrics import put_metric
+from shared.micro_batch import get_batcher
+from shared.models import AnalysisData, Landmark, Location
+from shared.rate_limit import get_limiter
+from shared.response_shaping import decode_request, shape_response
+from shared.results_store import record_result
+from shared.upstream_timeouts import get_upstream_timeout
+from shared.warmup import (
+    is_warmup_event,
+    run_warmup,
+    warm_country_cache,
+    warm_knowledge_base,
+    warm_s3,
+    warm_up_on_init,
+    warm_weather_cells,
+    warmup_response,
+)
 
 # Configure logging
 logger = logging.getLogger()
@@ -19,16 +47,96 @@ GOOGLE_VISION_API_KEY = os.getenv("GOOGLE_VISION_API_KEY")
 GEOCODE_API_KEY = os.getenv("GEOCODE_API_KEY")
 GOOGLE_VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
 
+# Share of the remaining request budget each stage may use
+VISION_BUDGET_SHARE = float(os.getenv("VISION_BUDGET_SHARE", "0.6"))
+WEATHER_BUDGET_SHARE = float(os.getenv("WEATHER_BUDGET_SHARE", "0.5"))
+COUNTRY_BUDGET_SHARE = float(os.getenv("COUNTRY_BUDGET_SHARE", "0.8"))
+INGEST_BUDGET_SHARE = float(os.getenv("INGEST_BUDGET_SHARE", "0.3"))
+
+# Fetch and downscale images ourselves and send the bytes inline instead of an imageUri
+VISION_INLINE_IMAGES = os.getenv("VISION_INLINE_IMAGES", "false").lower() == "true"
+
+# Fetch failures that mean the image is gone, so Vision would fail on it too
+DEAD_IMAGE_STATUSES = (404, 410)
+
+# Per-image Vision errors that are about the image itself, so a retry would fail too
+# (google.rpc.Code INVALID_ARGUMENT, and the "can not access the URL" fetch failure).
+# DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, INTERNAL, UNAVAILABLE and the like are transient.
+VISION_INVALID_ARGUMENT = 3
+VISION_FETCH_FAILED_MESSAGES = ("can not access the url", "cannot access the url", "unable to access the url")
+
+# Negative cache: images that were unreachable or had no landmark, keyed by normalized URL
+UNREACHABLE = "unreachable"
+NO_LANDMARK = "no_landmark"
+NEGATIVE_CACHE_TTLS = {
+    UNREACHABLE: float(os.getenv("NEGATIVE_CACHE_UNREACHABLE_TTL", "120")),
+    NO_LANDMARK: float(os.getenv("NEGATIVE_CACHE_NO_LANDMARK_TTL", "900")),
+}
+NEGATIVE_CACHE = TTLCache(maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", "2048")), ttl=NEGATIVE_CACHE_TTLS[NO_LANDMARK])
+
+def warm_up():
+    """
+    Open upstream connections, create the S3 client and load bundled indexes
+    """
+    return run_warmup("image_processor", [
+        ("http_pools", lambda: preconnect([
+            GOOGLE_VISION_URL,
+            api_helpers.GOOGLE_WEATHER_URL,
+            api_helpers.RESTCOUNTRIES_BASE_URL,
+            geocoding.GOOGLE_GEOCODE_URL,
+            geocoding.GEOCODE_MAPS_CO_URL
+        ])),
+        ("s3_client", lambda: warm_s3(get_s3_client(), os.environ.get('S3_BUCKET'))),
+        ("knowledge_base", warm_knowledge_base),
+        ("country_cache", warm_country_cache),
+        ("weather_cells", warm_weather_cells)
+    ])
+
 def lambda_handler(event, context):
     """
     Lambda function to process landmark images using Google Vision API
     """
+    if is_warmup_event(event):
+        return warmup_response(warm_up())
+
+    event = decode_request(event)
+    # Retries of the same image share one execution and its response
+    response = run_idempotent("image_processor", event, context, process_image, idempotency_payload,
+                              idempotency_replay_ttl)
+    # Projection (fields=, profile=compact) and compression apply per request, after replay
+    return shape_response("image_processor", event, response)
+
+def idempotency_payload(body):
+    """
+    Request fields that identify an image analysis
+    """
+    return {"image_url": normalize_image_url(body.get('image_url') or '')}
+
+def idempotency_replay_ttl(response):
+    """
+    Unreachable and no-landmark answers are replayed no longer than the
+    negative cache keeps them
+    """
+    if response.get("statusCode") != 400:
+        return None
+    try:
+        reason = json_codec.loads(response["body"]).get("reason")
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    return NEGATIVE_CACHE_TTLS.get(reason)
+
+def process_image(event, context):
+    """
+    Analyze one image: Vision, weather and country enrichment, S3 storage
+    """
+    deadline = Deadline.from_context(context)
+    degraded = []
     try:
         # Debug: Print environment variables
         logger.info(f"Environment variables: ENVIRONMENT={os.getenv('ENVIRONMENT')}, S3_BUCKET={os.getenv('S3_BUCKET')}")
         
         # Initialize S3 client
-        s3 = boto3.client('s3')
+        s3 = get_s3_client()
         
         # Get environment variables
         s3_bucket = os.environ.get('S3_BUCKET')
@@ -38,9 +146,9 @@ def lambda_handler(event, context):
             # API Gateway sends body as a string, so we need to parse it
             if isinstance(event['body'], str):
                 try:
-                    body_data = json.loads(event['body'])
+                    body_data = json_codec.loads(event['body'])
                     image_url = body_data.get('image_url', '')
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     logger.error("Invalid JSON in request body")
                     raise ValueError("Invalid JSON in request body")
             else:
@@ -55,47 +163,106 @@ def lambda_handler(event, context):
         
         logger.info(f"Processing image: {image_url}")
         
+        # Images we recently failed on are answered without calling any upstream
+        cache_key = normalize_image_url(image_url)
+        outcome = NEGATIVE_CACHE.get(cache_key)
+        if outcome is not None:
+            logger.info(f"Negative cache hit ({outcome}) for {cache_key}")
+            put_metric("NegativeCacheHit", 1, dimensions={"Outcome": outcome})
+            return negative_response(outcome, cached=True)
+
         # Step 1: Analyze image with Google Vision API
-        vision_result = analyze_image_with_vision(image_url, GOOGLE_VISION_API_KEY)
-        
-        if not vision_result or not vision_result.get('landmarks'):
+        if deadline.expired():
             return {
-                "statusCode": 400,
-                "body": {
-                    "error": "No landmarks detected in the image",
+                "statusCode": 504,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"
+                },
+                "body": json_codec.dumps({
+                    "error": "Request deadline reached before image analysis",
+                    "degraded": ["vision"],
                     "timestamp": datetime.utcnow().isoformat()
-                }
+                })
             }
+
+        # Optional: fetch and downscale the image ourselves, falling back to imageUri on failure
+        image = None
+        if VISION_INLINE_IMAGES:
+            try:
+                image = ingest_image(image_url, deadline.slice(INGEST_BUDGET_SHARE))
+            except ImageURLRejected as e:
+                logger.warning(f"Image URL rejected: {str(e)}")
+                return {
+                    "statusCode": 400,
+                    "headers": {
+                        "Content-Type": "application/json",
+                        "Access-Control-Allow-Origin": "*"
+                    },
+                    "body": json_codec.dumps({
+                        "error": f"Image URL not allowed: {str(e)}",
+                        "timestamp": datetime.utcnow().isoformat()
+                    })
+                }
+            except ImageFetchError as e:
+                if e.status_code in DEAD_IMAGE_STATUSES:
+                    logger.warning(f"Image could not be fetched: {str(e)}")
+                    remember_negative(cache_key, UNREACHABLE)
+                    return negative_response(UNREACHABLE)
+                logger.warning(f"Image ingestion failed, letting Vision fetch the URL: {str(e)}")
+
+        vision_result = analyze_image_with_vision(image_url, GOOGLE_VISION_API_KEY, deadline.slice(VISION_BUDGET_SHARE), image)
+        
+        if not vision_result or not vision_result.get('landmarks'):
+            # Only definite answers are cached; a failed Vision call (None) or a transient
+            # per-image error gets a 502, so neither this cache nor idempotency replays it
+            if vision_result is not None:
+                if not vision_result.get('error'):
+                    remember_negative(cache_key, NO_LANDMARK)
+                    return negative_response(NO_LANDMARK)
+                if is_image_error(vision_result.get('error_code'), vision_result['error']):
+                    remember_negative(cache_key, UNREACHABLE)
+                    return negative_response(UNREACHABLE)
+                return vision_failed_response(vision_result['error'])
+            return vision_failed_response("Vision API call failed")
         
         # Get the first detected landmark
         landmark = vision_result['landmarks'][0]
-        landmark_name = landmark.get('name', 'Unknown Landmark')
-        location = landmark.get('location', {})
+        location = landmark.location
         
-        logger.info(f"Detected landmark: {landmark_name}")
+        logger.info(f"Detected landmark: {landmark.name}")
         
-        # Step 2: Get weather information
+        # Step 2: Get weather information (optional enrichment)
         weather_info = None
-        if location.get('city') and location.get('country'):
-            weather_info = get_weather(location['city'], location['country'])
+        if location.city and location.country:
+            if deadline.expired():
+                logger.warning("Request deadline reached, skipping weather")
+            else:
+                # Knowledge base coordinates are canonical, so weather needs no geocoding
+                coordinates = location.coordinates if landmark.source == "knowledge_base" else None
+                weather_info = get_weather(location.city, location.country, deadline.slice(WEATHER_BUDGET_SHARE), coordinates)
+            if weather_info is None:
+                degraded.append("weather")
         
-        # Step 3: Get country information
+        # Step 3: Get country information (optional enrichment)
         country_info = None
-        if location.get('country'):
-            country_info = get_country_info(location['country'])
+        if location.country:
+            if deadline.expired():
+                logger.warning("Request deadline reached, skipping country info")
+            else:
+                country_info = get_country_info(location.country, deadline.slice(COUNTRY_BUDGET_SHARE))
+            if country_info is None:
+                degraded.append("country_info")
         
-        # Step 4: Prepare result for Bedrock analysis
-        analysis_data = {
-            "landmark": {
-                "name": landmark_name,
-                "description": landmark.get('description', ''),
-                "confidence": landmark.get('confidence', 0),
-                "location": location
-            },
-            "weather": weather_info,
-            "country_info": country_info,
-            "image_url": image_url
-        }
+        # Step 4: Prepare result for Bedrock analysis (converted to its wire form once,
+        # for S3, the results index and the response)
+        analysis_data = AnalysisData(
+            landmark=landmark,
+            weather=weather_info,
+            country_info=country_info,
+            image_url=image_url,
+            image_fingerprint=image.fingerprint if image else None
+        ).to_dict()
         
         # Step 5: Store intermediate result in S3
         result_key = f"landmark_analysis/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_analysis.json"
@@ -104,25 +271,34 @@ def lambda_handler(event, context):
         environment = os.getenv('ENVIRONMENT')
         if environment == 'local':
             logger.info(f"Environment: {environment} - skipping S3 upload. Would store at: s3://{s3_bucket}/{result_key}")
+        elif deadline.expired():
+            logger.warning(f"Request deadline reached, skipping S3 upload to {result_key}")
+            degraded.append("storage")
+            result_key = None
         else:
             s3.put_object(
                 Bucket=s3_bucket,
                 Key=result_key,
-                Body=json.dumps(analysis_data, indent=2),
+                Body=json_codec.dumps_bytes(analysis_data, indent=2),
                 ContentType='application/json'
             )
             logger.info(f"Analysis data stored at s3://{s3_bucket}/{result_key}")
         
+        # Index the result for history lookups (best-effort)
+        result_id = record_result("image_analysis", analysis_data, result_key) if result_key else None
+
         return {
             "statusCode": 200,
             "headers": {
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps({
-                "landmark_detected": landmark_name,
+            "body": json_codec.dumps({
+                "landmark_detected": landmark.name,
                 "analysis_data": analysis_data,
                 "s3_key": result_key,
+                "result_id": result_id,
+                "degraded": degraded,
                 "timestamp": datetime.utcnow().isoformat()
             })
         }
@@ -135,79 +311,157 @@ def lambda_handler(event, context):
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps({
+            "body": json_codec.dumps({
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
             })
         }
 
-def analyze_image_with_vision(image_url, api_key):
+def remember_negative(cache_key, outcome):
+    """
+    Record that an image was unreachable or had no landmark
+    """
+    NEGATIVE_CACHE.set(cache_key, outcome, ttl=NEGATIVE_CACHE_TTLS[outcome])
+    put_metric("NegativeCacheStore", 1, dimensions={"Outcome": outcome})
+
+def is_image_error(code, message):
+    """
+    Whether a per-image Vision error means the image itself cannot be used
+    """
+    if code == VISION_INVALID_ARGUMENT:
+        return True
+    message = (message or "").lower()
+    return any(marker in message for marker in VISION_FETCH_FAILED_MESSAGES)
+
+def negative_response(outcome, cached=False):
     """
-    Use Google Vision API to detect landmarks in the image
+    400 response for an image that was unreachable or had no landmark
+    """
+    return {
+        "statusCode": 400,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps({
+            "error": "Image could not be fetched" if outcome == UNREACHABLE else "No landmarks detected in the image",
+            "reason": outcome,
+            "cached": cached,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    }
+
+def vision_failed_response(reason):
+    """
+    502 response when Vision could not analyze the image this time; not cached
+    """
+    return {
+        "statusCode": 502,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps({
+            "error": "Image analysis is temporarily unavailable",
+            "reason": reason,
+            "degraded": ["vision"],
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    }
+
+def analyze_image_with_vision(image_url, api_key, deadline=None, image=None):
+    """
+    Use Google Vision API to detect landmarks in the image.
+
+    When ``image`` (an IngestedImage) is given its bytes are sent inline as
+    base64 ``content``; otherwise Vision fetches ``image_url`` itself.
     """
     if not api_key:
         logger.warning("Google Vision API key not configured")
         return None
     
+    timeout = stage_timeout(deadline, 30)
+    if timeout is None:
+        logger.warning("Request deadline reached, skipping Vision API call")
+        return None
+
     try:
         # Prepare the request for Google Vision API
-        vision_request = {
-            "requests": [
+        if image is not None:
+            vision_image = {"content": image.as_base64()}
+        else:
+            vision_image = {"source": {"imageUri": image_url}}
+        vision_entry = {
+            "image": vision_image,
+            "features": [
                 {
-                    "image": {
-                        "source": {
-                            "imageUri": image_url
-                        }
-                    },
-                    "features": [
-                        {
-                            "type": "LANDMARK_DETECTION",
-                            "maxResults": 5
-                        },
-                        {
-                            "type": "LABEL_DETECTION",
-                            "maxResults": 10
-                        }
-                    ]
+                    "type": "LANDMARK_DETECTION",
+                    "maxResults": 5
+                },
+                {
+                    "type": "LABEL_DETECTION",
+                    "maxResults": 10
                 }
             ]
         }
+        vision_request = {"requests": [vision_entry]}
         
-        # Call Google Vision API
-        response = requests.post(
-            f"{GOOGLE_VISION_URL}?key={api_key}",
-            json=vision_request,
-            timeout=30
-        )
-        response.raise_for_status()
+        # Call Google Vision API (concurrent requests for the same image share one call)
+        def annotate(attempt_timeout):
+            response = get_session().post(
+                f"{GOOGLE_VISION_URL}?key={api_key}",
+                json=vision_request,
+                timeout=attempt_timeout
+            )
+            response.raise_for_status()
+            return response.json()
         
-        vision_data = response.json()
+        # Timeouts follow Vision's observed latency, with one fast retry on a stuck call.
+        # With batching on (service mode), concurrent images share one images:annotate call.
+        coalesce_key = image.fingerprint if image is not None else image_url
+        batcher = get_batcher("google_vision", annotate_batch) if api_key == GOOGLE_VISION_API_KEY else None
+        if batcher is not None:
+            vision_data = get_limiter("google_vision").call(
+                coalesce_key, lambda: {"responses": [batcher.submit(vision_entry, timeout)]}, timeout)
+        else:
+            vision_data = get_limiter("google_vision").call(
+                coalesce_key, lambda: get_upstream_timeout("google_vision").call(annotate, timeout), timeout)
         
         # Extract landmark information
         landmarks = []
         if 'responses' in vision_data and vision_data['responses']:
             response_data = vision_data['responses'][0]
             
+            # Per-image errors, e.g. Vision could not download the imageUri
+            if response_data.get('error'):
+                message = response_data['error'].get('message', 'unknown error')
+                logger.warning(f"Vision could not process image: {message}")
+                return {"landmarks": [], "error": message, "error_code": response_data['error'].get('code')}
+
             # Process landmark annotations
             if 'landmarkAnnotations' in response_data:
                 for landmark in response_data['landmarkAnnotations']:
-                    landmark_info = {
-                        "name": landmark.get('description', ''),
-                        "confidence": landmark.get('score', 0),
-                        "description": landmark.get('description', ''),
-                        "location": {
-                            "lat": landmark.get('locations', [{}])[0].get('latLng', {}).get('latitude'),
-                            "lng": landmark.get('locations', [{}])[0].get('latLng', {}).get('longitude')
-                        }
-                    }
+                    lat_lng = landmark.get('locations', [{}])[0].get('latLng', {})
+                    landmark_info = Landmark(
+                        name=landmark.get('description', ''),
+                        mid=landmark.get('mid'),
+                        confidence=landmark.get('score', 0),
+                        description=landmark.get('description', ''),
+                        location=Location(lat=lat_lng.get('latitude'), lng=lat_lng.get('longitude'))
+                    )
+                    location = landmark_info.location
                     
-                    # Try to extract city/country from landmark name
-                    # This is a simple heuristic - in production you might use geocoding
-                    if landmark_info["name"]:
-                        city, country, country_code = extract_info_from_landmark(landmark_info["name"])
-                        landmark_info["location"]["city"] = city
-                        landmark_info["location"]["country"] = country
-                        landmark_info["location"]["country_code"] = country_code
+                    # Known landmarks come from the bundled knowledge base, the rest are geocoded
+                    known = lookup_landmark(landmark_info.name, landmark_info.mid)
+                    landmark_info.source = "knowledge_base" if known else "vision"
+                    if known:
+                        location.lat = known.get('lat', location.lat)
+                        location.lng = known.get('lng', location.lng)
+                        location.city = known.get('city')
+                        location.country = known.get('country')
+                        location.country_code = known.get('country_code')
+                    elif landmark_info.name:
+                        location.city, location.country, location.country_code = extract_info_from_landmark(landmark_info.name, deadline)
                     
                     landmarks.append(landmark_info)
             
@@ -215,12 +469,13 @@ def analyze_image_with_vision(image_url, api_key):
             if not landmarks and 'labelAnnotations' in response_data:
                 location_info = extract_location_from_labels(response_data['labelAnnotations'])
                 if location_info:
-                    landmarks.append({
-                        "name": "Unknown Landmark",
-                        "confidence": 0.5,
-                        "description": "Location detected from image labels",
-                        "location": location_info
-                    })
+                    landmarks.append(Landmark(
+                        name="Unknown Landmark",
+                        source="labels",
+                        confidence=0.5,
+                        description="Location detected from image labels",
+                        location=Location.from_dict(location_info)
+                    ))
         
         logger.info(f"Vision API detected {len(landmarks)} landmarks")
         return {"landmarks": landmarks}
@@ -232,8 +487,23 @@ def analyze_image_with_vision(image_url, api_key):
         logger.error(f"Unexpected error in Vision API: {str(e)}")
         return None
 
-def extract_info_from_landmark(landmark_name):
-    result = geocode_city_country(landmark_name)
+def annotate_batch(entries, timeout):
+    """
+    One images:annotate call for several images; returns their responses in order
+    """
+    def annotate(attempt_timeout):
+        response = get_session().post(
+            f"{GOOGLE_VISION_URL}?key={GOOGLE_VISION_API_KEY}",
+            json={"requests": entries},
+            timeout=attempt_timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    return get_upstream_timeout("google_vision").call(annotate, timeout).get('responses') or []
+
+def extract_info_from_landmark(landmark_name, deadline=None):
+    result = geocode_city_country(landmark_name, deadline)
     return result.get("city"), result.get("country"), result.get("country_code")
 
 def extract_location_from_labels(labels):
@@ -255,4 +525,6 @@ def extract_location_from_labels(labels):
                 "description": description
             }
     
-    return None 
\ No newline at end of file
+    return None
+
+warm_up_on_init(warm_up)
@@ -0,0 +1,421 @@
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+# Import shared utilities
+from shared import api_helpers, geocoding, json_codec
+from shared.api_helpers import (
+    format_weather_summary,
+    get_country_info,
+    get_travel_advisory,
+    get_weather,
+)
+from shared.aws_clients import get_bedrock_client, get_s3_client
+from shared.bedrock_usage import invoke_model
+from shared.deadline import Deadline
+from shared.geocoding import geocode
+from shared.http_client import preconnect
+from shared.landmark_kb import lookup_landmark
+from shared.response_shaping import decode_request
+from shared.warmup import (
+    is_warmup_event,
+    run_warmup,
+    warm_knowledge_base,
+    warm_up_on_init,
+    warm_weather_cells,
+    warmup_response,
+)
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+
+# Bump whenever create_itinerary_prompt changes so usage reports can compare versions
+ITINERARY_PROMPT_VERSION = "itinerary-v1"
+
+# Minimum time left (seconds) for the Bedrock call to be worth starting
+MIN_BEDROCK_SECONDS = float(os.getenv("MIN_BEDROCK_SECONDS", "5"))
+
+# Largest itinerary accepted in one request
+MAX_ACTIVITIES = int(os.getenv("ITINERARY_MAX_ACTIVITIES", "20"))
+
+# Share of the remaining request budget for resolving stops and their enrichments
+LOOKUP_BUDGET_SHARE = float(os.getenv("ITINERARY_LOOKUP_BUDGET_SHARE", "0.5"))
+
+# Stops and their country/weather lookups run on one pool shared across invocations
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ITINERARY_MAX_WORKERS", "16")),
+                               thread_name_prefix="itinerary")
+
+# Leading verbs that are not part of the place name ("Visit Eiffel Tower")
+ACTIVITY_VERBS = re.compile(r"^(visit|see|tour|explore|walk along|walk|stroll along|climb|go to|discover)\s+(the\s+)?",
+                            re.IGNORECASE)
+
+def warm_up():
+    """
+    Open upstream connections, create the Bedrock client and load bundled indexes
+    """
+    return run_warmup("itinerary_analyzer", [
+        ("http_pools", lambda: preconnect([
+            api_helpers.GOOGLE_WEATHER_URL,
+            api_helpers.RESTCOUNTRIES_BASE_URL,
+            api_helpers.SMART_TRAVELLER_BASE_URL,
+            geocoding.GOOGLE_GEOCODE_URL,
+            geocoding.GEOCODE_MAPS_CO_URL
+        ])),
+        ("bedrock_client", lambda: get_bedrock_client().meta.endpoint_url),
+        ("knowledge_base", warm_knowledge_base),
+        ("weather_cells", warm_weather_cells)
+    ])
+
+def lambda_handler(event, context):
+    """
+    Lambda function to analyze a multi-stop itinerary with one Bedrock call
+    """
+    if is_warmup_event(event):
+        return warmup_response(warm_up())
+
+    # API Gateway base64-encodes request bodies because the API declares binary media types
+    event = decode_request(event)
+    deadline = Deadline.from_context(context)
+    degraded = []
+    try:
+        s3_bucket = os.environ.get('S3_BUCKET')
+
+        # Extract itinerary from event
+        if 'body' in event:
+            # API Gateway sends body as a string, so we need to parse it
+            if isinstance(event['body'], str):
+                try:
+                    body_data = json_codec.loads(event['body'])
+                except json_codec.JSONDecodeError:
+                    logger.error("Invalid JSON in request body")
+                    return error_response(400, "Invalid JSON in request body")
+            else:
+                # If body is already a dict (direct Lambda invocation)
+                body_data = event['body']
+            if not isinstance(body_data, dict):
+                return error_response(400, "Request body must be a JSON object")
+            itinerary = body_data.get('itinerary_data', {})
+        else:
+            # Direct Lambda invocation without API Gateway
+            itinerary = event.get('itinerary_data', {})
+
+        if not isinstance(itinerary, dict):
+            return error_response(400, "itinerary_data must be an object")
+        if not isinstance(itinerary.get('activities', []), list):
+            return error_response(400, "activities must be a list")
+        if not isinstance(itinerary.get('destination') or '', str):
+            return error_response(400, "destination must be a string")
+
+        activities = [a.strip() for a in itinerary.get('activities', []) if isinstance(a, str) and a.strip()]
+        destination = (itinerary.get('destination') or '').strip()
+        if not destination or not activities:
+            return error_response(400, "Itinerary needs a destination and at least one activity")
+        if len(activities) > MAX_ACTIVITIES:
+            return error_response(400, f"Itinerary has {len(activities)} activities; the limit is {MAX_ACTIVITIES}")
+
+        logger.info(f"Analyzing itinerary for {destination} with {len(activities)} activities")
+
+        # Step 1: Resolve every stop and its country/weather/advisory concurrently
+        lookup_deadline = deadline.slice(LOOKUP_BUDGET_SHARE)
+        stops, enrichment, lookup_degraded = resolve_itinerary(destination, activities, lookup_deadline)
+        degraded.extend(lookup_degraded)
+
+        # Step 2: One Bedrock prompt for the whole plan
+        bedrock_usage = None
+        if deadline.expired(MIN_BEDROCK_SECONDS):
+            logger.warning(f"Only {deadline.remaining_ms()}ms left, skipping Bedrock analysis")
+            analysis = fallback_itinerary_analysis(stops, "Analysis skipped because the request ran out of time")
+            degraded.append("analysis")
+        else:
+            analysis, bedrock_usage = analyze_itinerary_with_bedrock(itinerary, stops, enrichment, deadline)
+            if analysis is None:
+                analysis = fallback_itinerary_analysis(stops, "Unable to generate AI analysis due to technical issues")
+                degraded.append("analysis")
+
+        result = {
+            "destination": destination,
+            "duration": itinerary.get('duration'),
+            "budget": itinerary.get('budget'),
+            "travel_style": itinerary.get('travel_style'),
+            "stops": stops,
+            "weather": enrichment["weather"],
+            "country_info": enrichment["country_info"],
+            "travel_advisory": enrichment["travel_advisory"],
+            "analysis": analysis,
+            "bedrock_usage": bedrock_usage,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+        # Step 3: Store result in S3
+        result_key = f"itinerary_analysis/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_itinerary.json"
+        environment = os.getenv('ENVIRONMENT')
+        if environment == 'local':
+            logger.info(f"Environment: {environment} - skipping S3 upload. Would store at: s3://{s3_bucket}/{result_key}")
+        elif deadline.expired():
+            logger.warning(f"Request deadline reached, skipping S3 upload to {result_key}")
+            degraded.append("storage")
+            result_key = None
+        else:
+            get_s3_client().put_object(
+                Bucket=s3_bucket,
+                Key=result_key,
+                Body=json_codec.dumps_bytes(result, indent=2),
+                ContentType='application/json'
+            )
+            logger.info(f"Itinerary analysis stored at s3://{s3_bucket}/{result_key}")
+
+        return {
+            "statusCode": 200,
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*"
+            },
+            "body": json_codec.dumps(dict(result, s3_key=result_key, degraded=degraded))
+        }
+
+    except Exception as e:
+        logger.error(f"Error in itinerary analysis: {str(e)}")
+        return error_response(500, str(e))
+
+def error_response(status_code, message):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps({
+            "error": message,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    }
+
+def activity_place(activity):
+    """
+    Place name inside an activity ("Visit Eiffel Tower" -> "Eiffel Tower")
+    """
+    return ACTIVITY_VERBS.sub("", activity).strip() or activity
+
+def resolve_stop(activity, destination, deadline):
+    """
+    Resolve one activity to a landmark and location, knowledge base first
+    """
+    place = activity_place(activity)
+    known = lookup_landmark(place)
+    if known:
+        location = {key: known.get(key) for key in ("city", "country", "country_code", "lat", "lng")}
+        return {"activity": activity, "place": known.get('name', place), "location": location, "source": "knowledge_base"}
+
+    located = geocode(f"{place}, {destination}", deadline)
+    if not located.get('country'):
+        # Unknown place: fall back to the destination itself
+        located = geocode(destination, deadline)
+    location = {key: located.get(key) for key in ("city", "country", "country_code", "lat", "lng")}
+    return {"activity": activity, "place": place, "location": location, "source": located.get('provider')}
+
+class _Lookups:
+    """
+    Country, advisory and weather lookups, each submitted at most once per itinerary
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.futures = {}
+        self._lock = threading.Lock()
+
+    def submit_once(self, key, fn, *args):
+        with self._lock:
+            if key not in self.futures:
+                self.futures[key] = _executor.submit(fn, *args)
+
+    def add_stop(self, location):
+        country = location.get('country')
+        if not country:
+            return
+        self.submit_once(("country_info", country), get_country_info, country, self.deadline)
+        self.submit_once(("travel_advisory", country), get_travel_advisory, country,
+                         location.get('country_code'), self.deadline)
+        city = location.get('city')
+        if city:
+            coordinates = None
+            if location.get('lat') is not None and location.get('lng') is not None:
+                coordinates = (location['lat'], location['lng'])
+            self.submit_once(("weather", f"{city}, {country}"), get_weather, city, country, self.deadline, coordinates)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.futures)
+
+def resolve_itinerary(destination, activities, deadline):
+    """
+    Resolve all stops concurrently, starting each stop's country and weather
+    lookups as soon as it resolves, with shared lookups deduplicated.
+    Returns ``(stops, enrichment, degraded)``.
+    """
+    lookups = _Lookups(deadline)
+    degraded = []
+
+    def resolve(activity):
+        stop = resolve_stop(activity, destination, deadline)
+        lookups.add_stop(stop["location"])
+        return stop
+
+    # Identical activities share one resolution
+    unique = list(dict.fromkeys(activities))
+    stop_futures = {activity: _executor.submit(resolve, activity) for activity in unique}
+    wait(list(stop_futures.values()), timeout=deadline.remaining())
+
+    resolved = {}
+    for activity, future in stop_futures.items():
+        if future.done() and future.exception() is None:
+            resolved[activity] = future.result()
+        else:
+            if future.done():
+                logger.error(f"Could not resolve '{activity}': {str(future.exception())}")
+            resolved[activity] = {"activity": activity, "place": activity_place(activity), "location": {}, "source": None}
+            if "stops" not in degraded:
+                degraded.append("stops")
+    stops = [dict(resolved[activity]) for activity in activities]
+
+    lookup_futures = lookups.snapshot()
+    wait(list(lookup_futures.values()), timeout=deadline.remaining())
+    enrichment = {"weather": {}, "country_info": {}, "travel_advisory": {}}
+    for (kind, key), future in lookup_futures.items():
+        value = future.result() if future.done() and future.exception() is None else None
+        enrichment[kind][key] = value
+        if value is None and kind not in degraded:
+            degraded.append(kind)
+
+    logger.info(f"Resolved {len(unique)} stops with {len(lookup_futures)} shared lookups")
+    return stops, enrichment, degraded
+
+def create_itinerary_prompt(itinerary, stops, enrichment):
+    """
+    Create one prompt covering every stop of the itinerary
+    """
+    stop_lines = []
+    for index, stop in enumerate(stops, 1):
+        location = stop.get('location', {})
+        where = ", ".join(part for part in (location.get('city'), location.get('country')) if part) or "location unknown"
+        stop_lines.append(f"{index}. {stop['activity']} ({stop['place']}, {where})")
+
+    weather_lines = [f"- {place}: {format_weather_summary(weather)}" for place, weather in enrichment["weather"].items()]
+
+    country_lines = []
+    for country, info in enrichment["country_info"].items():
+        if not info:
+            continue
+        currencies = ", ".join(c.get('name', '') for c in info.currencies or [])
+        languages = ", ".join((info.languages or {}).values())
+        country_lines.append(f"- {country}: capital {', '.join(info.capital or [])}; currency {currencies}; languages {languages}")
+    for country, advisory in enrichment["travel_advisory"].items():
+        if advisory:
+            country_lines.append(f"- {country} travel advisory: {advisory.level} - {advisory.summary}")
+
+    prompt = f"""
+You are a travel expert reviewing a traveler's itinerary. Analyze the whole plan in one response.
+
+**TRIP:**
+- Destination: {itinerary.get('destination')}
+- Duration: {itinerary.get('duration', 'Not specified')}
+- Budget: {itinerary.get('budget', 'Not specified')}
+- Travel style: {itinerary.get('travel_style', 'Not specified')}
+
+**STOPS:**
+{chr(10).join(stop_lines)}
+
+**WEATHER:**
+{chr(10).join(weather_lines) if weather_lines else 'No weather data available'}
+
+**COUNTRY INFORMATION:**
+{chr(10).join(country_lines) if country_lines else 'No country data available'}
+
+Please provide your analysis in the following JSON format, with one "stops" entry per stop in the same order:
+
+{{
+    "summary": "A 2-3 sentence overview of the itinerary",
+    "stops": [
+        {{"activity": "Activity as given", "tips": "Practical tip for this stop", "best_time": "Best time of day or week", "estimated_cost": "Rough cost"}}
+    ],
+    "daily_plan": [
+        {{"day": 1, "activities": ["Activity"], "notes": "Why these go together"}}
+    ],
+    "budget_assessment": "Whether the budget fits the plan",
+    "travel_tips": ["Tip 1", "Tip 2", "Tip 3"]
+}}
+
+Group nearby stops on the same day, consider the weather and the travel style, and keep advice practical.
+"""
+    return prompt
+
+def analyze_itinerary_with_bedrock(itinerary, stops, enrichment, deadline=None):
+    """
+    Use Amazon Bedrock to analyze the whole itinerary in a single call.
+    Returns ``(analysis, usage)``; analysis is None when the call or parse failed.
+    """
+    try:
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "system": "Respond with only valid JSON. No code fences, no explanations, no trailing commas.",
+            # Room for one entry per stop on top of the overall plan
+            "max_tokens": min(1500 + 250 * len(stops), 4000),
+            "messages": [
+                { "role": "user", "content": create_itinerary_prompt(itinerary, stops, enrichment) }
+            ]
+        }
+
+        client = get_bedrock_client(deadline.remaining() if deadline else None)
+        response_body, usage = invoke_model(
+            client, BEDROCK_MODEL_ID, request_body,
+            function="itinerary_analyzer", prompt_version=ITINERARY_PROMPT_VERSION
+        )
+        analysis = parse_itinerary_response(response_body['content'][0]['text'])
+        if analysis is None:
+            logger.warning("Bedrock itinerary response was not valid JSON")
+        return analysis, usage
+
+    except Exception as e:
+        logger.error(f"Error calling Bedrock: {str(e)}")
+        return None, None
+
+def parse_itinerary_response(response_text):
+    """
+    Extract the JSON analysis from Bedrock's reply, or None if there is none
+    """
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", response_text.strip(), flags=re.IGNORECASE|re.MULTILINE)
+    # Remove trailing commas in objects/arrays
+    cleaned = re.sub(r",(\s*[}\]])", r"\1", cleaned)
+    start_idx = cleaned.find('{')
+    end_idx = cleaned.rfind('}') + 1
+    if start_idx == -1 or end_idx <= start_idx:
+        return None
+    try:
+        analysis = json_codec.loads(cleaned[start_idx:end_idx])
+    except json_codec.JSONDecodeError:
+        return None
+    if not isinstance(analysis, dict):
+        return None
+    analysis.setdefault("stops", [])
+    analysis.setdefault("daily_plan", [])
+    analysis.setdefault("travel_tips", [])
+    return analysis
+
+def fallback_itinerary_analysis(stops, summary):
+    """
+    Placeholder analysis used when Bedrock is unavailable or skipped
+    """
+    return {
+        "summary": summary,
+        "stops": [{"activity": stop["activity"], "tips": "", "best_time": "", "estimated_cost": ""} for stop in stops],
+        "daily_plan": [],
+        "budget_assessment": "Budget assessment unavailable",
+        "travel_tips": []
+    }
+
+warm_up_on_init(warm_up)
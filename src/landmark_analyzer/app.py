@@ -1,24 +1,90 @@
-import boto3
-import json
 import logging
 import os
 from datetime import datetime
 import re
 
+from shared import json_codec
+from shared.api_helpers import get_travel_advisory
+from shared.aws_clients import get_bedrock_client, get_s3_client
+from shared.bedrock_usage import invoke_model
+from shared.deadline import Deadline
+from shared.idempotency import run_idempotent
+from shared.landmark_kb import precomputed_analysis
+from shared.metrics import put_metric
+from shared.models import Analysis, AnalysisData, Landmark, SchemaVersionError
+from shared.response_shaping import decode_request, shape_response
+from shared.results_store import record_result
+from shared.warmup import is_warmup_event, run_warmup, warm_knowledge_base, warm_s3, warm_up_on_init, warmup_response
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize Bedrock client
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+# Use Claude 3 Haiku for analysis (more commonly available)
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+
+# Bump whenever create_analysis_prompt changes so usage reports can compare versions
+ANALYSIS_PROMPT_VERSION = "landmark-analysis-v1"
+
+# Minimum time left (seconds) for a Bedrock call to be worth starting
+MIN_BEDROCK_SECONDS = float(os.getenv("MIN_BEDROCK_SECONDS", "5"))
+
+# Serve the stored analysis for landmarks in the knowledge base instead of calling Bedrock
+USE_PRECOMPUTED_ANALYSIS = os.getenv("LANDMARK_KB_ANALYSIS", "true").lower() == "true"
+
+# Share of the remaining request budget for the current travel advisory sent with a stored analysis
+ADVISORY_BUDGET_SHARE = float(os.getenv("ADVISORY_BUDGET_SHARE", "0.3"))
+
+# Analysis tiers by detection confidence and data completeness: label-only or very weak
+# detections get a template analysis without Bedrock, weak or sparse ones a short light call
+ANALYSIS_TIERING = os.getenv("ANALYSIS_TIERING", "true").lower() == "true"
+ANALYSIS_TEMPLATE_BELOW = float(os.getenv("ANALYSIS_TEMPLATE_BELOW", "0.35"))
+ANALYSIS_FULL_MIN_CONFIDENCE = float(os.getenv("ANALYSIS_FULL_MIN_CONFIDENCE", "0.6"))
+ANALYSIS_FULL_MIN_COMPLETENESS = float(os.getenv("ANALYSIS_FULL_MIN_COMPLETENESS", "0.25"))
+
+# Model, output cap and prompt version of the light tier
+BEDROCK_LIGHT_MODEL_ID = os.getenv("BEDROCK_LIGHT_MODEL_ID", BEDROCK_MODEL_ID)
+LIGHT_ANALYSIS_MAX_TOKENS = int(os.getenv("LIGHT_ANALYSIS_MAX_TOKENS", "800"))
+LIGHT_ANALYSIS_PROMPT_VERSION = "landmark-analysis-light-v1"
+
+def warm_up():
+    """
+    Create the Bedrock and S3 clients and load bundled indexes
+    """
+    return run_warmup("landmark_analyzer", [
+        ("bedrock_client", lambda: get_bedrock_client().meta.endpoint_url),
+        ("s3_client", lambda: warm_s3(get_s3_client(), os.environ.get('S3_BUCKET'))),
+        ("knowledge_base", warm_knowledge_base)
+    ])
 
 def lambda_handler(event, context):
     """
     Lambda function to analyze landmark data using Amazon Bedrock
     """
+    if is_warmup_event(event):
+        return warmup_response(warm_up())
+
+    event = decode_request(event)
+    # Retries of the same analysis share one Bedrock call and its response
+    response = run_idempotent("landmark_analyzer", event, context, analyze_landmark, idempotency_payload)
+    # Projection (fields=, profile=compact) and compression apply per request, after replay
+    return shape_response("landmark_analyzer", event, response)
+
+def idempotency_payload(body):
+    """
+    Request fields that identify a landmark analysis
+    """
+    return {"analysis_data": body.get('analysis_data') or {}, "s3_key": body.get('s3_key') or ''}
+
+def analyze_landmark(event, context):
+    """
+    Analyze one landmark with Bedrock and store the final result
+    """
+    deadline = Deadline.from_context(context)
+    degraded = []
     try:
         # Initialize S3 client
-        s3 = boto3.client('s3')
+        s3 = get_s3_client()
         
         # Get environment variables
         s3_bucket = os.environ.get('S3_BUCKET')
@@ -28,10 +94,10 @@ def lambda_handler(event, context):
             # API Gateway sends body as a string, so we need to parse it
             if isinstance(event['body'], str):
                 try:
-                    body_data = json.loads(event['body'])
+                    body_data = json_codec.loads(event['body'])
                     analysis_data = body_data.get('analysis_data', {})
                     s3_key = body_data.get('s3_key', '')
-                except json.JSONDecodeError:
+                except json_codec.JSONDecodeError:
                     logger.error("Invalid JSON in request body")
                     raise ValueError("Invalid JSON in request body")
             else:
@@ -47,7 +113,7 @@ def lambda_handler(event, context):
         if not analysis_data and s3_key:
             try:
                 s3_response = s3.get_object(Bucket=s3_bucket, Key=s3_key)
-                analysis_data = json.loads(s3_response['Body'].read())
+                analysis_data = json_codec.loads(s3_response['Body'].read())
                 logger.info(f"Retrieved analysis data from S3: {s3_key}")
             except Exception as e:
                 logger.error(f"Error retrieving data from S3: {str(e)}")
@@ -57,7 +123,7 @@ def lambda_handler(event, context):
                         "Content-Type": "application/json",
                         "Access-Control-Allow-Origin": "*"
                     },
-                    "body": json.dumps({
+                    "body": json_codec.dumps({
                         "error": f"Failed to retrieve analysis data: {str(e)}",
                         "timestamp": datetime.utcnow().isoformat()
                     })
@@ -70,31 +136,69 @@ def lambda_handler(event, context):
                     "Content-Type": "application/json",
                     "Access-Control-Allow-Origin": "*"
                 },
-                "body": json.dumps({
+                "body": json_codec.dumps({
                     "error": "No analysis data provided",
                     "timestamp": datetime.utcnow().isoformat()
                 })
             }
         
-        logger.info(f"Analyzing landmark: {analysis_data.get('landmark', {}).get('name', 'Unknown')}")
+        # Parsed once; every step below reads the same records
+        try:
+            analysis_data = AnalysisData.from_wire(analysis_data)
+        except (SchemaVersionError, TypeError) as e:
+            logger.error(f"Rejected analysis data: {str(e)}")
+            return {
+                "statusCode": 400,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"
+                },
+                "body": json_codec.dumps({
+                    "error": f"Invalid analysis data: {str(e)}",
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+            }
+        landmark = analysis_data.landmark or Landmark()
+        landmark_name = 'Unknown' if landmark.name is None else landmark.name
+
+        logger.info(f"Analyzing landmark: {landmark_name}")
         
         # Step 1: Generate comprehensive travel analysis using Bedrock
-        travel_analysis = analyze_with_bedrock(analysis_data)
+        # (famous landmarks use the precomputed analysis from the knowledge base)
+        travel_analysis = precomputed_analysis(analysis_data.landmark) if USE_PRECOMPUTED_ANALYSIS else None
+        analysis_source = "bedrock" if travel_analysis is None else "knowledge_base"
+        analysis_tier = None
+        bedrock_usage = None
+        if travel_analysis is not None:
+            logger.info("Using precomputed analysis from the landmark knowledge base")
+            # The stored analysis only describes the landmark; the advisory is looked up now
+            travel_analysis["travel_advisory"] = current_travel_advisory(analysis_data, deadline)
+            if travel_analysis["travel_advisory"] is None and analysis_data.location.country:
+                degraded.append("travel_advisory")
+        else:
+            # Weak detections get a cheaper analysis; the long narrative adds little for them
+            analysis_tier, reason = choose_analysis_tier(analysis_data)
+            put_metric("AnalysisTier", 1, dimensions={"Tier": analysis_tier})
+            if reason:
+                logger.info(f"Analysis tier {analysis_tier}: {reason}")
+            if analysis_tier == "template":
+                travel_analysis = template_analysis(analysis_data)
+                analysis_source = "template"
+            elif deadline.expired(MIN_BEDROCK_SECONDS):
+                logger.warning(f"Only {deadline.remaining_ms()}ms left, skipping Bedrock analysis")
+                travel_analysis = fallback_analysis("Analysis skipped because the request ran out of time")
+                analysis_source = "fallback"
+                degraded.append("analysis")
+            else:
+                travel_analysis, bedrock_usage = analyze_with_bedrock(analysis_data, deadline, analysis_tier)
+        travel_analysis = as_analysis(travel_analysis)
         
         # Step 2: Generate travel recommendations
         recommendations = generate_recommendations(analysis_data, travel_analysis)
         
         # Step 3: Create final response
-        final_result = {
-            "landmark": analysis_data.get('landmark', {}),
-            "weather": analysis_data.get('weather', {}),
-            "country_info": analysis_data.get('country_info', {}),
-            "travel_advisory": travel_analysis.get('travel_advisory', {}),
-            "analysis": travel_analysis,
-            "recommendations": recommendations,
-            "image_url": analysis_data.get('image_url', ''),
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        final_result = build_final_result(analysis_data, travel_analysis, recommendations,
+                                          analysis_source, bedrock_usage, analysis_tier)
         
         # Step 4: Store final result in S3
         final_result_key = f"landmark_analysis/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_final.json"
@@ -103,26 +207,38 @@ def lambda_handler(event, context):
         environment = os.getenv('ENVIRONMENT')
         if environment == 'local':
             logger.info(f"Environment: {environment} - skipping S3 upload. Would store at: s3://{s3_bucket}/{final_result_key}")
+        elif deadline.expired():
+            logger.warning(f"Request deadline reached, skipping S3 upload to {final_result_key}")
+            degraded.append("storage")
+            final_result_key = None
         else:
             s3.put_object(
                 Bucket=s3_bucket,
                 Key=final_result_key,
-                Body=json.dumps(final_result, indent=2),
+                Body=json_codec.dumps_bytes(final_result, indent=2),
                 ContentType='application/json'
             )
             logger.info(f"Final analysis stored at s3://{s3_bucket}/{final_result_key}")
         
+        # Index the result for history lookups (best-effort)
+        result_id = record_result("landmark_analysis", final_result, final_result_key) if final_result_key else None
+
         return {
             "statusCode": 200,
             "headers": {
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps({
-                "landmark_name": analysis_data.get('landmark', {}).get('name', 'Unknown'),
+            "body": json_codec.dumps({
+                "landmark_name": landmark_name,
                 "analysis": travel_analysis,
+                "analysis_source": analysis_source,
+                "analysis_tier": analysis_tier,
+                "bedrock_usage": bedrock_usage,
                 "recommendations": recommendations,
                 "s3_key": final_result_key,
+                "result_id": result_id,
+                "degraded": degraded,
                 "timestamp": datetime.utcnow().isoformat()
             })
         }
@@ -135,87 +251,163 @@ def lambda_handler(event, context):
                 "Content-Type": "application/json",
                 "Access-Control-Allow-Origin": "*"
             },
-            "body": json.dumps({
+            "body": json_codec.dumps({
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
             })
         }
 
-def analyze_with_bedrock(analysis_data):
+def current_travel_advisory(analysis_data, deadline=None):
+    """
+    Travel advisory for the landmark's country: the one the request carried, else
+    Smart Traveller's current one. None when the country is unknown or the lookup failed.
+    """
+    analysis_data = AnalysisData.coerce(analysis_data)
+    if analysis_data.travel_advisory:
+        return analysis_data.travel_advisory.to_dict()
+    location = analysis_data.location
+    if not location.country or (deadline is not None and deadline.expired()):
+        return None
+    advisory = get_travel_advisory(location.country, location.country_code,
+                                   deadline.slice(ADVISORY_BUDGET_SHARE) if deadline else None)
+    return advisory.to_dict() if advisory else None
+
+def build_final_result(analysis_data, travel_analysis, recommendations, analysis_source, bedrock_usage=None,
+                       analysis_tier=None):
+    """
+    Final result as stored in S3, in its wire form (plain dicts)
+    """
+    analysis_data = AnalysisData.coerce(analysis_data)
+    travel_analysis = as_analysis(travel_analysis).to_dict()
+    return {
+        "landmark": analysis_data.landmark.to_dict() if analysis_data.landmark else {},
+        "weather": analysis_data.weather.to_dict() if analysis_data.weather else {},
+        "country_info": analysis_data.country_info.to_dict() if analysis_data.country_info else {},
+        "travel_advisory": travel_analysis.get('travel_advisory', {}),
+        "analysis": travel_analysis,
+        "recommendations": recommendations,
+        "image_url": analysis_data.image_url or '',
+        "analysis_source": analysis_source,
+        "analysis_tier": analysis_tier,
+        "bedrock_usage": bedrock_usage,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+def data_completeness(analysis_data):
+    """
+    Share of the inputs a full analysis draws on that are present: city, country, weather, country info
+    """
+    analysis_data = AnalysisData.coerce(analysis_data)
+    location = analysis_data.location
+    inputs = [location.city, location.country, analysis_data.weather, analysis_data.country_info]
+    return sum(1 for value in inputs if value) / len(inputs)
+
+def choose_analysis_tier(analysis_data):
+    """
+    Pick "full", "light" or "template" analysis from detection confidence and data completeness.
+    Returns ``(tier, reason)``; the reason is None for full analyses.
+    """
+    if not ANALYSIS_TIERING:
+        return "full", None
+    analysis_data = AnalysisData.coerce(analysis_data)
+    landmark = analysis_data.landmark or Landmark()
+    if not landmark.identified:
+        return "template", "no landmark identified, only image labels"
+    # Clients that send no confidence are not downgraded for it
+    confidence = landmark.confidence
+    if confidence is not None and confidence < ANALYSIS_TEMPLATE_BELOW:
+        return "template", f"confidence {confidence:.2f} below {ANALYSIS_TEMPLATE_BELOW}"
+    if confidence is not None and confidence < ANALYSIS_FULL_MIN_CONFIDENCE:
+        return "light", f"confidence {confidence:.2f} below {ANALYSIS_FULL_MIN_CONFIDENCE}"
+    completeness = data_completeness(analysis_data)
+    if completeness < ANALYSIS_FULL_MIN_COMPLETENESS:
+        return "light", f"data completeness {completeness:.2f} below {ANALYSIS_FULL_MIN_COMPLETENESS}"
+    return "full", None
+
+def build_bedrock_request(analysis_data, tier="full"):
+    """
+    Bedrock Messages API request body for one landmark analysis
+    """
+    # Alternative models if the default doesn't work (set BEDROCK_MODEL_ID):
+    # anthropic.claude-instant-v1
+    # amazon.titan-text-express-v1
+    light = tier == "light"
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "system": "Respond with only valid JSON. No code fences, no explanations, no trailing commas.",
+        "max_tokens": LIGHT_ANALYSIS_MAX_TOKENS if light else 3000,
+        "messages": [
+            { "role": "user", "content": create_light_analysis_prompt(analysis_data) if light else create_analysis_prompt(analysis_data) }
+        ]
+    }
+
+def analyze_with_bedrock(analysis_data, deadline=None, tier="full"):
     """
-    Use Amazon Bedrock to analyze landmark and travel data
+    Use Amazon Bedrock to analyze landmark and travel data.
+    Returns ``(analysis, usage)``; usage is None when the call failed.
     """
     try:
-        # Prepare the prompt for Bedrock
-        prompt = create_analysis_prompt(analysis_data)
+        request_body = build_bedrock_request(analysis_data, tier)
+        light = tier == "light"
         
-        # Use Claude 3 Haiku for analysis (more commonly available)
-        model_id = "anthropic.claude-3-haiku-20240307-v1:0"
-        
-        # Alternative models if the above doesn't work:
-        # model_id = "anthropic.claude-instant-v1"
-        # model_id = "amazon.titan-text-express-v1"
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "system": "Respond with only valid JSON. No code fences, no explanations, no trailing commas.",
-            "max_tokens": 3000,
-            "messages": [
-                { "role": "user", "content": prompt }
-            ]
-        }
-        
-        response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps(request_body)
+        client = get_bedrock_client(deadline.remaining() if deadline else None)
+        response_body, usage = invoke_model(
+            client, BEDROCK_LIGHT_MODEL_ID if light else BEDROCK_MODEL_ID, request_body,
+            function="landmark_analyzer",
+            prompt_version=LIGHT_ANALYSIS_PROMPT_VERSION if light else ANALYSIS_PROMPT_VERSION
         )
-        
-        response_body = json.loads(response['body'].read())
         analysis_text = response_body['content'][0]['text']
         
         # Parse the analysis into structured format
         structured_analysis = parse_bedrock_response(analysis_text)
         
-        return structured_analysis
+        return structured_analysis, usage
         
     except Exception as e:
         logger.error(f"Error calling Bedrock: {str(e)}")
-        return {
-            "summary": "Unable to generate AI analysis due to technical issues",
-            "insights": [],
-            "travel_tips": [],
-            "best_visit_time": "Check weather data for optimal timing",
-            "safety_rating": "3 - Moderate",
-            "cultural_highlights": "See country information for cultural context",
-            "travel_advisory": {
-                "level": "Exercise normal precautions",
-                "summary": "Travel advisory information unavailable due to technical issues",
-                "recommendations": []
-            }
+        return fallback_analysis("Unable to generate AI analysis due to technical issues"), None
+
+def fallback_analysis(summary):
+    """
+    Placeholder analysis used when Bedrock is unavailable or skipped
+    """
+    return {
+        "summary": summary,
+        "insights": [],
+        "travel_tips": [],
+        "best_visit_time": "Check weather data for optimal timing",
+        "safety_rating": "3 - Moderate",
+        "cultural_highlights": "See country information for cultural context",
+        "travel_advisory": {
+            "level": "Exercise normal precautions",
+            "summary": "Travel advisory information unavailable due to technical issues",
+            "recommendations": []
         }
+    }
 
 def create_analysis_prompt(analysis_data):
     """
     Create a comprehensive prompt for Bedrock analysis
     """
-    landmark = analysis_data.get('landmark', {})
-    weather = analysis_data.get('weather', {})
-    country_info = analysis_data.get('country_info', {})
+    analysis_data = AnalysisData.coerce(analysis_data)
+    landmark = analysis_data.landmark or Landmark()
+    weather = analysis_data.weather
+    country_info = analysis_data.country_info
     
     prompt = f"""
 You are a travel expert analyzing a landmark for a traveler. Please provide a comprehensive analysis based on the following data:
 
 **LANDMARK INFORMATION:**
-- Name: {landmark.get('name', 'Unknown')}
-- Description: {landmark.get('description', 'No description available')}
-- Confidence: {landmark.get('confidence', 0)}
-- Location: {landmark.get('location', {})}
+- Name: {'Unknown' if landmark.name is None else landmark.name}
+- Description: {'No description available' if landmark.description is None else landmark.description}
+- Confidence: {landmark.confidence or 0}
+- Location: {landmark.location.to_dict() if landmark.location else {}}
 
 **WEATHER INFORMATION:**
-{json.dumps(weather, indent=2) if weather else 'No weather data available'}
+{json_codec.dumps(weather.prompt_dict(), indent=2, stable=True) if weather else 'No weather data available'}
 
 **COUNTRY INFORMATION:**
-{json.dumps(country_info, indent=2) if country_info else 'No country data available'}
+{json_codec.dumps(country_info, indent=2, stable=True) if country_info else 'No country data available'}
 
 Please provide your analysis in the following JSON format:
 
@@ -248,6 +440,86 @@ Focus on providing actionable, practical advice for travelers. Consider weather
     
     return prompt
 
+def create_light_analysis_prompt(analysis_data):
+    """
+    Short prompt for the light tier: the same JSON fields with brief content
+    """
+    analysis_data = AnalysisData.coerce(analysis_data)
+    landmark = analysis_data.landmark or Landmark()
+    weather = analysis_data.weather
+    capital = analysis_data.country_info.capital if analysis_data.country_info else None
+    place = analysis_data.location.place or "unknown location"
+    conditions = f"{weather.conditions or 'unknown'}, {weather.current_temperature}°C" if weather else "unknown"
+
+    return f"""
+A traveler photographed what may be {landmark.name or 'an unidentified landmark'} ({place}); the detection is uncertain.
+Current weather: {conditions}. Capital: {', '.join(capital or []) or 'unknown'}.
+
+Answer briefly in this JSON format, with one sentence per field and at most two items per list:
+
+{{
+    "summary": "...",
+    "insights": ["..."],
+    "travel_tips": ["..."],
+    "best_visit_time": "...",
+    "safety_rating": "1-5 rating",
+    "cultural_highlights": "...",
+    "travel_advisory": {{"level": "...", "summary": "...", "recommendations": ["..."]}}
+}}
+"""
+
+def template_analysis(analysis_data):
+    """
+    Deterministic analysis built from the detection and enrichment data, without Bedrock
+    """
+    analysis_data = AnalysisData.coerce(analysis_data)
+    landmark = analysis_data.landmark or Landmark()
+    location = analysis_data.location
+    weather = analysis_data.weather
+    country_info = analysis_data.country_info
+
+    name = landmark.name or "Unknown Landmark"
+    place = location.place
+    if name == "Unknown Landmark":
+        summary = f"No specific landmark was identified in this image ({landmark.description or 'no description'})."
+    else:
+        summary = f"{name}{f' in {place}' if place else ''}. {landmark.description or ''}".strip()
+
+    insights = []
+    if country_info and country_info.capital:
+        insights.append(f"Capital of {country_info.common_name or location.country}: {', '.join(country_info.capital)}")
+    if country_info and country_info.region:
+        insights.append(f"Region: {country_info.region}")
+    if weather:
+        temperature = weather.current_temperature
+        insights.append(f"Current weather: {weather.conditions or 'Unknown conditions'}"
+                        + (f", {temperature}°C" if temperature is not None else ""))
+
+    languages = list((country_info.languages or {}).values()) if country_info else []
+    # No safety rating is made up; an advisory is only passed on when the request carried a real one
+    advisory = analysis_data.travel_advisory
+    return {
+        "summary": summary,
+        "insights": insights,
+        "travel_tips": [],
+        "best_visit_time": "Check weather data for optimal timing",
+        "safety_rating": None,
+        "cultural_highlights": f"Languages: {', '.join(languages)}" if languages else "See country information for cultural context",
+        "travel_advisory": advisory.to_dict() if advisory else None
+    }
+
+def as_analysis(travel_analysis):
+    """
+    Analysis record from a parsed analysis; output that does not have the
+    expected shape keeps what fits or becomes the fallback analysis
+    """
+    if isinstance(travel_analysis, Analysis):
+        return travel_analysis
+    if not isinstance(travel_analysis, dict):
+        return Analysis.from_dict(fallback_analysis("Unable to parse the analysis"))
+    if not isinstance(travel_analysis.get('travel_advisory'), (dict, type(None))):
+        travel_analysis = dict(travel_analysis, travel_advisory=None)
+    return Analysis.from_dict(travel_analysis) or Analysis()
 
 def parse_bedrock_response(response_text):
     try:
@@ -261,7 +533,7 @@ def parse_bedrock_response(response_text):
         end_idx = cleaned.rfind('}') + 1
         if start_idx != -1 and end_idx > start_idx:
             json_str = cleaned[start_idx:end_idx]
-            return json.loads(json_str)
+            return json_codec.loads(json_str)
     except Exception:
         pass
 
@@ -286,48 +558,52 @@ def generate_recommendations(analysis_data, travel_analysis):
         "safety_advice": []
     }
     
+    analysis_data = AnalysisData.coerce(analysis_data)
+    travel_analysis = as_analysis(travel_analysis)
+
     # Weather-based recommendations
-    weather = analysis_data.get('weather', {})
+    weather = analysis_data.weather
     if weather:
-        temp = weather.get('temperature', {})
-        if temp:
-            current_temp = temp.get('current', 0)
+        current_temp = weather.current_temperature
+        if current_temp is not None:
             if current_temp < 10:
                 recommendations["packing_tips"].append("Pack warm clothing - temperatures are cold")
             elif current_temp > 25:
                 recommendations["packing_tips"].append("Pack light clothing - temperatures are warm")
         
-        conditions = weather.get('conditions', '')
+        conditions = weather.conditions or ''
         if 'rain' in conditions.lower():
             recommendations["packing_tips"].append("Bring rain gear - precipitation expected")
         elif 'sunny' in conditions.lower():
             recommendations["packing_tips"].append("Don't forget sunscreen and hat")
     
     # Country-based recommendations
-    country_info = analysis_data.get('country_info', {})
+    country_info = analysis_data.country_info
     if country_info:
-        currency = country_info.get('currencies', [{}])[0].get('name', '')
+        currency = (country_info.currencies or [{}])[0].get('name', '')
         if currency:
             recommendations["cultural_notes"].append(f"Local currency: {currency}")
         
-        languages = country_info.get('languages', {})
+        languages = country_info.languages
         if languages:
-            primary_language = list(languages.keys())[0] if languages else "English"
+            primary_language = list(languages.keys())[0]
             recommendations["cultural_notes"].append(f"Primary language: {primary_language}")
     
     # Travel advisory recommendations from Bedrock analysis
-    travel_advisory = travel_analysis.get('travel_advisory', {})
+    travel_advisory = travel_analysis.travel_advisory
     if travel_advisory:
-        level = travel_advisory.get('level', '')
+        level = travel_advisory.level or ''
         if any(keyword in level.lower() for keyword in ['increased caution', 'reconsider travel', 'do not travel']):
             recommendations["safety_advice"].append(f"Travel advisory level: {level}")
         
-        advisory_recommendations = travel_advisory.get('recommendations', [])
+        advisory_recommendations = travel_advisory.recommendations
         if advisory_recommendations:
             recommendations["safety_advice"].extend(advisory_recommendations[:2])  # Add first 2 recommendations
     
     # Timing recommendations from analysis
-    if travel_analysis.get('best_visit_time'):
-        recommendations["timing_recommendations"].append(travel_analysis['best_visit_time'])
+    if travel_analysis.best_visit_time:
+        recommendations["timing_recommendations"].append(travel_analysis.best_visit_time)
     
-    return recommendations 
\ No newline at end of file
+    return recommendations
+
+warm_up_on_init(warm_up)
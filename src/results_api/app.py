@@ -0,0 +1,115 @@
+import logging
+import time
+from datetime import datetime
+
+# Import shared utilities
+from shared import json_codec
+from shared.results_store import get_results_store, summary
+from shared.warmup import (
+    is_warmup_event,
+    run_warmup,
+    warm_knowledge_base,
+    warm_up_on_init,
+    warmup_response,
+)
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_LIMIT = 50
+
+def warm_up():
+    """
+    Open the results store and load bundled indexes
+    """
+    return run_warmup("results_api", [
+        ("results_store", lambda: type(get_results_store()).__name__),
+        ("knowledge_base", warm_knowledge_base)
+    ])
+
+def lambda_handler(event, context):
+    """
+    Lambda function to look up past analyses by id, landmark, country, image or date
+
+    GET /history?landmark=&country=&image_url=&since=&until=&kind=&limit=
+    GET /history/latest?landmark=|image_url=
+    GET /history/{result_id}
+    """
+    if is_warmup_event(event):
+        return warmup_response(warm_up())
+
+    try:
+        store = get_results_store()
+        if store is None:
+            return error_response(503, "Results store is not configured")
+
+        params = event.get('queryStringParameters') or {}
+        result_id = (event.get('pathParameters') or {}).get('result_id') or event.get('result_id')
+        started = time.monotonic()
+
+        if result_id == 'latest':
+            if not params.get('landmark') and not params.get('image_url'):
+                return error_response(400, "latest needs a landmark or image_url")
+            record = store.latest(landmark=params.get('landmark'), image_url=params.get('image_url'),
+                                  kind=params.get('kind'))
+            if record is None:
+                return error_response(404, "No results found")
+            return success_response({"result": record, "query_ms": elapsed_ms(started)})
+
+        if result_id:
+            record = store.get(result_id)
+            if record is None:
+                return error_response(404, f"Result {result_id} not found")
+            return success_response({"result": record, "query_ms": elapsed_ms(started)})
+
+        try:
+            limit = int(params.get('limit') or DEFAULT_LIMIT)
+        except ValueError:
+            return error_response(400, "limit must be a number")
+        results = store.query(
+            landmark=params.get('landmark'),
+            country_code=params.get('country'),
+            image_url=params.get('image_url'),
+            since=params.get('since'),
+            until=params.get('until'),
+            kind=params.get('kind'),
+            limit=max(1, limit)
+        )
+        return success_response({
+            "results": [summary(record) for record in results],
+            "count": len(results),
+            "query_ms": elapsed_ms(started)
+        })
+
+    except Exception as e:
+        logger.error(f"Error in results lookup: {str(e)}")
+        return error_response(500, str(e))
+
+def elapsed_ms(started):
+    return round((time.monotonic() - started) * 1000, 2)
+
+def success_response(body):
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps(dict(body, timestamp=datetime.utcnow().isoformat()))
+    }
+
+def error_response(status_code, message):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps({
+            "error": message,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    }
+
+warm_up_on_init(warm_up)
@@ -0,0 +1,343 @@
+"""
+Long-running HTTP service that hosts the image processor and landmark analyzer.
+
+On Lambda each container handles one event at a time, so its connection
+pools, caches and warm state serve a single request. This service runs the
+same handlers in one process for container deployments under sustained
+load:
+
+  - ``POST /analyze-image`` and ``POST /analyze-landmark`` take the same
+    bodies (and ``fields=``/``profile=`` query parameters) as the API
+    Gateway routes. Requests are turned into proxy events and run through
+    the unchanged ``lambda_handler`` functions, so idempotency, response
+    shaping, deadlines and metrics behave as on Lambda.
+  - ``GET /health`` reports in-flight requests and Vision batch statistics.
+  - An asyncio loop accepts and parses connections (HTTP/1.1 keep-alive).
+    The handlers do blocking I/O, so they run on a worker pool of
+    ``SERVICE_WORKERS`` threads. All of them share one HTTP session (its
+    pool is sized to match), the weather, country and negative caches,
+    breakers, limiters and the knowledge base.
+  - Vision calls from concurrent requests are micro-batched: images
+    submitted within ``VISION_BATCH_WINDOW_MS`` (5 ms by default here) go
+    out as one multi-image ``images:annotate`` call (see
+    ``shared/micro_batch.py``).
+
+Each request gets a deadline of ``SERVICE_REQUEST_TIMEOUT_MS``, as a
+Lambda invocation gets its function timeout.
+
+Usage (from ``src/``):
+    python -m service.app --port 8080
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from shared import http_client, json_codec, micro_batch
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+
+# Handler threads; each request holds one for its whole run
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "64"))
+
+# Per-request budget, the equivalent of the Lambda function timeout
+SERVICE_REQUEST_TIMEOUT_MS = int(os.getenv("SERVICE_REQUEST_TIMEOUT_MS", "29000"))
+
+# Largest request body accepted, and how long an idle keep-alive connection stays open
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(1024 * 1024)))
+SERVICE_KEEPALIVE_SECONDS = float(os.getenv("SERVICE_KEEPALIVE_SECONDS", "75"))
+
+# Vision micro-batch window; batching is on by default in the service
+SERVICE_VISION_BATCH_WINDOW_MS = float(os.getenv("VISION_BATCH_WINDOW_MS", "5"))
+
+ROUTES = {
+    "/analyze-image": "image_processor",
+    "/analyze-landmark": "landmark_analyzer",
+}
+
+
+class ServiceContext:
+    """
+    Lambda context stand-in carrying the request deadline
+    """
+
+    def __init__(self, function_name: str, timeout_ms: int):
+        self.function_name = function_name
+        self.aws_request_id = uuid.uuid4().hex
+        self._deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+
+class BadRequest(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def load_handlers() -> Dict[str, Any]:
+    import image_processor.app as image_app
+    import landmark_analyzer.app as landmark_app
+    return {"image_processor": image_app, "landmark_analyzer": landmark_app}
+
+
+class Service:
+    """
+    Asyncio HTTP front end running the Lambda handlers on a shared worker pool
+    """
+
+    def __init__(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT, workers: int = SERVICE_WORKERS,
+                 request_timeout_ms: int = SERVICE_REQUEST_TIMEOUT_MS,
+                 batch_window_ms: float = SERVICE_VISION_BATCH_WINDOW_MS):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.request_timeout_ms = request_timeout_ms
+        self.batch_window_ms = batch_window_ms
+        self.modules: Dict[str, Any] = {}
+        self.inflight = 0
+        self.served = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._previous_window_ms = micro_batch.VISION_BATCH_WINDOW_MS
+        # Open connections by serving task, and the tasks handling a request right now
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: Set[asyncio.Task] = set()
+        self._closing = False
+
+    def configure(self) -> None:
+        """
+        Process-wide setup shared by every request: pools, batching, handler modules
+        """
+        # One pooled connection per handler thread and upstream host
+        if http_client.HTTP_POOL_SIZE < self.workers:
+            http_client.HTTP_POOL_SIZE = self.workers
+            http_client.reset_session()
+        micro_batch.VISION_BATCH_WINDOW_MS = self.batch_window_ms
+        self.modules = load_handlers()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="handler")
+
+    async def start(self) -> None:
+        if not self.modules:
+            self.configure()
+        loop = asyncio.get_running_loop()
+        # Open upstream connections and load indexes before taking traffic
+        for module in self.modules.values():
+            await loop.run_in_executor(self._executor, module.warm_up)
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port,
+                                                  limit=SERVICE_MAX_BODY_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Service listening on {self.host}:{self.port} with {self.workers} workers, "
+                    f"Vision batch window {self.batch_window_ms}ms")
+
+    async def stop(self) -> None:
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Idle keep-alive connections are dropped; busy ones close after their response
+        for task, writer in list(self._connections.items()):
+            if task not in self._busy:
+                writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._executor is not None:
+            # Requests already running finish before the pool goes away
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        micro_batch.VISION_BATCH_WINDOW_MS = self._previous_window_ms
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Not the main thread, or no signal support on this platform
+                pass
+        await stop.wait()
+        logger.info("Shutting down")
+        await self.stop()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while not self._closing:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), SERVICE_KEEPALIVE_SECONDS)
+                except BadRequest as e:
+                    await write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self._busy.add(task)
+                method, target, headers, body = request
+                status, response_headers, payload = await self.dispatch(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and not self._closing
+                await write_response(writer, status, payload, response_headers, keep_alive)
+                self._busy.discard(task)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            self._busy.discard(task)
+            writer.close()
+
+    async def dispatch(self, method: str, target: str, headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        """
+        Route one request; returns ``(status, headers, body)``
+        """
+        url = urlsplit(target)
+        if url.path == "/health" and method == "GET":
+            return 200, {}, {"status": "ok", "inflight": self.inflight, "served": self.served,
+                             "vision_batches": micro_batch.batcher_stats()}
+        route = ROUTES.get(url.path)
+        if route is None:
+            return 404, {}, {"error": f"No route for {url.path}"}
+        if method == "OPTIONS":
+            return 204, {"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "POST, OPTIONS",
+                         "Access-Control-Allow-Headers": "*"}, b""
+        if method != "POST":
+            return 405, {"Allow": "POST, OPTIONS"}, {"error": f"{method} not allowed"}
+
+        # API Gateway proxy event, as the handlers receive it on Lambda
+        event = {
+            "httpMethod": method,
+            "path": url.path,
+            "headers": headers,
+            "queryStringParameters": dict(parse_qsl(url.query)) or None,
+            "body": body.decode("utf-8") if body else None,
+            "isBase64Encoded": False,
+        }
+        context = ServiceContext(route, self.request_timeout_ms)
+        handler = self.modules[route].lambda_handler
+        self.inflight += 1
+        try:
+            response = await asyncio.get_running_loop().run_in_executor(self._executor, handler, event, context)
+        except Exception as e:
+            logger.error(f"Unhandled error in {route}: {str(e)}")
+            return 500, {}, {"error": str(e)}
+        finally:
+            self.inflight -= 1
+            self.served += 1
+
+        payload = response.get("body") or b""
+        if response.get("isBase64Encoded"):
+            payload = base64.b64decode(payload)
+        return response.get("statusCode", 200), response.get("headers") or {}, payload
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Read one HTTP/1.1 request; None when the client closed the connection
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding"):
+        raise BadRequest(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > SERVICE_MAX_BODY_BYTES:
+        raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {SERVICE_MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, payload: Any,
+                         headers: Optional[Dict[str, str]] = None, keep_alive: bool = True) -> None:
+    if isinstance(payload, (bytes, bytearray)):
+        data = bytes(payload)
+    elif isinstance(payload, str):
+        data = payload.encode("utf-8")
+    else:
+        data = json_codec.dumps_bytes(payload)
+    headers = dict(headers or {})
+    headers.setdefault("Content-Type", "application/json")
+    headers["Content-Length"] = str(len(data))
+    headers["Connection"] = "keep-alive" if keep_alive else "close"
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    head = f"HTTP/1.1 {status} {reason}\r\n" + "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(head.encode("latin-1") + b"\r\n" + data)
+    await writer.drain()
+
+
+class BackgroundService:
+    """
+    A Service running on its own event loop thread, for tests and benchmarks
+    """
+
+    def __init__(self, **kwargs):
+        self.service = Service(**kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="service-loop", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.service.port}"
+
+    def start(self) -> "BackgroundService":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.service.start(), self._loop).result()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.service.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="LambdaTrip image and landmark analysis service")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--batch-window-ms", type=float, default=SERVICE_VISION_BATCH_WINDOW_MS,
+                        help="Vision micro-batch window; 0 sends every image on its own")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    service = Service(args.host, args.port, args.workers, batch_window_ms=args.batch_window_ms)
+    asyncio.run(service.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
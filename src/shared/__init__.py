@@ -8,10 +8,30 @@ from .api_helpers import (
     get_travel_advisory,
     format_weather_summary
 )
+from .models import (
+    SCHEMA_VERSION,
+    Advisory,
+    Analysis,
+    AnalysisData,
+    CountryInfo,
+    Landmark,
+    Location,
+    SchemaVersionError,
+    Weather
+)
 
 __all__ = [
     'get_weather',
     'get_country_info', 
     'get_travel_advisory',
-    'format_weather_summary'
+    'format_weather_summary',
+    'SCHEMA_VERSION',
+    'Advisory',
+    'Analysis',
+    'AnalysisData',
+    'CountryInfo',
+    'Landmark',
+    'Location',
+    'SchemaVersionError',
+    'Weather'
 ] 
\ No newline at end of file
@@ -2,9 +2,29 @@ import requests
 import logging
 import json
 import os
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, Hashable, Tuple, Union
+from datetime import datetime, timezone
+from .cache import TTLCache
+from .circuit_breaker import get_breaker
 from .country_codes import COUNTRY_CODES
+from .deadline import Deadline, stage_timeout
+from .geocoding import geocode
+from .http_client import get_session
+from .metrics import put_metric
+from .models import Advisory, CountryInfo, Weather
+from .rate_limit import get_limiter
+from .upstream_timeouts import get_upstream_timeout
+from .weather_cache import (
+    CELL_HEAT,
+    WEATHER_CACHE,
+    WEATHER_CACHE_TTL,
+    WEATHER_HOT_CELLS,
+    WEATHER_STALE_MAX,
+    cells_due,
+    decode_geohash,
+    encode_geohash,
+    ensure_refresher,
+)
 
 # Load environment variables from .env file
 try:
@@ -17,67 +37,31 @@ except ImportError:
 logger = logging.getLogger()
 
 # Google Weather API configuration
-GOOGLE_GEOCODING_API_KEY = os.getenv("GOOGLE_GEOCODING_API_KEY")
 GOOGLE_WEATHER_API_KEY = os.getenv("GOOGLE_WEATHER_API_KEY")
-GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
 GOOGLE_WEATHER_URL = "https://weather.googleapis.com/v1/currentConditions:lookup"
 
 # API Configuration
 RESTCOUNTRIES_BASE_URL = "https://restcountries.com/v3.1"
 SMART_TRAVELLER_BASE_URL = "https://smartraveller.kevle.xyz/api/"
 
-# Maps.co Geocoding API configuration
-GEOCODE_API_KEY = os.getenv("GEOCODE_API_KEY")
+# Last known good responses, served when an upstream circuit is open or a call fails
+COUNTRY_INFO_CACHE = TTLCache(maxsize=256, ttl=24 * 3600)
+TRAVEL_ADVISORY_CACHE = TTLCache(maxsize=256, ttl=6 * 3600)
 
-def geocode_city_country(query: str) -> Dict[str, Optional[str]]:
-    try:
-        base_url = "https://geocode.maps.co/search"
-        params = {"q": query, "format": "json", "addressdetails": 1, "limit": 1}
-        if GEOCODE_API_KEY:
-            params["api_key"] = GEOCODE_API_KEY
-        response = requests.get(
-            base_url,
-            params=params,
-            timeout=15,
-            headers={"User-Agent": "LambdaTrip/1.0 (contact@example.com)"}
-        )
-        response.raise_for_status()
-        results = response.json() or []
-        if not results:
-            return {"city": None, "country": None}
-
-        top = results[0]
-        address = top.get("address", {}) or {}
-        city = (
-            address.get("city") or address.get("town") or address.get("village")
-            or address.get("hamlet") or address.get("municipality")
-            or address.get("suburb") or address.get("county")
-        )
-        country = address.get("country")
-        country_code = (address.get("country_code") or "").upper() or None
-
-        if (not city or not country) and top.get("display_name"):
-            parts = [p.strip() for p in top["display_name"].split(",") if p.strip()]
-            if parts:
-                country = country or parts[-1]
-                if not city and len(parts) >= 3:
-                    city = parts[-4] if len(parts) >= 4 else parts[-3]
-
-        return {"city": city, "country": country, "country_code": country_code}
-    except requests.RequestException:
-        logger.warning(f"Geocoding request failed for '{query}'")
-        return {"city": None, "country": None, "country_code": None}
-    except Exception:
-        logger.error(f"Unexpected error during geocoding for '{query}'")
-        return {"city": None, "country": None, "country_code": None}
+def geocode_city_country(query: str, deadline: Optional[Deadline] = None) -> Dict[str, Optional[str]]:
+    """
+    Resolve a landmark or place name to city/country, hedging across geocoding providers
+    """
+    return geocode(query, deadline)
 
-def get_weather(city: str, country: str) -> Optional[Dict[str, Any]]:
+def get_weather(city: str, country: str, deadline: Optional[Deadline] = None,
+                coordinates: Optional[Tuple[float, float]] = None) -> Optional[Weather]:
     """
-    Get weather information for a city using Google Weather API
+    Get weather information for a city using Google Weather API.
+    Pass known ``(lat, lng)`` coordinates to skip geocoding the city.
+    Conditions are shared by every lookup in the same geohash cell for
+    ``WEATHER_CACHE_TTL_MINUTES``; ``as_of`` says when they were fetched.
     """
-    if not GOOGLE_GEOCODING_API_KEY:
-        logger.warning("Google Geocoding API key not configured")
-        return None
     if not GOOGLE_WEATHER_API_KEY:
         logger.warning("Google Weather API key not configured")
         return None
@@ -85,65 +69,54 @@ def get_weather(city: str, country: str) -> Optional[Dict[str, Any]]:
     try:
         # Use Google Weather API
         location = f"{city},{country}"
-        url = GOOGLE_GEOCODE_URL
-        params = {
-            "address": location,
-            "key": GOOGLE_GEOCODING_API_KEY
-        }
         
-        # First, geocode the location
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        
-        geocode_data = response.json()
-        if not geocode_data.get('results'):
+        # First, geocode the location (Google first for city names, maps.co as the hedge)
+        if coordinates is not None:
+            lat, lng = coordinates
+        else:
+            geocoded = geocode(location, deadline, providers=("google", "maps_co"))
+            lat = geocoded.get('lat')
+            lng = geocoded.get('lng')
+        if lat is None or lng is None:
             logger.warning(f"No geocoding results for {location}")
             return None
         
-        # Extract coordinates
-        location_data = geocode_data['results'][0]['geometry']['location']
-        lat = location_data['lat']
-        lng = location_data['lng']
-        
-        # Get weather data using coordinates
-        weather_params = {
-            "key": GOOGLE_WEATHER_API_KEY,
-            "location.latitude": lat,
-            "location.longitude": lng
-        }
-        
-        weather_response = requests.get(GOOGLE_WEATHER_URL, params=weather_params, timeout=10)
-        weather_response.raise_for_status()
-        
-        weather_data = weather_response.json()
-        
-        # Parse weather data (Google's response structure)
-        # See: https://developers.google.com/maps/documentation/weather/reference/rest/v1/currentConditions/lookup
-        # Example fields: temperature, feelsLikeTemperature, weatherCondition, relativeHumidity, wind, precipitation, isDaytime, uvIndex
-        try:
-            # Google Weather API may return either a 'currentConditions' list or a flat dict
-            if "currentConditions" in weather_data and weather_data["currentConditions"]:
-                current = weather_data["currentConditions"][0]
+        cell = encode_geohash(lat, lng)
+        conditions = None
+        stale = False
+        if WEATHER_CACHE_TTL > 0:
+            ensure_refresher(refresh_hot_weather_cells)
+            CELL_HEAT.touch(cell)
+            conditions = WEATHER_CACHE.get(cell)
+        if conditions is not None:
+            put_metric("WeatherCache", 1, dimensions={"Result": "hit"})
+        else:
+            timeout = stage_timeout(deadline, 10)
+            try:
+                if timeout is None:
+                    logger.warning(f"Request deadline reached before weather lookup for {location}")
+                elif WEATHER_CACHE_TTL > 0:
+                    # Fetched at the cell centre so every lookup in the cell can share it
+                    conditions = fetch_current_conditions(*decode_geohash(cell), cell, timeout)
+                else:
+                    conditions = fetch_current_conditions(lat, lng, (round(lat, 3), round(lng, 3)), timeout)
+            except requests.RequestException as e:
+                logger.error(f"Error getting weather data: {str(e)}")
+            if conditions is not None:
+                if WEATHER_CACHE_TTL > 0:
+                    WEATHER_CACHE.set(cell, conditions)
+                put_metric("WeatherCache", 1, dimensions={"Result": "miss"})
             else:
-                current = weather_data
-        except (KeyError, IndexError):
-            logger.error(f"Unexpected Google Weather API response: {weather_data}")
-            return None
-
-        # Extract relevant fields
-        temperature = current.get("temperature", {}).get("degrees")
-        feels_like = current.get("feelsLikeTemperature", {}).get("degrees")
-        condition = current.get("weatherCondition", {}).get("type")
-        condition_text = current.get("weatherCondition", {}).get("description", {}).get("text")
-        humidity = current.get("relativeHumidity")
-        wind_speed = current.get("wind", {}).get("speed", {}).get("value")
-        precipitation_chance = current.get("precipitation", {}).get("probability", {}).get("percent")
-        is_daytime = current.get("isDaytime")
-        uv_index = current.get("uvIndex")
+                # Recently fetched conditions beat none while Google Weather is slow or failing
+                conditions = WEATHER_CACHE.get_stale(cell)
+                if conditions is None or datetime.now().timestamp() - conditions["fetched_at"] > WEATHER_STALE_MAX:
+                    return None
+                stale = True
+                put_metric("WeatherCache", 1, dimensions={"Result": "stale"})
 
         # Format weather information
-        weather_info = {
-            "location": {
+        weather_info = Weather(
+            location={
                 "city": city,
                 "country": country,
                 "coordinates": {
@@ -151,43 +124,129 @@ def get_weather(city: str, country: str) -> Optional[Dict[str, Any]]:
                     "lng": lng
                 }
             },
-            "temperature": {
-                "current": temperature,
-                "feels_like": feels_like,
+            temperature={
+                "current": conditions["temperature"],
+                "feels_like": conditions["feels_like"],
                 "min": None,  # Google Weather API doesn't provide min/max in current conditions
                 "max": None
             },
-            "conditions": condition_text or condition or "Unknown conditions",
-            "humidity": humidity,
-            "wind_speed": wind_speed,
-            "timestamp": datetime.now().timestamp(),
+            conditions=conditions["condition_text"] or conditions["condition"] or "Unknown conditions",
+            humidity=conditions["humidity"],
+            wind_speed=conditions["wind_speed"],
+            timestamp=conditions["fetched_at"],
             # Additional Google Weather API fields
-            "condition": condition,
-            "condition_text": condition_text,
-            "precipitation_chance": precipitation_chance,
-            "is_daytime": is_daytime,
-            "uv_index": uv_index
-        }
+            condition=conditions["condition"],
+            condition_text=conditions["condition_text"],
+            precipitation_chance=conditions["precipitation_chance"],
+            is_daytime=conditions["is_daytime"],
+            uv_index=conditions["uv_index"],
+            # Freshness: when the conditions were fetched and for which cell
+            as_of=datetime.fromtimestamp(conditions["fetched_at"], timezone.utc).isoformat(),
+            age_seconds=round(max(datetime.now().timestamp() - conditions["fetched_at"], 0.0), 1),
+            geohash=cell,
+            stale=True if stale else None
+        )
         
         logger.info(f"Weather data retrieved for {city}, {country}")
         return weather_info
         
-    except requests.RequestException as e:
-        logger.error(f"Error getting weather data: {str(e)}")
-        return None
     except Exception as e:
         logger.error(f"Unexpected error in weather API: {str(e)}")
         return None
 
-def get_country_info(country_name: str) -> Optional[Dict[str, Any]]:
+def fetch_current_conditions(lat: float, lng: float, key: Hashable, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    Fetch and parse Google Weather current conditions at a point
+    """
+    weather_params = {
+        "key": GOOGLE_WEATHER_API_KEY,
+        "location.latitude": lat,
+        "location.longitude": lng
+    }
+    def fetch_weather(attempt_timeout):
+        weather_response = get_session().get(GOOGLE_WEATHER_URL, params=weather_params, timeout=attempt_timeout)
+        weather_response.raise_for_status()
+        return weather_response.json()
+
+    # Concurrent requests for the same spot share one call
+    weather_data = get_limiter("google_weather").call(
+        key, lambda: get_upstream_timeout("google_weather").call(fetch_weather, timeout), timeout)
+
+    # Parse weather data (Google's response structure)
+    # See: https://developers.google.com/maps/documentation/weather/reference/rest/v1/currentConditions/lookup
+    # Example fields: temperature, feelsLikeTemperature, weatherCondition, relativeHumidity, wind, precipitation, isDaytime, uvIndex
+    try:
+        # Google Weather API may return either a 'currentConditions' list or a flat dict
+        if "currentConditions" in weather_data and weather_data["currentConditions"]:
+            current = weather_data["currentConditions"][0]
+        else:
+            current = weather_data
+    except (KeyError, IndexError, TypeError):
+        logger.error(f"Unexpected Google Weather API response: {weather_data}")
+        return None
+
+    # Extract relevant fields
+    return {
+        "temperature": current.get("temperature", {}).get("degrees"),
+        "feels_like": current.get("feelsLikeTemperature", {}).get("degrees"),
+        "condition": current.get("weatherCondition", {}).get("type"),
+        "condition_text": current.get("weatherCondition", {}).get("description", {}).get("text"),
+        "humidity": current.get("relativeHumidity"),
+        "wind_speed": current.get("wind", {}).get("speed", {}).get("value"),
+        "precipitation_chance": current.get("precipitation", {}).get("probability", {}).get("percent"),
+        "is_daytime": current.get("isDaytime"),
+        "uv_index": current.get("uvIndex"),
+        "fetched_at": datetime.now().timestamp()
+    }
+
+def refresh_hot_weather_cells(top_n: Optional[int] = None) -> Dict[str, int]:
+    """
+    Refetch conditions for the hottest cells that are close to expiring
+    """
+    refreshed = failed = 0
+    if GOOGLE_WEATHER_API_KEY and WEATHER_CACHE_TTL > 0:
+        for cell in cells_due(WEATHER_HOT_CELLS if top_n is None else top_n):
+            try:
+                conditions = fetch_current_conditions(*decode_geohash(cell), cell, 10)
+            except requests.RequestException as e:
+                logger.warning(f"Weather refresh for cell {cell} failed: {str(e)}")
+                conditions = None
+            if conditions is None:
+                failed += 1
+                continue
+            WEATHER_CACHE.set(cell, conditions)
+            refreshed += 1
+        if refreshed:
+            put_metric("WeatherCellsRefreshed", refreshed)
+    return {"refreshed": refreshed, "failed": failed, "cached": len(WEATHER_CACHE)}
+
+def get_country_info(country_name: str, deadline: Optional[Deadline] = None) -> Optional[CountryInfo]:
     """
     Get country information using RestCountries API
     """
+    cache_key = country_name.strip().lower()
+    timeout = stage_timeout(deadline, 10)
+    if timeout is None:
+        logger.warning(f"Request deadline reached, skipping country info for {country_name}")
+        return COUNTRY_INFO_CACHE.get_stale(cache_key)
+
+    breaker = get_breaker("restcountries")
+    if not breaker.allow_request():
+        logger.warning(f"RestCountries circuit open, using cached country info for {country_name}")
+        return COUNTRY_INFO_CACHE.get_stale(cache_key)
     try:
         # Search by country name
         url = f"{RESTCOUNTRIES_BASE_URL}/name/{country_name}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        def fetch(attempt_timeout):
+            response = get_session().get(url, timeout=attempt_timeout)
+            response.raise_for_status()
+            return response
+        try:
+            response = get_upstream_timeout("restcountries").call(fetch, timeout)
+        except requests.RequestException as e:
+            breaker.record_exception(e)
+            raise
+        breaker.record_success()
         
         countries_data = response.json()
         if not countries_data:
@@ -198,71 +257,92 @@ def get_country_info(country_name: str) -> Optional[Dict[str, Any]]:
         country_data = countries_data[0]
         
         # Format country information
-        country_info = {
-            "name": {
+        country_info = CountryInfo(
+            name={
                 "common": country_data.get('name', {}).get('common', ''),
                 "official": country_data.get('name', {}).get('official', '')
             },
-            "capital": country_data.get('capital', []),
-            "region": country_data.get('region', ''),
-            "subregion": country_data.get('subregion', ''),
-            "population": country_data.get('population', 0),
-            "currencies": list(country_data.get('currencies', {}).values()),
-            "languages": country_data.get('languages', {}),
-            "flags": {
+            capital=country_data.get('capital', []),
+            region=country_data.get('region', ''),
+            subregion=country_data.get('subregion', ''),
+            population=country_data.get('population', 0),
+            currencies=list(country_data.get('currencies', {}).values()),
+            languages=country_data.get('languages', {}),
+            flags={
                 "png": country_data.get('flags', {}).get('png', ''),
                 "svg": country_data.get('flags', {}).get('svg', '')
             },
-            "timezones": country_data.get('timezones', []),
-            "area": country_data.get('area', 0),
-            "borders": country_data.get('borders', [])
-        }
+            timezones=country_data.get('timezones', []),
+            area=country_data.get('area', 0),
+            borders=country_data.get('borders', [])
+        )
         
         logger.info(f"Country data retrieved for {country_name}")
+        COUNTRY_INFO_CACHE.set(cache_key, country_info)
         return country_info
         
     except requests.RequestException as e:
         logger.error(f"Error getting country data: {str(e)}")
-        return None
+        return COUNTRY_INFO_CACHE.get_stale(cache_key)
     except Exception as e:
         logger.error(f"Unexpected error in country API: {str(e)}")
         return None
 
-def get_travel_advisory(country_name: str, country_code: str) -> Optional[Dict[str, Any]]:
+def get_travel_advisory(country_name: str, country_code: str,
+                        deadline: Optional[Deadline] = None) -> Optional[Advisory]:
     """
     Get travel advisory information using Smart Traveller API
     """
+    # Map country names to Smart Traveller country codes
+    country_code = country_code if country_code else map_country_to_smart_traveller_code(country_name)
+    if not country_code:
+        logger.warning(f"No Smart Traveller code found for {country_name}")
+        return None
+
+    cache_key = country_code.lower()
+    timeout = stage_timeout(deadline, 10)
+    if timeout is None:
+        logger.warning(f"Request deadline reached, skipping travel advisory for {country_name}")
+        return TRAVEL_ADVISORY_CACHE.get_stale(cache_key)
+
+    breaker = get_breaker("smart_traveller")
+    if not breaker.allow_request():
+        logger.warning(f"Smart Traveller circuit open, using cached advisory for {country_name}")
+        return TRAVEL_ADVISORY_CACHE.get_stale(cache_key)
     try:
-        # Map country names to Smart Traveller country codes
-        country_code = country_code if country_code else map_country_to_smart_traveller_code(country_name)
-        if not country_code:
-            logger.warning(f"No Smart Traveller code found for {country_name}")
-            return None
-        
         # Get travel advisory from Smart Traveller API
-        url = f"{SMART_TRAVELLER_BASE_URL}advisory?country={country_code.lower()}"
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        url = f"{SMART_TRAVELLER_BASE_URL}advisory?country={cache_key}"
+        def fetch(attempt_timeout):
+            response = get_session().get(url, timeout=attempt_timeout)
+            response.raise_for_status()
+            return response
+        try:
+            response = get_upstream_timeout("smart_traveller").call(fetch, timeout)
+        except requests.RequestException as e:
+            breaker.record_exception(e)
+            raise
+        breaker.record_success()
         
         advisory_data = response.json()
         
         # Format travel advisory information
-        travel_advisory = {
-            "country": country_name,
-            "country_code": country_code,
-            "level": advisory_data.get('level', 'Unknown'),
-            "summary": advisory_data.get('summary', ''),
-            "details": advisory_data.get('details', ''),
-            "last_updated": advisory_data.get('last_updated', ''),
-            "advice": advisory_data.get('advice', [])
-        }
+        travel_advisory = Advisory(
+            country=country_name,
+            country_code=country_code,
+            level=advisory_data.get('level', 'Unknown'),
+            summary=advisory_data.get('summary', ''),
+            details=advisory_data.get('details', ''),
+            last_updated=advisory_data.get('last_updated', ''),
+            advice=advisory_data.get('advice', [])
+        )
         
         logger.info(f"Travel advisory retrieved for {country_name}")
+        TRAVEL_ADVISORY_CACHE.set(cache_key, travel_advisory)
         return travel_advisory
         
     except requests.RequestException as e:
         logger.error(f"Error getting travel advisory: {str(e)}")
-        return None
+        return TRAVEL_ADVISORY_CACHE.get_stale(cache_key)
     except Exception as e:
         logger.error(f"Unexpected error in travel advisory API: {str(e)}")
         return None
@@ -283,31 +363,35 @@ def map_country_to_smart_traveller_code(country_name: str) -> Optional[str]:
     
     return None
 
-def validate_image_url(image_url: str) -> bool:
+def validate_image_url(image_url: str, deadline: Optional[Deadline] = None) -> bool:
     """
     Validate if the provided image URL is accessible
     """
+    timeout = stage_timeout(deadline, 10)
+    if timeout is None:
+        return False
     try:
-        response = requests.head(image_url, timeout=10)
+        response = get_session().head(image_url, timeout=timeout)
         return response.status_code == 200
     except:
         return False
 
-def format_weather_summary(weather_data: Dict[str, Any]) -> str:
+def format_weather_summary(weather_data: Union[Weather, Dict[str, Any], None]) -> str:
     """
     Format weather data into a human-readable summary
     
     Args:
-        weather_data: Weather information dictionary
+        weather_data: Weather record (or its dict form)
     
     Returns:
         Formatted weather summary string
     """
-    if not weather_data:
+    weather = Weather.from_dict(weather_data)
+    if weather is None:
         return "Weather information unavailable"
     
-    temp = weather_data.get("temperature", "Unknown")
-    description = weather_data.get("conditions", "Unknown conditions")
-    humidity = weather_data.get("humidity", "Unknown")
+    temp = "Unknown" if weather.temperature is None else weather.temperature
+    description = weather.conditions or "Unknown conditions"
+    humidity = "Unknown" if weather.humidity is None else weather.humidity
     
     return f"{description.capitalize()}, {temp}°C, {humidity}% humidity" 
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+AWS clients shared by every handler in the process.
+
+Each boto3 client has its own connection pool, so a new client pays its own
+setup and TLS handshake on first use. Clients are created once per process
+and reused across invocations:
+
+  - one S3 client
+  - one Bedrock client per read-timeout bucket; a deadline-bounded call gets
+    the largest bucket that still fits in the time left, so a container
+    holds at most ``len(BEDROCK_TIMEOUT_BUCKETS) + 1`` Bedrock clients
+
+Clients are created on first use, or during warm-up.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+
+import boto3
+from botocore.config import Config
+
+# Read timeout (seconds) of calls with no deadline
+BEDROCK_READ_TIMEOUT = 60
+
+# Read timeouts (seconds) offered to deadline-bounded Bedrock calls
+BEDROCK_TIMEOUT_BUCKETS = sorted(int(s) for s in os.getenv("BEDROCK_TIMEOUT_BUCKETS", "5,10,20,30").split(",") if s.strip())
+
+BEDROCK_REGION = os.getenv("BEDROCK_REGION", "us-east-1")
+
+_s3_client = None
+_bedrock_clients: Dict[int, object] = {}
+_lock = threading.Lock()
+
+
+def get_s3_client():
+    global _s3_client
+    with _lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3')
+        return _s3_client
+
+
+def bedrock_timeout_bucket(read_timeout: Optional[float]) -> int:
+    """
+    The largest bucket that fits within ``read_timeout`` seconds (the smallest if none does)
+    """
+    if read_timeout is None or read_timeout >= BEDROCK_READ_TIMEOUT:
+        return BEDROCK_READ_TIMEOUT
+    fitting = [bucket for bucket in BEDROCK_TIMEOUT_BUCKETS if bucket <= read_timeout]
+    return fitting[-1] if fitting else BEDROCK_TIMEOUT_BUCKETS[0]
+
+
+def get_bedrock_client(read_timeout: Optional[float] = None):
+    """
+    Return a Bedrock client whose read timeout fits within ``read_timeout`` seconds
+    """
+    seconds = bedrock_timeout_bucket(read_timeout)
+    with _lock:
+        client = _bedrock_clients.get(seconds)
+        if client is None:
+            # Bounded calls are not retried: a retry would not fit in the time left
+            client = _bedrock_clients[seconds] = boto3.client(
+                'bedrock-runtime',
+                region_name=BEDROCK_REGION,
+                config=Config(connect_timeout=min(5, seconds), read_timeout=seconds,
+                              retries={'max_attempts': 3 if seconds >= BEDROCK_READ_TIMEOUT else 1})
+            )
+        return client
+
+
+def reset_clients() -> None:
+    """
+    Drop cached clients so the next call creates them against the current endpoints
+    """
+    global _s3_client
+    with _lock:
+        _s3_client = None
+        _bedrock_clients.clear()
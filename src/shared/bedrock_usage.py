@@ -0,0 +1,179 @@
+"""
+Bedrock usage and cost accounting.
+
+Every model call goes through ``invoke_model``, which returns the parsed
+response together with a usage record: model, prompt version, input,
+output and prompt-cache tokens, end-to-end latency, time to first token
+and an estimated cost. The record is emitted as metrics (dimensioned by
+function, model and prompt version) and is meant to be stored alongside
+the result it paid for, so ``tools/bedrock_usage_report.py`` can total
+stored results by model, country and prompt version.
+
+Time to first token is only observable on streamed responses. With
+``BEDROCK_STREAM_RESPONSES=true`` calls use
+``invoke_model_with_response_stream``; otherwise the whole body arrives
+at once and ``time_to_first_token_ms`` is None.
+"""
+
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from . import json_codec
+from .metrics import put_metric, set_gauge
+
+logger = logging.getLogger()
+
+BEDROCK_STREAM_RESPONSES = os.getenv("BEDROCK_STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+# USD per 1000 tokens: (input, output). Cache reads and writes are priced
+# relative to input tokens. Override or extend with BEDROCK_PRICES, a JSON
+# object of {model_id: [input, output]}.
+MODEL_PRICES = {
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "anthropic.claude-3-5-haiku-20241022-v1:0": (0.0008, 0.004),
+    "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (0.003, 0.015),
+    "anthropic.claude-instant-v1": (0.0008, 0.0024),
+    "amazon.titan-text-express-v1": (0.0002, 0.0006),
+}
+MODEL_PRICES.update({
+    model_id: tuple(prices) for model_id, prices in json_codec.loads(os.getenv("BEDROCK_PRICES", "{}")).items()
+})
+CACHE_READ_PRICE_FACTOR = 0.1
+CACHE_WRITE_PRICE_FACTOR = 1.25
+# Batch inference is billed at half the on-demand price
+BATCH_PRICE_FACTOR = 0.5
+
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_read_input_tokens",
+    "cache_creation_input_tokens",
+)
+
+
+def model_price(model_id: str) -> Optional[Tuple[float, float]]:
+    """
+    (input, output) USD per 1000 tokens for a model, or None if unknown.
+    Cross-region inference profile IDs ("us.anthropic...") use the base model's price.
+    """
+    if model_id in MODEL_PRICES:
+        return MODEL_PRICES[model_id]
+    base = model_id.split(".", 1)[1] if model_id.count(".") > 1 else None
+    return MODEL_PRICES.get(base) if base else None
+
+
+def estimate_cost(model_id: str, usage: Dict[str, Any], batch: bool = False) -> Optional[float]:
+    """
+    Estimated USD cost of one call, or None for a model without a known price
+    """
+    price = model_price(model_id)
+    if price is None:
+        return None
+    input_price, output_price = price
+    cost = (
+        (usage.get("input_tokens") or 0) * input_price
+        + (usage.get("output_tokens") or 0) * output_price
+        + (usage.get("cache_read_input_tokens") or 0) * input_price * CACHE_READ_PRICE_FACTOR
+        + (usage.get("cache_creation_input_tokens") or 0) * input_price * CACHE_WRITE_PRICE_FACTOR
+    ) / 1000
+    if batch:
+        cost *= BATCH_PRICE_FACTOR
+    return round(cost, 8)
+
+
+def _read_stream(response: Dict[str, Any], started: float) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    Rebuild a Messages API response body from a response stream,
+    noting when the first text arrived
+    """
+    body = {"content": [], "usage": {}}
+    text = []
+    first_token_ms = None
+    for event in response["body"]:
+        chunk = event.get("chunk")
+        if not chunk:
+            continue
+        data = json_codec.loads(chunk["bytes"])
+        kind = data.get("type")
+        if kind == "message_start":
+            message = data.get("message", {})
+            body.update({key: value for key, value in message.items() if key not in ("content", "usage")})
+            body["usage"].update(message.get("usage") or {})
+        elif kind == "content_block_delta":
+            delta = data.get("delta", {}).get("text")
+            if delta:
+                if first_token_ms is None:
+                    first_token_ms = (time.monotonic() - started) * 1000
+                text.append(delta)
+        elif kind == "message_delta":
+            body.update(data.get("delta") or {})
+            body["usage"].update(data.get("usage") or {})
+    body["content"] = [{"type": "text", "text": "".join(text)}]
+    return body, first_token_ms
+
+
+def invoke_model(client, model_id: str, request_body: Dict[str, Any], function: str,
+                 prompt_version: str, stream: Optional[bool] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Call a Bedrock model and return ``(response_body, usage)``
+    """
+    stream = BEDROCK_STREAM_RESPONSES if stream is None else stream
+    started = time.monotonic()
+    if stream:
+        response = client.invoke_model_with_response_stream(modelId=model_id, body=json_codec.dumps_bytes(request_body))
+        response_body, first_token_ms = _read_stream(response, started)
+    else:
+        response = client.invoke_model(modelId=model_id, body=json_codec.dumps_bytes(request_body))
+        response_body = json_codec.loads(response["body"].read())
+        first_token_ms = None
+    latency_ms = (time.monotonic() - started) * 1000
+
+    usage = usage_record(model_id, prompt_version, response_body, latency_ms, first_token_ms)
+    record_usage(function, usage)
+    return response_body, usage
+
+
+def usage_record(model_id: str, prompt_version: str, response_body: Dict[str, Any],
+                 latency_ms: Optional[float] = None, first_token_ms: Optional[float] = None,
+                 batch: bool = False) -> Dict[str, Any]:
+    """
+    Usage record for a Messages API response body. Batch inference results
+    have no per-call latency and are priced at the batch rate.
+    """
+    reported = response_body.get("usage") or {}
+    usage = {
+        "model_id": model_id,
+        "prompt_version": prompt_version,
+        "latency_ms": round(latency_ms, 1) if latency_ms is not None else None,
+        "time_to_first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+    }
+    if batch:
+        usage["batch"] = True
+    for field in USAGE_FIELDS:
+        usage[field] = int(reported.get(field) or 0)
+    usage["cost_usd"] = estimate_cost(model_id, usage, batch)
+    return usage
+
+
+def record_usage(function: str, usage: Dict[str, Any]) -> None:
+    """
+    Emit token, latency and cost metrics for one call
+    """
+    dimensions = {"Function": function, "Model": usage["model_id"], "PromptVersion": usage["prompt_version"]}
+    put_metric("BedrockInputTokens", usage["input_tokens"], dimensions=dimensions)
+    put_metric("BedrockOutputTokens", usage["output_tokens"], dimensions=dimensions)
+    if usage["cache_read_input_tokens"] or usage["cache_creation_input_tokens"]:
+        put_metric("BedrockCacheReadTokens", usage["cache_read_input_tokens"], dimensions=dimensions)
+        put_metric("BedrockCacheWriteTokens", usage["cache_creation_input_tokens"], dimensions=dimensions)
+    if usage["latency_ms"] is not None:
+        set_gauge("BedrockLatency", usage["latency_ms"], unit="Milliseconds", dimensions=dimensions)
+    if usage["time_to_first_token_ms"] is not None:
+        set_gauge("BedrockTimeToFirstToken", usage["time_to_first_token_ms"], unit="Milliseconds",
+                  dimensions=dimensions)
+    if usage["cost_usd"] is not None:
+        set_gauge("BedrockCost", usage["cost_usd"], dimensions=dimensions)
+    logger.info(f"Bedrock {usage['model_id']} ({usage['prompt_version']}): {usage['input_tokens']} in, "
+                f"{usage['output_tokens']} out, {usage['latency_ms']}ms, ${usage['cost_usd']}")
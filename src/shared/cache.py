@@ -0,0 +1,83 @@
+"""
+In-memory caches shared across invocations of a warm Lambda container
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    Expired entries are kept until evicted so callers can still fall back to
+    the last known good value with ``get_stale`` when an upstream is down.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return a fresh value, or None when missing or expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_stale(self, key: Hashable) -> Optional[Any]:
+        """
+        Return the last stored value regardless of age
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """
+        Seconds since the value for ``key`` was stored
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return None if entry is None else time.monotonic() - entry[2]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._data[key] = (value, now + (self.ttl if ttl is None else ttl), now)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def items(self) -> Dict[Hashable, Any]:
+        """
+        Snapshot of all stored values, fresh or stale
+        """
+        with self._lock:
+            return {key: entry[0] for key, entry in self._data.items()}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,176 @@
+"""
+Per-upstream circuit breakers.
+
+Each upstream (RestCountries, Smart Traveller, ...) gets a breaker that
+tracks the outcome of its recent calls. When the failure rate over the
+window crosses the threshold the breaker opens and calls fail fast; after a
+cool-down it lets a limited number of probe requests through (half-open)
+and closes again once a probe succeeds.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+
+from .metrics import put_metric, set_gauge
+
+logger = logging.getLogger()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Numeric values reported in the CircuitBreakerState metric
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_WINDOW_SIZE = int(os.getenv("CIRCUIT_WINDOW_SIZE", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker driven by the failure rate of recent calls
+    """
+
+    def __init__(self, name: str, window_size: int = CIRCUIT_WINDOW_SIZE,
+                 min_calls: int = CIRCUIT_MIN_CALLS, failure_rate: float = CIRCUIT_FAILURE_RATE,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS,
+                 half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Whether a call may go to the upstream now
+        """
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+        put_metric("CircuitBreakerRejected", 1, dimensions={"Upstream": self.name})
+        return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+                return
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            self._outcomes.append(False)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._transition(OPEN)
+
+    def record_exception(self, error: Exception) -> None:
+        """
+        Record a failed call, ignoring client errors that say nothing about upstream health
+        """
+        if is_upstream_failure(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._transition(CLOSED)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self._state,
+                "calls": len(self._outcomes),
+                "failures": self._outcomes.count(False),
+            }
+
+    def _maybe_half_open(self) -> None:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state: str) -> None:
+        previous = self._state
+        self._state = state
+        self._probes_in_flight = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._outcomes.clear()
+        if previous != state:
+            logger.warning(f"Circuit breaker for {self.name}: {previous} -> {state}")
+            set_gauge("CircuitBreakerState", STATE_VALUES[state], dimensions={"Upstream": self.name})
+            if state == OPEN:
+                put_metric("CircuitBreakerOpened", 1, dimensions={"Upstream": self.name})
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """
+    Timeouts, connection errors, 429s and 5xx count against an upstream; other 4xx do not
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, requests.RequestException)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str, **settings) -> CircuitBreaker:
+    """
+    Return the process-wide breaker for an upstream, creating it on first use
+    """
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **settings)
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, object]]:
+    """
+    Snapshot of every registered breaker, for metrics and debugging
+    """
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def reset_breakers(name: Optional[str] = None) -> None:
+    with _registry_lock:
+        breakers = [_breakers[name]] if name in _breakers else ([] if name else list(_breakers.values()))
+    for breaker in breakers:
+        breaker.reset()
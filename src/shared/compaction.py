@@ -0,0 +1,335 @@
+"""
+Compaction of per-request results into partitioned datasets.
+
+Every request leaves a small pretty-printed JSON object in S3
+(``landmark_analysis/<YYYYMMDD_HHMMSS>_analysis.json`` and ``..._final.json``).
+Compaction streams one day of those objects into a few large files,
+partitioned by kind, date and country:
+
+    compacted/<kind>/date=<YYYY-MM-DD>/country=<CC>/part-00000.ndjson.gz
+    compacted/<kind>/date=<YYYY-MM-DD>/_manifest.json
+
+Each line of a part is one result with ``source_key`` and ``timestamp``
+added. Parts roll over at ``max_part_bytes`` of uncompressed data. The
+manifest is written last and lists every part with its record count,
+sizes and timestamp range, so a reader scans a day with one manifest read
+plus one sequential read per part. Re-compacting a day rewrites the same
+part names and replaces the manifest, so the job can be re-run safely.
+
+With pyarrow installed, ``fmt="parquet"`` writes zstd-compressed Parquet
+parts (the summary fields as columns, the full result as a JSON column)
+instead of gzip NDJSON.
+"""
+
+import gzip
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # pyarrow not available, only NDJSON output
+    pyarrow = None
+
+from . import json_codec
+
+logger = logging.getLogger()
+
+SOURCE_PREFIX = "landmark_analysis/"
+OUTPUT_PREFIX = "compacted/"
+MANIFEST_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+MAX_PART_BYTES = int(os.getenv("COMPACTION_MAX_PART_BYTES", str(128 * 1024 * 1024)))
+READ_CONCURRENCY = int(os.getenv("COMPACTION_READ_CONCURRENCY", "16"))
+
+# Source object suffix -> dataset kind
+KINDS = {"_analysis.json": "analysis", "_final.json": "final"}
+FORMATS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+
+
+class LocalStorage:
+    """
+    Directory standing in for a bucket; keys are relative paths
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def list(self, prefix: str) -> Iterator[str]:
+        directory = os.path.join(self.root, os.path.dirname(prefix))
+        keys = []
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                key = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return iter(sorted(keys))
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    def write(self, key: str, data: bytes) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def delete(self, keys: List[str]) -> None:
+        for key in keys:
+            os.remove(os.path.join(self.root, key))
+
+
+class S3Storage:
+    """
+    One S3 bucket
+    """
+
+    def __init__(self, bucket: str, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self.bucket = bucket
+        self.client = client
+
+    def list(self, prefix: str) -> Iterator[str]:
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"]
+
+    def read(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def write(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def delete(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), 1000):
+            batch = [{"Key": key} for key in keys[start:start + 1000]]
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": batch, "Quiet": True})
+
+
+def source_kind(key: str) -> Optional[str]:
+    for suffix, kind in KINDS.items():
+        if key.endswith(suffix):
+            return kind
+    return None
+
+
+def record_country(result: Dict[str, Any]) -> str:
+    location = (result.get("landmark") or {}).get("location") or {}
+    return (location.get("country_code") or "").upper() or "unknown"
+
+
+def key_timestamp(key: str) -> Optional[str]:
+    """
+    ISO timestamp from a ``<YYYYMMDD_HHMMSS>_...`` key name
+    """
+    try:
+        return datetime.strptime(os.path.basename(key)[:15], "%Y%m%d_%H%M%S").isoformat()
+    except ValueError:
+        return None
+
+
+def partition_prefix(kind: str, date: str, output_prefix: str = OUTPUT_PREFIX) -> str:
+    return f"{output_prefix}{kind}/date={date}/"
+
+
+def _read_sources(storage, keys: Iterable[str], concurrency: int) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """
+    Read objects with at most ``concurrency`` reads in flight, in key order
+    """
+    def read(key):
+        try:
+            return key, storage.read(key)
+        except Exception as e:
+            logger.error(f"Could not read {key}: {str(e)}")
+            return key, None
+
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="compaction") as executor:
+        while True:
+            batch = [key for _, key in zip(range(concurrency * 4), keys)]
+            if not batch:
+                return
+            yield from executor.map(read, batch)
+
+
+class _PartWriter:
+    """
+    Spools one partition's rows to a temporary file and rolls over to a new
+    part when the uncompressed size passes the limit
+    """
+
+    def __init__(self, storage, prefix: str, fmt: str, max_part_bytes: int):
+        self.storage = storage
+        self.prefix = prefix
+        self.fmt = fmt
+        self.max_part_bytes = max_part_bytes
+        self.parts: List[Dict[str, Any]] = []
+        self._open()
+
+    def _open(self):
+        self._spool = tempfile.TemporaryFile()
+        self._gzip = gzip.GzipFile(fileobj=self._spool, mode="wb", mtime=0) if self.fmt == "ndjson" else None
+        self._rows: List[Dict[str, Any]] = []
+        self._records = 0
+        self._bytes = 0
+        self._timestamps: List[str] = []
+
+    def add(self, row: Dict[str, Any]) -> None:
+        line = json_codec.dumps_bytes(row) + b"\n"
+        if self._gzip is not None:
+            self._gzip.write(line)
+        else:
+            self._rows.append(row)
+        self._records += 1
+        self._bytes += len(line)
+        if row.get("timestamp"):
+            self._timestamps.append(row["timestamp"])
+        if self._bytes >= self.max_part_bytes:
+            self.flush()
+            self._open()
+
+    def flush(self) -> None:
+        if not self._records:
+            return
+        if self._gzip is not None:
+            self._gzip.close()
+            self._spool.seek(0)
+            data = self._spool.read()
+        else:
+            data = _parquet_bytes(self._rows)
+        self._spool.close()
+        key = f"{self.prefix}part-{len(self.parts):05d}{FORMATS[self.fmt]}"
+        self.storage.write(key, data)
+        self.parts.append({
+            "key": key,
+            "records": self._records,
+            "bytes": self._bytes,
+            "stored_bytes": len(data),
+            "min_timestamp": min(self._timestamps) if self._timestamps else None,
+            "max_timestamp": max(self._timestamps) if self._timestamps else None,
+        })
+        self._records = 0
+
+
+def _parquet_bytes(rows: List[Dict[str, Any]]) -> bytes:
+    columns = {
+        "source_key": [row.get("source_key") for row in rows],
+        "timestamp": [row.get("timestamp") for row in rows],
+        "landmark_name": [(row.get("landmark") or {}).get("name") for row in rows],
+        "country_code": [((row.get("landmark") or {}).get("location") or {}).get("country_code") for row in rows],
+        "city": [((row.get("landmark") or {}).get("location") or {}).get("city") for row in rows],
+        "image_url": [row.get("image_url") for row in rows],
+        "result": [json_codec.dumps(row) for row in rows],
+    }
+    buffer = io.BytesIO()
+    pyarrow.parquet.write_table(pyarrow.table(columns), buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def compact_day(storage, date: str, source_prefix: str = SOURCE_PREFIX, output_prefix: str = OUTPUT_PREFIX,
+                fmt: str = "ndjson", max_part_bytes: int = MAX_PART_BYTES,
+                concurrency: int = READ_CONCURRENCY, delete_sources: bool = False) -> Dict[str, Dict[str, Any]]:
+    """
+    Compact one day (``YYYY-MM-DD``) of source objects; returns the manifest
+    written for each kind. With ``delete_sources`` the compacted objects are
+    removed once every manifest is written; unreadable ones are left alone.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; use one of {', '.join(FORMATS)}")
+    if fmt == "parquet" and pyarrow is None:
+        raise ValueError("Parquet output needs pyarrow installed")
+
+    day = datetime.strptime(date, "%Y-%m-%d")
+    keys = (key for key in storage.list(f"{source_prefix}{day.strftime('%Y%m%d')}") if source_kind(key))
+
+    writers: Dict[Tuple[str, str], _PartWriter] = {}
+    sources: Dict[str, int] = {}
+    compacted: List[str] = []
+    skipped = 0
+    for key, body in _read_sources(storage, keys, concurrency):
+        try:
+            result = json_codec.loads(body) if body is not None else None
+        except ValueError:
+            result = None
+        if not isinstance(result, dict):
+            skipped += 1
+            continue
+        kind = source_kind(key)
+        country = record_country(result)
+        row = dict(result, source_key=key, timestamp=result.get("timestamp") or key_timestamp(key))
+        writer = writers.get((kind, country))
+        if writer is None:
+            prefix = f"{partition_prefix(kind, date, output_prefix)}country={country}/"
+            writer = writers[(kind, country)] = _PartWriter(storage, prefix, fmt, max_part_bytes)
+        writer.add(row)
+        sources[kind] = sources.get(kind, 0) + 1
+        compacted.append(key)
+
+    manifests = {}
+    for kind in sorted({kind for kind, _ in writers}):
+        parts = []
+        for (writer_kind, country), writer in sorted(writers.items()):
+            if writer_kind != kind:
+                continue
+            writer.flush()
+            parts.extend(dict(part, country=country) for part in writer.parts)
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "kind": kind,
+            "date": date,
+            "format": fmt,
+            "created": datetime.utcnow().isoformat(),
+            "sources": sources[kind],
+            "records": sum(part["records"] for part in parts),
+            "parts": parts,
+        }
+        storage.write(f"{partition_prefix(kind, date, output_prefix)}{MANIFEST_NAME}",
+                      json_codec.dumps_bytes(manifest, indent=2))
+        manifests[kind] = manifest
+    if delete_sources and compacted:
+        storage.delete(compacted)
+    if skipped:
+        logger.warning(f"Skipped {skipped} unreadable objects while compacting {date}")
+    logger.info(f"Compacted {sum(sources.values())} objects for {date} into "
+                f"{sum(len(m['parts']) for m in manifests.values())} parts")
+    return manifests
+
+
+def read_manifest(storage, kind: str, date: str, output_prefix: str = OUTPUT_PREFIX) -> Optional[Dict[str, Any]]:
+    try:
+        return json_codec.loads(storage.read(f"{partition_prefix(kind, date, output_prefix)}{MANIFEST_NAME}"))
+    except Exception:
+        return None
+
+
+def iter_compacted(storage, kind: str, date: str, country: Optional[str] = None,
+                   output_prefix: str = OUTPUT_PREFIX) -> Iterator[Dict[str, Any]]:
+    """
+    Every result of one day (optionally one country), read part by part
+    """
+    manifest = read_manifest(storage, kind, date, output_prefix)
+    if manifest is None:
+        return
+    for part in manifest["parts"]:
+        if country and part["country"] != country.upper():
+            continue
+        data = storage.read(part["key"])
+        if manifest["format"] == "parquet":
+            if pyarrow is None:
+                raise ValueError("Reading Parquet parts needs pyarrow installed")
+            for value in pyarrow.parquet.read_table(io.BytesIO(data), columns=["result"]).column("result"):
+                yield json_codec.loads(value.as_py())
+        else:
+            for line in gzip.decompress(data).splitlines():
+                yield json_codec.loads(line)
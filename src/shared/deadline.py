@@ -0,0 +1,91 @@
+"""
+Request deadline propagation for LambdaTrip Lambda functions.
+
+A Deadline is derived from the Lambda context's remaining time and handed to
+each pipeline stage. Stages ask it for a timeout instead of using a fixed
+value, so downstream timeouts shrink as the request runs out of time and
+optional enrichments are skipped once the budget is gone.
+"""
+
+import logging
+import os
+import time
+from typing import Optional
+
+logger = logging.getLogger()
+
+# Time kept back for serializing the response and returning it to Lambda
+DEADLINE_RESERVE_MS = int(os.getenv("DEADLINE_RESERVE_MS", "1500"))
+
+# Budget used when there is no Lambda context (direct/local invocation)
+DEFAULT_REQUEST_BUDGET_MS = int(os.getenv("REQUEST_BUDGET_MS", "55000"))
+
+# Below this many seconds an upstream call is not worth starting
+MIN_STAGE_TIMEOUT = float(os.getenv("MIN_STAGE_TIMEOUT", "0.5"))
+
+
+class Deadline:
+    """
+    Absolute point in time by which a request (or one stage of it) must finish.
+    """
+
+    def __init__(self, budget_ms: float, parent: Optional["Deadline"] = None):
+        self.expires_at = time.monotonic() + max(budget_ms, 0) / 1000.0
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+
+    @classmethod
+    def from_context(cls, context, reserve_ms: int = DEADLINE_RESERVE_MS) -> "Deadline":
+        """
+        Build the request deadline from the Lambda context, keeping ``reserve_ms`` back.
+        """
+        remaining_ms = DEFAULT_REQUEST_BUDGET_MS
+        get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+        if callable(get_remaining):
+            try:
+                remaining_ms = get_remaining()
+            except Exception:
+                logger.warning("Could not read remaining time from Lambda context")
+        return cls(remaining_ms - reserve_ms)
+
+    def remaining(self) -> float:
+        """
+        Seconds left before the deadline (never negative).
+        """
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def remaining_ms(self) -> int:
+        return int(self.remaining() * 1000)
+
+    def expired(self, minimum: float = MIN_STAGE_TIMEOUT) -> bool:
+        """
+        True when less than ``minimum`` seconds remain.
+        """
+        return self.remaining() < minimum
+
+    def slice(self, share: float) -> "Deadline":
+        """
+        Child deadline covering ``share`` of the remaining time, for one stage.
+        """
+        return Deadline(self.remaining() * 1000 * share, parent=self)
+
+    def timeout(self, default: float, minimum: float = MIN_STAGE_TIMEOUT) -> Optional[float]:
+        """
+        Timeout for an upstream call: ``default`` capped by the remaining time.
+
+        Returns None when the remaining time is below ``minimum``, meaning the
+        call should be skipped rather than started.
+        """
+        remaining = self.remaining()
+        if remaining < minimum:
+            return None
+        return min(default, remaining)
+
+
+def stage_timeout(deadline: Optional[Deadline], default: float) -> Optional[float]:
+    """
+    Timeout for an upstream call, falling back to ``default`` when no deadline is set.
+    """
+    if deadline is None:
+        return default
+    return deadline.timeout(default)
@@ -0,0 +1,307 @@
+"""
+Multi-provider geocoding with hedged requests.
+
+Landmark and city lookups go to a primary provider first. If it has not
+answered within the hedge delay, the same query is sent to the next provider
+and the first good answer wins. The hedge delay tracks the primary's observed
+p90 latency, so it tunes itself as provider latency changes. Every provider's
+answer is normalised to the same record:
+
+    {"city", "country", "country_code", "lat", "lng", "provider"}
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import requests
+
+from .circuit_breaker import OPEN, get_breaker
+from .deadline import Deadline, stage_timeout
+from .http_client import get_session
+from .metrics import put_metric
+from .rate_limit import get_limiter
+from .upstream_timeouts import get_upstream_timeout
+
+logger = logging.getLogger()
+
+# Maps.co (Nominatim) geocoding
+GEOCODE_API_KEY = os.getenv("GEOCODE_API_KEY")
+GEOCODE_MAPS_CO_URL = "https://geocode.maps.co/search"
+
+# Google Geocoding
+GOOGLE_GEOCODING_API_KEY = os.getenv("GOOGLE_GEOCODING_API_KEY")
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Provider order for landmark lookups; the first available provider is primary
+GEOCODING_PROVIDERS = [p.strip() for p in os.getenv("GEOCODING_PROVIDERS", "maps_co,google").split(",") if p.strip()]
+
+# Hedge delay used until a provider has enough latency samples, and its bounds
+HEDGE_DELAY_MS = float(os.getenv("GEOCODE_HEDGE_DELAY_MS", "800"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("GEOCODE_HEDGE_MIN_DELAY_MS", "50"))
+HEDGE_MAX_DELAY_MS = float(os.getenv("GEOCODE_HEDGE_MAX_DELAY_MS", "3000"))
+HEDGE_PERCENTILE = float(os.getenv("GEOCODE_HEDGE_PERCENTILE", "90"))
+HEDGE_MIN_SAMPLES = 20
+
+USER_AGENT = "LambdaTrip/1.0 (contact@example.com)"
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geocode")
+
+
+def empty_location() -> Dict[str, Any]:
+    return {"city": None, "country": None, "country_code": None, "lat": None, "lng": None, "provider": None}
+
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderStats:
+    """
+    Rolling latency samples and win counts for one geocoding provider
+    """
+
+    def __init__(self, name: str, window: int = 200):
+        self.name = name
+        self.latencies_ms = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record_call(self, latency_ms: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.latencies_ms.append(latency_ms)
+            if not ok:
+                self.errors += 1
+
+    def record_win(self) -> None:
+        with self._lock:
+            self.wins += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies_ms)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(len(samples) * q / 100.0 + 0.999999) - 1))
+        return samples[index]
+
+    def hedge_delay_ms(self) -> float:
+        """
+        Delay before hedging to the next provider: this provider's p90, within bounds
+        """
+        with self._lock:
+            enough = len(self.latencies_ms) >= HEDGE_MIN_SAMPLES
+        if not enough:
+            return HEDGE_DELAY_MS
+        return min(max(self.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY_MS), HEDGE_MAX_DELAY_MS)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            calls, errors, wins = self.calls, self.errors, self.wins
+        return {
+            "calls": calls,
+            "errors": errors,
+            "wins": wins,
+            "win_rate": round(wins / calls, 4) if calls else None,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "hedge_delay_ms": self.hedge_delay_ms(),
+        }
+
+
+def _geocode_maps_co(query: str, timeout: float) -> Optional[Dict[str, Any]]:
+    params = {"q": query, "format": "json", "addressdetails": 1, "limit": 1}
+    if GEOCODE_API_KEY:
+        params["api_key"] = GEOCODE_API_KEY
+    response = get_session().get(GEOCODE_MAPS_CO_URL, params=params, timeout=timeout, headers={"User-Agent": USER_AGENT})
+    response.raise_for_status()
+    results = response.json() or []
+    if not results:
+        return None
+
+    top = results[0]
+    address = top.get("address", {}) or {}
+    city = (
+        address.get("city") or address.get("town") or address.get("village")
+        or address.get("hamlet") or address.get("municipality")
+        or address.get("suburb") or address.get("county")
+    )
+    country = address.get("country")
+    country_code = (address.get("country_code") or "").upper() or None
+
+    if (not city or not country) and top.get("display_name"):
+        parts = [p.strip() for p in top["display_name"].split(",") if p.strip()]
+        if parts:
+            country = country or parts[-1]
+            if not city and len(parts) >= 3:
+                city = parts[-4] if len(parts) >= 4 else parts[-3]
+
+    return {
+        "city": city,
+        "country": country,
+        "country_code": country_code,
+        "lat": _to_float(top.get("lat")),
+        "lng": _to_float(top.get("lon")),
+    }
+
+
+def _geocode_google(query: str, timeout: float) -> Optional[Dict[str, Any]]:
+    response = get_session().get(GOOGLE_GEOCODE_URL, params={"address": query, "key": GOOGLE_GEOCODING_API_KEY}, timeout=timeout)
+    response.raise_for_status()
+    results = response.json().get("results") or []
+    if not results:
+        return None
+
+    top = results[0]
+    city = country = country_code = None
+    for component in top.get("address_components", []):
+        types = component.get("types", [])
+        if not city and ("locality" in types or "postal_town" in types):
+            city = component.get("long_name")
+        if "country" in types:
+            country = component.get("long_name")
+            country_code = (component.get("short_name") or "").upper() or None
+    if not city:
+        for component in top.get("address_components", []):
+            if "administrative_area_level_1" in component.get("types", []):
+                city = component.get("long_name")
+                break
+
+    location = top.get("geometry", {}).get("location", {})
+    return {
+        "city": city,
+        "country": country,
+        "country_code": country_code,
+        "lat": _to_float(location.get("lat")),
+        "lng": _to_float(location.get("lng")),
+    }
+
+
+class Provider:
+    def __init__(self, name: str, lookup: Callable[[str, float], Optional[Dict[str, Any]]],
+                 default_timeout: float, is_configured: Callable[[], bool]):
+        self.name = name
+        self.lookup = lookup
+        self.default_timeout = default_timeout
+        self.is_configured = is_configured
+        self.stats = ProviderStats(name)
+
+    def available(self) -> bool:
+        return self.is_configured() and get_breaker(self.name).state != OPEN
+
+
+PROVIDERS = {
+    "maps_co": Provider("maps_co", _geocode_maps_co, 15, lambda: True),
+    "google": Provider("google_geocode", _geocode_google, 10, lambda: bool(GOOGLE_GEOCODING_API_KEY)),
+}
+
+
+def _lookup_with_breaker(provider: Provider, query: str, timeout: float) -> Optional[Dict[str, Any]]:
+    breaker = get_breaker(provider.name)
+    if not breaker.allow_request():
+        return None
+    start = time.monotonic()
+    try:
+        record = get_upstream_timeout(provider.name).call(
+            lambda attempt_timeout: provider.lookup(query, attempt_timeout), timeout)
+    except Exception as e:
+        provider.stats.record_call((time.monotonic() - start) * 1000, False)
+        if isinstance(e, requests.RequestException):
+            breaker.record_exception(e)
+        else:
+            # A malformed answer (a 200 carrying an error object) is an upstream
+            # failure too, and recording it releases a half-open probe
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+    provider.stats.record_call((time.monotonic() - start) * 1000, True)
+    return record
+
+
+def _call_provider(provider: Provider, query: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    Query one provider under its rate limiter; identical concurrent queries share one call
+    """
+    limiter = get_limiter(provider.name)
+    try:
+        return limiter.call(query.strip().lower(), lambda: _lookup_with_breaker(provider, query, timeout), timeout)
+    except requests.RequestException as e:
+        logger.warning(f"Geocoding via {provider.name} failed for '{query}': {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error geocoding '{query}' via {provider.name}: {str(e)}")
+        return None
+
+
+def _is_good(record: Optional[Dict[str, Any]]) -> bool:
+    return bool(record and record.get("country"))
+
+
+def geocode(query: str, deadline: Optional[Deadline] = None,
+            providers: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Geocode ``query`` with hedging across providers and return a normalised record
+    """
+    order = [PROVIDERS[name] for name in (providers or GEOCODING_PROVIDERS) if name in PROVIDERS]
+    candidates: List[Provider] = [provider for provider in order if provider.available()]
+    if not query or not candidates:
+        return empty_location()
+
+    pending = {}
+
+    def launch(provider: Provider) -> bool:
+        timeout = stage_timeout(deadline, provider.default_timeout)
+        if timeout is None:
+            return False
+        pending[_executor.submit(_call_provider, provider, query, timeout)] = provider
+        return True
+
+    primary = candidates.pop(0)
+    if not launch(primary):
+        logger.warning(f"Request deadline reached, skipping geocoding for '{query}'")
+        return empty_location()
+    hedge_delay = primary.stats.hedge_delay_ms() / 1000.0
+    hedged = False
+    fallback = None
+
+    while pending:
+        wait_for = hedge_delay if candidates and not hedged else None
+        done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+        if not done:
+            hedged = True
+            put_metric("GeocodeHedged", 1, dimensions={"Provider": primary.name})
+            launch(candidates.pop(0))
+            continue
+
+        for future in done:
+            provider = pending.pop(future)
+            record = future.result()
+            if _is_good(record):
+                provider.stats.record_win()
+                put_metric("GeocodeWin", 1, dimensions={"Provider": provider.name})
+                record["provider"] = provider.name
+                return record
+            if record and fallback is None:
+                fallback = dict(record, provider=provider.name)
+        # The finished provider had no usable answer: try the next one straight away
+        if not pending and candidates:
+            launch(candidates.pop(0))
+
+    return fallback or empty_location()
+
+
+def geocoding_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-provider call counts, win rates, latency percentiles and current hedge delay
+    """
+    return {key: provider.stats.snapshot() for key, provider in PROVIDERS.items()}
@@ -0,0 +1,82 @@
+"""
+Shared HTTP session for outbound API calls.
+
+Every upstream call goes through one ``requests.Session`` per container, so
+TLS connections to Google, RestCountries, Smart Traveller and maps.co stay
+open across calls and across warm invocations instead of being set up for
+every request.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger()
+
+# Connections kept open per upstream host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    Process-wide session with a connection pool per upstream host
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def reset_session() -> None:
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+def preconnect(urls: Iterable[str], timeout: float = 2.0) -> Dict[str, Optional[float]]:
+    """
+    Open a pooled connection to each distinct origin in ``urls``.
+
+    Sends a HEAD to the origin root; any HTTP answer means DNS, TCP and TLS
+    are done and the connection is back in the pool. Returns milliseconds
+    per origin, or None where the origin could not be reached.
+    """
+    origins = sorted({origin(url) for url in urls if url})
+    session = get_session()
+
+    def connect(target: str) -> Optional[float]:
+        start = time.monotonic()
+        try:
+            session.head(target, timeout=timeout, allow_redirects=False).close()
+        except requests.RequestException as e:
+            logger.warning(f"Could not pre-connect to {target}: {str(e)}")
+            return None
+        return round((time.monotonic() - start) * 1000, 1)
+
+    if not origins:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(origins), 8)) as executor:
+        return dict(zip(origins, executor.map(connect, origins)))
@@ -0,0 +1,468 @@
+"""
+Idempotent request handling for the analysis endpoints.
+
+The extension and API Gateway retry requests that time out, and each retry
+used to run Vision and Bedrock again while the first attempt was still
+running. Requests now carry an idempotency key: the ``Idempotency-Key``
+header, an ``idempotency_key`` body field, or (when neither is given) a
+hash of the request payload and the client's identity. The first request
+with a key claims it with a conditional write and runs; its response is
+kept and replayed to later requests with the same key: for
+``IDEMPOTENCY_TTL`` seconds under a client key, and only for the short
+``IDEMPOTENCY_DERIVED_TTL`` retry window under a derived key, so identical
+requests from other clients, or much later, run again. A handler can
+shorten the replay of a particular response further (``replay_ttl``). A duplicate that
+arrives while the first is still running polls the record until the
+response is stored, then replays it. If the wait runs out it answers 409
+with ``Retry-After``.
+
+A claim is a lease for the lifetime of the claiming invocation. If that
+container dies, the next duplicate takes the key over once the lease
+expires. Server errors release the key so a retry runs again. A client key
+reused with a different payload is rejected with 422.
+
+Backends share the ``IdempotencyStore`` interface:
+
+- ``SQLiteIdempotencyStore``: one local file, for development and tests
+  (claims are atomic across processes sharing the file)
+- ``DynamoDBIdempotencyStore``: a table keyed by ``idempotency_key`` with
+  TTL on ``expires_at``, for production
+
+``IDEMPOTENCY_STORE`` selects the backend (``sqlite``, ``dynamodb`` or
+``none``); by default DynamoDB is used when ``IDEMPOTENCY_TABLE`` is set and
+requests are not deduplicated otherwise. If the store fails, the request
+runs as if the store were off.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from . import json_codec
+from .deadline import Deadline
+from .metrics import put_metric
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_TABLE = os.getenv("IDEMPOTENCY_TABLE", "")
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "/tmp/lambdatrip_idempotency.db")
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "dynamodb" if IDEMPOTENCY_TABLE else "none").lower()
+
+# How long completed responses are replayed under a client-supplied key
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "900"))
+
+# How long they are replayed under a derived key: long enough to absorb the
+# retries of one request, short enough not to act as a response cache
+IDEMPOTENCY_DERIVED_TTL = int(os.getenv("IDEMPOTENCY_DERIVED_TTL", "60"))
+
+# Longest a duplicate waits for the original request before answering 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "25"))
+
+# Derive a key from the payload when the client sends none
+IDEMPOTENCY_DERIVE_KEYS = os.getenv("IDEMPOTENCY_DERIVE_KEYS", "true").lower() == "true"
+
+# Polling interval while waiting, doubling up to the maximum
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 1.0
+
+# Shortest lease taken, in case the invocation reports almost no time left
+MIN_LEASE_SECONDS = 5
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+HEADER_NAME = "idempotency-key"
+MAX_KEY_LENGTH = 255
+
+
+def request_body(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Request payload from an API Gateway or direct event, or None if unreadable
+    """
+    if "body" not in event:
+        return event
+    body = event["body"]
+    if isinstance(body, str):
+        try:
+            body = json_codec.loads(body)
+        except ValueError:
+            return None
+    return body if isinstance(body, dict) else None
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json_codec.dumps(payload, sort_keys=True, stable=True).encode("utf-8")).hexdigest()
+
+
+def client_identity(event: Dict[str, Any]) -> str:
+    """
+    Who sent a request, as far as API Gateway reports it: the API key or
+    authorized principal, else the source IP and user agent. Direct
+    invocations have no identity.
+    """
+    request_context = event.get("requestContext") or {}
+    identity = request_context.get("identity") or {}
+    principal = (identity.get("apiKeyId") or identity.get("cognitoIdentityId")
+                 or (request_context.get("authorizer") or {}).get("principalId"))
+    if principal:
+        return f"principal:{principal}"
+    return f"{identity.get('sourceIp') or ''}|{identity.get('userAgent') or ''}"
+
+
+def request_key(function: str, event: Dict[str, Any], payload: Any) -> Tuple[Optional[str], bool]:
+    """
+    Store key for a request and whether the client supplied it
+    """
+    headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+    body = request_body(event) or {}
+    supplied = headers.get(HEADER_NAME) or body.get("idempotency_key")
+    if supplied:
+        return f"{function}:client:{str(supplied)[:MAX_KEY_LENGTH]}", True
+    if IDEMPOTENCY_DERIVE_KEYS:
+        # Scoped to the client, so one client's response is never replayed to another
+        return f"{function}:payload:{fingerprint({'client': client_identity(event), 'payload': payload})}", False
+    return None, False
+
+
+class IdempotencyStore:
+    """
+    Claims, completed responses and releases, keyed by idempotency key
+    """
+
+    def claim(self, key: str, request_hash: str, lease_seconds: float) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Claim ``key`` for a new execution. Returns ``(owner, None)`` when
+        claimed, or ``(None, record)`` with the live record holding it.
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def complete(self, key: str, owner: str, response: Dict[str, Any], ttl: int = IDEMPOTENCY_TTL) -> None:
+        raise NotImplementedError
+
+    def release(self, key: str, owner: str) -> None:
+        raise NotImplementedError
+
+
+def _live(record: Optional[Dict[str, Any]], now: float) -> bool:
+    if record is None or record["expires_at"] <= now:
+        return False
+    return record["status"] == COMPLETED or record["lease_until"] > now
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency records in a local SQLite file
+    """
+
+    COLUMNS = ("idempotency_key", "status", "owner", "request_hash", "response", "lease_until", "expires_at")
+
+    def __init__(self, path: str = IDEMPOTENCY_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                "idempotency_key TEXT PRIMARY KEY, status TEXT, owner TEXT, request_hash TEXT, "
+                "response TEXT, lease_until REAL, expires_at REAL)"
+            )
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM idempotency WHERE idempotency_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(self.COLUMNS, row))
+        record["response"] = json_codec.loads(record["response"]) if record["response"] else None
+        return record
+
+    def claim(self, key, request_hash, lease_seconds):
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock, so check-and-insert is atomic across processes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                record = self._get(key)
+                if _live(record, now):
+                    return None, record
+                owner = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?, NULL, ?, ?)",
+                    (key, IN_PROGRESS, owner, request_hash, now + lease_seconds, now + max(lease_seconds, IDEMPOTENCY_TTL))
+                )
+                return owner, None
+            finally:
+                self._conn.execute("COMMIT")
+
+    def get(self, key):
+        with self._lock:
+            record = self._get(key)
+        return record if _live(record, time.time()) else None
+
+    def complete(self, key, owner, response, ttl=IDEMPOTENCY_TTL):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency SET status = ?, response = ?, expires_at = ? "
+                "WHERE idempotency_key = ? AND owner = ?",
+                (COMPLETED, json_codec.dumps(response), time.time() + ttl, key, owner)
+            )
+
+    def release(self, key, owner):
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency WHERE idempotency_key = ? AND owner = ?", (key, owner))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class DynamoDBIdempotencyStore(IdempotencyStore):
+    """
+    Idempotency records in a DynamoDB table keyed by ``idempotency_key``;
+    claims, completions and releases are conditional writes
+    """
+
+    def __init__(self, table_name: str = IDEMPOTENCY_TABLE, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = client
+
+    @staticmethod
+    def _record(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "idempotency_key": item["idempotency_key"]["S"],
+            "status": item["status"]["S"],
+            "owner": item["owner"]["S"],
+            "request_hash": item.get("request_hash", {}).get("S"),
+            "response": json_codec.loads(item["response"]["S"]) if "response" in item else None,
+            "lease_until": float(item["lease_until"]["N"]),
+            "expires_at": float(item["expires_at"]["N"]),
+        }
+
+    @staticmethod
+    def _conditional_failure(error: Exception) -> bool:
+        return getattr(error, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+    def claim(self, key, request_hash, lease_seconds):
+        now = time.time()
+        owner = uuid.uuid4().hex
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "idempotency_key": {"S": key},
+                    "status": {"S": IN_PROGRESS},
+                    "owner": {"S": owner},
+                    "request_hash": {"S": request_hash},
+                    "lease_until": {"N": str(round(now + lease_seconds, 3))},
+                    "expires_at": {"N": str(int(now + max(lease_seconds, IDEMPOTENCY_TTL)))},
+                },
+                # New key, an expired record, or an in-progress claim whose invocation is gone
+                ConditionExpression="attribute_not_exists(idempotency_key) OR expires_at <= :now "
+                                    "OR (#s = :in_progress AND lease_until <= :now)",
+                ExpressionAttributeNames={"#s": "status"},
+                ExpressionAttributeValues={":now": {"N": str(round(now, 3))}, ":in_progress": {"S": IN_PROGRESS}},
+            )
+            return owner, None
+        except Exception as e:
+            if not self._conditional_failure(e):
+                raise
+        record = self.get(key)
+        if record is None:
+            # Released or expired between the write and the read; let the caller retry
+            return None, {"status": IN_PROGRESS, "request_hash": request_hash, "lease_until": now, "expires_at": now}
+        return None, record
+
+    def get(self, key):
+        item = self.client.get_item(TableName=self.table_name, Key={"idempotency_key": {"S": key}},
+                                    ConsistentRead=True).get("Item")
+        if not item:
+            return None
+        record = self._record(item)
+        return record if _live(record, time.time()) else None
+
+    def complete(self, key, owner, response, ttl=IDEMPOTENCY_TTL):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"idempotency_key": {"S": key}},
+                UpdateExpression="SET #s = :completed, #r = :response, expires_at = :expires",
+                ConditionExpression="#o = :owner",
+                ExpressionAttributeNames={"#s": "status", "#r": "response", "#o": "owner"},
+                ExpressionAttributeValues={
+                    ":completed": {"S": COMPLETED},
+                    ":response": {"S": json_codec.dumps(response)},
+                    ":expires": {"N": str(int(time.time() + ttl))},
+                    ":owner": {"S": owner},
+                },
+            )
+        except Exception as e:
+            # Another invocation took the key over after our lease ran out
+            if not self._conditional_failure(e):
+                raise
+
+    def release(self, key, owner):
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={"idempotency_key": {"S": key}},
+                ConditionExpression="#o = :owner",
+                ExpressionAttributeNames={"#o": "owner"},
+                ExpressionAttributeValues={":owner": {"S": owner}},
+            )
+        except Exception as e:
+            if not self._conditional_failure(e):
+                raise
+
+
+_store: Optional[IdempotencyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> Optional[IdempotencyStore]:
+    """
+    Process-wide idempotency store, or None when deduplication is off
+    """
+    global _store
+    if _store is None and IDEMPOTENCY_STORE != "none":
+        with _store_lock:
+            if _store is None:
+                if IDEMPOTENCY_STORE == "sqlite":
+                    _store = SQLiteIdempotencyStore(IDEMPOTENCY_DB_PATH)
+                elif IDEMPOTENCY_STORE == "dynamodb":
+                    _store = DynamoDBIdempotencyStore(IDEMPOTENCY_TABLE)
+                else:
+                    logger.error(f"Unknown IDEMPOTENCY_STORE {IDEMPOTENCY_STORE!r}; requests will not be deduplicated")
+    return _store
+
+
+def set_idempotency_store(store: Optional[IdempotencyStore]) -> None:
+    """
+    Replace the process-wide store (tests, tools)
+    """
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def _json_response(status_code: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return {
+        "statusCode": status_code,
+        "headers": dict({
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        }, **(headers or {})),
+        "body": json_codec.dumps(dict(body, timestamp=datetime.utcnow().isoformat()))
+    }
+
+
+def _replay(function: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    put_metric("IdempotentReplay", 1, dimensions={"Function": function})
+    response = dict(record["response"])
+    response["headers"] = dict(response.get("headers") or {}, **{"Idempotent-Replayed": "true"})
+    return response
+
+
+def _wait(store: IdempotencyStore, key: str, budget: float) -> Optional[Dict[str, Any]]:
+    """
+    Poll until the record completes or disappears; returns the last record
+    seen (None once it is gone)
+    """
+    waited_until = time.monotonic() + budget
+    interval = POLL_INTERVAL
+    record = store.get(key)
+    while record is not None and record["status"] != COMPLETED and time.monotonic() < waited_until:
+        time.sleep(min(interval, max(waited_until - time.monotonic(), 0)))
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
+        record = store.get(key)
+    return record
+
+
+def run_idempotent(function: str, event: Dict[str, Any], context, handler: Callable,
+                   payload: Callable[[Dict[str, Any]], Any],
+                   replay_ttl: Optional[Callable[[Dict[str, Any]], Optional[float]]] = None) -> Dict[str, Any]:
+    """
+    Run ``handler(event, context)`` at most once per idempotency key.
+
+    ``payload`` maps the request body to the fields that identify the
+    request; it is hashed into the derived key and into the fingerprint that
+    detects a client key reused for a different request. ``replay_ttl``
+    maps a response to the longest it may be replayed, or None for the
+    key's default.
+    """
+    store = get_idempotency_store()
+    body = request_body(event) if store is not None else None
+    if body is None:
+        return handler(event, context)
+
+    request_hash = fingerprint(payload(body))
+    key, supplied = request_key(function, event, payload(body))
+    if key is None:
+        return handler(event, context)
+
+    # The claim lasts as long as this invocation can run
+    lease = max(Deadline.from_context(context, reserve_ms=0).remaining(), MIN_LEASE_SECONDS)
+    owner = None
+    try:
+        for _ in range(2):
+            owner, record = store.claim(key, request_hash, lease)
+            if owner is not None:
+                break
+            if supplied and record.get("request_hash") != request_hash:
+                put_metric("IdempotencyConflict", 1, dimensions={"Function": function})
+                return _json_response(422, {"error": "Idempotency key was already used for a different request"})
+            if record["status"] == COMPLETED:
+                return _replay(function, record)
+
+            put_metric("IdempotentWait", 1, dimensions={"Function": function})
+            budget = min(IDEMPOTENCY_WAIT_SECONDS, Deadline.from_context(context).remaining())
+            record = _wait(store, key, budget)
+            if record is not None and record["status"] == COMPLETED:
+                return _replay(function, record)
+            if record is not None:
+                return _json_response(409, {"error": "A request with this idempotency key is still in progress"},
+                                      {"Retry-After": str(max(1, int(record["lease_until"] - time.time())))})
+            # The original released the key (it failed) or its lease lapsed: run it here
+    except Exception as e:
+        logger.error(f"Idempotency store unavailable, running request without it: {str(e)}")
+        put_metric("IdempotencyStoreError", 1, dimensions={"Function": function})
+        return handler(event, context)
+    if owner is None:
+        return handler(event, context)
+
+    try:
+        response = handler(event, context)
+    except Exception:
+        _settle(store, key, owner, None, 0)
+        raise
+    ttl = IDEMPOTENCY_TTL if supplied else IDEMPOTENCY_DERIVED_TTL
+    limit = replay_ttl(response) if replay_ttl is not None and response is not None else None
+    _settle(store, key, owner, response, ttl if limit is None else min(ttl, limit))
+    return response
+
+
+def _settle(store: IdempotencyStore, key: str, owner: str, response: Optional[Dict[str, Any]],
+            ttl: float) -> None:
+    """
+    Keep a final response for replay for ``ttl`` seconds; release the key
+    after server errors (or with no replay time) so a retry runs again
+    """
+    try:
+        if response is not None and response.get("statusCode", 500) < 500 and ttl > 0:
+            store.complete(key, owner, response, ttl)
+        else:
+            store.release(key, owner)
+    except Exception as e:
+        logger.error(f"Could not record idempotent response for {key}: {str(e)}")
@@ -0,0 +1,225 @@
+"""
+Image ingestion for the Vision call.
+
+Fetches the image once with a streaming, byte-capped read, downscales it to
+the resolution Vision needs for landmark detection and returns the bytes to
+send inline as base64 ``content``. This avoids Google fetching large
+originals itself (or being blocked by the image host), and the SHA-256 of
+the original bytes doubles as an image fingerprint.
+
+Image URLs come from clients, so only http and https URLs whose host
+resolves to public addresses are fetched. Private, loopback and link-local
+addresses (the instance metadata service among them) are rejected, and each
+redirect is checked the same way before it is followed.
+
+Downscaling needs Pillow; without it images under the size cap are sent
+as-is.
+"""
+
+import base64
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+from typing import Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import requests
+
+from .deadline import Deadline, stage_timeout
+from .http_client import get_session
+
+try:
+    from PIL import Image
+except ImportError:
+    # Pillow not available, send images without downscaling
+    Image = None
+
+logger = logging.getLogger()
+
+# Largest image we are willing to download
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Longest edge after downscaling; landmark detection does not benefit from more
+VISION_MAX_DIMENSION = int(os.getenv("VISION_MAX_DIMENSION", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+
+# Vision rejects inline requests above ~10MB, so leave room for base64 overhead
+VISION_MAX_INLINE_BYTES = 7 * 1024 * 1024
+
+FETCH_CHUNK_SIZE = 64 * 1024
+USER_AGENT = "LambdaTrip/1.0 (contact@example.com)"
+
+# Redirects followed (each one re-checked) before giving up
+IMAGE_MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Fetch from private, loopback and link-local addresses too; for local stubs only
+IMAGE_FETCH_ALLOW_PRIVATE = os.getenv("IMAGE_FETCH_ALLOW_PRIVATE", "false").lower() == "true"
+
+
+class ImageFetchError(Exception):
+    """
+    The image could not be downloaded or is not an image
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImageURLRejected(ImageFetchError):
+    """
+    The image URL points somewhere we do not fetch from (bad scheme, private address)
+    """
+
+
+class IngestedImage:
+    """
+    Image bytes ready for Vision, plus what we learned while fetching them
+    """
+
+    __slots__ = ("content", "content_type", "width", "height", "original_bytes", "fingerprint")
+
+    def __init__(self, content: bytes, content_type: str, width: Optional[int], height: Optional[int],
+                 original_bytes: int, fingerprint: str):
+        self.content = content
+        self.content_type = content_type
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        self.fingerprint = fingerprint
+
+    def as_base64(self) -> str:
+        return base64.b64encode(self.content).decode("ascii")
+
+
+def normalize_image_url(image_url: str) -> str:
+    """
+    Canonical form of an image URL for cache keys: lower-case scheme and host,
+    no default port, no fragment. Path and query are kept as-is.
+    """
+    parts = urlsplit(image_url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return image_url.strip()
+    if port == (80 if scheme == "http" else 443):
+        port = None
+    netloc = f"{host}:{port}" if port else host
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def check_image_url(image_url: str) -> None:
+    """
+    Reject URLs that are not http(s) or whose host resolves to a non-public address
+    """
+    parts = urlsplit(image_url)
+    if parts.scheme not in ("http", "https"):
+        raise ImageURLRejected("Image URL must use http or https")
+    host = parts.hostname
+    if not host:
+        raise ImageURLRejected("Image URL has no host")
+    try:
+        port = parts.port or (80 if parts.scheme == "http" else 443)
+    except ValueError:
+        raise ImageURLRejected("Image URL has an invalid port")
+    if IMAGE_FETCH_ALLOW_PRIVATE:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ImageFetchError(f"Could not resolve image host {host}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ImageURLRejected(f"Image host {host} resolves to a non-public address")
+
+
+def fetch_image(image_url: str, max_bytes: int = IMAGE_MAX_BYTES,
+                deadline: Optional[Deadline] = None) -> bytes:
+    """
+    Download an image with a streaming read, aborting once it exceeds ``max_bytes``.
+    The URL and every redirect target are checked with ``check_image_url``.
+    """
+    timeout = stage_timeout(deadline, 10)
+    if timeout is None:
+        raise ImageFetchError("Request deadline reached before fetching image")
+    url = image_url
+    try:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            check_image_url(url)
+            with get_session().get(url, stream=True, timeout=timeout, allow_redirects=False,
+                                   headers={"User-Agent": USER_AGENT}) as response:
+                location = response.headers.get("Location")
+                if response.status_code in REDIRECT_STATUSES and location:
+                    url = urljoin(url, location)
+                    continue
+                return read_image_response(response, max_bytes)
+        raise ImageFetchError(f"Image URL redirected more than {IMAGE_MAX_REDIRECTS} times")
+    except requests.RequestException as e:
+        raise ImageFetchError(f"Could not fetch image: {str(e)}")
+
+
+def read_image_response(response, max_bytes: int) -> bytes:
+    """
+    Read a streamed image response, enforcing status, content type and size
+    """
+    if response.status_code >= 400:
+        raise ImageFetchError(f"Image URL returned HTTP {response.status_code}", response.status_code)
+    content_type = response.headers.get("Content-Type", "")
+    if content_type and not content_type.startswith("image/") and "octet-stream" not in content_type:
+        raise ImageFetchError(f"URL is not an image (Content-Type: {content_type})")
+    declared = response.headers.get("Content-Length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise ImageFetchError(f"Image is {declared} bytes, over the {max_bytes} byte limit")
+
+    buffer = bytearray()
+    for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise ImageFetchError(f"Image exceeds the {max_bytes} byte limit")
+    return bytes(buffer)
+
+
+def downscale_image(data: bytes, max_dimension: int = VISION_MAX_DIMENSION):
+    """
+    Shrink an image so its longest edge is at most ``max_dimension``.
+
+    Returns ``(bytes, content_type, width, height)``; the original bytes are
+    returned unchanged when Pillow is missing or the image is already small.
+    """
+    if Image is None:
+        return data, "application/octet-stream", None, None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if max(width, height) <= max_dimension and len(data) <= VISION_MAX_INLINE_BYTES:
+                return data, Image.MIME.get(image.format, "application/octet-stream"), width, height
+            image.draft("RGB", (max_dimension, max_dimension))
+            image = image.convert("RGB")
+            image.thumbnail((max_dimension, max_dimension))
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+            return output.getvalue(), "image/jpeg", image.width, image.height
+    except Exception as e:
+        raise ImageFetchError(f"Could not decode image: {str(e)}")
+
+
+def ingest_image(image_url: str, deadline: Optional[Deadline] = None) -> IngestedImage:
+    """
+    Fetch, fingerprint and downscale an image for an inline Vision request
+    """
+    original = fetch_image(image_url, deadline=deadline)
+    fingerprint = hashlib.sha256(original).hexdigest()
+    content, content_type, width, height = downscale_image(original)
+    if len(content) > VISION_MAX_INLINE_BYTES:
+        raise ImageFetchError(f"Image is too large to send inline ({len(content)} bytes)")
+    logger.info(f"Ingested image {fingerprint[:12]}: {len(original)} -> {len(content)} bytes")
+    return IngestedImage(content, content_type, width, height, len(original), fingerprint)
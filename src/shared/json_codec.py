@@ -0,0 +1,132 @@
+"""
+JSON encoding and decoding for the handlers and shared modules.
+
+Every request parses its event body and the Bedrock response, and it
+serializes S3 artifacts, the results index entry and the response body.
+When ``orjson`` is installed (it is listed in the function requirements)
+these calls go through it, which is several times faster than the stdlib
+``json`` module. Without it, the stdlib is used with the same output
+format, so nothing else changes.
+
+Output format:
+
+- ``dumps`` is compact (``{"a":1,"b":[1,2]}``), or uses two-space indentation
+  with ``indent=2``
+- non-ASCII text is written as UTF-8 rather than ``\\u`` escapes
+- datetimes, dates and times are written with ``isoformat()``
+  (``2025-03-01T12:30:00``)
+- NaN and infinities are written as ``null``
+- integers beyond 64 bits, which orjson rejects, are encoded by the stdlib
+  and written exactly
+- objects that are not JSON types go through ``default``; the default
+  writes records from ``shared.models`` (anything with ``to_dict``) as their
+  wire dict and everything else with ``str``
+
+The one difference left is the spelling of floats in exponent form: orjson
+writes ``1e16`` where the stdlib writes ``1e+16``. Both parse to the same
+value.
+
+Some outputs must not change with the backend, because they are hashed,
+cached or sent as prompt text: idempotency fingerprints and the JSON
+embedded in Bedrock prompts. These use ``stable=True``, which always uses
+the stdlib with its historical settings (``", "``/``": "`` separators,
+ASCII escapes). Their bytes are then identical with or without orjson and
+identical to what the code produced before this module existed.
+
+``JSON_BACKEND=stdlib`` forces the stdlib, for comparisons and debugging.
+"""
+
+import json
+import math
+import os
+from datetime import date, datetime, time
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    # orjson not available, stdlib only
+    orjson = None
+
+if os.getenv("JSON_BACKEND", "").lower() == "stdlib":
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "stdlib"
+
+# Raised by loads for malformed input, whichever backend parsed it
+JSONDecodeError = json.JSONDecodeError
+
+
+def encode_default(obj: Any) -> Any:
+    to_dict = getattr(obj, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any, indent: Optional[int] = None, sort_keys: bool = False,
+                default: Optional[Callable[[Any], Any]] = encode_default) -> bytes:
+    """
+    UTF-8 encoded JSON, for S3 bodies and other byte sinks
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except orjson.JSONEncodeError:
+            # Integers beyond 64 bits; the stdlib writes them (and raises for anything else)
+            pass
+    return _stdlib_dumps(obj, indent, sort_keys, default).encode("utf-8")
+
+
+def dumps(obj: Any, indent: Optional[int] = None, sort_keys: bool = False,
+          default: Optional[Callable[[Any], Any]] = encode_default, stable: bool = False) -> str:
+    """
+    JSON text; with ``stable`` the output is the stdlib's default format,
+    byte-for-byte independent of the installed backend
+    """
+    if stable:
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys, default=default)
+    if orjson is not None:
+        return dumps_bytes(obj, indent, sort_keys, default).decode("utf-8")
+    return _stdlib_dumps(obj, indent, sort_keys, default)
+
+
+def _stdlib_dumps(obj, indent, sort_keys, default) -> str:
+    # Same layout as orjson: compact separators, or indent 2 with ": "
+    options = {"indent": 2 if indent else None, "separators": (",", ": ") if indent else (",", ":"),
+               "sort_keys": sort_keys, "ensure_ascii": False, "allow_nan": False}
+    try:
+        return json.dumps(obj, default=default, **options)
+    except ValueError as e:
+        if "Out of range float" not in str(e):
+            raise
+    # Like orjson, write NaN and infinities as null
+    def finite_default(value):
+        return _finite(default(value))
+
+    return json.dumps(_finite(obj), default=finite_default if default is not None else None, **options)
+
+
+def _finite(value: Any) -> Any:
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
@@ -0,0 +1,255 @@
+"""
+Precomputed landmark knowledge base.
+
+A small set of famous landmarks accounts for most traffic, and their city,
+country, coordinates and the static parts of their analysis never change.
+The knowledge base stores those records in a single file that is
+memory-mapped read-only, so a warm container pays only for the pages it
+touches and no parsing happens at import time.
+
+File layout (little-endian):
+
+    header   magic "LTKB", version u32, key_count u32, index_offset u32
+    records  compact UTF-8 JSON objects, back to back
+    index    key_count x (key_hash u64, record_offset u32, record_length u32),
+             sorted by key_hash
+
+Each record is reachable from several keys (``name:<normalized name>`` and
+``mid:<Vision mid>``). Keys are hashed to 64 bits; a record lists its keys so
+a hash collision is detected on lookup rather than returning the wrong
+landmark.
+
+Build files with ``python -m tools.build_landmark_kb``. No file is checked
+in: the deploy builds ``src/shared/data/landmarks.kb`` from past results
+before ``sam build``, and without it every lookup is a miss.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .metrics import put_metric
+from .models import Landmark
+
+logger = logging.getLogger()
+
+LANDMARK_KB_PATH = os.getenv(
+    "LANDMARK_KB_PATH", os.path.join(os.path.dirname(__file__), "data", "landmarks.kb")
+)
+
+MAGIC = b"LTKB"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+INDEX_ENTRY = struct.Struct("<QII")
+
+# Analysis fields that describe the landmark itself. Safety rating, best visit time
+# and travel advisory depend on current conditions and are never served from the file.
+ANALYSIS_FIELDS = (
+    "summary",
+    "insights",
+    "travel_tips",
+    "cultural_highlights",
+)
+
+
+def normalize_landmark_name(name: str) -> str:
+    """
+    Lower-case, accent-free, punctuation-free form of a Vision landmark name
+    """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    ascii_name = decomposed.encode("ascii", "ignore").decode("ascii").lower()
+    return re.sub(r"[^a-z0-9]+", " ", ascii_name).strip()
+
+
+def landmark_keys(name: Optional[str] = None, mid: Optional[str] = None) -> List[str]:
+    keys = []
+    if mid:
+        keys.append(f"mid:{mid.strip()}")
+    normalized = normalize_landmark_name(name) if name else ""
+    if normalized:
+        keys.append(f"name:{normalized}")
+    return keys
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def write_knowledge_base(entries: Iterable[Dict[str, Any]], path: str) -> int:
+    """
+    Write entries to ``path`` atomically and return the number of records.
+
+    Each entry needs a ``name`` and may carry ``mid``, ``aliases``, location
+    fields and an ``analysis`` dict.
+    """
+    records = bytearray()
+    index = []
+    count = 0
+    for entry in entries:
+        keys = landmark_keys(entry.get("name"), entry.get("mid"))
+        for alias in entry.get("aliases", []):
+            keys.extend(key for key in landmark_keys(alias) if key not in keys)
+        if not keys:
+            continue
+        record = dict(entry, keys=keys)
+        blob = json.dumps(record, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        offset = HEADER.size + len(records)
+        records.extend(blob)
+        index.extend((_key_hash(key), offset, len(blob)) for key in keys)
+        count += 1
+    index.sort()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(index), HEADER.size + len(records)))
+        f.write(records)
+        for item in index:
+            f.write(INDEX_ENTRY.pack(*item))
+    os.replace(tmp_path, path)
+    return count
+
+
+class LandmarkKnowledgeBase:
+    """
+    Read-only view over a memory-mapped knowledge base file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.key_count, self._index_offset = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} landmark knowledge base")
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _hash_at(self, position: int) -> int:
+        return INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)[0]
+
+    def _record(self, position: int) -> Dict[str, Any]:
+        _, offset, length = INDEX_ENTRY.unpack_from(self._map, self._index_offset + position * INDEX_ENTRY.size)
+        with self._lock:
+            record = self._records.get(offset)
+            if record is None:
+                record = self._records[offset] = json.loads(self._map[offset:offset + length])
+        return record
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Record for an exact key (``name:...`` or ``mid:...``), or None
+        """
+        target = _key_hash(key)
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._hash_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self.key_count and self._hash_at(low) == target:
+            record = self._record(low)
+            if key in record.get("keys", ()):
+                return record
+            low += 1
+        return None
+
+    def lookup(self, name: Optional[str] = None, mid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a landmark by Vision ``mid`` first, then by normalized name
+        """
+        for key in landmark_keys(name, mid):
+            record = self.get(key)
+            if record is not None:
+                return record
+        return None
+
+    def preload(self) -> None:
+        """
+        Ask the kernel to read the whole file in now rather than on first lookup
+        """
+        if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._map.madvise(mmap.MADV_WILLNEED)
+        else:
+            page = mmap.PAGESIZE
+            sum(self._map[offset] for offset in range(0, len(self._map), page))
+
+    def close(self) -> None:
+        self._map.close()
+
+
+_knowledge_base: Optional[LandmarkKnowledgeBase] = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_knowledge_base() -> Optional[LandmarkKnowledgeBase]:
+    """
+    Process-wide knowledge base, or None when no file is bundled
+    """
+    global _knowledge_base, _loaded
+    if _loaded:
+        return _knowledge_base
+    with _load_lock:
+        if not _loaded:
+            if os.path.exists(LANDMARK_KB_PATH):
+                try:
+                    _knowledge_base = LandmarkKnowledgeBase(LANDMARK_KB_PATH)
+                    logger.info(f"Loaded landmark knowledge base with {_knowledge_base.key_count} keys")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not load landmark knowledge base: {str(e)}")
+            else:
+                logger.info(f"No landmark knowledge base at {LANDMARK_KB_PATH}, every lookup will miss")
+            _loaded = True
+    return _knowledge_base
+
+
+def reset_knowledge_base(path: Optional[str] = None) -> None:
+    """
+    Drop the loaded knowledge base, optionally pointing at a new file
+    """
+    global _knowledge_base, _loaded, LANDMARK_KB_PATH
+    with _load_lock:
+        if _knowledge_base is not None:
+            _knowledge_base.close()
+        _knowledge_base = None
+        _loaded = False
+        if path is not None:
+            LANDMARK_KB_PATH = path
+
+
+def lookup_landmark(name: Optional[str] = None, mid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Knowledge base record for a detected landmark, or None on a miss
+    """
+    knowledge_base = get_knowledge_base()
+    if knowledge_base is None:
+        return None
+    record = knowledge_base.lookup(name, mid)
+    put_metric("LandmarkKnowledgeBase", 1, dimensions={"Result": "hit" if record else "miss"})
+    return record
+
+
+def precomputed_analysis(landmark: Union[Landmark, Dict[str, Any], None]) -> Optional[Dict[str, Any]]:
+    """
+    Copy of the stored analysis for a landmark, if the knowledge base has one
+    """
+    landmark = Landmark.from_dict(landmark)
+    if landmark is None:
+        return None
+    record = lookup_landmark(landmark.name, landmark.mid)
+    if not record or not record.get("analysis"):
+        return None
+    # Files built before the field list shrank may still carry condition-dependent fields
+    analysis = {field: record["analysis"][field] for field in ANALYSIS_FIELDS if field in record["analysis"]}
+    return json.loads(json.dumps(analysis))
@@ -0,0 +1,89 @@
+"""
+Lightweight metrics for LambdaTrip Lambda functions.
+
+Metrics are written to stdout in CloudWatch Embedded Metric Format (EMF),
+which CloudWatch Logs turns into metrics without any API calls, and are also
+kept in-process so tests and benchmarks can inspect them.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "LambdaTrip")
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+
+
+def metrics_enabled() -> bool:
+    """
+    EMF output is on inside Lambda, or when METRICS_ENABLED=true
+    """
+    setting = os.getenv("METRICS_ENABLED")
+    if setting is not None:
+        return setting.lower() in ("1", "true", "yes")
+    return bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+
+
+def _key(name: str, dimensions: Optional[Dict[str, str]]) -> str:
+    if not dimensions:
+        return name
+    dims = ",".join(f"{k}={v}" for k, v in sorted(dimensions.items()))
+    return f"{name}[{dims}]"
+
+
+def put_metric(name: str, value: float, unit: str = "Count",
+               dimensions: Optional[Dict[str, str]] = None) -> None:
+    """
+    Record a metric value and emit it as an EMF log line
+    """
+    key = _key(name, dimensions)
+    with _lock:
+        if unit == "Count":
+            _counters[key] = _counters.get(key, 0) + value
+        else:
+            _gauges[key] = value
+
+    if not metrics_enabled():
+        return
+
+    dimensions = dimensions or {}
+    record: Dict[str, Any] = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [sorted(dimensions.keys())],
+                "Metrics": [{"Name": name, "Unit": unit}],
+            }],
+        },
+        name: value,
+    }
+    record.update(dimensions)
+    print(json.dumps(record))
+
+
+def set_gauge(name: str, value: float, dimensions: Optional[Dict[str, str]] = None,
+              unit: str = "None") -> None:
+    """
+    Record a point-in-time value such as a breaker state or queue depth
+    """
+    put_metric(name, value, unit=unit, dimensions=dimensions)
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """
+    Current in-process counters and gauges
+    """
+    with _lock:
+        return {"counters": dict(_counters), "gauges": dict(_gauges)}
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,192 @@
+"""
+Cross-request micro-batching for upstreams that accept several items per call.
+
+Google Vision's ``images:annotate`` takes up to 16 images in one request,
+but each invocation used to send its own one-image call. When one process
+serves many requests at once (the service mode in ``src/service``), a
+``MicroBatcher`` collects the items that callers submit within a short
+window and sends them as one call:
+
+  - the first item opens a batch; the batch is sent when
+    ``window`` seconds have passed or ``max_size`` items have joined
+  - each caller blocks only on its own item and gives up after its own
+    timeout, so a short request budget is not stretched by the batch
+  - the batch call gets the longest remaining budget of its items
+  - per-item errors in a successful call (Vision's per-image ``error``)
+    are results of their own item only
+  - when a call with several items fails as a whole, each item is retried
+    in a call of its own, so one bad item fails only its own caller; a
+    timeout fails the whole batch, since the retries would not fit in the
+    budget either
+
+Batches are sent on a small pool, so the next batch can fill while one is
+in flight. ``MicroBatchSize`` records how many items each call carried and
+``MicroBatchRetries`` how many items were retried on their own.
+
+On Lambda each container serves one request at a time, and a batch could
+only ever hold one item, so batching is off unless a window is configured
+(``VISION_BATCH_WINDOW_MS``) or the service turns it on.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from .metrics import put_metric
+
+logger = logging.getLogger()
+
+# Collection window for Vision batches in milliseconds; 0 sends every image on its own
+VISION_BATCH_WINDOW_MS = float(os.getenv("VISION_BATCH_WINDOW_MS", "0"))
+
+# Images per images:annotate call (Vision accepts at most 16)
+VISION_BATCH_MAX = int(os.getenv("VISION_BATCH_MAX", "16"))
+
+# Batch calls in flight at once per batcher
+BATCH_SENDERS = int(os.getenv("MICRO_BATCH_SENDERS", "4"))
+
+
+class BatchTimeout(requests.Timeout):
+    """
+    The caller's budget ran out while its item was queued or in flight
+    """
+
+
+class _Item:
+    __slots__ = ("payload", "future", "deadline")
+
+    def __init__(self, payload: Any, deadline: float):
+        self.payload = payload
+        self.future: Future = Future()
+        self.deadline = deadline
+
+
+class MicroBatcher:
+    """
+    Groups items submitted by concurrent callers into calls of
+    ``send(payloads, timeout) -> results`` (one result per payload, in order)
+    """
+
+    def __init__(self, name: str, send: Callable[[List[Any], float], List[Any]],
+                 window: float, max_size: int):
+        self.name = name
+        self.send = send
+        self.window = window
+        self.max_size = max(max_size, 1)
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[_Item]" = queue.Queue()
+        self._senders = ThreadPoolExecutor(max_workers=BATCH_SENDERS, thread_name_prefix=f"{name}-batch")
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, payload: Any, timeout: float) -> Any:
+        """
+        Send ``payload`` with the next batch and return its result
+        """
+        item = _Item(payload, time.monotonic() + timeout)
+        self._ensure_collector()
+        self._queue.put(item)
+        try:
+            return item.future.result(timeout)
+        except FutureTimeout:
+            item.future.cancel()
+            raise BatchTimeout(f"{self.name} batch did not answer within {timeout:.2f}s")
+
+    def _ensure_collector(self) -> None:
+        if self._collector is not None:
+            return
+        with self._lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name=f"{self.name}-batcher", daemon=True)
+                self._collector.start()
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            closes = time.monotonic() + self.window
+            while len(batch) < self.max_size:
+                wait = closes - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=wait))
+                except queue.Empty:
+                    break
+            # Callers that already gave up are not sent
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if batch:
+                self._senders.submit(self._flush, batch)
+
+    def _flush(self, batch: List[_Item]) -> None:
+        timeout = max(item.deadline for item in batch) - time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+        put_metric("MicroBatchSize", len(batch), dimensions={"Batcher": self.name})
+        try:
+            if timeout <= 0:
+                raise BatchTimeout(f"{self.name} batch expired before it was sent")
+            results = self.send([item.payload for item in batch], timeout)
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name} batch of {len(batch)} returned {len(results)} results")
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, requests.Timeout):
+                logger.warning(f"{self.name} batch of {len(batch)} failed ({str(e)}), retrying items on their own")
+                put_metric("MicroBatchRetries", len(batch), dimensions={"Batcher": self.name})
+                for item in batch:
+                    self._senders.submit(self._flush, [item])
+                return
+            for item in batch:
+                item.future.set_exception(e)
+            return
+        for item, result in zip(batch, results):
+            item.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_size": round(self.items / self.batches, 2) if self.batches else None,
+            }
+
+
+_batchers: Dict[str, MicroBatcher] = {}
+_registry_lock = threading.Lock()
+
+
+def get_batcher(name: str, send: Callable[[List[Any], float], List[Any]],
+                window_ms: Optional[float] = None, max_size: Optional[int] = None) -> Optional[MicroBatcher]:
+    """
+    Return the process-wide batcher for ``name``, or None when batching is off
+    (a window of 0 ms). Defaults come from ``VISION_BATCH_WINDOW_MS`` and
+    ``VISION_BATCH_MAX``.
+    """
+    window_ms = VISION_BATCH_WINDOW_MS if window_ms is None else window_ms
+    if window_ms <= 0:
+        return None
+    with _registry_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = _batchers[name] = MicroBatcher(
+                name, send, window_ms / 1000.0, VISION_BATCH_MAX if max_size is None else max_size)
+        return batcher
+
+
+def batcher_stats() -> Dict[str, Dict[str, Any]]:
+    with _registry_lock:
+        batchers = list(_batchers.values())
+    return {batcher.name: batcher.stats() for batcher in batchers}
+
+
+def reset_batchers() -> None:
+    with _registry_lock:
+        _batchers.clear()
@@ -0,0 +1,316 @@
+"""
+Typed records for the data the handlers pass between each other.
+
+The image processor builds the landmark, weather and country info as
+nested dicts and the landmark analyzer reads them back with chains of
+``.get(...)``; each handler re-shaped the same data its own way. These
+slotted records are the one in-memory form of that data. They are built
+(or parsed) once per request and passed around by reference; dicts only
+exist at the edges, when a record is written as JSON or read from it.
+
+Wire format:
+
+- ``to_dict`` gives the JSON shape, with keys in the same order as before
+  these records existed; fields that are None are left out unless the
+  record lists them in ``_keep_none``
+- ``from_dict`` ignores unknown keys and treats missing ones as None, so
+  older and newer writers both parse
+- ``json_codec`` serializes records directly (it calls ``to_dict``)
+- the image processor's hand-off to the landmark analyzer
+  (``AnalysisData``) carries ``schema_version``. Payloads without one are
+  version 1; payloads from a newer writer raise ``SchemaVersionError``.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# Version of the AnalysisData wire schema; bump when a field changes meaning or type
+SCHEMA_VERSION = 1
+
+
+class SchemaVersionError(ValueError):
+    """
+    The payload was written with a schema this code does not understand
+    """
+
+
+class Record:
+    """
+    Base for slotted records: JSON conversion, equality and repr from ``__slots__``
+    """
+
+    __slots__ = ()
+
+    # Fields written as null instead of being left out when they are None
+    _keep_none: Tuple[str, ...] = ()
+    # Fields holding nested records: field name -> record class
+    _nested: Dict[str, type] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        out = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None:
+                if name in self._keep_none:
+                    out[name] = None
+                continue
+            if isinstance(value, Record):
+                value = value.to_dict()
+            out[name] = value
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]):
+        """
+        Parse the wire form; None or an empty dict gives None
+        """
+        if data is None or isinstance(data, cls):
+            return data
+        if not isinstance(data, dict):
+            raise TypeError(f"{cls.__name__} expects an object, got {type(data).__name__}")
+        if not data:
+            return None
+        fields = {}
+        for name in cls.__slots__:
+            value = data.get(name)
+            nested = cls._nested.get(name)
+            if nested is not None and value is not None:
+                value = nested.from_dict(value)
+            fields[name] = value
+        return cls(**fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__
+                           if getattr(self, name) is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+class Location(Record):
+    """
+    Where a landmark is; label-only detections only have a description
+    """
+
+    __slots__ = ("lat", "lng", "city", "country", "country_code", "description")
+    _keep_none = ("city", "country")
+
+    def __init__(self, lat: Optional[float] = None, lng: Optional[float] = None, city: Optional[str] = None,
+                 country: Optional[str] = None, country_code: Optional[str] = None,
+                 description: Optional[str] = None):
+        self.lat = lat
+        self.lng = lng
+        self.city = city
+        self.country = country
+        self.country_code = country_code
+        self.description = description
+
+    @property
+    def coordinates(self) -> Optional[Tuple[float, float]]:
+        if self.lat is None or self.lng is None:
+            return None
+        return self.lat, self.lng
+
+    @property
+    def place(self) -> str:
+        """
+        "City, Country" with whichever parts are known
+        """
+        return ", ".join(part for part in (self.city, self.country) if part)
+
+
+class Landmark(Record):
+    """
+    A detected landmark; ``source`` is "knowledge_base", "vision" or "labels"
+    """
+
+    __slots__ = ("name", "mid", "source", "description", "confidence", "location")
+    _keep_none = ("name",)
+    _nested = {"location": Location}
+
+    def __init__(self, name: Optional[str] = None, mid: Optional[str] = None, source: Optional[str] = None,
+                 description: Optional[str] = None, confidence: Optional[float] = None,
+                 location: Optional[Location] = None):
+        self.name = name
+        self.mid = mid
+        self.source = source
+        self.description = description
+        self.confidence = confidence
+        self.location = location
+
+    @property
+    def identified(self) -> bool:
+        return bool(self.name) and self.name != "Unknown Landmark" and self.source != "labels"
+
+
+class Weather(Record):
+    """
+    Current conditions near a place, as returned by ``api_helpers.get_weather``
+    """
+
+    __slots__ = ("location", "temperature", "conditions", "humidity", "wind_speed", "timestamp",
+                 "condition", "condition_text", "precipitation_chance", "is_daytime", "uv_index",
+                 "as_of", "age_seconds", "geohash", "stale")
+    _keep_none = ("location", "temperature", "conditions", "humidity", "wind_speed", "timestamp",
+                  "condition", "condition_text", "precipitation_chance", "is_daytime", "uv_index")
+    # Weather cache bookkeeping; changes on every read of the same cached answer
+    _cache_fields = ("as_of", "age_seconds", "geohash", "stale")
+
+    def __init__(self, location: Optional[Dict[str, Any]] = None, temperature: Optional[Dict[str, Any]] = None,
+                 conditions: Optional[str] = None, humidity: Optional[float] = None,
+                 wind_speed: Optional[float] = None, timestamp: Optional[Any] = None,
+                 condition: Optional[str] = None, condition_text: Optional[str] = None,
+                 precipitation_chance: Optional[float] = None, is_daytime: Optional[bool] = None,
+                 uv_index: Optional[float] = None, as_of: Optional[str] = None,
+                 age_seconds: Optional[float] = None, geohash: Optional[str] = None, stale: Optional[bool] = None):
+        self.location = location
+        self.temperature = temperature
+        self.conditions = conditions
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.timestamp = timestamp
+        self.condition = condition
+        self.condition_text = condition_text
+        self.precipitation_chance = precipitation_chance
+        self.is_daytime = is_daytime
+        self.uv_index = uv_index
+        self.as_of = as_of
+        self.age_seconds = age_seconds
+        self.geohash = geohash
+        self.stale = stale
+
+    @property
+    def current_temperature(self) -> Optional[float]:
+        return (self.temperature or {}).get("current")
+
+    def prompt_dict(self) -> Dict[str, Any]:
+        """
+        ``to_dict`` without the cache bookkeeping, so the same weather always
+        gives the same prompt text
+        """
+        return {k: v for k, v in self.to_dict().items() if k not in self._cache_fields}
+
+
+class CountryInfo(Record):
+    """
+    RestCountries data for one country
+    """
+
+    __slots__ = ("name", "capital", "region", "subregion", "population", "currencies", "languages",
+                 "flags", "timezones", "area", "borders")
+
+    def __init__(self, name: Optional[Dict[str, str]] = None, capital: Optional[List[str]] = None,
+                 region: Optional[str] = None, subregion: Optional[str] = None, population: Optional[int] = None,
+                 currencies: Optional[List[Dict[str, Any]]] = None, languages: Optional[Dict[str, str]] = None,
+                 flags: Optional[Dict[str, str]] = None, timezones: Optional[List[str]] = None,
+                 area: Optional[float] = None, borders: Optional[List[str]] = None):
+        self.name = name
+        self.capital = capital
+        self.region = region
+        self.subregion = subregion
+        self.population = population
+        self.currencies = currencies
+        self.languages = languages
+        self.flags = flags
+        self.timezones = timezones
+        self.area = area
+        self.borders = borders
+
+    @property
+    def common_name(self) -> Optional[str]:
+        return (self.name or {}).get("common")
+
+
+class Advisory(Record):
+    """
+    A travel advisory, from Smart Traveller or generated with the analysis
+    """
+
+    __slots__ = ("country", "country_code", "level", "summary", "details", "last_updated", "advice",
+                 "recommendations")
+
+    def __init__(self, country: Optional[str] = None, country_code: Optional[str] = None,
+                 level: Optional[str] = None, summary: Optional[str] = None, details: Optional[str] = None,
+                 last_updated: Optional[str] = None, advice: Optional[List[Any]] = None,
+                 recommendations: Optional[List[str]] = None):
+        self.country = country
+        self.country_code = country_code
+        self.level = level
+        self.summary = summary
+        self.details = details
+        self.last_updated = last_updated
+        self.advice = advice
+        self.recommendations = recommendations
+
+
+class Analysis(Record):
+    """
+    A landmark's travel analysis, from Bedrock, the knowledge base or a template
+    """
+
+    __slots__ = ("summary", "insights", "travel_tips", "best_visit_time", "safety_rating",
+                 "cultural_highlights", "travel_advisory")
+    _nested = {"travel_advisory": Advisory}
+
+    def __init__(self, summary: Optional[str] = None, insights: Optional[List[str]] = None,
+                 travel_tips: Optional[List[str]] = None, best_visit_time: Optional[str] = None,
+                 safety_rating: Optional[str] = None, cultural_highlights: Optional[str] = None,
+                 travel_advisory: Optional[Advisory] = None):
+        self.summary = summary
+        self.insights = insights
+        self.travel_tips = travel_tips
+        self.best_visit_time = best_visit_time
+        self.safety_rating = safety_rating
+        self.cultural_highlights = cultural_highlights
+        self.travel_advisory = travel_advisory
+
+
+class AnalysisData(Record):
+    """
+    What the image processor hands the landmark analyzer: the detection and its enrichments
+    """
+
+    __slots__ = ("landmark", "weather", "country_info", "travel_advisory", "image_url", "image_fingerprint",
+                 "schema_version")
+    _keep_none = ("weather", "country_info", "image_url")
+    _nested = {"landmark": Landmark, "weather": Weather, "country_info": CountryInfo,
+               "travel_advisory": Advisory}
+
+    def __init__(self, landmark: Optional[Landmark] = None, weather: Optional[Weather] = None,
+                 country_info: Optional[CountryInfo] = None, travel_advisory: Optional[Advisory] = None,
+                 image_url: Optional[str] = None, image_fingerprint: Optional[str] = None,
+                 schema_version: Optional[int] = SCHEMA_VERSION):
+        self.landmark = landmark
+        self.weather = weather
+        self.country_info = country_info
+        self.travel_advisory = travel_advisory
+        self.image_url = image_url
+        self.image_fingerprint = image_fingerprint
+        self.schema_version = schema_version
+
+    @classmethod
+    def from_wire(cls, data: Any) -> Optional["AnalysisData"]:
+        """
+        Parse a hand-off payload, rejecting ones written with a newer schema
+        """
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, dict):
+            version = data.get("schema_version") or 1
+            if not isinstance(version, int) or version > SCHEMA_VERSION:
+                raise SchemaVersionError(f"Unsupported analysis_data schema_version {version!r} "
+                                         f"(this service reads up to {SCHEMA_VERSION})")
+        return cls.from_dict(data)
+
+    @classmethod
+    def coerce(cls, data: Any) -> "AnalysisData":
+        """
+        A record from either a record or its wire dict; never None
+        """
+        return cls.from_wire(data) or cls(landmark=None)
+
+    @property
+    def location(self) -> Location:
+        return (self.landmark and self.landmark.location) or Location()
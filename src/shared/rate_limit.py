@@ -0,0 +1,315 @@
+"""
+Client-side rate limiting and request coalescing for quota-limited upstreams.
+
+Each upstream gets an UpstreamLimiter made of:
+  - a token bucket that spaces outbound calls to the configured rate,
+  - single-flight coalescing, so concurrent callers asking the same question
+    share one outbound request,
+  - a shared pause that honours ``Retry-After`` when the upstream answers 429.
+
+Limiters work for thread-pool callers (``call``) and asyncio callers
+(``call_async`` / ``acquire_async``).
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import requests
+
+from .metrics import put_metric
+
+logger = logging.getLogger()
+
+# "rate_per_second:burst" per upstream, overridable with RATE_LIMIT_<UPSTREAM>
+DEFAULT_LIMITS = {
+    "maps_co": "2:4",
+    "google_geocode": "20:40",
+    "google_weather": "10:20",
+    "google_vision": "10:20",
+}
+
+# Longest Retry-After we will wait out inline before giving up on a call
+MAX_RETRY_AFTER_WAIT = float(os.getenv("MAX_RETRY_AFTER_WAIT", "2"))
+
+# Fallback pause after a 429 without a usable Retry-After header
+DEFAULT_THROTTLE_PAUSE = 1.0
+
+
+class RateLimitExceeded(requests.RequestException):
+    """
+    No token became available before the caller's timeout
+    """
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given as delta-seconds or an HTTP date
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket; a rate of 0 or less means unlimited
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Take a token if one is available, else return seconds until one might be
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return False
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold all callers back for ``seconds`` (e.g. after a 429)
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error", "followers")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+
+        if not leader:
+            put_metric("RequestsCoalesced", 1, dimensions={"Upstream": self.name})
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Followers get their own copy so callers can mutate results safely
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+class UpstreamLimiter:
+    """
+    Token bucket, single-flight and Retry-After handling for one upstream
+    """
+
+    def __init__(self, name: str, rate: float, burst: float):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.flight = SingleFlight(name)
+        self._async_flights: Dict[Any, Dict[Hashable, asyncio.Future]] = {}
+
+    def backoff(self, retry_after: Optional[float]) -> float:
+        pause = DEFAULT_THROTTLE_PAUSE if retry_after is None else retry_after
+        self.bucket.pause(pause)
+        put_metric("UpstreamThrottled", 1, dimensions={"Upstream": self.name})
+        logger.warning(f"{self.name} returned 429, pausing calls for {pause:.1f}s")
+        return pause
+
+    def _throttle_delay(self, error: requests.HTTPError) -> Optional[float]:
+        response = error.response
+        if response is None or response.status_code != 429:
+            return None
+        return self.backoff(parse_retry_after(response.headers.get("Retry-After")))
+
+    def _run(self, fn: Callable[[], Any], timeout: Optional[float]) -> Any:
+        started = time.monotonic()
+        for attempt in range(2):
+            remaining = None if timeout is None else max(timeout - (time.monotonic() - started), 0.0)
+            if not self.bucket.acquire(remaining):
+                put_metric("RateLimited", 1, dimensions={"Upstream": self.name})
+                raise RateLimitExceeded(f"{self.name} rate limit: no capacity within {timeout}s")
+            try:
+                return fn()
+            except requests.HTTPError as e:
+                pause = self._throttle_delay(e)
+                # One retry when the upstream asks for a short wait we can afford
+                if pause is None or attempt or pause > MAX_RETRY_AFTER_WAIT:
+                    raise
+                if timeout is not None and time.monotonic() - started + pause > timeout:
+                    raise
+
+    def call(self, key: Optional[Hashable], fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run ``fn`` under the limiter, sharing the result with concurrent callers of ``key``
+        """
+        if key is None:
+            return self._run(fn, timeout)
+        return self.flight.do(key, lambda: self._run(fn, timeout))
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        return await self.bucket.acquire_async(timeout)
+
+    async def call_async(self, key: Optional[Hashable], fn: Callable[[], Any],
+                         timeout: Optional[float] = None) -> Any:
+        """
+        Asyncio variant of ``call``.
+
+        Coroutine functions are coalesced per event loop and wait for tokens
+        without blocking it; plain functions run in the default executor and
+        share single-flight state with thread-pool callers.
+        """
+        if not asyncio.iscoroutinefunction(fn):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.call, key, fn, timeout)
+
+        async def run():
+            if not await self.bucket.acquire_async(timeout):
+                put_metric("RateLimited", 1, dimensions={"Upstream": self.name})
+                raise RateLimitExceeded(f"{self.name} rate limit: no capacity within {timeout}s")
+            try:
+                return await fn()
+            except requests.HTTPError as e:
+                self._throttle_delay(e)
+                raise
+
+        if key is None:
+            return await run()
+
+        loop = asyncio.get_running_loop()
+        flights = self._async_flights.setdefault(loop, {})
+        if key in flights:
+            put_metric("RequestsCoalesced", 1, dimensions={"Upstream": self.name})
+            return copy.deepcopy(await asyncio.shield(flights[key]))
+        future = loop.create_future()
+        flights[key] = future
+        try:
+            result = await run()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            flights.pop(key, None)
+            if not flights:
+                self._async_flights.pop(loop, None)
+
+
+_limiters: Dict[str, UpstreamLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _configured_limit(name: str):
+    spec = os.getenv(f"RATE_LIMIT_{name.upper()}", DEFAULT_LIMITS.get(name, "0:1"))
+    try:
+        rate, _, burst = spec.partition(":")
+        return float(rate), float(burst or rate or 1)
+    except ValueError:
+        logger.warning(f"Invalid rate limit '{spec}' for {name}, not limiting")
+        return 0.0, 1.0
+
+
+def get_limiter(name: str) -> UpstreamLimiter:
+    """
+    Return the process-wide limiter for an upstream, creating it on first use
+    """
+    with _registry_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            rate, burst = _configured_limit(name)
+            limiter = _limiters[name] = UpstreamLimiter(name, rate, burst)
+        return limiter
+
+
+def reset_limiters() -> None:
+    with _registry_lock:
+        _limiters.clear()
@@ -0,0 +1,260 @@
+"""
+Response projection and compression for the API handlers.
+
+The analysis handlers return every field they have: full country records
+(flag SVGs, borders, timezones), raw coordinates, image fingerprints and
+Bedrock usage. Callers can ask for less:
+
+- ``fields=analysis.summary,recommendations`` keeps only the listed dotted
+  paths (plus ``timestamp``)
+- ``profile=compact`` keeps the fields the extension sidebar renders. It
+  is for display only: a caller that forwards ``analysis_data`` to
+  ``/analyze-landmark`` needs the full profile, or the analysis loses the
+  weather, country, coordinate and advisory context
+
+Both can be passed as query string parameters or as body fields on a
+direct invocation. Only successful JSON responses are projected; errors
+are returned as they are.
+
+Responses of at least ``MIN_COMPRESS_BYTES`` are compressed when the
+client's ``Accept-Encoding`` allows: ``br`` if the brotli module is
+installed, otherwise ``gzip``. The compressed body is returned base64
+encoded with ``isBase64Encoded``. API Gateway turns it back into bytes only
+when the request's ``Accept`` header is one of the API's binary media
+types (``BINARY_MEDIA_TYPES``, matching template.yaml), so other clients
+get the body uncompressed. API Gateway also base64-encodes request bodies
+of those types, so handlers call ``decode_request`` first.
+
+Every shaped response records ``ResponseBytes`` (JSON size after
+projection) and ``ResponseWireBytes`` (size sent) by function and profile.
+"""
+
+import base64
+import gzip
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    # brotli not available, gzip only
+    brotli = None
+
+from . import json_codec
+from .metrics import put_metric
+
+logger = logging.getLogger()
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+MIN_COMPRESS_BYTES = int(os.getenv("MIN_COMPRESS_BYTES", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Binary media types declared on the API (template.yaml): the content type
+# of every response that may be compressed
+BINARY_MEDIA_TYPES = ("application/json",)
+
+# Always kept by a projection
+ALWAYS_FIELDS = ("timestamp",)
+
+# What the extension sidebar renders, per function (display only)
+COMPACT_PROFILES = {
+    "image_processor": [
+        "landmark_detected",
+        "result_id",
+        "s3_key",
+        "degraded",
+        "analysis_data.landmark.name",
+        "analysis_data.landmark.mid",
+        "analysis_data.landmark.source",
+        "analysis_data.landmark.description",
+        "analysis_data.landmark.confidence",
+        "analysis_data.landmark.location.city",
+        "analysis_data.landmark.location.country",
+        "analysis_data.landmark.location.country_code",
+        "analysis_data.weather.temperature",
+        "analysis_data.weather.conditions",
+        "analysis_data.weather.wind_speed",
+        "analysis_data.weather.humidity",
+        "analysis_data.weather.is_daytime",
+        "analysis_data.weather.as_of",
+        "analysis_data.country_info.name",
+        "analysis_data.country_info.capital",
+        "analysis_data.country_info.population",
+        "analysis_data.country_info.currencies",
+        "analysis_data.country_info.languages",
+        "analysis_data.country_info.region",
+        "analysis_data.country_info.flags.png",
+        "analysis_data.image_url",
+        "analysis_data.schema_version",
+    ],
+    "landmark_analyzer": [
+        "landmark_name",
+        "analysis",
+        "recommendations",
+        "result_id",
+        "degraded",
+    ],
+}
+
+
+def decode_request(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Event with a base64-encoded body (binary media types) decoded to text
+    """
+    if event.get("isBase64Encoded") and isinstance(event.get("body"), str):
+        event = dict(event, body=base64.b64decode(event["body"]).decode("utf-8"), isBase64Encoded=False)
+    return event
+
+
+def parse_fields(spec: Any) -> List[str]:
+    if not spec:
+        return []
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    return [field.strip() for field in spec if isinstance(field, str) and field.strip()]
+
+
+def project(value: Any, paths: Iterable[str]) -> Any:
+    """
+    Copy of ``value`` holding only the given dotted paths. Lists are
+    projected element by element; missing paths are left out.
+    """
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            child = node.setdefault(part, {})
+            if child is True:
+                break
+            node = child
+        else:
+            # A whole-field path overrides narrower ones under it
+            node[parts[-1]] = True
+    return _project(value, tree)
+
+
+def _project(value: Any, tree: Dict[str, Any]) -> Any:
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    projected = {}
+    for name, subtree in tree.items():
+        if name in value:
+            projected[name] = value[name] if subtree is True else _project(value[name], subtree)
+    return projected
+
+
+def requested_projection(function: str, event: Dict[str, Any]) -> Tuple[str, Optional[List[str]]]:
+    """
+    Profile name (``full``, ``compact`` or ``custom``) and the fields asked
+    for by ``fields=``/``profile=``, or None for everything
+    """
+    params = dict(event.get("queryStringParameters") or {})
+    body = event.get("body") if "body" in event else event
+    if isinstance(body, str):
+        try:
+            body = json_codec.loads(body)
+        except ValueError:
+            body = None
+    if isinstance(body, dict):
+        for name in ("fields", "profile"):
+            if name not in params and body.get(name):
+                params[name] = body[name]
+
+    fields = parse_fields(params.get("fields"))
+    profile = "custom" if fields else "full"
+    if params.get("profile") == "compact" and function in COMPACT_PROFILES:
+        fields = COMPACT_PROFILES[function] + fields
+        profile = "compact"
+    return profile, fields + list(ALWAYS_FIELDS) if fields else None
+
+
+def accepted_encoding(headers: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    Best encoding the client accepts among the ones available here
+    """
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    accepted = {}
+    for item in (headers.get("accept-encoding") or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def accepts_binary(headers: Optional[Dict[str, str]]) -> bool:
+    """
+    Whether API Gateway will decode a base64 response for this request: it
+    checks the first ``Accept`` type against the binary media types
+    """
+    headers = {name.lower(): value for name, value in (headers or {}).items()}
+    first = (headers.get("accept") or "").split(",")[0]
+    return first.partition(";")[0].strip().lower() in BINARY_MEDIA_TYPES
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def shape_response(function: str, event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply the requested projection and compression to a handler response
+    """
+    body = response.get("body")
+    if not isinstance(body, str):
+        return response
+
+    profile, fields = requested_projection(function, event)
+    if fields and response.get("statusCode") == 200:
+        try:
+            body = json_codec.dumps(project(json_codec.loads(body), fields))
+        except ValueError:
+            logger.warning("Response body is not JSON, returning it unprojected")
+    payload = body.encode("utf-8")
+    put_metric("ResponseBytes", len(payload), unit="Bytes", dimensions={"Function": function, "Profile": profile})
+
+    shaped = dict(response, body=body)
+    headers = event.get("headers")
+    encoding = accepted_encoding(headers) if RESPONSE_COMPRESSION and accepts_binary(headers) else None
+    if encoding and len(payload) >= MIN_COMPRESS_BYTES:
+        compressed = compress(payload, encoding)
+        shaped["body"] = base64.b64encode(compressed).decode("ascii")
+        shaped["isBase64Encoded"] = True
+        shaped["headers"] = dict(response.get("headers") or {}, **{
+            "Content-Encoding": encoding,
+            "Vary": "Accept-Encoding",
+        })
+        payload = compressed
+    put_metric("ResponseWireBytes", len(payload), unit="Bytes", dimensions={"Function": function, "Profile": profile})
+    return shaped
+
+
+def read_body(response: Dict[str, Any]) -> Any:
+    """
+    Decoded JSON body of a (possibly compressed) response, for tests and tools
+    """
+    body = response["body"]
+    if not response.get("isBase64Encoded"):
+        return json_codec.loads(body) if isinstance(body, str) else body
+    data = base64.b64decode(body)
+    encoding = (response.get("headers") or {}).get("Content-Encoding")
+    if encoding == "br":
+        data = brotli.decompress(data)
+    elif encoding == "gzip":
+        data = gzip.decompress(data)
+    return json_codec.loads(data)
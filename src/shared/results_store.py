@@ -0,0 +1,374 @@
+"""
+Indexed store of analysis results.
+
+S3 keeps every result as a timestamp-named JSON object, which is fine for
+archiving but needs listing and downloading to answer "latest analysis of
+this landmark" or "everything in Japan this week". The handlers also write
+each result here, next to the S3 artifact, indexed by canonical landmark
+key, country code, image URL hash and date. The landmark key is the
+normalized name, using the knowledge base's canonical name when the
+landmark is known so aliases and Vision ``mid``s land on the same key.
+
+Backends share the ``ResultsStore`` interface:
+
+- ``SQLiteResultsStore``: one local file, for development and tests
+- ``DynamoDBResultsStore``: a table with one global secondary index per
+  lookup, for production; records expire through TTL on ``expires_at``
+  after ``RESULTS_TTL_DAYS``, like the per-request S3 objects
+
+``RESULTS_STORE`` selects the backend (``sqlite``, ``dynamodb`` or
+``none``); by default DynamoDB is used when ``RESULTS_TABLE`` is set and
+the store is off otherwise. Writes are best-effort: a store failure is
+logged and never fails the request.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from . import json_codec
+from .image_ingest import normalize_image_url
+from .landmark_kb import get_knowledge_base, landmark_keys
+from .metrics import put_metric, set_gauge
+
+logger = logging.getLogger()
+
+RESULTS_TABLE = os.getenv("RESULTS_TABLE", "")
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "/tmp/lambdatrip_results.db")
+RESULTS_STORE = os.getenv("RESULTS_STORE", "dynamodb" if RESULTS_TABLE else "none").lower()
+
+# Longest date range a DynamoDB country-less query walks day by day
+MAX_QUERY_DAYS = int(os.getenv("RESULTS_MAX_QUERY_DAYS", "31"))
+MAX_QUERY_LIMIT = 200
+
+# DynamoDB records expire with the S3 artifacts they point to (0 keeps them)
+RESULTS_TTL_DAYS = int(os.getenv("RESULTS_TTL_DAYS", "30"))
+
+# Columns every backend can filter and sort on
+INDEXED_FIELDS = ("kind", "landmark_key", "landmark_name", "country_code", "image_hash", "date", "timestamp", "s3_key")
+
+
+def image_hash(image_url: Optional[str]) -> Optional[str]:
+    if not image_url:
+        return None
+    return hashlib.sha256(normalize_image_url(image_url).encode("utf-8")).hexdigest()[:32]
+
+
+def landmark_key(name: Optional[str] = None, mid: Optional[str] = None) -> Optional[str]:
+    """
+    Canonical key for a landmark: ``name:<normalized name>``, or ``mid:<mid>``
+    for an unnamed landmark the knowledge base does not know
+    """
+    knowledge_base = get_knowledge_base()
+    known = knowledge_base.lookup(name, mid) if knowledge_base is not None else None
+    if known:
+        name = known.get("name") or name
+    keys = landmark_keys(name) or landmark_keys(mid=mid)
+    return keys[0] if keys else None
+
+
+def result_record(kind: str, result: Dict[str, Any], s3_key: Optional[str] = None,
+                  timestamp: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Index entry for a stored result (``image_analysis`` or ``landmark_analysis``)
+    """
+    landmark = result.get("landmark") or {}
+    location = landmark.get("location") or {}
+    timestamp = timestamp or result.get("timestamp") or datetime.utcnow().isoformat()
+    return {
+        "result_id": uuid.uuid4().hex,
+        "kind": kind,
+        "landmark_key": landmark_key(landmark.get("name"), landmark.get("mid")),
+        "landmark_name": landmark.get("name"),
+        "country_code": (location.get("country_code") or "").upper() or None,
+        "image_hash": image_hash(result.get("image_url")),
+        "date": timestamp[:10],
+        "timestamp": timestamp,
+        "s3_key": s3_key,
+        "result": result,
+    }
+
+
+def summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A record without its result body
+    """
+    return {field: record.get(field) for field in ("result_id",) + INDEXED_FIELDS}
+
+
+class ResultsStore:
+    """
+    Interface shared by the results store backends
+    """
+
+    def put(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def query(self, landmark: Optional[str] = None, country_code: Optional[str] = None,
+              image_url: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+              kind: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Summaries of matching results, newest first. ``landmark`` is a name or
+        ``mid:``/``name:`` key; ``since``/``until`` are ISO dates or timestamps.
+        """
+        raise NotImplementedError
+
+    def latest(self, landmark: Optional[str] = None, image_url: Optional[str] = None,
+               kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Newest full record for a landmark or image
+        """
+        matches = self.query(landmark=landmark, image_url=image_url, kind=kind, limit=1)
+        return self.get(matches[0]["result_id"]) if matches else None
+
+
+def _landmark_filter(landmark: Optional[str]) -> Optional[str]:
+    if not landmark:
+        return None
+    if landmark.startswith("mid:"):
+        return landmark_key(mid=landmark[len("mid:"):])
+    if landmark.startswith("name:"):
+        return landmark_key(landmark[len("name:"):])
+    return landmark_key(landmark)
+
+
+def _until_bound(until: Optional[str]) -> Optional[str]:
+    # A bare date includes the whole day
+    return f"{until}T99" if until and len(until) == 10 else until
+
+
+class SQLiteResultsStore(ResultsStore):
+    """
+    Results in a local SQLite file, one indexed table
+    """
+
+    def __init__(self, path: str = RESULTS_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "result_id TEXT PRIMARY KEY, kind TEXT, landmark_key TEXT, landmark_name TEXT, "
+                "country_code TEXT, image_hash TEXT, date TEXT, timestamp TEXT, s3_key TEXT, body TEXT)"
+            )
+            for column in ("landmark_key", "country_code", "image_hash", "date"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS results_{column} ON results ({column}, timestamp)"
+                )
+
+    def put(self, record: Dict[str, Any]) -> None:
+        row = [record["result_id"]] + [record.get(field) for field in INDEXED_FIELDS]
+        row.append(json_codec.dumps(record["result"]))
+        with self._lock, self._conn:
+            self._conn.execute(f"INSERT OR REPLACE INTO results VALUES ({','.join('?' * len(row))})", row)
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT result_id, {', '.join(INDEXED_FIELDS)}, body FROM results WHERE result_id = ?",
+                (result_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = dict(zip(("result_id",) + INDEXED_FIELDS, row[:-1]))
+        record["result"] = json_codec.loads(row[-1])
+        return record
+
+    def query(self, landmark=None, country_code=None, image_url=None, since=None, until=None,
+              kind=None, limit=50):
+        conditions, params = [], []
+        for column, value in (("landmark_key", _landmark_filter(landmark)),
+                              ("country_code", country_code.upper() if country_code else None),
+                              ("image_hash", image_hash(image_url)),
+                              ("kind", kind)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp <= ?")
+            params.append(_until_bound(until))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(min(limit, MAX_QUERY_LIMIT))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT result_id, {', '.join(INDEXED_FIELDS)} FROM results {where} "
+                f"ORDER BY timestamp DESC LIMIT ?", params
+            ).fetchall()
+        return [dict(zip(("result_id",) + INDEXED_FIELDS, row)) for row in rows]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class DynamoDBResultsStore(ResultsStore):
+    """
+    Results in a DynamoDB table keyed by ``result_id``, with global secondary
+    indexes ``landmark-index``, ``country-index``, ``image-index`` and
+    ``date-index`` (each partitioned on its field and sorted by timestamp)
+    """
+
+    INDEXES = {
+        "landmark_key": "landmark-index",
+        "country_code": "country-index",
+        "image_hash": "image-index",
+        "date": "date-index",
+    }
+
+    def __init__(self, table_name: str = RESULTS_TABLE, client=None):
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = client
+
+    def put(self, record: Dict[str, Any]) -> None:
+        item = {"result_id": {"S": record["result_id"]},
+                "body": {"S": json_codec.dumps(record["result"])}}
+        for field in INDEXED_FIELDS:
+            # Index key attributes must be absent rather than empty
+            if record.get(field):
+                item[field] = {"S": record[field]}
+        if RESULTS_TTL_DAYS > 0:
+            item["expires_at"] = {"N": str(int(time.time()) + RESULTS_TTL_DAYS * 86400)}
+        self.client.put_item(TableName=self.table_name, Item=item)
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        item = self.client.get_item(TableName=self.table_name, Key={"result_id": {"S": result_id}}).get("Item")
+        if not item:
+            return None
+        record = self._summary(item)
+        record["result"] = json_codec.loads(item["body"]["S"])
+        return record
+
+    @staticmethod
+    def _summary(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {field: item[field]["S"] if field in item else None for field in ("result_id",) + INDEXED_FIELDS}
+
+    def _query_index(self, field: str, value: str, since, until, limit, keep=None) -> List[Dict[str, Any]]:
+        """
+        Up to ``limit`` rows of one index partition, newest first, that pass
+        ``keep``. Pages are followed until enough rows pass or the partition
+        is exhausted.
+        """
+        condition = "#k = :k"
+        values = {":k": {"S": value}}
+        if since and until:
+            condition += " AND #t BETWEEN :since AND :until"
+            values.update({":since": {"S": since}, ":until": {"S": _until_bound(until)}})
+        elif since:
+            condition += " AND #t >= :since"
+            values[":since"] = {"S": since}
+        elif until:
+            condition += " AND #t <= :until"
+            values[":until"] = {"S": _until_bound(until)}
+        params = {
+            "TableName": self.table_name,
+            "IndexName": self.INDEXES[field],
+            "KeyConditionExpression": condition,
+            "ExpressionAttributeNames": {"#k": field, "#t": "timestamp"},
+            "ExpressionAttributeValues": values,
+            "ScanIndexForward": False,
+            # Read full pages when rows will be dropped client-side
+            "Limit": limit if keep is None else MAX_QUERY_LIMIT,
+        }
+        rows = []
+        while True:
+            response = self.client.query(**params)
+            rows.extend(row for row in map(self._summary, response.get("Items", []))
+                        if keep is None or keep(row))
+            if len(rows) >= limit or "LastEvaluatedKey" not in response:
+                return rows[:limit]
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def query(self, landmark=None, country_code=None, image_url=None, since=None, until=None,
+              kind=None, limit=50):
+        limit = min(limit, MAX_QUERY_LIMIT)
+        filters = {
+            "landmark_key": _landmark_filter(landmark),
+            "image_hash": image_hash(image_url),
+            "country_code": country_code.upper() if country_code else None,
+        }
+
+        def keep(row):
+            return (all(not value or row.get(name) == value for name, value in filters.items())
+                    and (not kind or row.get("kind") == kind))
+
+        # Query the most selective index and filter the rest client-side
+        field = next((name for name, value in filters.items() if value), None)
+        if field is not None:
+            only_index = sum(1 for value in filters.values() if value) == 1 and not kind
+            return self._query_index(field, filters[field], since, until, limit, None if only_index else keep)
+        rows = []
+        end = datetime.strptime((until or datetime.utcnow().isoformat())[:10], "%Y-%m-%d")
+        start = datetime.strptime(since[:10], "%Y-%m-%d") if since else end
+        day = end
+        while day >= start and (end - day).days < MAX_QUERY_DAYS and len(rows) < limit:
+            rows.extend(self._query_index("date", day.strftime("%Y-%m-%d"), since, until, limit - len(rows),
+                                          keep if kind else None))
+            day -= timedelta(days=1)
+        return rows[:limit]
+
+
+_store: Optional[ResultsStore] = None
+_store_lock = threading.Lock()
+
+
+def get_results_store() -> Optional[ResultsStore]:
+    """
+    Process-wide results store, or None when the store is off
+    """
+    global _store
+    if _store is None and RESULTS_STORE != "none":
+        with _store_lock:
+            if _store is None:
+                if RESULTS_STORE == "sqlite":
+                    _store = SQLiteResultsStore(RESULTS_DB_PATH)
+                elif RESULTS_STORE == "dynamodb":
+                    _store = DynamoDBResultsStore(RESULTS_TABLE)
+                else:
+                    logger.error(f"Unknown RESULTS_STORE {RESULTS_STORE!r}; results will not be indexed")
+    return _store
+
+
+def set_results_store(store: Optional[ResultsStore]) -> None:
+    """
+    Replace the process-wide store (tests, tools)
+    """
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def record_result(kind: str, result: Dict[str, Any], s3_key: Optional[str] = None) -> Optional[str]:
+    """
+    Index a result next to its S3 artifact; returns its ``result_id``, or
+    None if the store is off or the write failed
+    """
+    store = get_results_store()
+    if store is None:
+        return None
+    record = result_record(kind, result, s3_key)
+    started = time.monotonic()
+    try:
+        store.put(record)
+    except Exception as e:
+        logger.error(f"Could not index {kind} result: {str(e)}")
+        put_metric("ResultsStoreWrite", 1, dimensions={"Result": "error"})
+        return None
+    set_gauge("ResultsStoreWriteLatency", round((time.monotonic() - started) * 1000, 2), unit="Milliseconds")
+    put_metric("ResultsStoreWrite", 1, dimensions={"Result": "ok"})
+    return record["result_id"]
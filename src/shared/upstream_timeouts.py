@@ -0,0 +1,234 @@
+"""
+Adaptive per-upstream timeouts.
+
+The fixed timeouts (10-30 s) are far above how long a healthy call to
+Google, RestCountries or maps.co takes, so a hung connection used to hold
+a request for seconds. Each upstream now keeps a streaming quantile sketch
+of its observed call latencies, and its timeouts follow the sketch:
+
+  - read timeout = p99 x ``ADAPTIVE_TIMEOUT_FACTOR``, between the upstream's
+    floor and its old fixed timeout (the ceiling)
+  - connect timeout = p50 x ``CONNECT_TIMEOUT_FACTOR``, within
+    ``CONNECT_TIMEOUT_FLOOR``/``CONNECT_TIMEOUT_CEILING`` and never above the
+    read timeout
+
+Until an upstream has ``ADAPTIVE_TIMEOUT_MIN_SAMPLES`` samples the ceiling is
+used. A call that times out is retried once straight away if the caller's
+budget still covers a retry: a stuck connection is usually an outlier, and a
+fresh attempt tends to answer in normal time. Timed-out calls are recorded
+at their timeout so a real slowdown raises the timeouts instead of causing a
+run of retries.
+
+Current timeouts and latency percentiles are emitted as gauges
+(``UpstreamReadTimeout``, ``UpstreamConnectTimeout``, ``UpstreamLatencyP50``,
+``UpstreamLatencyP99``) whenever they are recomputed.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+from .metrics import put_metric, set_gauge
+
+logger = logging.getLogger()
+
+# "floor:ceiling" read timeouts in seconds per upstream, overridable with UPSTREAM_TIMEOUT_<UPSTREAM>
+DEFAULT_TIMEOUTS = {
+    "google_vision": "3:30",
+    "google_weather": "1:10",
+    "google_geocode": "1:10",
+    "maps_co": "1.5:15",
+    "restcountries": "1:10",
+    "smart_traveller": "1:10",
+}
+
+ADAPTIVE_TIMEOUTS = os.getenv("ADAPTIVE_TIMEOUTS", "true").lower() == "true"
+ADAPTIVE_TIMEOUT_PERCENTILE = float(os.getenv("ADAPTIVE_TIMEOUT_PERCENTILE", "99"))
+ADAPTIVE_TIMEOUT_FACTOR = float(os.getenv("ADAPTIVE_TIMEOUT_FACTOR", "2"))
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", "50"))
+
+CONNECT_TIMEOUT_FACTOR = float(os.getenv("CONNECT_TIMEOUT_FACTOR", "3"))
+CONNECT_TIMEOUT_FLOOR = float(os.getenv("CONNECT_TIMEOUT_FLOOR", "0.5"))
+CONNECT_TIMEOUT_CEILING = float(os.getenv("CONNECT_TIMEOUT_CEILING", "3.05"))
+
+# Timeouts and gauges are recomputed after this many new samples
+RECOMPUTE_EVERY = 20
+
+
+class QuantileSketch:
+    """
+    Log-bucketed latency histogram with relative error ``relative_accuracy``
+    (a DDSketch). Counts halve every ``half_life`` samples so the sketch
+    follows recent behaviour.
+    """
+
+    MIN_VALUE = 0.1
+
+    def __init__(self, relative_accuracy: float = 0.01, half_life: int = 1000):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.half_life = half_life
+        self.count = 0.0
+        self._bins: Dict[int, float] = {}
+        self._since_decay = 0
+
+    def add(self, value: float) -> None:
+        index = math.ceil(math.log(max(value, self.MIN_VALUE)) / self._log_gamma)
+        self._bins[index] = self._bins.get(index, 0.0) + 1.0
+        self.count += 1.0
+        self._since_decay += 1
+        if self._since_decay >= self.half_life:
+            self._decay()
+
+    def _decay(self) -> None:
+        self._bins = {index: count / 2 for index, count in self._bins.items() if count >= 0.02}
+        self.count = sum(self._bins.values())
+        self._since_decay = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Value at quantile ``q`` (0-1), or None when empty
+        """
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0.0
+        for index in sorted(self._bins):
+            seen += self._bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self._bins) / (self.gamma + 1)
+
+
+def _configured_bounds(name: str) -> Tuple[float, float]:
+    spec = os.getenv(f"UPSTREAM_TIMEOUT_{name.upper()}", DEFAULT_TIMEOUTS.get(name, "1:10"))
+    try:
+        floor, _, ceiling = spec.partition(":")
+        return float(floor), float(ceiling or floor)
+    except ValueError:
+        logger.warning(f"Invalid upstream timeout '{spec}' for {name}, using 1:10")
+        return 1.0, 10.0
+
+
+class UpstreamTimeout:
+    """
+    Latency sketch and current connect/read timeouts for one upstream
+    """
+
+    def __init__(self, name: str, floor: float, ceiling: float):
+        self.name = name
+        self.floor = floor
+        self.ceiling = ceiling
+        self.sketch = QuantileSketch()
+        self.samples = 0
+        self._current = (min(CONNECT_TIMEOUT_CEILING, ceiling), ceiling)
+        self._lock = threading.Lock()
+
+    def timeouts(self) -> Tuple[float, float]:
+        """
+        Current ``(connect, read)`` timeouts in seconds
+        """
+        if not ADAPTIVE_TIMEOUTS:
+            return min(CONNECT_TIMEOUT_CEILING, self.ceiling), self.ceiling
+        with self._lock:
+            return self._current
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.sketch.add(seconds * 1000)
+            self.samples += 1
+            if self.samples % RECOMPUTE_EVERY:
+                return
+            p50 = self.sketch.quantile(0.5)
+            tail = self.sketch.quantile(ADAPTIVE_TIMEOUT_PERCENTILE / 100.0)
+            if self.samples >= ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+                read = min(max(tail / 1000 * ADAPTIVE_TIMEOUT_FACTOR, self.floor), self.ceiling)
+                connect = min(max(p50 / 1000 * CONNECT_TIMEOUT_FACTOR, CONNECT_TIMEOUT_FLOOR),
+                              CONNECT_TIMEOUT_CEILING, read)
+                self._current = (round(connect, 3), round(read, 3))
+            connect, read = self._current
+        dimensions = {"Upstream": self.name}
+        set_gauge("UpstreamLatencyP50", round(p50, 1), dimensions, unit="Milliseconds")
+        set_gauge("UpstreamLatencyP99", round(self.sketch.quantile(0.99), 1), dimensions, unit="Milliseconds")
+        set_gauge("UpstreamReadTimeout", read * 1000, dimensions, unit="Milliseconds")
+        set_gauge("UpstreamConnectTimeout", connect * 1000, dimensions, unit="Milliseconds")
+
+    def call(self, fn: Callable[[Tuple[float, float]], Any], budget: Optional[float] = None) -> Any:
+        """
+        Run ``fn((connect, read))``, retrying once if it times out and
+        ``budget`` seconds still leave room for another attempt
+        """
+        started = time.monotonic()
+        for attempt in range(2):
+            connect, read = self.timeouts()
+            if budget is not None:
+                read = min(read, max(budget - (time.monotonic() - started), 0.001))
+                connect = min(connect, read)
+            attempt_started = time.monotonic()
+            try:
+                result = fn((connect, read))
+            except requests.Timeout:
+                # Censored sample: the call took at least its timeout
+                self.record(read)
+                put_metric("UpstreamTimedOut", 1, dimensions={"Upstream": self.name})
+                remaining = None if budget is None else budget - (time.monotonic() - started)
+                if attempt or not ADAPTIVE_TIMEOUTS or (remaining is not None and remaining < self.floor):
+                    raise
+                put_metric("UpstreamTimeoutRetry", 1, dimensions={"Upstream": self.name})
+                logger.warning(f"{self.name} call timed out after {read:.2f}s, retrying once")
+                continue
+            except requests.RequestException as e:
+                # The upstream answered (with an error status): still a latency sample
+                if getattr(e, "response", None) is not None:
+                    self.record(time.monotonic() - attempt_started)
+                raise
+            self.record(time.monotonic() - attempt_started)
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        connect, read = self.timeouts()
+        with self._lock:
+            p50, p99 = self.sketch.quantile(0.5), self.sketch.quantile(0.99)
+            samples = self.samples
+        return {
+            "samples": samples,
+            "p50_ms": None if p50 is None else round(p50, 1),
+            "p99_ms": None if p99 is None else round(p99, 1),
+            "connect_timeout": connect,
+            "read_timeout": read,
+        }
+
+
+_timeouts: Dict[str, UpstreamTimeout] = {}
+_registry_lock = threading.Lock()
+
+
+def get_upstream_timeout(name: str) -> UpstreamTimeout:
+    """
+    Return the process-wide timeout tracker for an upstream, creating it on first use
+    """
+    with _registry_lock:
+        tracker = _timeouts.get(name)
+        if tracker is None:
+            floor, ceiling = _configured_bounds(name)
+            tracker = _timeouts[name] = UpstreamTimeout(name, floor, ceiling)
+        return tracker
+
+
+def upstream_timeout_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Per-upstream sample counts, latency percentiles and current timeouts
+    """
+    with _registry_lock:
+        trackers = list(_timeouts.values())
+    return {tracker.name: tracker.snapshot() for tracker in trackers}
+
+
+def reset_upstream_timeouts() -> None:
+    with _registry_lock:
+        _timeouts.clear()
@@ -0,0 +1,133 @@
+"""
+Container warm-up.
+
+A warm-up event (a scheduled ``{"warmup": true}`` ping, an EventBridge
+scheduled event, or provisioned-concurrency initialisation) runs a list of
+named steps - opening connection pools, creating AWS clients, loading
+bundled indexes, filling caches - and returns a report of how long each
+step took instead of processing a request. A failing step is reported but
+does not stop the others.
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from botocore.exceptions import ClientError
+
+from .api_helpers import COUNTRY_INFO_CACHE, get_country_info, refresh_hot_weather_cells
+from .landmark_kb import get_knowledge_base
+from .metrics import set_gauge
+
+logger = logging.getLogger()
+
+# Set by Lambda for execution environments started for provisioned concurrency
+PROVISIONED_INIT = os.getenv("AWS_LAMBDA_INITIALIZATION_TYPE") == "provisioned-concurrency"
+
+# Countries whose RestCountries data is fetched during warm-up (comma-separated)
+WARMUP_COUNTRIES = [c.strip() for c in os.getenv("WARMUP_COUNTRIES", "").split(",") if c.strip()]
+
+
+def is_warmup_event(event: Any) -> bool:
+    """
+    Whether an invocation is a warm-up ping rather than a real request
+    """
+    if not isinstance(event, dict):
+        return False
+    if event.get("warmup") or event.get("source") == "aws.events":
+        return True
+    body = event.get("body")
+    return isinstance(body, dict) and bool(body.get("warmup"))
+
+
+def run_warmup(function: str, steps: Iterable[Tuple[str, Callable[[], Any]]]) -> Dict[str, Any]:
+    """
+    Run warm-up steps in order and report each step's duration and outcome
+    """
+    report = {"function": function, "steps": {}}
+    started = time.monotonic()
+    for name, step in steps:
+        step_started = time.monotonic()
+        entry = {}
+        try:
+            detail = step()
+            if detail is not None:
+                entry["detail"] = detail
+            entry["ok"] = True
+        except Exception as e:
+            logger.warning(f"Warm-up step {name} failed: {str(e)}")
+            entry["ok"] = False
+            entry["error"] = str(e)
+        entry["ms"] = round((time.monotonic() - step_started) * 1000, 1)
+        set_gauge("WarmupStepDuration", entry["ms"], unit="Milliseconds",
+                  dimensions={"Function": function, "Step": name})
+        report["steps"][name] = entry
+    report["total_ms"] = round((time.monotonic() - started) * 1000, 1)
+    logger.info(f"Warm-up of {function} finished in {report['total_ms']}ms")
+    return report
+
+
+def warm_up_on_init(warm_up: Callable[[], Any]) -> None:
+    """
+    Run a handler's warm-up during init in containers started for provisioned
+    concurrency, before the first request
+    """
+    if PROVISIONED_INIT:
+        warm_up()
+
+
+def warmup_response(report: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json.dumps(dict(report, warmup=True))
+    }
+
+
+def warm_s3(client, bucket: Optional[str]) -> Optional[str]:
+    """
+    Resolve the S3 endpoint and open a connection with one signed request
+    """
+    if bucket and os.getenv("ENVIRONMENT") != "local":
+        try:
+            client.head_bucket(Bucket=bucket)
+        except ClientError:
+            # Any answer (even 403 without s3:ListBucket) means the connection is open
+            pass
+    return client.meta.endpoint_url
+
+
+def warm_knowledge_base() -> Optional[Dict[str, Any]]:
+    """
+    Map the bundled landmark knowledge base and fault in its index
+    """
+    knowledge_base = get_knowledge_base()
+    if knowledge_base is None:
+        return None
+    knowledge_base.preload()
+    return {"keys": knowledge_base.key_count}
+
+
+def warm_country_cache(countries: Sequence[str] = ()) -> Dict[str, int]:
+    """
+    Fetch country info for the configured countries that are not cached yet
+    """
+    countries = countries or WARMUP_COUNTRIES
+    fetched = 0
+    for country in countries:
+        if COUNTRY_INFO_CACHE.get(country.strip().lower()) is None and get_country_info(country) is not None:
+            fetched += 1
+    return {"fetched": fetched, "cached": len(COUNTRY_INFO_CACHE)}
+
+
+def warm_weather_cells() -> Dict[str, int]:
+    """
+    Refresh the hottest weather cells before they expire, so the next
+    requests for popular places are served from cache
+    """
+    return refresh_hot_weather_cells()
@@ -0,0 +1,194 @@
+"""
+Weather cache keyed by geohash cell.
+
+Current conditions barely differ across a few kilometres or a few minutes,
+and most requests are for a small set of popular places. Lookups are
+therefore bucketed into geohash cells (precision 5 is about 4.9 x 4.9 km)
+and each cell's conditions are cached for a few minutes. Every request in a
+cell shares one Google Weather call, made at the cell's centre, so the
+number of calls follows the number of distinct busy cells rather than the
+number of requests.
+
+Each cell also has a decaying hit score. The hottest cells whose score is
+still above ``WEATHER_HOT_MIN_HEAT`` are refreshed before they expire - on the scheduled warm-up ping in Lambda, or by a
+background thread in long-running processes - so popular places are always
+served from cache, and a cell that stops getting traffic drops out once
+its score has decayed. Cached conditions carry the time they were fetched, which
+the responses report as ``as_of``.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .cache import TTLCache
+
+logger = logging.getLogger()
+
+# Cell size: 4 ~ 39 km, 5 ~ 4.9 km, 6 ~ 1.2 km
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", "5"))
+
+# How long a cell's conditions are served before they are fetched again (0 disables caching)
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL_MINUTES", "10")) * 60
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "2048"))
+
+# Expired conditions younger than this are still served when Google Weather fails
+WEATHER_STALE_MAX = float(os.getenv("WEATHER_STALE_MAX_MINUTES", "60")) * 60
+
+# Number of hottest cells kept warm, and the share of the TTL after which they are refreshed
+WEATHER_HOT_CELLS = int(os.getenv("WEATHER_HOT_CELLS", "20"))
+WEATHER_REFRESH_AHEAD = float(os.getenv("WEATHER_REFRESH_AHEAD", "0.5"))
+
+# Decayed score a cell needs to be kept warm; the score halves every TTL, so
+# at 0.5 a single hit keeps its cell warm for one TTL and each doubling of
+# the hits adds another
+WEATHER_HOT_MIN_HEAT = float(os.getenv("WEATHER_HOT_MIN_HEAT", "0.5"))
+
+# Background refresh period for long-running processes (0 leaves it to the warm-up ping)
+WEATHER_REFRESH_SECONDS = float(os.getenv("WEATHER_REFRESH_SECONDS", "0"))
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(lat: float, lng: float, precision: int = WEATHER_GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    cell = []
+    bits, value, even = 0, 0, True
+    while len(cell) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            cell.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(cell)
+
+
+def decode_geohash(cell: str) -> Tuple[float, float]:
+    """
+    Centre ``(lat, lng)`` of a geohash cell
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2
+
+
+class CellHeat:
+    """
+    Exponentially decaying hit score per cell; a hit counts half as much
+    after ``half_life`` seconds
+    """
+
+    def __init__(self, half_life: float, maxsize: int = 4096):
+        self.half_life = max(half_life, 1.0)
+        self.maxsize = maxsize
+        self._scores: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, score: float, updated: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated) / self.half_life)
+
+    def touch(self, cell: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            score, updated = self._scores.get(cell, (0.0, now))
+            self._scores[cell] = (self._decayed(score, updated, now) + 1.0, now)
+            if len(self._scores) > self.maxsize:
+                coldest = min(self._scores, key=lambda c: self._decayed(*self._scores[c], now))
+                del self._scores[coldest]
+
+    def hottest(self, n: int, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        """
+        Up to ``n`` cells with a decayed score of at least ``min_score``, hottest first
+        """
+        now = time.monotonic()
+        with self._lock:
+            scores = [(cell, self._decayed(score, updated, now)) for cell, (score, updated) in self._scores.items()]
+        scores = [item for item in scores if item[1] >= min_score]
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:n]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scores.clear()
+
+
+# Parsed current conditions per cell, with the epoch time they were fetched
+WEATHER_CACHE = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL)
+CELL_HEAT = CellHeat(half_life=WEATHER_CACHE_TTL or 600)
+
+
+def cells_due(top_n: int = WEATHER_HOT_CELLS) -> List[str]:
+    """
+    Hottest cells, still above ``WEATHER_HOT_MIN_HEAT``, whose cached
+    conditions are missing or past the refresh-ahead point
+    """
+    due = []
+    for cell, _ in CELL_HEAT.hottest(top_n, WEATHER_HOT_MIN_HEAT):
+        age = WEATHER_CACHE.age(cell)
+        if age is None or age >= WEATHER_CACHE_TTL * WEATHER_REFRESH_AHEAD:
+            due.append(cell)
+    return due
+
+
+class HotCellRefresher:
+    """
+    Daemon thread that calls ``refresh`` every ``interval`` seconds
+    """
+
+    def __init__(self, refresh: Callable[[], object], interval: float):
+        self.refresh = refresh
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="weather-refresh", daemon=True)
+
+    def start(self) -> "HotCellRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Weather cell refresh failed: {str(e)}")
+
+
+_refresher: Optional[HotCellRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def ensure_refresher(refresh: Callable[[], object]) -> Optional[HotCellRefresher]:
+    """
+    Start the process-wide background refresher once, when one is configured
+    """
+    global _refresher
+    if WEATHER_REFRESH_SECONDS <= 0 or WEATHER_CACHE_TTL <= 0:
+        return None
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = HotCellRefresher(refresh, WEATHER_REFRESH_SECONDS).start()
+        return _refresher
@@ -0,0 +1,429 @@
+import base64
+import io
+import logging
+import os
+import tempfile
+from collections import deque
+from datetime import datetime
+from urllib.parse import urljoin
+
+import pdfplumber
+import requests
+from PyPDF2 import PdfReader, PdfWriter
+
+# Import shared utilities
+from shared import json_codec
+from shared.aws_clients import get_s3_client
+from shared.deadline import Deadline, stage_timeout
+from shared.http_client import get_session, preconnect
+from shared.image_ingest import (
+    IMAGE_MAX_REDIRECTS,
+    REDIRECT_STATUSES,
+    VISION_MAX_INLINE_BYTES,
+    ImageFetchError,
+    ImageURLRejected,
+    check_image_url,
+)
+from shared.rate_limit import get_limiter
+from shared.response_shaping import decode_request
+from shared.warmup import is_warmup_event, run_warmup, warm_up_on_init, warmup_response
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Google Vision API configuration
+GOOGLE_VISION_API_KEY = os.getenv("GOOGLE_VISION_API_KEY")
+GOOGLE_VISION_URL = "https://vision.googleapis.com/v1/images:annotate"
+GOOGLE_VISION_FILES_URL = "https://vision.googleapis.com/v1/files:annotate"
+
+# Largest document downloaded, and most pages read from it
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(50 * 1024 * 1024)))
+DOCUMENT_MAX_PAGES = int(os.getenv("DOCUMENT_MAX_PAGES", "200"))
+
+# Pages with less embedded text than this are treated as scanned images
+MIN_EMBEDDED_TEXT_CHARS = int(os.getenv("MIN_EMBEDDED_TEXT_CHARS", "25"))
+
+# Scanned pages sent to Vision per files:annotate request (Vision allows at most 5)
+OCR_BATCH_PAGES = min(int(os.getenv("OCR_BATCH_PAGES", "5")), 5)
+
+# Text returned inline; the full result is stored in S3
+MAX_RESPONSE_TEXT_CHARS = int(os.getenv("MAX_RESPONSE_TEXT_CHARS", "200000"))
+
+# Time kept back to assemble the response once extraction stops early
+MIN_OCR_SECONDS = 3
+
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+USER_AGENT = "LambdaTrip/1.0 (contact@example.com)"
+
+class DocumentError(Exception):
+    """
+    The document could not be downloaded or read
+    """
+
+def warm_up():
+    """
+    Open the Vision connection and create the S3 client
+    """
+    return run_warmup("text_extractor", [
+        ("http_pools", lambda: preconnect([GOOGLE_VISION_URL])),
+        ("s3_client", lambda: get_s3_client().meta.endpoint_url)
+    ])
+
+def lambda_handler(event, context):
+    """
+    Lambda function to extract text from PDFs and images
+    """
+    if is_warmup_event(event):
+        return warmup_response(warm_up())
+
+    # API Gateway base64-encodes request bodies because the API declares binary media types
+    event = decode_request(event)
+    deadline = Deadline.from_context(context)
+    degraded = []
+    try:
+        s3_bucket = os.environ.get('S3_BUCKET')
+
+        # Extract document URL from event
+        if 'body' in event:
+            # API Gateway sends body as a string, so we need to parse it
+            if isinstance(event['body'], str):
+                try:
+                    body_data = json_codec.loads(event['body'])
+                except json_codec.JSONDecodeError:
+                    logger.error("Invalid JSON in request body")
+                    raise ValueError("Invalid JSON in request body")
+            else:
+                # If body is already a dict (direct Lambda invocation)
+                body_data = event['body']
+        else:
+            # Direct Lambda invocation without API Gateway
+            body_data = event
+        document_url = body_data.get('document_url') or body_data.get('image_url', '')
+
+        if not document_url:
+            return error_response(400, "No document URL provided")
+
+        logger.info(f"Extracting text from: {document_url}")
+
+        pages = []
+        status = {}
+        with tempfile.NamedTemporaryFile(suffix=".download") as download:
+            try:
+                document_type = download_document(document_url, download, deadline)
+            except ImageURLRejected as e:
+                logger.warning(f"Document URL rejected: {str(e)}")
+                return error_response(400, f"Document URL not allowed: {str(e)}")
+            except DocumentError as e:
+                return error_response(400, str(e))
+
+            if document_type == "pdf":
+                page_results = iter_pdf_text(download.name, deadline, status)
+            else:
+                page_results = iter_image_text(document_url, download.name, deadline)
+
+            # Pages arrive in order as soon as they are ready
+            for page in page_results:
+                if page.get("error") and "ocr" not in degraded:
+                    degraded.append("ocr")
+                pages.append(page)
+
+        if status.get("stopped_early"):
+            degraded.append("incomplete")
+
+        result = {
+            "document_url": document_url,
+            "document_type": document_type,
+            "page_count": len(pages),
+            "ocr_pages": sum(1 for page in pages if page["source"] == "ocr"),
+            "pages": pages,
+            "truncated": False,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+        # Store result in S3
+        result_key = f"text_extraction/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_text.json"
+        environment = os.getenv('ENVIRONMENT')
+        if environment == 'local':
+            logger.info(f"Environment: {environment} - skipping S3 upload. Would store at: s3://{s3_bucket}/{result_key}")
+        elif deadline.expired():
+            logger.warning(f"Request deadline reached, skipping S3 upload to {result_key}")
+            degraded.append("storage")
+            result_key = None
+        else:
+            get_s3_client().put_object(
+                Bucket=s3_bucket,
+                Key=result_key,
+                Body=json_codec.dumps_bytes(result),
+                ContentType='application/json'
+            )
+            logger.info(f"Extracted text stored at s3://{s3_bucket}/{result_key}")
+
+        return {
+            "statusCode": 200,
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*"
+            },
+            "body": json_codec.dumps(dict(result, s3_key=result_key, degraded=degraded,
+                                          **inline_pages(pages, MAX_RESPONSE_TEXT_CHARS)))
+        }
+
+    except Exception as e:
+        logger.error(f"Error in text extraction: {str(e)}")
+        return error_response(500, str(e))
+
+def error_response(status_code, message):
+    return {
+        "statusCode": status_code,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*"
+        },
+        "body": json_codec.dumps({
+            "error": message,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    }
+
+def inline_pages(pages, max_chars):
+    """
+    The leading pages whose text fits in ``max_chars``. The page that crosses
+    the limit is cut short, so the inline response always carries text even
+    when the first page alone is longer than the limit.
+    """
+    kept = []
+    remaining = max_chars
+    for page in pages:
+        if len(page["text"]) > remaining:
+            if remaining > 0:
+                kept.append(dict(page, text=page["text"][:remaining], truncated=True))
+            return {"pages": kept, "truncated": True}
+        kept.append(page)
+        remaining -= len(page["text"])
+    return {"pages": kept, "truncated": False}
+
+def download_document(url, target, deadline=None):
+    """
+    Stream a document into ``target`` (an open binary file) without holding it
+    in memory. Returns "pdf" or "image". The URL and every redirect target are
+    checked with ``check_image_url``; a non-public address raises
+    ``ImageURLRejected``.
+    """
+    timeout = stage_timeout(deadline, 15)
+    if timeout is None:
+        raise DocumentError("Request deadline reached before downloading the document")
+    try:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            check_image_url(url)
+            with get_session().get(url, stream=True, timeout=timeout, allow_redirects=False,
+                                   headers={"User-Agent": USER_AGENT}) as response:
+                location = response.headers.get("Location")
+                if response.status_code in REDIRECT_STATUSES and location:
+                    url = urljoin(url, location)
+                    continue
+                content_type, head = read_document_response(response, target)
+                break
+        else:
+            raise DocumentError(f"Document URL redirected more than {IMAGE_MAX_REDIRECTS} times")
+    except ImageURLRejected:
+        raise
+    except ImageFetchError as e:
+        raise DocumentError(str(e))
+    except requests.RequestException as e:
+        raise DocumentError(f"Could not download document: {str(e)}")
+
+    if head.startswith(b"%PDF-") or "pdf" in content_type:
+        return "pdf"
+    if content_type.startswith("image/") or "octet-stream" in content_type or not content_type:
+        return "image"
+    raise DocumentError(f"Unsupported document type: {content_type}")
+
+def read_document_response(response, target):
+    """
+    Write a download response into ``target``; returns its content type and first bytes
+    """
+    if response.status_code >= 400:
+        raise DocumentError(f"Document URL returned HTTP {response.status_code}")
+    content_type = response.headers.get("Content-Type", "")
+    size = 0
+    head = b""
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        if len(head) < 5:
+            head += chunk[:5]
+        size += len(chunk)
+        if size > DOCUMENT_MAX_BYTES:
+            raise DocumentError(f"Document exceeds the {DOCUMENT_MAX_BYTES} byte limit")
+        target.write(chunk)
+    target.flush()
+    return content_type, head
+
+def needs_ocr(page, text):
+    """
+    A page needs OCR when it has images but (almost) no embedded text
+    """
+    return len(text.strip()) < MIN_EMBEDDED_TEXT_CHARS and bool(page.images)
+
+def iter_pdf_text(path, deadline=None, status=None):
+    """
+    Yield ``{"page", "text", "source"}`` for each page of a PDF, in order.
+
+    Embedded text is used where it exists. Scanned pages are collected into
+    batches of ``OCR_BATCH_PAGES`` and sent to Vision together; later text
+    pages wait behind them so output stays in page order. Each page's layout
+    is released once read, so memory stays flat regardless of page count.
+    ``status["stopped_early"]`` is set when the page limit or deadline is hit.
+    """
+    status = {} if status is None else status
+    reader = PdfReader(path)
+    pending = deque()
+    batch = []
+
+    def flush():
+        results = ocr_pdf_pages(reader, [entry["page"] for entry in batch], deadline)
+        for entry in batch:
+            text, error = results.get(entry["page"], ("", "no OCR result"))
+            entry["text"] = text
+            if error:
+                entry["error"] = error
+        batch.clear()
+
+    with pdfplumber.open(path) as pdf:
+        for index, page in enumerate(pdf.pages):
+            if index >= DOCUMENT_MAX_PAGES or deadline is not None and deadline.expired(MIN_OCR_SECONDS):
+                logger.warning(f"Stopping after {index} pages")
+                status["stopped_early"] = True
+                break
+            try:
+                text = page.extract_text() or ""
+                scanned = needs_ocr(page, text)
+            finally:
+                page.close()
+
+            if scanned:
+                entry = {"page": index + 1, "text": None, "source": "ocr"}
+                batch.append(entry)
+            else:
+                entry = {"page": index + 1, "text": text, "source": "embedded"}
+            pending.append(entry)
+
+            if len(batch) >= OCR_BATCH_PAGES:
+                flush()
+            while pending and pending[0]["text"] is not None:
+                yield pending.popleft()
+
+    if batch:
+        flush()
+    while pending:
+        yield pending.popleft()
+
+def ocr_pdf_pages(reader, page_numbers, deadline=None):
+    """
+    OCR a batch of PDF pages with one Vision files:annotate request.
+    Returns ``{page_number: (text, error)}``.
+    """
+    if not GOOGLE_VISION_API_KEY:
+        return {number: ("", "Google Vision API key not configured") for number in page_numbers}
+    timeout = stage_timeout(deadline, 60)
+    if timeout is None:
+        return {number: ("", "Request deadline reached") for number in page_numbers}
+
+    # Only the scanned pages are sent, as a small PDF of their own
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+
+    vision_request = {
+        "requests": [
+            {
+                "inputConfig": {
+                    "content": base64.b64encode(buffer.getvalue()).decode("ascii"),
+                    "mimeType": "application/pdf"
+                },
+                "features": [{"type": "DOCUMENT_TEXT_DETECTION"}],
+                "pages": list(range(1, len(page_numbers) + 1))
+            }
+        ]
+    }
+
+    def annotate():
+        response = get_session().post(
+            f"{GOOGLE_VISION_FILES_URL}?key={GOOGLE_VISION_API_KEY}",
+            json=vision_request,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        vision_data = get_limiter("google_vision").call(None, annotate, timeout)
+    except requests.RequestException as e:
+        logger.error(f"Error calling Google Vision OCR: {str(e)}")
+        return {number: ("", str(e)) for number in page_numbers}
+
+    results = {}
+    file_response = (vision_data.get('responses') or [{}])[0]
+    for page_response in file_response.get('responses', []):
+        # Page numbers in the response refer to the batch PDF
+        batch_page = page_response.get('context', {}).get('pageNumber')
+        if not batch_page or batch_page > len(page_numbers):
+            continue
+        error = page_response.get('error', {}).get('message')
+        text = page_response.get('fullTextAnnotation', {}).get('text', '')
+        results[page_numbers[batch_page - 1]] = (text, error)
+    logger.info(f"Vision OCR processed pages {page_numbers}")
+    return results
+
+def iter_image_text(image_url, path=None, deadline=None):
+    """
+    Yield the text of a single image using Vision DOCUMENT_TEXT_DETECTION.
+    The downloaded copy at ``path`` is sent inline when it is small enough.
+    """
+    entry = {"page": 1, "text": "", "source": "ocr"}
+    if not GOOGLE_VISION_API_KEY:
+        entry["error"] = "Google Vision API key not configured"
+        yield entry
+        return
+    timeout = stage_timeout(deadline, 30)
+    if timeout is None:
+        entry["error"] = "Request deadline reached"
+        yield entry
+        return
+
+    if path and os.path.getsize(path) <= VISION_MAX_INLINE_BYTES:
+        with open(path, "rb") as f:
+            vision_image = {"content": base64.b64encode(f.read()).decode("ascii")}
+    else:
+        vision_image = {"source": {"imageUri": image_url}}
+    vision_request = {
+        "requests": [
+            {
+                "image": vision_image,
+                "features": [{"type": "DOCUMENT_TEXT_DETECTION"}]
+            }
+        ]
+    }
+
+    def annotate():
+        response = get_session().post(
+            f"{GOOGLE_VISION_URL}?key={GOOGLE_VISION_API_KEY}",
+            json=vision_request,
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    try:
+        vision_data = get_limiter("google_vision").call(("ocr", image_url), annotate, timeout)
+        response_data = (vision_data.get('responses') or [{}])[0]
+        if response_data.get('error'):
+            entry["error"] = response_data['error'].get('message', 'unknown error')
+        entry["text"] = response_data.get('fullTextAnnotation', {}).get('text', '')
+    except requests.RequestException as e:
+        logger.error(f"Error calling Google Vision OCR: {str(e)}")
+        entry["error"] = str(e)
+    yield entry
+
+warm_up_on_init(warm_up)
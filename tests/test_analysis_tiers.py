@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Tests for confidence-gated analysis tiers in the landmark analyzer.
+"""
+
+import copy
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+
+ANALYSIS_DATA = {
+    "landmark": {
+        "name": "Old Harbour Lighthouse",
+        "description": "Old Harbour Lighthouse",
+        "source": "vision",
+        "confidence": 0.9,
+        "location": {"city": "Valletta", "country": "Malta", "lat": 35.8989, "lng": 14.5146},
+    },
+    "weather": {"temperature": {"current": 27}, "conditions": "Sunny", "humidity": 50},
+    "country_info": {
+        "name": {"common": "Malta"},
+        "capital": ["Valletta"],
+        "region": "Europe",
+        "currencies": [{"name": "Euro"}],
+        "languages": {"mlt": "Maltese", "eng": "English"},
+    },
+}
+
+LABEL_ONLY = {
+    "landmark": {
+        "name": "Unknown Landmark",
+        "source": "labels",
+        "confidence": 0.5,
+        "description": "Location detected from image labels",
+        "location": {"city": None, "country": None, "description": "tower"},
+    },
+}
+
+
+def with_landmark(**changes):
+    data = copy.deepcopy(ANALYSIS_DATA)
+    data["landmark"].update(changes)
+    return data
+
+
+class TestTierPolicy(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        _, cls.landmark_app = load_handlers()
+
+    def test_tiers(self):
+        choose = self.landmark_app.choose_analysis_tier
+        self.assertEqual(choose(ANALYSIS_DATA), ("full", None))
+        self.assertEqual(choose(LABEL_ONLY)[0], "template")
+        self.assertEqual(choose(with_landmark(confidence=0.2))[0], "template")
+        self.assertEqual(choose(with_landmark(confidence=0.5))[0], "light")
+        # Confident detection that was never placed: no location, weather or country info
+        self.assertEqual(choose({"landmark": dict(ANALYSIS_DATA["landmark"], location={})})[0], "light")
+        self.assertEqual(choose({"landmark": ANALYSIS_DATA["landmark"]})[0], "full")
+        # Older clients send no confidence; they are tiered on completeness only
+        self.assertEqual(choose(with_landmark(confidence=None))[0], "full")
+
+    def test_light_request_is_short(self):
+        full = self.landmark_app.build_bedrock_request(ANALYSIS_DATA)
+        light = self.landmark_app.build_bedrock_request(ANALYSIS_DATA, "light")
+        self.assertEqual(full["max_tokens"], 3000)
+        self.assertEqual(light["max_tokens"], self.landmark_app.LIGHT_ANALYSIS_MAX_TOKENS)
+        self.assertLess(len(light["messages"][0]["content"]), len(full["messages"][0]["content"]) / 2)
+
+    def test_template_analysis_is_deterministic(self):
+        analysis = self.landmark_app.template_analysis(ANALYSIS_DATA)
+        self.assertEqual(analysis, self.landmark_app.template_analysis(ANALYSIS_DATA))
+        self.assertIn("Valletta, Malta", analysis["summary"])
+        self.assertIn("Current weather: Sunny, 27°C", analysis["insights"])
+        self.assertEqual(analysis["cultural_highlights"], "Languages: Maltese, English")
+        self.assertIn("No specific landmark", self.landmark_app.template_analysis(LABEL_ONLY)["summary"])
+
+    def test_template_analysis_makes_up_no_safety_data(self):
+        analysis = self.landmark_app.template_analysis(LABEL_ONLY)
+        self.assertIsNone(analysis["safety_rating"])
+        self.assertIsNone(analysis["travel_advisory"])
+
+        advisory = {"country": "Malta", "level": "Exercise normal safety precautions", "summary": "Level 1"}
+        analysis = self.landmark_app.template_analysis(dict(ANALYSIS_DATA, travel_advisory=advisory))
+        self.assertEqual(analysis["travel_advisory"], advisory)
+
+
+class TestTieredHandler(unittest.TestCase):
+    """Only detections worth a full narrative get the full Bedrock call."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        self.stubs["bedrock"].reset_stats()
+
+    def analyze(self, analysis_data):
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}}, FakeLambdaContext(30000))
+        self.assertEqual(response["statusCode"], 200)
+        return json.loads(response["body"])
+
+    def test_label_only_detection_uses_template(self):
+        body = self.analyze(LABEL_ONLY)
+        self.assertEqual(body["analysis_source"], "template")
+        self.assertEqual(body["analysis_tier"], "template")
+        self.assertIsNone(body["bedrock_usage"])
+        self.assertIn("packing_tips", body["recommendations"])
+        self.assertNotIn("safety_rating", body["analysis"])
+        self.assertNotIn("travel_advisory", body["analysis"])
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 0)
+
+    def test_weak_detection_uses_light_call(self):
+        body = self.analyze(with_landmark(confidence=0.45))
+        self.assertEqual(body["analysis_source"], "bedrock")
+        self.assertEqual(body["analysis_tier"], "light")
+        self.assertEqual(body["bedrock_usage"]["prompt_version"], self.landmark_app.LIGHT_ANALYSIS_PROMPT_VERSION)
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 1)
+
+    def test_confident_detection_uses_full_call(self):
+        body = self.analyze(ANALYSIS_DATA)
+        self.assertEqual(body["analysis_tier"], "full")
+        self.assertEqual(body["bedrock_usage"]["prompt_version"], self.landmark_app.ANALYSIS_PROMPT_VERSION)
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Tests for the analysis backfill tool against the stub S3 and Bedrock.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import load_handlers
+from benchmarks.stubs import DEFAULT_BEDROCK_ANALYSIS, StubUpstreams, UpstreamProfile
+from tools import backfill_analysis
+from tools.backfill_analysis import (
+    Checkpoint,
+    collect_batch,
+    output_key,
+    prepare_batch,
+    run_invoke,
+)
+
+BUCKET = "stub-bucket"
+SOURCES = [f"landmark_analysis/202501{day:02d}_120000_analysis.json" for day in range(1, 8)]
+
+
+def intermediate(day):
+    return {
+        "landmark": {"name": f"Landmark {day}", "location": {"city": "Paris", "country": "France"}},
+        "weather": {"temperature": {"current": 20, "unit": "C"}, "conditions": "Sunny"},
+        "country_info": {"name": "France"},
+        "image_url": f"https://example.com/{day}.jpg",
+    }
+
+
+class BackfillTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        cls.prompt_version = cls.landmark_app.ANALYSIS_PROMPT_VERSION
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stubs["s3"].objects.clear()
+        self.stubs["bedrock"].profile = UpstreamProfile()
+        self.stubs.reset_stats()
+        self.s3 = boto3.client("s3")
+        self.bedrock = self.landmark_app.get_bedrock_client()
+        for day, key in enumerate(SOURCES, start=1):
+            self.s3.put_object(Bucket=BUCKET, Key=key, Body=json.dumps(intermediate(day)))
+        # Final results sit under the same prefix and are not backfill sources
+        self.s3.put_object(Bucket=BUCKET, Key="landmark_analysis/20250101_120000_final.json", Body=b"{}")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def stored(self, key):
+        return json.loads(self.s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+
+class TestInvokeMode(BackfillTestCase):
+    """On-demand re-analysis with checkpoints."""
+
+    def checkpoint(self):
+        return Checkpoint(os.path.join(self.tmp, "checkpoint.json"), self.prompt_version,
+                          self.landmark_app.BEDROCK_MODEL_ID)
+
+    def test_backfills_every_intermediate(self):
+        counts = run_invoke(self.s3, self.bedrock, BUCKET, concurrency=3, rate=0, checkpoint=self.checkpoint())
+
+        self.assertEqual(counts, {"written": len(SOURCES), "skipped": 0, "failed": 0})
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], len(SOURCES))
+        result = self.stored(output_key(SOURCES[2], self.prompt_version))
+        self.assertEqual(result["backfill_source"], SOURCES[2])
+        self.assertEqual(result["landmark"]["name"], "Landmark 3")
+        self.assertEqual(result["analysis"]["summary"], DEFAULT_BEDROCK_ANALYSIS["summary"])
+        self.assertEqual(result["bedrock_usage"]["prompt_version"], self.prompt_version)
+
+    def test_resumes_from_checkpoint(self):
+        run_invoke(self.s3, self.bedrock, BUCKET, concurrency=2, rate=0, checkpoint=self.checkpoint(), limit=3)
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 3)
+
+        counts = run_invoke(self.s3, self.bedrock, BUCKET, concurrency=2, rate=0, checkpoint=self.checkpoint())
+        self.assertEqual(counts["written"], len(SOURCES))
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], len(SOURCES))
+
+    def test_rerun_is_idempotent(self):
+        run_invoke(self.s3, self.bedrock, BUCKET, rate=0)
+        self.stubs.reset_stats()
+
+        # A fresh run without a checkpoint skips results that already exist
+        counts = run_invoke(self.s3, self.bedrock, BUCKET, rate=0)
+        self.assertEqual(counts, {"written": 0, "skipped": len(SOURCES), "failed": 0})
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 0)
+
+    def test_failed_keys_are_retried_on_resume(self):
+        self.stubs["bedrock"].profile = UpstreamProfile(failure_rate=1.0, failure_status=400)
+        counts = run_invoke(self.s3, self.bedrock, BUCKET, rate=0, checkpoint=self.checkpoint())
+        self.assertEqual(counts["failed"], len(SOURCES))
+
+        self.stubs["bedrock"].profile = UpstreamProfile()
+        checkpoint = self.checkpoint()
+        counts = run_invoke(self.s3, self.bedrock, BUCKET, rate=0, checkpoint=checkpoint)
+        self.assertEqual((counts["written"], counts["failed"]), (len(SOURCES), 0))
+        self.assertEqual(checkpoint.state["failed"], [])
+
+
+class TestBatchMode(BackfillTestCase):
+    """Batch-inference input files and output collection."""
+
+    def test_prepare_and_collect(self):
+        batch_input = "s3://stub-batch/input/backfill.jsonl"
+        self.assertEqual(prepare_batch(self.s3, BUCKET, batch_input, concurrency=3), len(SOURCES))
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 0)
+
+        lines = self.s3.get_object(Bucket="stub-batch", Key="input/backfill.jsonl")["Body"].read().splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(len(records), len(SOURCES))
+        self.assertIn("Landmark 1", records[0]["modelInput"]["messages"][0]["content"])
+
+        # What a finished batch job leaves in the output location (one record failed)
+        output = []
+        for record in records[:-1]:
+            output.append({"recordId": record["recordId"], "modelInput": record["modelInput"], "modelOutput": {
+                "content": [{"type": "text", "text": json.dumps(DEFAULT_BEDROCK_ANALYSIS)}],
+                "usage": {"input_tokens": 1000, "output_tokens": 400},
+            }})
+        output.append({"recordId": records[-1]["recordId"], "modelInput": records[-1]["modelInput"],
+                       "error": {"errorCode": 400, "errorMessage": "bad request"}})
+        self.s3.put_object(Bucket="stub-batch", Key="output/job-1/backfill.jsonl.out",
+                           Body="\n".join(json.dumps(line) for line in output))
+
+        counts = collect_batch(self.s3, BUCKET, batch_input, "s3://stub-batch/output/")
+        self.assertEqual(counts, {"written": len(SOURCES) - 1, "skipped": 0, "failed": 1, "missing": 0})
+        usage = self.stored(output_key(SOURCES[0], self.prompt_version))["bedrock_usage"]
+        self.assertTrue(usage["batch"])
+        self.assertAlmostEqual(usage["cost_usd"], (1000 * 0.00025 + 400 * 0.00125) / 1000 / 2)
+
+    def test_prepare_skips_existing_results(self):
+        run_invoke(self.s3, self.bedrock, BUCKET, rate=0, limit=2)
+        count = prepare_batch(self.s3, BUCKET, "s3://stub-batch/input/rest.jsonl")
+        self.assertEqual(count, len(SOURCES) - 2)
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_output_key_is_deterministic(self):
+        key = output_key("landmark_analysis/20250101_120000_analysis.json", "v2")
+        self.assertEqual(key, "landmark_analysis/backfill/v2/20250101_120000_final.json")
+        self.assertEqual(backfill_analysis.record_id("a"), backfill_analysis.record_id("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
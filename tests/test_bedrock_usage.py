@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for Bedrock usage accounting and the usage report tool.
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+from shared import metrics
+from shared.bedrock_usage import estimate_cost, invoke_model
+from tools.bedrock_usage_report import main as report_main
+from tools.bedrock_usage_report import summarize, usage_rows
+from tools.build_landmark_kb import iter_results_from_dir
+
+HAIKU = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+class FakeBody:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def read(self):
+        return json.dumps(self.payload).encode("utf-8")
+
+
+class FakeBedrockClient:
+    """Answers invoke_model and invoke_model_with_response_stream from canned data."""
+
+    def __init__(self, text="{}", usage=None):
+        self.text = text
+        self.usage = usage or {"input_tokens": 1000, "output_tokens": 200}
+
+    def invoke_model(self, modelId, body):
+        return {"body": FakeBody({"content": [{"type": "text", "text": self.text}], "usage": self.usage})}
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        events = [
+            {"type": "message_start", "message": {"id": "msg", "role": "assistant", "content": [],
+                                                  "usage": {"input_tokens": self.usage["input_tokens"]}}},
+            {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+        ]
+        events += [{"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": part}}
+                   for part in (self.text[:1], self.text[1:])]
+        events += [
+            {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+             "usage": {"output_tokens": self.usage["output_tokens"]}},
+            {"type": "message_stop"},
+        ]
+        return {"body": ({"chunk": {"bytes": json.dumps(event).encode("utf-8")}} for event in events)}
+
+
+class TestInvokeModel(unittest.TestCase):
+    """Usage records and metrics for single calls."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_usage_record_and_metrics(self):
+        body, usage = invoke_model(FakeBedrockClient('{"summary": "ok"}'), HAIKU, {"messages": []},
+                                   function="landmark_analyzer", prompt_version="v1", stream=False)
+
+        self.assertEqual(body["content"][0]["text"], '{"summary": "ok"}')
+        self.assertEqual(usage["input_tokens"], 1000)
+        self.assertEqual(usage["output_tokens"], 200)
+        self.assertEqual(usage["cache_read_input_tokens"], 0)
+        self.assertEqual(usage["prompt_version"], "v1")
+        self.assertIsNone(usage["time_to_first_token_ms"])
+        self.assertAlmostEqual(usage["cost_usd"], 0.0005)
+
+        counters = metrics.snapshot()["counters"]
+        key = f"BedrockInputTokens[Function=landmark_analyzer,Model={HAIKU},PromptVersion=v1]"
+        self.assertEqual(counters[key], 1000)
+
+    def test_streamed_call_measures_first_token(self):
+        body, usage = invoke_model(FakeBedrockClient('{"summary": "streamed"}'), HAIKU, {"messages": []},
+                                   function="landmark_analyzer", prompt_version="v1", stream=True)
+
+        self.assertEqual(json.loads(body["content"][0]["text"]), {"summary": "streamed"})
+        self.assertEqual(body["stop_reason"], "end_turn")
+        self.assertEqual((usage["input_tokens"], usage["output_tokens"]), (1000, 200))
+        self.assertIsNotNone(usage["time_to_first_token_ms"])
+        self.assertLessEqual(usage["time_to_first_token_ms"], usage["latency_ms"])
+
+    def test_cost_includes_cache_tokens_and_unknown_models(self):
+        usage = {"input_tokens": 1000, "output_tokens": 0, "cache_read_input_tokens": 1000}
+        self.assertAlmostEqual(estimate_cost(HAIKU, usage), 0.00025 * 1.1)
+        self.assertAlmostEqual(estimate_cost(f"us.{HAIKU}", usage), 0.00025 * 1.1)
+        self.assertIsNone(estimate_cost("example.unknown-model", usage))
+
+
+class TestHandlerUsage(unittest.TestCase):
+    """The analyzer stores the usage record with its result."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def test_landmark_analysis_reports_usage(self):
+        analysis_data = {"landmark": {"name": "Big Ben", "location": {"country": "United Kingdom"}}}
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}},
+                                                    FakeLambdaContext(30000))
+        usage = json.loads(response["body"])["bedrock_usage"]
+
+        self.assertEqual(usage["model_id"], self.landmark_app.BEDROCK_MODEL_ID)
+        self.assertEqual(usage["prompt_version"], self.landmark_app.ANALYSIS_PROMPT_VERSION)
+        self.assertEqual((usage["input_tokens"], usage["output_tokens"]), (850, 420))
+        self.assertGreater(usage["cost_usd"], 0)
+
+
+class TestUsageReport(unittest.TestCase):
+    """Aggregating stored results."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        results = [
+            ("France", "landmark-analysis-v1", 100.0, 0.002),
+            ("France", "landmark-analysis-v2", 300.0, 0.001),
+            ("Japan", "landmark-analysis-v1", 200.0, 0.004),
+        ]
+        for i, (country, version, latency, cost) in enumerate(results):
+            result = {
+                "landmark": {"name": f"Landmark {i}", "location": {"country": country}},
+                "bedrock_usage": {"model_id": HAIKU, "prompt_version": version, "input_tokens": 800,
+                                  "output_tokens": 400, "latency_ms": latency,
+                                  "time_to_first_token_ms": None, "cost_usd": cost},
+            }
+            with open(os.path.join(self.tmp, f"{i}_final.json"), "w") as f:
+                json.dump(result, f)
+        # Knowledge base hits carry no usage and are skipped
+        with open(os.path.join(self.tmp, "kb_final.json"), "w") as f:
+            json.dump({"landmark": {"name": "Eiffel Tower"}, "bedrock_usage": None}, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_groups_by_country_and_prompt_version(self):
+        rows = list(usage_rows(iter_results_from_dir(self.tmp)))
+        self.assertEqual(len(rows), 3)
+
+        by_country = {row["country"]: row for row in summarize(rows, "country")}
+        self.assertEqual(by_country["France"]["calls"], 2)
+        self.assertAlmostEqual(by_country["France"]["cost_usd"], 0.003)
+        self.assertEqual(by_country["France"]["latency_p95_ms"], 300.0)
+
+        by_version = summarize(rows, "prompt_version")
+        self.assertEqual(by_version[0]["prompt_version"], "landmark-analysis-v1")
+        self.assertEqual(by_version[0]["input_tokens"], 1600)
+
+    def test_cli_json_output(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(report_main(["--from-dir", self.tmp, "--json", "--by", "model"]), 0)
+        tables = json.loads(output.getvalue())
+        self.assertEqual(tables["model"][0]["calls"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
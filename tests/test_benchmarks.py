@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Smoke tests for the offline benchmark harness and its stub upstreams.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks import e2e, load, micro
+from benchmarks.harness import route_for, summarize_latencies
+from benchmarks.stubs import StubUpstream, UpstreamProfile
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+    """Offline checks that need no API keys."""
+
+    def test_route_for_events(self):
+        self.assertEqual(route_for({"path": "/analyze-image"}), "image_processor")
+        self.assertEqual(route_for({"body": {"analysis_data": {}}}), "landmark_analyzer")
+        self.assertIsNone(route_for({"path": "/analyze-itinerary"}))
+
+    def test_summarize_latencies(self):
+        stats = summarize_latencies([float(i) for i in range(1, 101)])
+        self.assertEqual(stats["p50"], 50.0)
+        self.assertEqual(stats["p99"], 99.0)
+        self.assertEqual(summarize_latencies([])["count"], 0)
+
+    def test_stub_failure_rate(self):
+        stub = StubUpstream("restcountries", UpstreamProfile(failure_rate=1.0, failure_status=503)).start()
+        try:
+            response = requests.get(f"{stub.url}/v3.1/name/France", timeout=5)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(stub.stats()["failures"], 1)
+        finally:
+            stub.stop()
+
+    def test_e2e_writes_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "e2e.json")
+            code = e2e.main(["--iterations", "1", "--warmup", "0", "--output", output])
+            self.assertEqual(code, 0)
+            with open(output) as f:
+                results = json.load(f)
+        image = results["phases"]["image_processor"]
+        self.assertEqual(image["errors"], 0)
+        self.assertEqual(image["upstream_calls"]["vision"]["calls"], 1)
+        self.assertIn("bedrock", results["phases"]["landmark_analyzer"]["upstream_calls"])
+
+
+    def test_micro_cases_run(self):
+        cases = dict(micro.build_cases())
+        self.assertIn("parse_bedrock_response[truncated]", cases)
+        for name, func in cases.items():
+            with self.subTest(case=name):
+                func()
+
+        # Malformed Bedrock output should degrade to the text fallback, not raise
+        fallback = cases["parse_bedrock_response[truncated]"]()
+        self.assertEqual(fallback["insights"], ["Analysis completed successfully"])
+
+    def test_load_driver_reports_injected_errors(self):
+        scenario = {
+            "duration_s": 1.0,
+            "arrival_rate": 10,
+            "concurrency": 4,
+            "mix": {"landmark_analyzer": 1.0},
+            "phases": [{"at_s": 0.0, "upstreams": {"bedrock": {"failure_rate": 1.0, "failure_status": 400}}}],
+        }
+        report = load.run_load(scenario, interval_s=0.5)
+        self.assertGreater(report["overall"]["requests"], 0)
+        self.assertTrue(report["timeline"])
+        self.assertEqual(report["upstream_calls"]["bedrock"]["calls"], report["overall"]["requests"])
+
+    @unittest.skipUnless(os.getenv("RUN_MICROBENCHMARKS"), "Set RUN_MICROBENCHMARKS=1 to run the regression gate")
+    def test_micro_regression_gate(self):
+        self.assertEqual(micro.main([]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for per-upstream circuit breakers and cached fallback.
+"""
+
+import os
+import sys
+import time
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import api_helpers, metrics
+from shared.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    get_breaker,
+    is_upstream_failure,
+    reset_breakers,
+)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """State machine behaviour."""
+
+    def test_opens_on_failure_rate_and_recovers_after_probe(self):
+        breaker = CircuitBreaker("test", window_size=10, min_calls=4, failure_rate=0.5, open_seconds=0.05)
+        for _ in range(2):
+            breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # only one probe at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test", min_calls=1, failure_rate=1.0, open_seconds=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_client_errors_are_not_upstream_failures(self):
+        not_found = requests.Response()
+        not_found.status_code = 404
+        throttled = requests.Response()
+        throttled.status_code = 429
+        self.assertFalse(is_upstream_failure(requests.HTTPError(response=not_found)))
+        self.assertTrue(is_upstream_failure(requests.HTTPError(response=throttled)))
+        self.assertTrue(is_upstream_failure(requests.ConnectTimeout()))
+
+
+class TestCircuitBreakerWithStub(unittest.TestCase):
+    """RestCountries stub flipping between healthy and failing."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_breakers()
+        metrics.reset()
+        api_helpers.COUNTRY_INFO_CACHE.clear()
+        self.stub = self.stubs["restcountries"]
+        self.stub.profile = UpstreamProfile()
+        self.stub.reset_stats()
+
+    def test_open_breaker_fails_fast_with_cached_value(self):
+        healthy = api_helpers.get_country_info("France")
+        self.assertEqual(healthy.common_name, "France")
+
+        self.stub.profile = UpstreamProfile(failure_rate=1.0, failure_status=503)
+        breaker = get_breaker("restcountries")
+        for _ in range(breaker.min_calls):
+            self.assertEqual(api_helpers.get_country_info("France"), healthy)
+        self.assertEqual(breaker.state, OPEN)
+
+        calls = self.stub.stats()["calls"]
+        start = time.monotonic()
+        self.assertEqual(api_helpers.get_country_info("France"), healthy)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(self.stub.stats()["calls"], calls)
+        self.assertIsNone(api_helpers.get_country_info("Japan"))
+
+        gauges = metrics.snapshot()["gauges"]
+        self.assertEqual(gauges["CircuitBreakerState[Upstream=restcountries]"], 2)
+
+    def test_probe_closes_breaker_when_upstream_recovers(self):
+        breaker = get_breaker("restcountries")
+        breaker.open_seconds = 0.05
+        self.stub.profile = UpstreamProfile(failure_rate=1.0)
+        for _ in range(breaker.min_calls):
+            api_helpers.get_country_info("France")
+        self.assertEqual(breaker.state, OPEN)
+
+        self.stub.profile = UpstreamProfile()
+        time.sleep(0.06)
+        self.assertIsNotNone(api_helpers.get_country_info("France"))
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.open_seconds = 30
+
+
+if __name__ == "__main__":
+    unittest.main()
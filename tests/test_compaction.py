@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for compacting per-request results into partitioned datasets.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.stubs import StubUpstreams
+from shared.compaction import (
+    LocalStorage,
+    S3Storage,
+    compact_day,
+    iter_compacted,
+    read_manifest,
+)
+from tools import compact_results
+
+BUCKET = "stub-bucket"
+
+
+def stored_result(name, country_code, suffix):
+    return {
+        "landmark": {"name": name, "location": {"city": "Somewhere", "country_code": country_code}},
+        "analysis": {"summary": f"About {name}"} if suffix == "final" else None,
+        "image_url": f"https://example.com/{name}.jpg",
+    }
+
+
+def write_day(storage):
+    """Two countries, both kinds, plus objects that must be left out."""
+    for second in range(6):
+        country = "FR" if second % 2 else "jp"
+        for suffix in ("analysis", "final"):
+            key = f"landmark_analysis/20250301_1200{second:02d}_{suffix}.json"
+            storage.write(key, json.dumps(stored_result(f"Landmark {second}", country, suffix), indent=2).encode())
+    storage.write("landmark_analysis/20250302_000000_final.json", json.dumps(stored_result("Next day", "FR", "final")).encode())
+    storage.write("landmark_analysis/20250301_130000_final.json", b"{not json")
+    storage.write("landmark_analysis/backfill/v2/20250301_120000_final.json", b"{}")
+
+
+class TestLocalCompaction(unittest.TestCase):
+    """Partitioning, manifests and reading back from a local directory."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.storage = LocalStorage(self.tmp)
+        write_day(self.storage)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_partitions_by_kind_date_and_country(self):
+        manifests = compact_day(self.storage, "2025-03-01")
+
+        self.assertEqual(sorted(manifests), ["analysis", "final"])
+        final = read_manifest(self.storage, "final", "2025-03-01")
+        self.assertEqual(final, manifests["final"])
+        self.assertEqual(final["records"], 6)
+        self.assertEqual([part["key"] for part in final["parts"]], [
+            "compacted/final/date=2025-03-01/country=FR/part-00000.ndjson.gz",
+            "compacted/final/date=2025-03-01/country=JP/part-00000.ndjson.gz",
+        ])
+        self.assertEqual(final["parts"][0]["min_timestamp"], "2025-03-01T12:00:01")
+        self.assertEqual(final["parts"][0]["max_timestamp"], "2025-03-01T12:00:05")
+
+        lines = gzip.decompress(self.storage.read(final["parts"][0]["key"])).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0])["source_key"], "landmark_analysis/20250301_120001_final.json")
+
+    def test_read_back_by_country(self):
+        compact_day(self.storage, "2025-03-01")
+        names = [r["landmark"]["name"] for r in iter_compacted(self.storage, "final", "2025-03-01", country="jp")]
+        self.assertEqual(names, ["Landmark 0", "Landmark 2", "Landmark 4"])
+        self.assertEqual(len(list(iter_compacted(self.storage, "analysis", "2025-03-01"))), 6)
+        self.assertEqual(list(iter_compacted(self.storage, "final", "2025-02-28")), [])
+
+    def test_parts_roll_over_and_rerun_is_stable(self):
+        first = compact_day(self.storage, "2025-03-01", max_part_bytes=1)
+        self.assertEqual(len(first["final"]["parts"]), 6)
+        self.assertTrue(all(part["records"] == 1 for part in first["final"]["parts"]))
+
+        second = compact_day(self.storage, "2025-03-01", max_part_bytes=1)
+        self.assertEqual([p["key"] for p in first["final"]["parts"]], [p["key"] for p in second["final"]["parts"]])
+        self.assertEqual(self.storage.read(first["final"]["parts"][0]["key"]),
+                         self.storage.read(second["final"]["parts"][0]["key"]))
+
+    def test_delete_sources_keeps_unreadable_objects(self):
+        compact_day(self.storage, "2025-03-01", delete_sources=True)
+        self.assertEqual(list(self.storage.list("landmark_analysis/20250301")),
+                         ["landmark_analysis/20250301_130000_final.json"])
+        self.assertEqual(len(list(iter_compacted(self.storage, "final", "2025-03-01"))), 6)
+
+    def test_cli(self):
+        self.assertEqual(compact_results.main(["--from-dir", self.tmp, "--since", "2025-03-01", "--until", "2025-03-02"]), 0)
+        self.assertEqual(read_manifest(self.storage, "final", "2025-03-02")["records"], 1)
+
+
+class TestS3Compaction(unittest.TestCase):
+    """The same job against the stub S3 endpoint."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def test_compacts_bucket_day(self):
+        self.stubs["s3"].objects.clear()
+        storage = S3Storage(BUCKET, client=boto3.client("s3"))
+        write_day(storage)
+
+        manifests = compact_day(storage, "2025-03-01", concurrency=2)
+        self.assertEqual(manifests["analysis"]["records"], 6)
+        self.assertIn(f"/{BUCKET}/compacted/analysis/date=2025-03-01/_manifest.json", self.stubs["s3"].objects)
+        self.assertEqual(len(list(iter_compacted(storage, "final", "2025-03-01", country="FR"))), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
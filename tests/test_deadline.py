@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for request deadline propagation.
+"""
+
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import api_helpers, aws_clients
+from shared.circuit_breaker import reset_breakers
+from shared.deadline import Deadline, stage_timeout
+
+
+class TestDeadline(unittest.TestCase):
+    """Deadline arithmetic."""
+
+    def test_from_context_keeps_reserve(self):
+        deadline = Deadline.from_context(FakeLambdaContext(10000), reserve_ms=2000)
+        self.assertLessEqual(deadline.remaining(), 8.0)
+        self.assertGreater(deadline.remaining(), 7.5)
+
+    def test_from_context_without_context(self):
+        self.assertGreater(Deadline.from_context(None).remaining(), 1.0)
+
+    def test_timeout_shrinks_with_budget(self):
+        deadline = Deadline(2000)
+        self.assertLessEqual(deadline.timeout(10), 2.0)
+        self.assertEqual(Deadline(60000).timeout(10), 10)
+        self.assertIsNone(Deadline(100).timeout(10))
+        self.assertEqual(stage_timeout(None, 15), 15)
+
+    def test_slice_never_outlives_parent(self):
+        parent = Deadline(1000)
+        child = parent.slice(5.0)
+        self.assertLessEqual(child.expires_at, parent.expires_at)
+        self.assertLess(parent.slice(0.5).remaining(), 0.51)
+
+    def test_bedrock_clients_are_bucketed(self):
+        aws_clients.reset_clients()
+        self.assertIs(aws_clients.get_bedrock_client(12.7), aws_clients.get_bedrock_client(19.9))
+        self.assertEqual(aws_clients.get_bedrock_client(12.7).meta.config.read_timeout, 10)
+        self.assertEqual(aws_clients.get_bedrock_client(2).meta.config.read_timeout, 5)
+        self.assertIs(aws_clients.get_bedrock_client(), aws_clients.get_bedrock_client(90))
+        for seconds in range(1, 120):
+            aws_clients.get_bedrock_client(seconds + 0.5)
+        self.assertLessEqual(len(aws_clients._bedrock_clients), len(aws_clients.BEDROCK_TIMEOUT_BUCKETS) + 1)
+
+
+class TestDeadlineHandlers(unittest.TestCase):
+    """Handlers return partial results instead of running past the deadline."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_breakers()
+        api_helpers.COUNTRY_INFO_CACHE.clear()
+
+    def tearDown(self):
+        self.stubs["restcountries"].profile = UpstreamProfile()
+
+    def test_slow_country_lookup_is_degraded(self):
+        self.stubs["restcountries"].profile = UpstreamProfile(hang_ms=3000)
+        event = {"body": {"image_url": "https://example.com/eiffel.jpg"}}
+        start = time.monotonic()
+        response = self.image_app.lambda_handler(event, FakeLambdaContext(4000))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response["statusCode"], 200)
+        body = json.loads(response["body"])
+        self.assertIn("country_info", body["degraded"])
+        self.assertIsNotNone(body["analysis_data"]["weather"])
+        self.assertLess(elapsed, 4.0)
+
+    def test_exhausted_budget_skips_bedrock(self):
+        event = {"body": {"analysis_data": {"landmark": {"name": "Eiffel Tower"}}}}
+        calls = self.stubs["bedrock"].stats()["calls"]
+        response = self.landmark_app.lambda_handler(event, FakeLambdaContext(3000))
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(json.loads(response["body"])["degraded"], ["analysis"])
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged multi-provider geocoding.
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import geocoding
+from shared.circuit_breaker import HALF_OPEN, get_breaker, reset_breakers
+
+
+class TestHedgedGeocoding(unittest.TestCase):
+    """Provider racing against local stub providers."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_breakers()
+        for name in ("maps_co", "google_geocode"):
+            self.stubs[name].profile = UpstreamProfile()
+            self.stubs[name].reset_stats()
+        for provider in geocoding.PROVIDERS.values():
+            provider.stats = geocoding.ProviderStats(provider.name)
+
+    def test_providers_normalise_to_same_record(self):
+        maps_co = geocoding.geocode("Eiffel Tower", providers=("maps_co",))
+        google = geocoding.geocode("Eiffel Tower", providers=("google",))
+        for key in ("city", "country", "country_code", "lat", "lng"):
+            self.assertEqual(maps_co[key], google[key], key)
+        self.assertEqual(maps_co["provider"], "maps_co")
+        self.assertEqual(google["provider"], "google_geocode")
+
+    def test_fast_primary_is_not_hedged(self):
+        record = geocoding.geocode("Eiffel Tower")
+        self.assertEqual(record["provider"], "maps_co")
+        self.assertEqual(self.stubs["google_geocode"].stats()["calls"], 0)
+
+    def test_slow_primary_is_hedged_to_second_provider(self):
+        self.stubs["maps_co"].profile = UpstreamProfile(hang_ms=1500)
+        start = time.monotonic()
+        record = geocoding.geocode("Eiffel Tower")
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(record["provider"], "google_geocode")
+        self.assertEqual(record["country_code"], "FR")
+        self.assertLess(elapsed, 1.4)
+        stats = geocoding.geocoding_stats()
+        self.assertEqual(stats["google"]["wins"], 1)
+
+    def test_failed_primary_falls_through_immediately(self):
+        self.stubs["maps_co"].profile = UpstreamProfile(failure_rate=1.0, failure_status=503)
+        start = time.monotonic()
+        record = geocoding.geocode("Eiffel Tower")
+        self.assertEqual(record["provider"], "google_geocode")
+        self.assertLess(time.monotonic() - start, geocoding.HEDGE_DELAY_MS / 1000.0)
+
+    def test_malformed_answer_releases_half_open_probe(self):
+        def lookup(query, timeout):
+            # maps.co can answer 200 with an error object instead of a result list
+            return {"error": "Invalid API key"}["results"][0]
+
+        provider = geocoding.Provider("test_malformed", lookup, 5, lambda: True)
+        breaker = get_breaker(provider.name, min_calls=1, open_seconds=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, HALF_OPEN)
+
+        for _ in range(3):
+            with self.assertRaises(KeyError):
+                geocoding._lookup_with_breaker(provider, "Eiffel Tower", 5)
+            # The failed probe reopens the breaker instead of holding the probe slot
+            self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+
+    def test_hedge_delay_tracks_primary_p90(self):
+        stats = geocoding.ProviderStats("test")
+        self.assertEqual(stats.hedge_delay_ms(), geocoding.HEDGE_DELAY_MS)
+        for latency in range(1, 101):
+            stats.record_call(float(latency), True)
+        self.assertEqual(stats.hedge_delay_ms(), 90.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
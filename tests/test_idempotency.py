@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent handling of retried analysis requests.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from botocore.exceptions import ClientError
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import idempotency
+from shared.idempotency import (
+    COMPLETED,
+    DynamoDBIdempotencyStore,
+    SQLiteIdempotencyStore,
+    request_key,
+    run_idempotent,
+    set_idempotency_store,
+)
+
+
+def analysis_data(name):
+    return {
+        "landmark": {"name": name, "location": {"city": "Paris", "country": "France"}},
+        "weather": {"temperature": {"current": 20, "unit": "C"}, "conditions": "Sunny"},
+        "country_info": {"name": "France"},
+        "image_url": "https://example.com/unknown.jpg",
+    }
+
+
+class TestSQLiteStore(unittest.TestCase):
+    """Claims, leases and completion on the local backend."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "idempotency.db")
+        self.store = SQLiteIdempotencyStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_claim_complete_and_replay(self):
+        owner, record = self.store.claim("k", "h", 30)
+        self.assertIsNotNone(owner)
+        self.assertIsNone(record)
+
+        # A second process sharing the file sees the claim
+        other = SQLiteIdempotencyStore(self.path)
+        try:
+            self.assertEqual(other.claim("k", "h", 30)[1]["status"], "in_progress")
+            self.store.complete("k", owner, {"statusCode": 200, "body": "{}"})
+            record = other.claim("k", "h", 30)[1]
+            self.assertEqual(record["status"], COMPLETED)
+            self.assertEqual(record["response"]["statusCode"], 200)
+        finally:
+            other.close()
+
+    def test_expired_lease_is_taken_over(self):
+        owner, _ = self.store.claim("k", "h", 0.05)
+        time.sleep(0.1)
+        new_owner, record = self.store.claim("k", "h", 30)
+        self.assertIsNotNone(new_owner)
+
+        # The stale owner can no longer complete or release the key
+        self.store.complete("k", owner, {"statusCode": 200})
+        self.store.release("k", owner)
+        self.assertEqual(self.store.get("k")["owner"], new_owner)
+        self.assertEqual(self.store.get("k")["status"], "in_progress")
+
+    def test_release_frees_the_key(self):
+        owner, _ = self.store.claim("k", "h", 30)
+        self.store.release("k", owner)
+        self.assertIsNone(self.store.get("k"))
+        self.assertIsNotNone(self.store.claim("k", "h", 30)[0])
+
+
+class FakeDynamoDB:
+    """Evaluates the conditions the DynamoDB backend sends."""
+
+    def __init__(self):
+        self.items = {}
+
+    @staticmethod
+    def _failed():
+        return ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}}, "PutItem")
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        key = Item["idempotency_key"]["S"]
+        existing = self.items.get(key)
+        now = float(ExpressionAttributeValues[":now"]["N"])
+        if existing and float(existing["expires_at"]["N"]) > now and not (
+                existing["status"]["S"] == "in_progress" and float(existing["lease_until"]["N"]) <= now):
+            raise self._failed()
+        self.items[key] = Item
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        item = self.items.get(Key["idempotency_key"]["S"])
+        return {"Item": item} if item else {}
+
+    def update_item(self, TableName, Key, ExpressionAttributeValues, **params):
+        item = self.items.get(Key["idempotency_key"]["S"])
+        if not item or item["owner"]["S"] != ExpressionAttributeValues[":owner"]["S"]:
+            raise self._failed()
+        item.update(status=ExpressionAttributeValues[":completed"], response=ExpressionAttributeValues[":response"],
+                    expires_at=ExpressionAttributeValues[":expires"])
+
+    def delete_item(self, TableName, Key, ExpressionAttributeValues, **params):
+        item = self.items.get(Key["idempotency_key"]["S"])
+        if not item or item["owner"]["S"] != ExpressionAttributeValues[":owner"]["S"]:
+            raise self._failed()
+        del self.items[Key["idempotency_key"]["S"]]
+
+
+class TestDynamoDBStore(unittest.TestCase):
+
+    def test_conditional_claims(self):
+        store = DynamoDBIdempotencyStore("idempotency", client=FakeDynamoDB())
+        owner, _ = store.claim("k", "h", 30)
+        self.assertEqual(store.claim("k", "h", 30)[1]["status"], "in_progress")
+
+        store.complete("k", owner, {"statusCode": 200, "body": "{}"})
+        self.assertEqual(store.claim("k", "h", 30)[1]["response"], {"statusCode": 200, "body": "{}"})
+
+        # A stale owner's release is a no-op
+        store.release("k", "someone-else")
+        self.assertEqual(store.get("k")["status"], COMPLETED)
+
+
+class TestRunIdempotent(unittest.TestCase):
+    """The request wrapper around an arbitrary handler."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = SQLiteIdempotencyStore(os.path.join(self.tmp, "idempotency.db"))
+        set_idempotency_store(self.store)
+        self.calls = 0
+
+    def tearDown(self):
+        set_idempotency_store(None)
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def run_request(self, body, status=200, headers=None, source_ip=None, replay_ttl=None):
+        def handler(event, context):
+            self.calls += 1
+            return {"statusCode": status, "body": json.dumps({"call": self.calls})}
+        event = {"body": json.dumps(body), "headers": headers}
+        if source_ip:
+            event["requestContext"] = {"identity": {"sourceIp": source_ip, "userAgent": "test"}}
+        return run_idempotent("test", event, FakeLambdaContext(10000), handler, lambda b: {"x": b.get("x")},
+                              replay_ttl)
+
+    def replay_seconds(self, event):
+        key, _ = request_key("test", event, {"x": json.loads(event["body"]).get("x")})
+        return self.store.get(key)["expires_at"] - time.time()
+
+    def test_server_errors_are_not_replayed(self):
+        self.run_request({"x": 1}, status=500)
+        self.run_request({"x": 1}, status=500)
+        self.assertEqual(self.calls, 2)
+
+    def test_client_key_reuse_with_other_payload_is_rejected(self):
+        headers = {"Idempotency-Key": "abc"}
+        self.assertEqual(self.run_request({"x": 1}, headers=headers)["statusCode"], 200)
+        self.assertEqual(self.run_request({"x": 2}, headers=headers)["statusCode"], 422)
+        self.assertEqual(self.run_request({"x": 1, "idempotency_key": "abc"})["headers"]["Idempotent-Replayed"], "true")
+        self.assertEqual(self.calls, 1)
+
+    def test_derived_keys_are_scoped_to_the_client(self):
+        self.run_request({"x": 1}, source_ip="203.0.113.5")
+        retry = self.run_request({"x": 1}, source_ip="203.0.113.5")
+        other_client = self.run_request({"x": 1}, source_ip="198.51.100.7")
+
+        self.assertEqual(retry["headers"]["Idempotent-Replayed"], "true")
+        self.assertNotIn("headers", other_client)
+        self.assertEqual(self.calls, 2)
+
+    def test_derived_keys_replay_only_within_the_retry_window(self):
+        self.run_request({"x": 1})
+        self.assertAlmostEqual(self.replay_seconds({"body": json.dumps({"x": 1})}),
+                               idempotency.IDEMPOTENCY_DERIVED_TTL, delta=5)
+        headers = {"Idempotency-Key": "abc"}
+        self.run_request({"x": 2}, headers=headers)
+        self.assertAlmostEqual(self.replay_seconds({"body": json.dumps({"x": 2}), "headers": headers}),
+                               idempotency.IDEMPOTENCY_TTL, delta=5)
+
+    def test_handler_can_shorten_the_replay(self):
+        headers = {"Idempotency-Key": "abc"}
+        self.run_request({"x": 1}, status=400, headers=headers, replay_ttl=lambda response: 30)
+        self.assertAlmostEqual(self.replay_seconds({"body": json.dumps({"x": 1}), "headers": headers}), 30, delta=5)
+        # No replay time at all releases the key
+        self.run_request({"x": 2}, status=400, replay_ttl=lambda response: 0)
+        self.run_request({"x": 2}, status=400, replay_ttl=lambda response: 0)
+        self.assertEqual(self.calls, 3)
+
+    def test_store_failure_runs_the_request(self):
+        self.store.close()
+        self.assertEqual(self.run_request({"x": 1})["statusCode"], 200)
+        self.assertEqual(self.calls, 1)
+
+
+class TestHandlers(unittest.TestCase):
+    """Retries against the real handlers reuse one upstream execution."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.store = SQLiteIdempotencyStore(os.path.join(self.tmp, f"{self._testMethodName}.db"))
+        set_idempotency_store(self.store)
+        self.stubs["bedrock"].profile = UpstreamProfile()
+        self.stubs.reset_stats()
+
+    def tearDown(self):
+        set_idempotency_store(None)
+        self.store.close()
+        self.stubs["vision"].profile = UpstreamProfile()
+
+    def test_image_retry_is_replayed(self):
+        event = {"body": json.dumps({"image_url": "https://example.com/eiffel.jpg"})}
+        first = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        # Same image, differently spelled URL
+        retry = self.image_app.lambda_handler({"body": json.dumps({"image_url": "HTTPS://example.com/eiffel.jpg"})},
+                                              FakeLambdaContext(30000))
+
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 1)
+        self.assertEqual(retry["body"], first["body"])
+        self.assertEqual(retry["headers"]["Idempotent-Replayed"], "true")
+
+    def test_failed_vision_call_is_retried(self):
+        event = {"body": json.dumps({"image_url": "https://example.com/louvre.jpg"})}
+        self.stubs["vision"].profile = UpstreamProfile(failure_rate=1.0, failure_status=503)
+        first = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        failed_calls = self.stubs["vision"].stats()["calls"]
+        self.stubs["vision"].profile = UpstreamProfile()
+        retry = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+
+        self.assertEqual(first["statusCode"], 502)
+        self.assertEqual(retry["statusCode"], 200)
+        self.assertNotIn("Idempotent-Replayed", retry["headers"])
+        self.assertEqual(self.stubs["vision"].stats()["calls"], failed_calls + 1)
+
+    def test_transient_image_error_is_not_replayed(self):
+        event = {"body": json.dumps({"image_url": "https://example.com/vision-busy/arch.jpg"})}
+        first = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        retry = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+
+        self.assertEqual([first["statusCode"], retry["statusCode"]], [502, 502])
+        self.assertNotIn("Idempotent-Replayed", retry["headers"])
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 2)
+
+    def test_negative_answer_is_replayed_no_longer_than_cached(self):
+        url = "https://example.com/unreachable/gone.jpg"
+        headers = {"Idempotency-Key": "gone-1"}
+        event = {"body": json.dumps({"image_url": url}), "headers": headers}
+        response = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        self.assertEqual(json.loads(response["body"])["reason"], self.image_app.UNREACHABLE)
+
+        key, _ = request_key("image_processor", event, self.image_app.idempotency_payload({"image_url": url}))
+        self.assertAlmostEqual(self.store.get(key)["expires_at"] - time.time(),
+                               self.image_app.NEGATIVE_CACHE_TTLS[self.image_app.UNREACHABLE], delta=5)
+
+    def test_concurrent_duplicates_share_one_bedrock_call(self):
+        self.stubs["bedrock"].profile = UpstreamProfile(latency={"distribution": "fixed", "ms": 400})
+        event = {"body": json.dumps({"analysis_data": analysis_data("Obscure Fountain")})}
+        responses = []
+
+        def call():
+            responses.append(self.landmark_app.lambda_handler(event, FakeLambdaContext(30000)))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 1)
+        self.assertEqual([r["statusCode"] for r in responses], [200, 200, 200])
+        self.assertEqual(len({r["body"] for r in responses}), 1)
+        self.assertEqual(sum(1 for r in responses if r["headers"].get("Idempotent-Replayed")), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Tests for image pre-fetch and inline Vision requests.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+from shared import image_ingest
+from shared.http_client import get_session
+from shared.image_ingest import (
+    ImageFetchError,
+    ImageURLRejected,
+    check_image_url,
+    downscale_image,
+    fetch_image,
+    ingest_image,
+)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_jpeg(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (120, 160, 200)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@unittest.skipIf(Image is None, "Pillow not installed")
+class TestImageIngest(unittest.TestCase):
+    """Fetching, capping and downscaling images."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.host = cls.stubs["s3"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        # The stub image host listens on loopback
+        patcher = mock.patch.object(image_ingest, "IMAGE_FETCH_ALLOW_PRIVATE", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def url(self, key):
+        return f"{self.host.url}{key}"
+
+    def test_large_image_is_downscaled(self):
+        self.host.objects["/images/large.jpg"] = make_jpeg(3000, 2000)
+        image = ingest_image(self.url("/images/large.jpg"))
+        self.assertEqual(max(image.width, image.height), image_ingest.VISION_MAX_DIMENSION)
+        self.assertEqual(image.content_type, "image/jpeg")
+        self.assertLess(len(image.content), image.original_bytes)
+        self.assertEqual(len(image.fingerprint), 64)
+
+    def test_small_image_is_sent_unchanged(self):
+        data = make_jpeg(200, 100)
+        content, content_type, width, height = downscale_image(data)
+        self.assertIs(content, data)
+        self.assertEqual((width, height), (200, 100))
+
+    def test_byte_cap_aborts_download(self):
+        self.host.objects["/images/big.jpg"] = b"\xff" * 200_000
+        with self.assertRaises(ImageFetchError):
+            fetch_image(self.url("/images/big.jpg"), max_bytes=100_000)
+
+    def test_missing_image_reports_status(self):
+        with self.assertRaises(ImageFetchError) as raised:
+            fetch_image(self.url("/images/missing.jpg"))
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_undecodable_bytes(self):
+        with self.assertRaises(ImageFetchError):
+            downscale_image(b"not an image")
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, content=b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+
+def resolve_public(host, port, *args, **kwargs):
+    # Test hostnames resolve to a public address; IP literals resolve to themselves
+    address = "93.184.216.34" if host.endswith(".example.com") else host
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+
+class TestImageURLChecks(unittest.TestCase):
+    """Client-supplied image URLs cannot reach private or internal addresses."""
+
+    def setUp(self):
+        for patcher in (mock.patch.object(image_ingest, "IMAGE_FETCH_ALLOW_PRIVATE", False),
+                        mock.patch.object(socket, "getaddrinfo", side_effect=resolve_public)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_internal_addresses_are_rejected(self):
+        for url in ("http://169.254.169.254/latest/meta-data/", "http://127.0.0.1:8080/x.jpg",
+                    "http://10.0.0.5/x.jpg", "http://192.168.1.1/x.jpg", "http://[::1]/x.jpg",
+                    "http://[::ffff:127.0.0.1]/x.jpg", "http://[fe80::1]/x.jpg"):
+            with self.subTest(url=url), self.assertRaises(ImageURLRejected):
+                check_image_url(url)
+
+    def test_only_http_and_https(self):
+        for url in ("file:///etc/passwd", "gopher://images.example.com/", "ftp://images.example.com/x.jpg"):
+            with self.subTest(url=url), self.assertRaises(ImageURLRejected):
+                check_image_url(url)
+        check_image_url("https://images.example.com/x.jpg")
+
+    def test_redirects_are_checked(self):
+        responses = [FakeResponse(302, {"Location": "/moved.jpg"}),
+                     FakeResponse(302, {"Location": "http://169.254.169.254/latest/meta-data/"})]
+        with mock.patch.object(get_session(), "get", side_effect=responses) as get:
+            with self.assertRaises(ImageURLRejected):
+                fetch_image("https://images.example.com/x.jpg")
+        self.assertEqual([c.args[0] for c in get.call_args_list],
+                         ["https://images.example.com/x.jpg", "https://images.example.com/moved.jpg"])
+        self.assertFalse(get.call_args.kwargs["allow_redirects"])
+
+    def test_redirect_to_public_image_is_followed(self):
+        responses = [FakeResponse(301, {"Location": "https://cdn.example.com/x.jpg"}),
+                     FakeResponse(200, {"Content-Type": "image/jpeg"}, b"\xff\xd8")]
+        with mock.patch.object(get_session(), "get", side_effect=responses):
+            self.assertEqual(fetch_image("https://images.example.com/x.jpg"), b"\xff\xd8")
+
+
+@unittest.skipIf(Image is None, "Pillow not installed")
+class TestInlineVision(unittest.TestCase):
+    """The image processor sends inline bytes when VISION_INLINE_IMAGES is on."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        cls.stubs["s3"].objects["/images/eiffel.jpg"] = make_jpeg(2400, 1600)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        self.image_app.NEGATIVE_CACHE.clear()
+
+    def invoke(self, image_url):
+        event = {"body": {"image_url": image_url}}
+        with mock.patch.object(self.image_app, "VISION_INLINE_IMAGES", True), \
+                mock.patch.object(get_session(), "post", wraps=get_session().post) as post:
+            response = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        vision_calls = [c for c in post.call_args_list if c.args and c.args[0].startswith(self.stubs["vision"].url)]
+        return response, vision_calls
+
+    def test_vision_receives_inline_content(self):
+        response, vision_calls = self.invoke(f"{self.stubs['s3'].url}/images/eiffel.jpg")
+        self.assertEqual(response["statusCode"], 200)
+        body = json.loads(response["body"])
+        self.assertEqual(len(body["analysis_data"]["image_fingerprint"]), 64)
+
+        vision_image = vision_calls[0].kwargs["json"]["requests"][0]["image"]
+        self.assertIn("content", vision_image)
+        self.assertNotIn("source", vision_image)
+
+    def test_dead_image_is_rejected(self):
+        response, vision_calls = self.invoke(f"{self.stubs['s3'].url}/images/gone.jpg")
+        self.assertEqual(response["statusCode"], 400)
+        self.assertEqual(vision_calls, [])
+
+    def test_metadata_address_is_refused(self):
+        with mock.patch.object(image_ingest, "IMAGE_FETCH_ALLOW_PRIVATE", False):
+            response, vision_calls = self.invoke("http://169.254.169.254/latest/meta-data/")
+        self.assertEqual(response["statusCode"], 400)
+        self.assertIn("not allowed", json.loads(response["body"])["error"])
+        self.assertEqual(vision_calls, [])
+
+    def test_unreachable_host_falls_back_to_uri(self):
+        response, vision_calls = self.invoke("http://127.0.0.1:9/eiffel.jpg")
+        self.assertEqual(response["statusCode"], 200)
+        vision_image = vision_calls[0].kwargs["json"]["requests"][0]["image"]
+        self.assertEqual(vision_image["source"]["imageUri"], "http://127.0.0.1:9/eiffel.jpg")
+
+
+if __name__ == '__main__':
+    unittest.main()
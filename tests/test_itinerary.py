@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the itinerary analyzer.
+"""
+
+import json
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import EVENTS_DIR, FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import api_helpers
+from shared.circuit_breaker import reset_breakers
+
+
+class TestItineraryAnalyzer(unittest.TestCase):
+    """Stops fan out in parallel and shared lookups run once."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        import itinerary_analyzer.app as itinerary_app
+        cls.itinerary_app = itinerary_app
+        cls.stubs.install_itinerary(itinerary_app)
+        with open(os.path.join(EVENTS_DIR, "analyze-itinerary-event.json")) as f:
+            cls.event = json.load(f)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_breakers()
+        api_helpers.COUNTRY_INFO_CACHE.clear()
+        api_helpers.TRAVEL_ADVISORY_CACHE.clear()
+        api_helpers.WEATHER_CACHE.clear()
+        for name in ("maps_co", "restcountries", "google_weather", "smart_traveller", "bedrock"):
+            self.stubs[name].reset_stats()
+
+    def tearDown(self):
+        for name in ("maps_co", "bedrock"):
+            self.stubs[name].profile = UpstreamProfile()
+
+    def invoke(self, event=None, timeout_ms=30000):
+        response = self.itinerary_app.lambda_handler(event or self.event, FakeLambdaContext(timeout_ms))
+        return response, json.loads(response["body"])
+
+    def test_sample_event(self):
+        response, body = self.invoke()
+        self.assertEqual(response["statusCode"], 200)
+        activities = self.event["body"]["itinerary_data"]["activities"]
+        self.assertEqual([stop["activity"] for stop in body["stops"]], activities)
+        self.assertEqual(body["stops"][0]["place"], "Eiffel Tower")
+        self.assertIn("summary", body["analysis"])
+        self.assertEqual(body["degraded"], [])
+
+    def test_shared_lookups_run_once(self):
+        self.invoke()
+        # Every stub stop resolves to Paris, France: one lookup of each kind and one prompt
+        self.assertEqual(self.stubs["restcountries"].stats()["calls"], 1)
+        self.assertEqual(self.stubs["smart_traveller"].stats()["calls"], 1)
+        self.assertEqual(self.stubs["google_weather"].stats()["calls"], 1)
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 1)
+        self.assertEqual(self.stubs["maps_co"].stats()["calls"], 5)
+
+    def test_latency_follows_slowest_stop(self):
+        self.stubs["maps_co"].profile = UpstreamProfile(latency={"distribution": "fixed", "ms": 300})
+        start = time.monotonic()
+        response, _ = self.invoke()
+        elapsed = time.monotonic() - start
+        self.assertEqual(response["statusCode"], 200)
+        # Five sequential 300ms geocodes alone would take 1.5s
+        self.assertLess(elapsed, 1.2)
+
+    def test_bedrock_failure_is_degraded(self):
+        self.stubs["bedrock"].profile = UpstreamProfile(failure_rate=1.0, failure_status=400)
+        response, body = self.invoke()
+        self.assertEqual(response["statusCode"], 200)
+        self.assertIn("analysis", body["degraded"])
+        self.assertEqual(len(body["analysis"]["stops"]), 5)
+
+    def test_rejects_empty_itinerary(self):
+        response, body = self.invoke({"body": json.dumps({"itinerary_data": {"destination": "Paris"}})})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_malformed_itinerary_is_rejected(self):
+        for body in ([1, 2], {"itinerary_data": "Paris"}, {"itinerary_data": ["Paris"]},
+                     {"itinerary_data": {"destination": "Paris", "activities": "Visit the Louvre"}},
+                     {"itinerary_data": {"destination": ["Paris"], "activities": ["Visit the Louvre"]}}):
+            with self.subTest(body=body):
+                response, _ = self.invoke({"body": json.dumps(body)})
+                self.assertEqual(response["statusCode"], 400)
+        response, _ = self.invoke({"body": "{not json"})
+        self.assertEqual(response["statusCode"], 400)
+
+    def test_advisory_uses_resolved_country_code(self):
+        # The stop's country code is used, so free-text name mapping is not needed
+        with mock.patch.object(api_helpers, "map_country_to_smart_traveller_code", return_value=None):
+            response, body = self.invoke()
+        self.assertEqual(response["statusCode"], 200)
+        self.assertNotIn("travel_advisory", body["degraded"])
+        self.assertEqual(self.stubs["smart_traveller"].stats()["calls"], 1)
+
+    def test_activity_place(self):
+        self.assertEqual(self.itinerary_app.activity_place("Visit the Louvre Museum"), "Louvre Museum")
+        self.assertEqual(self.itinerary_app.activity_place("Champs-Élysées"), "Champs-Élysées")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the JSON facade: backend parity and byte-stable outputs.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import unittest
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks import fixtures
+from shared import json_codec
+
+DOCUMENTS = {
+    "analysis_data": fixtures.ANALYSIS_DATA,
+    "travel_analysis": fixtures.TRAVEL_ANALYSIS,
+    "non_ascii": {"capital": ["Brasília"], "name": {"common": "Côte d'Ivoire"}, "empty": {}, "list": []},
+    "numbers": {"lat": 48.8584, "lng": -2.2945, "population": 67391582, "confidence": 0.95, "flag": True},
+}
+
+# Values the two backends handle natively in different ways
+EDGE_DOCUMENTS = {
+    "datetimes": {"as_of": datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc),
+                  "naive": datetime(2025, 3, 1, 12, 30, 5, 250), "day": date(2025, 3, 1), "at": time(9, 15)},
+    "non_finite": {"uv_index": float("nan"), "range": [float("inf"), -float("inf"), 1.5]},
+    "big_int": {"id": 2 ** 70, "small": -(2 ** 63)},
+}
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip_and_bytes_input(self):
+        for name, document in DOCUMENTS.items():
+            with self.subTest(document=name):
+                self.assertEqual(json_codec.loads(json_codec.dumps(document)), document)
+                self.assertEqual(json_codec.loads(json_codec.dumps_bytes(document, indent=2)), document)
+
+    def test_decode_errors_are_stdlib_errors(self):
+        with self.assertRaises(json_codec.JSONDecodeError):
+            json_codec.loads("{not json")
+        with self.assertRaises(ValueError):
+            json_codec.loads(b"")
+
+    def test_unknown_types_use_default(self):
+        self.assertEqual(json_codec.dumps({"price": Decimal("0.25")}), '{"price":"0.25"}')
+        self.assertEqual(json_codec.dumps({"day": date(2025, 3, 1)}), '{"day":"2025-03-01"}')
+
+    @unittest.skipUnless(json_codec.BACKEND == "orjson", "orjson not installed")
+    def test_backends_produce_identical_bytes(self):
+        for name, document in DOCUMENTS.items():
+            for indent in (None, 2):
+                with self.subTest(document=name, indent=indent):
+                    self.assertEqual(json_codec.dumps(document, indent=indent),
+                                     json_codec._stdlib_dumps(document, indent, False, str))
+
+    def test_edge_values_match_orjson(self):
+        self.assertEqual(json_codec._stdlib_dumps(EDGE_DOCUMENTS["datetimes"], None, False, json_codec.encode_default),
+                         '{"as_of":"2025-03-01T12:30:00+00:00","naive":"2025-03-01T12:30:05.000250",'
+                         '"day":"2025-03-01","at":"09:15:00"}')
+        self.assertEqual(json_codec._stdlib_dumps(EDGE_DOCUMENTS["non_finite"], None, False, json_codec.encode_default),
+                         '{"uv_index":null,"range":[null,null,1.5]}')
+        self.assertEqual(json_codec.dumps(EDGE_DOCUMENTS["big_int"]), '{"id":1180591620717411303424,"small":-9223372036854775808}')
+        with self.assertRaises(ValueError):
+            circular = []
+            circular.append(circular)
+            json_codec._stdlib_dumps(circular, None, False, json_codec.encode_default)
+
+    @unittest.skipUnless(json_codec.BACKEND == "orjson", "orjson not installed")
+    def test_backends_agree_on_edge_values(self):
+        for name, document in EDGE_DOCUMENTS.items():
+            for indent in (None, 2):
+                with self.subTest(document=name, indent=indent):
+                    self.assertEqual(json_codec.dumps(document, indent=indent),
+                                     json_codec._stdlib_dumps(document, indent, False, json_codec.encode_default))
+        # Exponent floats are spelled differently but parse the same
+        document = {"tiny": 1e-7, "huge": 1e16}
+        self.assertEqual(json_codec.loads(json_codec.dumps(document)),
+                         json.loads(json_codec._stdlib_dumps(document, None, False, json_codec.encode_default)))
+
+    def test_stable_output_matches_stdlib_defaults(self):
+        for name, document in DOCUMENTS.items():
+            with self.subTest(document=name):
+                self.assertEqual(json_codec.dumps(document, indent=2, stable=True), json.dumps(document, indent=2))
+                self.assertEqual(json_codec.dumps(document, sort_keys=True, stable=True),
+                                 json.dumps(document, sort_keys=True))
+
+
+class TestCachedOutputs(unittest.TestCase):
+    """Outputs that are hashed or sent as prompts do not depend on the backend."""
+
+    def test_prompt_embeds_stdlib_json(self):
+        import landmark_analyzer.app as landmark_app
+        prompt = landmark_app.create_analysis_prompt(fixtures.ANALYSIS_DATA)
+        self.assertIn(json.dumps(fixtures.ANALYSIS_DATA["weather"], indent=2), prompt)
+        self.assertIn(json.dumps(fixtures.ANALYSIS_DATA["country_info"], indent=2), prompt)
+
+    def test_prompt_ignores_weather_cache_fields(self):
+        import landmark_analyzer.app as landmark_app
+        plain = landmark_app.create_analysis_prompt(fixtures.ANALYSIS_DATA)
+        for age, stale in ((0.0, None), (812.4, True)):
+            data = dict(fixtures.ANALYSIS_DATA)
+            data["weather"] = dict(data["weather"], as_of="2024-06-10T06:13:20+00:00",
+                                   age_seconds=age, geohash="u09tvw", stale=stale)
+            with self.subTest(age_seconds=age):
+                self.assertEqual(landmark_app.create_analysis_prompt(data), plain)
+
+    def test_idempotency_fingerprint(self):
+        from shared.idempotency import fingerprint
+        payload = {"image_url": "https://example.com/brasília.jpg", "n": 1.5}
+        expected = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        self.assertEqual(fingerprint(payload), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Tests for the landmark knowledge base and its build tool.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import DEFAULT_BEDROCK_ANALYSIS, DEFAULT_LANDMARK, StubUpstreams
+from shared import landmark_kb
+from shared.landmark_kb import (
+    LandmarkKnowledgeBase,
+    normalize_landmark_name,
+    write_knowledge_base,
+)
+from tools.build_landmark_kb import build_entries, iter_results_from_dir
+from tools.build_landmark_kb import main as build_main
+
+EIFFEL = {
+    "name": DEFAULT_LANDMARK["name"],
+    "mid": DEFAULT_LANDMARK["mid"],
+    "aliases": ["Tour Eiffel"],
+    "city": DEFAULT_LANDMARK["city"],
+    "country": DEFAULT_LANDMARK["country"],
+    "country_code": DEFAULT_LANDMARK["country_code"],
+    "lat": DEFAULT_LANDMARK["lat"],
+    "lng": DEFAULT_LANDMARK["lng"],
+    "analysis": DEFAULT_BEDROCK_ANALYSIS,
+}
+
+
+def past_result(name, city, country, mid=None, analysis=None, timestamp="2025-01-01T00:00:00", lat=48.8584,
+                source="bedrock", tier="full"):
+    result = {
+        "landmark": {
+            "name": name,
+            "mid": mid,
+            "location": {"city": city, "country": country, "country_code": "FR", "lat": lat, "lng": 2.2945},
+        },
+        "timestamp": timestamp,
+    }
+    if analysis is not None:
+        result.update(analysis=analysis, analysis_source=source, analysis_tier=tier)
+    return result
+
+
+class TestKnowledgeBaseFile(unittest.TestCase):
+    """Writing and reading the memory-mapped file."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "landmarks.kb")
+        entries = [EIFFEL] + [{"name": f"Landmark {i}", "country": "Testland"} for i in range(200)]
+        write_knowledge_base(entries, self.path)
+        self.kb = LandmarkKnowledgeBase(self.path)
+
+    def tearDown(self):
+        self.kb.close()
+        shutil.rmtree(self.tmp)
+
+    def test_lookup_by_mid_name_and_alias(self):
+        self.assertEqual(self.kb.lookup(mid="/m/02j81")["city"], "Paris")
+        self.assertEqual(self.kb.lookup(name="EIFFEL tower!")["city"], "Paris")
+        self.assertEqual(self.kb.lookup(name="Tour Eiffel")["name"], "Eiffel Tower")
+        self.assertEqual(self.kb.lookup(name="Landmark 117")["name"], "Landmark 117")
+
+    def test_miss(self):
+        self.assertIsNone(self.kb.lookup(name="Big Ben"))
+        self.assertIsNone(self.kb.lookup())
+
+    def test_name_normalization(self):
+        self.assertEqual(normalize_landmark_name("Basílica de la Sagrada Família"), "basilica de la sagrada familia")
+        self.assertEqual(normalize_landmark_name("  St. Peter's  Basilica "), "st peter s basilica")
+
+    def test_rejects_other_files(self):
+        bad_path = os.path.join(self.tmp, "bad.kb")
+        with open(bad_path, "wb") as f:
+            f.write(b"not a knowledge base")
+        with self.assertRaises(ValueError):
+            LandmarkKnowledgeBase(bad_path)
+
+
+class TestBuildTool(unittest.TestCase):
+    """Aggregating past S3 results into entries."""
+
+    def test_groups_by_mid_and_keeps_latest_real_analysis(self):
+        results = [
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", lat=48.8580,
+                        analysis=dict(DEFAULT_BEDROCK_ANALYSIS, summary="old"), timestamp="2025-01-01T00:00:00"),
+            past_result("Tour Eiffel", "Paris", "France", lat=48.8590,
+                        analysis=dict(DEFAULT_BEDROCK_ANALYSIS, summary="new"), timestamp="2025-02-01T00:00:00"),
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", lat=48.8584,
+                        analysis={"summary": "x", "insights": ["Analysis completed successfully"]},
+                        timestamp="2025-03-01T00:00:00"),
+        ]
+        # "Tour Eiffel" has no mid of its own, so it only joins the group via its name
+        results.append(past_result("Tour Eiffel", "Paris", "France", mid="/m/02j81"))
+        entries = build_entries(results, min_samples=3)
+
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry["mid"], "/m/02j81")
+        self.assertEqual(entry["samples"], 4)
+        self.assertEqual(entry["analysis"]["summary"], "new")
+        self.assertEqual(set(entry["analysis"]), {"summary", "insights", "travel_tips", "cultural_highlights"})
+        self.assertEqual(entry["lat"], 48.8584)
+        self.assertIn("Tour Eiffel", entry["aliases"] + [entry["name"]])
+
+    def test_only_full_bedrock_analyses_are_kept(self):
+        results = [
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", analysis=DEFAULT_BEDROCK_ANALYSIS),
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", timestamp="2025-02-01T00:00:00",
+                        analysis=dict(DEFAULT_BEDROCK_ANALYSIS, summary="template"), source="template",
+                        tier="template"),
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", timestamp="2025-03-01T00:00:00",
+                        analysis=dict(DEFAULT_BEDROCK_ANALYSIS, summary="light"), tier="light"),
+            past_result("Eiffel Tower", "Paris", "France", mid="/m/02j81", timestamp="2025-04-01T00:00:00",
+                        analysis=dict(DEFAULT_BEDROCK_ANALYSIS, summary="kb"), source="knowledge_base", tier=None),
+        ]
+        entry = build_entries(results, min_samples=3)[0]
+        self.assertEqual(entry["analysis"]["summary"], DEFAULT_BEDROCK_ANALYSIS["summary"])
+
+        self.assertNotIn("analysis", build_entries(results[1:], min_samples=3)[0])
+
+    def test_skips_rare_and_disputed_landmarks(self):
+        results = [past_result("Rare Statue", "Lyon", "France")] * 2
+        results += [past_result("Old Bridge", city, "France") for city in ("Lyon", "Paris", "Nice")]
+        self.assertEqual(build_entries(results, min_samples=3), [])
+
+    def test_cli_builds_from_directory(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            results_dir = os.path.join(tmp, "results")
+            os.makedirs(results_dir)
+            for i in range(3):
+                with open(os.path.join(results_dir, f"2025010{i}_final.json"), "w") as f:
+                    json.dump(past_result("Eiffel Tower", "Paris", "France", analysis=DEFAULT_BEDROCK_ANALYSIS), f)
+            output = os.path.join(tmp, "landmarks.kb")
+            self.assertEqual(build_main(["--from-dir", results_dir, "--output", output]), 0)
+            self.assertEqual(len(list(iter_results_from_dir(results_dir))), 3)
+            kb = LandmarkKnowledgeBase(output)
+            self.assertEqual(kb.lookup(name="Eiffel Tower")["country"], "France")
+            kb.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+class TestKnowledgeBaseHandlers(unittest.TestCase):
+    """Known landmarks skip geocoding and Bedrock."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.original_path = landmark_kb.LANDMARK_KB_PATH
+        path = os.path.join(cls.tmp, "landmarks.kb")
+        write_knowledge_base([EIFFEL], path)
+        landmark_kb.reset_knowledge_base(path)
+
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+        landmark_kb.reset_knowledge_base(cls.original_path)
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.image_app.NEGATIVE_CACHE.clear()
+        for name in ("maps_co", "google_geocode", "bedrock"):
+            self.stubs[name].reset_stats()
+
+    def test_known_landmark_skips_geocoding(self):
+        event = {"body": {"image_url": "https://example.com/eiffel.jpg"}}
+        response = self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+        body = json.loads(response["body"])
+
+        location = body["analysis_data"]["landmark"]["location"]
+        self.assertEqual(location["city"], "Paris")
+        self.assertEqual(location["country_code"], "FR")
+        self.assertEqual(body["analysis_data"]["landmark"]["mid"], "/m/02j81")
+        self.assertEqual(self.stubs["maps_co"].stats()["calls"], 0)
+        self.assertEqual(self.stubs["google_geocode"].stats()["calls"], 0)
+
+    def test_known_landmark_skips_bedrock(self):
+        analysis_data = {"landmark": {"name": "Eiffel Tower", "mid": "/m/02j81", "location": {}}}
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}}, FakeLambdaContext(30000))
+        body = json.loads(response["body"])
+
+        self.assertEqual(body["analysis_source"], "knowledge_base")
+        self.assertEqual(body["analysis"]["summary"], DEFAULT_BEDROCK_ANALYSIS["summary"])
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 0)
+
+    def test_stored_analysis_gets_current_advisory(self):
+        analysis_data = {"landmark": {"name": "Eiffel Tower", "mid": "/m/02j81",
+                                      "location": {"city": "Paris", "country": "France", "country_code": "FR"}}}
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}}, FakeLambdaContext(30000))
+        analysis = json.loads(response["body"])["analysis"]
+
+        # The file's frozen advisory, rating and visit time are not served
+        self.assertEqual(analysis["travel_advisory"]["level"], "Exercise a high degree of caution")
+        self.assertNotIn("safety_rating", analysis)
+        self.assertNotIn("best_visit_time", analysis)
+
+    def test_unknown_landmark_uses_bedrock(self):
+        analysis_data = {"landmark": {"name": "Big Ben", "location": {}}}
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}}, FakeLambdaContext(30000))
+        self.assertEqual(json.loads(response["body"])["analysis_source"], "bedrock")
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the typed records shared by the handlers and their wire format.
+"""
+
+import copy
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks import fixtures
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from shared import json_codec
+from shared.models import (
+    SCHEMA_VERSION,
+    AnalysisData,
+    CountryInfo,
+    Landmark,
+    Location,
+    SchemaVersionError,
+    Weather,
+)
+
+
+class TestRecords(unittest.TestCase):
+
+    def test_round_trip_keeps_wire_format(self):
+        data = AnalysisData.from_wire(fixtures.ANALYSIS_DATA)
+        self.assertIsInstance(data.landmark.location, Location)
+        self.assertIsInstance(data.weather, Weather)
+        self.assertIsInstance(data.country_info, CountryInfo)
+        # Same keys in the same order, so stored artifacts and prompts do not change
+        self.assertEqual(json.dumps(data.to_dict()), json.dumps(fixtures.ANALYSIS_DATA))
+
+    def test_codec_writes_records(self):
+        data = AnalysisData.from_wire(fixtures.ANALYSIS_DATA)
+        self.assertEqual(json_codec.dumps({"analysis_data": data}),
+                         json_codec.dumps({"analysis_data": fixtures.ANALYSIS_DATA}))
+        self.assertEqual(json_codec.dumps(data.weather, indent=2, stable=True),
+                         json.dumps(fixtures.ANALYSIS_DATA["weather"], indent=2))
+
+    def test_missing_and_unknown_fields(self):
+        landmark = Landmark.from_dict({"name": "Tower", "added_later": 1})
+        self.assertIsNone(landmark.location)
+        self.assertEqual(landmark.to_dict(), {"name": "Tower"})
+        self.assertIsNone(Weather.from_dict({}))
+        self.assertEqual(Location.from_dict({"description": "tower"}).to_dict(),
+                         {"city": None, "country": None, "description": "tower"})
+        with self.assertRaises(TypeError):
+            Landmark.from_dict({"location": "Paris"})
+
+    def test_equality(self):
+        self.assertEqual(Location(1.0, 2.0, "Paris"), Location(lat=1.0, lng=2.0, city="Paris"))
+        self.assertNotEqual(Location(city="Paris"), Location(city="Rome"))
+        self.assertFalse(hasattr(Location(), "__dict__"))
+
+    def test_schema_version(self):
+        self.assertEqual(AnalysisData(landmark=Landmark(name="Tower")).to_dict()["schema_version"], SCHEMA_VERSION)
+        legacy = copy.deepcopy(fixtures.ANALYSIS_DATA)
+        legacy.pop("schema_version", None)
+        self.assertEqual(AnalysisData.from_wire(legacy).landmark.name, legacy["landmark"]["name"])
+        with self.assertRaises(SchemaVersionError):
+            AnalysisData.from_wire(dict(legacy, schema_version=SCHEMA_VERSION + 1))
+
+
+class TestLandmarkAnalyzerSchema(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        _, cls.landmark_app = load_handlers()
+
+    def test_newer_schema_is_rejected(self):
+        analysis_data = dict(fixtures.ANALYSIS_DATA, schema_version=SCHEMA_VERSION + 1)
+        response = self.landmark_app.lambda_handler({"body": {"analysis_data": analysis_data}}, FakeLambdaContext(30000))
+        self.assertEqual(response["statusCode"], 400)
+        self.assertIn("schema_version", json.loads(response["body"])["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
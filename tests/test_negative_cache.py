@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the image processor's negative-result cache.
+"""
+
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared.image_ingest import normalize_image_url
+
+
+class TestNormalizeImageUrl(unittest.TestCase):
+    """Cache keys ignore case in the host, default ports and fragments."""
+
+    def test_equivalent_urls_share_a_key(self):
+        self.assertEqual(
+            normalize_image_url("HTTPS://Example.COM:443/a/Cat.jpg#top"),
+            normalize_image_url("https://example.com/a/Cat.jpg"),
+        )
+
+    def test_path_and_query_are_significant(self):
+        self.assertNotEqual(
+            normalize_image_url("https://example.com/a.jpg?w=100"),
+            normalize_image_url("https://example.com/a.jpg?w=200"),
+        )
+        self.assertNotEqual(
+            normalize_image_url("https://example.com/A.jpg"),
+            normalize_image_url("https://example.com/a.jpg"),
+        )
+
+
+class TestNegativeCache(unittest.TestCase):
+    """Repeated requests for failing images do not reach Vision again."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        self.image_app.NEGATIVE_CACHE.clear()
+        self.stubs["vision"].reset_stats()
+
+    def tearDown(self):
+        self.stubs["vision"].profile = UpstreamProfile()
+
+    def invoke(self, image_url):
+        event = {"body": {"image_url": image_url}}
+        return self.image_app.lambda_handler(event, FakeLambdaContext(30000))
+
+    def body(self, response):
+        self.assertEqual(response["headers"]["Content-Type"], "application/json")
+        return json.loads(response["body"])
+
+    def test_no_landmark_is_cached(self):
+        first = self.invoke("https://example.com/no-landmark/cat.jpg")
+        second = self.invoke("https://EXAMPLE.com/no-landmark/cat.jpg#again")
+
+        self.assertEqual(first["statusCode"], 400)
+        self.assertEqual(second["statusCode"], 400)
+        self.assertFalse(self.body(first)["cached"])
+        self.assertTrue(self.body(second)["cached"])
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 1)
+
+    def test_unreachable_image_is_cached(self):
+        first = self.invoke("https://example.com/unreachable.jpg")
+        second = self.invoke("https://example.com/unreachable.jpg")
+
+        self.assertEqual(self.body(first)["error"], "Image could not be fetched")
+        self.assertTrue(self.body(second)["cached"])
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 1)
+
+    def test_transient_image_error_is_not_cached(self):
+        first = self.invoke("https://example.com/vision-busy.jpg")
+        second = self.invoke("https://example.com/vision-busy.jpg")
+
+        self.assertEqual(first["statusCode"], 502)
+        self.assertEqual(second["statusCode"], 502)
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 2)
+
+    def test_image_errors_are_told_apart(self):
+        is_image_error = self.image_app.is_image_error
+        self.assertTrue(is_image_error(3, "Bad image data."))
+        self.assertTrue(is_image_error(7, "We can not access the URL currently."))
+        for code in (4, 8, 13, 14):
+            self.assertFalse(is_image_error(code, "Try again later."))
+
+    def test_vision_failure_is_not_cached(self):
+        self.stubs["vision"].profile = UpstreamProfile(failure_rate=1.0, failure_status=400)
+        self.invoke("https://example.com/eiffel.jpg")
+        self.stubs["vision"].profile = UpstreamProfile()
+
+        response = self.invoke("https://example.com/eiffel.jpg")
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 2)
+
+    def test_entries_expire(self):
+        with mock.patch.dict(self.image_app.NEGATIVE_CACHE_TTLS, {self.image_app.NO_LANDMARK: 0}):
+            self.invoke("https://example.com/no-landmark/dog.jpg")
+            response = self.invoke("https://example.com/no-landmark/dog.jpg")
+
+        self.assertFalse(self.body(response)["cached"])
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for client-side rate limiting and request coalescing.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from shared.rate_limit import (
+    RateLimitExceeded,
+    TokenBucket,
+    UpstreamLimiter,
+    parse_retry_after,
+)
+
+
+def throttled_error(retry_after):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(response=response)
+
+
+class TestRateLimit(unittest.TestCase):
+    """Token buckets, single-flight and Retry-After handling."""
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_bucket_spaces_calls_after_burst(self):
+        bucket = TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(4):
+            self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+        single = TokenBucket(rate=1, capacity=1)
+        self.assertTrue(single.acquire(0))
+        self.assertFalse(single.acquire(0))
+
+    def test_exhausted_limiter_raises(self):
+        limiter = UpstreamLimiter("test", rate=0.5, burst=1)
+        limiter.call(None, lambda: None)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.call(None, lambda: None, timeout=0.05)
+
+    def test_concurrent_identical_calls_are_coalesced(self):
+        limiter = UpstreamLimiter("test", rate=0, burst=1)
+        calls = []
+        release = threading.Event()
+
+        def lookup():
+            calls.append(1)
+            release.wait(1)
+            return {"city": "Paris"}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(limiter.call, "eiffel tower", lookup) for _ in range(8)]
+            time.sleep(0.1)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == {"city": "Paris"} for result in results))
+
+    def test_429_pauses_and_retries_once(self):
+        limiter = UpstreamLimiter("test", rate=100, burst=10)
+        attempts = []
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise throttled_error("0.2")
+            return "ok"
+
+        self.assertEqual(limiter.call(None, flaky), "ok")
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.19)
+
+    def test_long_retry_after_is_not_waited_inline(self):
+        limiter = UpstreamLimiter("test", rate=100, burst=10)
+
+        def throttled():
+            raise throttled_error("30")
+
+        with self.assertRaises(requests.HTTPError):
+            limiter.call(None, throttled)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.call(None, lambda: "ok", timeout=0.1)
+
+    def test_async_callers_are_coalesced(self):
+        limiter = UpstreamLimiter("test", rate=0, burst=1)
+        calls = []
+
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"city": "Paris"}
+
+        async def main():
+            return await asyncio.gather(*(limiter.call_async("eiffel tower", lookup) for _ in range(5)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for response projection, compression and the payload size budget.
+"""
+
+import base64
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+from shared import metrics
+from shared.response_shaping import (
+    accepted_encoding,
+    accepts_binary,
+    decode_request,
+    project,
+    read_body,
+    shape_response,
+)
+
+EVENTS_DIR = os.path.join(os.path.dirname(__file__), '..', 'events')
+
+# Largest compact response (JSON bytes) and compressed full response per sample event
+SIZE_BUDGETS = {
+    "analyze-image": {"compact": 1200, "compressed": 1100},
+    "analyze-landmark": {"compact": 1500, "compressed": 1200},
+}
+
+
+def sample_event(name, **overrides):
+    with open(os.path.join(EVENTS_DIR, f"{name}-event.json")) as f:
+        return dict(json.load(f), **overrides)
+
+
+class TestProjection(unittest.TestCase):
+
+    def test_dotted_paths_and_lists(self):
+        body = {"a": {"b": 1, "c": 2}, "items": [{"x": 1, "y": 2}, {"x": 3}], "d": 4}
+        self.assertEqual(project(body, ["a.b", "items.x", "missing.z"]),
+                         {"a": {"b": 1}, "items": [{"x": 1}, {"x": 3}]})
+        # A whole field wins over a narrower path in either order
+        self.assertEqual(project(body, ["a", "a.b"]), {"a": {"b": 1, "c": 2}})
+        self.assertEqual(project(body, ["a.b", "a"]), {"a": {"b": 1, "c": 2}})
+
+    def test_only_successful_json_bodies_are_projected(self):
+        event = {"queryStringParameters": {"fields": "a"}}
+        error = {"statusCode": 500, "body": json.dumps({"error": "boom", "timestamp": "t"})}
+        self.assertEqual(read_body(shape_response("test", event, error)), {"error": "boom", "timestamp": "t"})
+        ok = {"statusCode": 200, "body": json.dumps({"a": 1, "b": 2, "timestamp": "t"})}
+        self.assertEqual(read_body(shape_response("test", event, ok)), {"a": 1, "timestamp": "t"})
+        # Body-level fields work for direct invocations
+        direct = {"body": {"fields": ["b"]}}
+        self.assertEqual(read_body(shape_response("test", direct, ok)), {"b": 2, "timestamp": "t"})
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_accept_encoding(self):
+        self.assertEqual(accepted_encoding({"Accept-Encoding": "gzip, deflate"}), "gzip")
+        self.assertEqual(accepted_encoding({"accept-encoding": "*"}), "gzip")
+        self.assertIsNone(accepted_encoding({"Accept-Encoding": "gzip;q=0, identity"}))
+        self.assertIsNone(accepted_encoding(None))
+
+    def test_only_binary_accept_types_are_compressed(self):
+        self.assertTrue(accepts_binary({"Accept": "application/json"}))
+        self.assertTrue(accepts_binary({"accept": "application/json; charset=utf-8, */*"}))
+        self.assertFalse(accepts_binary({"Accept": "*/*"}))
+        self.assertFalse(accepts_binary(None))
+        # API Gateway would hand a base64 body to a client it does not treat as binary
+        body = json.dumps({"text": "x" * 4096})
+        response = shape_response("test", {"headers": {"Accept-Encoding": "gzip", "Accept": "*/*"}},
+                                  {"statusCode": 200, "body": body})
+        self.assertNotIn("isBase64Encoded", response)
+        self.assertEqual(response["body"], body)
+
+    def test_small_bodies_are_sent_as_is(self):
+        event = {"headers": {"Accept-Encoding": "gzip", "Accept": "application/json"}}
+        response = shape_response("test", event, {"statusCode": 200, "body": json.dumps({"a": 1})})
+        self.assertNotIn("isBase64Encoded", response)
+
+    def test_base64_request_bodies_are_decoded(self):
+        event = {"body": base64.b64encode(b'{"image_url": "x"}').decode(), "isBase64Encoded": True}
+        self.assertEqual(json.loads(decode_request(event)["body"]), {"image_url": "x"})
+
+
+class TestSizeBudget(unittest.TestCase):
+    """The sample events stay within their payload budgets."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        cls.apps = {"analyze-image": cls.image_app, "analyze-landmark": cls.landmark_app}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def call(self, name, profile=None, encoding=None):
+        event = sample_event(name, queryStringParameters={"profile": profile} if profile else None,
+                             headers={"Accept-Encoding": encoding, "Accept": "application/json"} if encoding else {})
+        response = self.apps[name].lambda_handler(event, FakeLambdaContext(30000))
+        self.assertEqual(response["statusCode"], 200)
+        return response
+
+    def test_sample_events_within_budget(self):
+        for name, budget in SIZE_BUDGETS.items():
+            with self.subTest(event=name):
+                full = self.call(name)
+                compact = self.call(name, profile="compact")
+                self.assertLess(len(compact["body"]), len(full["body"]))
+                self.assertLessEqual(len(compact["body"]), budget["compact"])
+
+                compressed = self.call(name, encoding="gzip, deflate, br")
+                self.assertEqual(compressed["headers"]["Content-Encoding"], "gzip")
+                self.assertLessEqual(len(base64.b64decode(compressed["body"])), budget["compressed"])
+                self.assertEqual(read_body(compressed).keys(), json.loads(full["body"]).keys())
+
+    def test_full_image_result_keeps_forwarded_context(self):
+        # The extension forwards the full analysis_data to /analyze-landmark
+        image = read_body(self.call("analyze-image", encoding="gzip"))
+        self.assertIn("lat", image["analysis_data"]["landmark"]["location"])
+        self.assertIn("borders", image["analysis_data"]["country_info"])
+
+    def test_compact_image_result_feeds_landmark_analysis(self):
+        image = read_body(self.call("analyze-image", profile="compact"))
+        self.assertNotIn("borders", image["analysis_data"].get("country_info") or {})
+        self.assertNotIn("lat", image["analysis_data"]["landmark"]["location"])
+
+        response = self.landmark_app.lambda_handler(
+            {"body": json.dumps({"analysis_data": image["analysis_data"]}),
+             "queryStringParameters": {"profile": "compact"}}, FakeLambdaContext(30000))
+        body = read_body(response)
+        self.assertEqual(body["landmark_name"], image["landmark_detected"])
+        self.assertNotIn("bedrock_usage", body)
+        self.assertIn("recommendations", body)
+
+    def test_payload_metrics(self):
+        metrics.reset()
+        self.call("analyze-landmark", profile="compact", encoding="gzip")
+        gauges = metrics.snapshot()["gauges"]
+        raw = gauges["ResponseBytes[Function=landmark_analyzer,Profile=compact]"]
+        wire = gauges["ResponseWireBytes[Function=landmark_analyzer,Profile=compact]"]
+        self.assertLess(wire, raw)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Tests for the indexed results store and the history API.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+from shared import results_store
+from shared.results_store import (
+    DynamoDBResultsStore,
+    SQLiteResultsStore,
+    result_record,
+    set_results_store,
+)
+
+
+def landmark_result(name, country_code, timestamp, image_url=None, mid=None):
+    return {
+        "landmark": {"name": name, "mid": mid, "location": {"country_code": country_code}},
+        "image_url": image_url or f"https://example.com/{name.replace(' ', '_')}.jpg",
+        "timestamp": timestamp,
+    }
+
+
+class TestSQLiteStore(unittest.TestCase):
+    """Point lookups and range queries on the local backend."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = SQLiteResultsStore(os.path.join(self.tmp, "results.db"))
+        self.records = [
+            result_record("landmark_analysis", landmark_result("Eiffel Tower", "fr", "2025-03-01T09:00:00")),
+            result_record("landmark_analysis", landmark_result("Eiffel Tower", "FR", "2025-03-03T09:00:00")),
+            result_record("image_analysis", landmark_result("Eiffel Tower", "FR", "2025-03-03T08:59:00")),
+            result_record("landmark_analysis", landmark_result("Tokyo Tower", "JP", "2025-03-02T12:00:00")),
+            result_record("landmark_analysis", landmark_result("Kinkaku-ji", "JP", "2025-03-09T12:00:00",
+                                                               image_url="https://example.com/kinkaku.jpg?b=2&a=1")),
+        ]
+        for record in self.records:
+            self.store.put(record)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_get_returns_full_result(self):
+        record = self.store.get(self.records[3]["result_id"])
+        self.assertEqual(record["landmark_name"], "Tokyo Tower")
+        self.assertEqual(record["result"]["landmark"]["name"], "Tokyo Tower")
+        self.assertIsNone(self.store.get("missing"))
+
+    def test_query_by_landmark_newest_first(self):
+        results = self.store.query(landmark="eiffel tower!")
+        self.assertEqual([r["timestamp"] for r in results],
+                         ["2025-03-03T09:00:00", "2025-03-03T08:59:00", "2025-03-01T09:00:00"])
+        self.assertEqual(len(self.store.query(landmark="Eiffel Tower", kind="image_analysis")), 1)
+
+    def test_query_by_country_and_date_range(self):
+        results = self.store.query(country_code="jp", since="2025-03-01", until="2025-03-07")
+        self.assertEqual([r["landmark_name"] for r in results], ["Tokyo Tower"])
+        self.assertEqual(len(self.store.query(since="2025-03-03", until="2025-03-03")), 2)
+
+    def test_query_by_normalized_image_url(self):
+        results = self.store.query(image_url="HTTPS://EXAMPLE.com:443/kinkaku.jpg?b=2&a=1#top")
+        self.assertEqual([r["landmark_name"] for r in results], ["Kinkaku-ji"])
+
+    def test_latest(self):
+        latest = self.store.latest(landmark="Eiffel Tower", kind="landmark_analysis")
+        self.assertEqual(latest["timestamp"], "2025-03-03T09:00:00")
+        self.assertIsNone(self.store.latest(landmark="Big Ben"))
+
+    def test_lookups_use_indexes(self):
+        for i in range(3000):
+            self.store.put(result_record("landmark_analysis",
+                                         landmark_result(f"Landmark {i}", "US", f"2024-01-{i % 28 + 1:02d}T00:00:00")))
+        plan = self.store._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM results WHERE landmark_key = ? ORDER BY timestamp DESC", ("x",)
+        ).fetchall()
+        self.assertIn("results_landmark_key", str(plan))
+
+        started = time.perf_counter()
+        for _ in range(100):
+            self.store.query(landmark="Tokyo Tower")
+        self.assertLess((time.perf_counter() - started) / 100, 0.01)
+
+
+class FakeDynamoDB:
+    """Records calls; answers queries from the items put so far."""
+
+    def __init__(self, page_items=None):
+        self.items = {}
+        self.queries = []
+        # Items per response page, standing in for DynamoDB's 1 MB page limit
+        self.page_items = page_items
+
+    def put_item(self, TableName, Item):
+        self.items[Item["result_id"]["S"]] = Item
+
+    def get_item(self, TableName, Key):
+        item = self.items.get(Key["result_id"]["S"])
+        return {"Item": item} if item else {}
+
+    def query(self, **params):
+        self.queries.append(params)
+        field = params["ExpressionAttributeNames"]["#k"]
+        value = params["ExpressionAttributeValues"][":k"]["S"]
+        items = [item for item in self.items.values() if item.get(field, {}).get("S") == value]
+        items.sort(key=lambda item: item["timestamp"]["S"], reverse=True)
+        start = 0
+        if "ExclusiveStartKey" in params:
+            last = params["ExclusiveStartKey"]["result_id"]["S"]
+            start = next(i for i, item in enumerate(items) if item["result_id"]["S"] == last) + 1
+        size = min(params["Limit"], self.page_items or params["Limit"])
+        page = items[start:start + size]
+        response = {"Items": [{k: v for k, v in item.items() if k != "body"} for item in page]}
+        if start + size < len(items):
+            response["LastEvaluatedKey"] = {"result_id": page[-1]["result_id"]}
+        return response
+
+
+class TestDynamoDBStore(unittest.TestCase):
+    """Index selection and item layout for the production backend."""
+
+    def setUp(self):
+        self.client = FakeDynamoDB()
+        self.store = DynamoDBResultsStore("results", client=self.client)
+
+    def test_put_get_and_query(self):
+        record = result_record("landmark_analysis", landmark_result("Tokyo Tower", "JP", "2025-03-02T12:00:00"))
+        self.store.put(record)
+        unnamed = result_record("landmark_analysis", {"landmark": {}, "timestamp": "2025-03-02T13:00:00"})
+        self.store.put(unnamed)
+
+        # Index keys are left out rather than stored empty
+        self.assertNotIn("landmark_key", self.client.items[unnamed["result_id"]])
+        self.assertEqual(self.client.items[record["result_id"]]["country_code"], {"S": "JP"})
+        self.assertEqual(self.store.get(record["result_id"])["result"]["landmark"]["name"], "Tokyo Tower")
+
+        results = self.store.query(country_code="jp", landmark="Tokyo Tower")
+        self.assertEqual([r["result_id"] for r in results], [record["result_id"]])
+        self.assertEqual(self.client.queries[-1]["IndexName"], "landmark-index")
+
+        self.assertEqual(len(self.store.query(since="2025-03-02", until="2025-03-02")), 2)
+        self.assertEqual(self.client.queries[-1]["IndexName"], "date-index")
+
+    def test_records_expire_with_s3_objects(self):
+        record = result_record("landmark_analysis", landmark_result("Tokyo Tower", "JP", "2025-03-02T12:00:00"))
+        self.store.put(record)
+        expires_at = int(self.client.items[record["result_id"]]["expires_at"]["N"])
+        self.assertAlmostEqual(expires_at - time.time(), 30 * 86400, delta=60)
+        self.assertNotIn("expires_at", self.store.get(record["result_id"]))
+
+    def test_query_follows_pages(self):
+        self.client.page_items = 3
+        for hour in range(10):
+            kind = "image_analysis" if hour % 4 == 0 else "landmark_analysis"
+            self.store.put(result_record(kind, landmark_result(
+                "Tokyo Tower", "JP", f"2025-03-02T{hour:02d}:00:00")))
+
+        self.assertEqual(len(self.store.query(landmark="Tokyo Tower", limit=8)), 8)
+        # Filtered rows are spread over every page of the partition
+        matches = self.store.query(landmark="Tokyo Tower", kind="image_analysis")
+        self.assertEqual([r["timestamp"][11:13] for r in matches], ["08", "04", "00"])
+        self.assertEqual(len(self.store.query(since="2025-03-02", until="2025-03-02", limit=20)), 10)
+
+
+class TestHistoryApi(unittest.TestCase):
+    """Both handlers index their results and the history API reads them back."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        import results_api.app as results_app
+        cls.results_app = results_app
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+        set_results_store(None)
+        shutil.rmtree(cls.tmp)
+
+    def setUp(self):
+        self.store = SQLiteResultsStore(os.path.join(self.tmp, f"{self._testMethodName}.db"))
+        set_results_store(self.store)
+
+    def tearDown(self):
+        set_results_store(None)
+        self.store.close()
+
+    def history(self, result_id=None, **params):
+        event = {"queryStringParameters": params or None, "pathParameters": {"result_id": result_id} if result_id else None}
+        response = self.results_app.lambda_handler(event, FakeLambdaContext(10000))
+        return response["statusCode"], json.loads(response["body"])
+
+    def test_pipeline_results_are_indexed(self):
+        image_response = self.image_app.lambda_handler({"body": {"image_url": "https://example.com/eiffel.jpg"}},
+                                                       FakeLambdaContext(30000))
+        image_body = json.loads(image_response["body"])
+        self.assertIsNotNone(image_body["result_id"])
+
+        landmark_response = self.landmark_app.lambda_handler(
+            {"body": {"analysis_data": image_body["analysis_data"]}}, FakeLambdaContext(30000))
+        landmark_body = json.loads(landmark_response["body"])
+
+        status, body = self.history(landmark="Eiffel Tower")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["count"], 2)
+        self.assertEqual({r["kind"] for r in body["results"]}, {"image_analysis", "landmark_analysis"})
+        self.assertEqual(body["results"][0]["country_code"], "FR")
+
+        status, body = self.history("latest", landmark="Eiffel Tower", kind="landmark_analysis")
+        self.assertEqual(body["result"]["result_id"], landmark_body["result_id"])
+        self.assertIn("recommendations", body["result"]["result"])
+
+        status, body = self.history(image_body["result_id"])
+        self.assertEqual(body["result"]["result"]["image_url"], "https://example.com/eiffel.jpg")
+
+    def test_errors(self):
+        self.assertEqual(self.history("missing")[0], 404)
+        self.assertEqual(self.history("latest")[0], 400)
+        self.assertEqual(self.history(limit="many")[0], 400)
+        set_results_store(None)
+        original = results_store.RESULTS_STORE
+        results_store.RESULTS_STORE = "none"
+        try:
+            self.assertEqual(self.history(landmark="x")[0], 503)
+        finally:
+            results_store.RESULTS_STORE = original
+
+
+if __name__ == '__main__':
+    unittest.main()
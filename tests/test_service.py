@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Tests for Vision micro-batching and the long-running service mode.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks import fixtures
+from benchmarks.harness import load_handlers
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import metrics, micro_batch
+from shared.micro_batch import BatchTimeout, MicroBatcher
+from shared.rate_limit import reset_limiters
+
+
+class TestMicroBatcher(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_concurrent_items_share_calls(self):
+        calls = []
+
+        def send(payloads, timeout):
+            calls.append(list(payloads))
+            time.sleep(0.01)
+            return [payload * 2 for payload in payloads]
+
+        batcher = MicroBatcher("test", send, window=0.02, max_size=4)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda n: batcher.submit(n, timeout=5), range(10)))
+        self.assertEqual(results, [n * 2 for n in range(10)])
+        self.assertLess(len(calls), 10)
+        self.assertLessEqual(max(len(call) for call in calls), 4)
+        self.assertEqual(batcher.stats()["items"], 10)
+
+    def test_failed_batch_fails_every_item(self):
+        def send(payloads, timeout):
+            raise requests.ConnectionError("down")
+
+        batcher = MicroBatcher("test", send, window=0.01, max_size=8)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(batcher.submit, n, 5) for n in range(3)]
+        for future in futures:
+            with self.assertRaises(requests.ConnectionError):
+                future.result()
+
+    def test_failed_batch_retries_items_on_their_own(self):
+        calls = []
+
+        def send(payloads, timeout):
+            calls.append(list(payloads))
+            # One bad item fails the whole call, as a malformed request does
+            if "bad" in payloads:
+                raise requests.HTTPError("400 Client Error")
+            return [payload.upper() for payload in payloads]
+
+        batcher = MicroBatcher("test", send, window=0.2, max_size=8)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = {payload: pool.submit(batcher.submit, payload, 5) for payload in ("a", "bad", "c")}
+        self.assertEqual(futures["a"].result(), "A")
+        self.assertEqual(futures["c"].result(), "C")
+        with self.assertRaises(requests.HTTPError):
+            futures["bad"].result()
+        self.assertEqual(sorted(map(len, calls)), [1, 1, 1, 3])
+        self.assertEqual(metrics.snapshot()["counters"]["MicroBatchRetries[Batcher=test]"], 3)
+
+    def test_timed_out_batch_is_not_retried(self):
+        calls = []
+
+        def send(payloads, timeout):
+            calls.append(list(payloads))
+            raise requests.Timeout("read timed out")
+
+        batcher = MicroBatcher("test", send, window=0.05, max_size=8)
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(batcher.submit, n, 5) for n in range(3)]
+        for future in futures:
+            with self.assertRaises(requests.Timeout):
+                future.result()
+        self.assertEqual(len(calls), 1)
+
+    def test_caller_timeout(self):
+        release = threading.Event()
+
+        def send(payloads, timeout):
+            release.wait(2)
+            return payloads
+
+        batcher = MicroBatcher("test", send, window=0.001, max_size=8)
+        start = time.monotonic()
+        with self.assertRaises(BatchTimeout):
+            batcher.submit("slow", timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        release.set()
+
+    def test_off_without_window(self):
+        self.assertIsNone(micro_batch.get_batcher("off", lambda payloads, timeout: payloads, window_ms=0))
+
+
+class TestService(unittest.TestCase):
+    """Both handlers behind one asyncio HTTP service, with Vision calls batched."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+        from service.app import BackgroundService
+        micro_batch.reset_batchers()
+        cls.service = BackgroundService(host="127.0.0.1", port=0, workers=16, batch_window_ms=20).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.service.stop()
+        micro_batch.reset_batchers()
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_limiters()
+        self.stubs.reset_stats()
+
+    def tearDown(self):
+        self.stubs["vision"].profile = UpstreamProfile()
+
+    def post(self, path, body):
+        return requests.post(f"{self.service.url}{path}", json=body, timeout=30)
+
+    def test_concurrent_images_share_vision_calls(self):
+        self.stubs["vision"].profile = UpstreamProfile.from_dict({"latency": {"distribution": "fixed", "ms": 50}})
+        urls = [f"https://example.com/photos/service-{time.time_ns()}-{n}.jpg" for n in range(12)]
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            responses = list(pool.map(lambda url: self.post("/analyze-image", {"image_url": url}), urls))
+
+        self.assertEqual([response.status_code for response in responses], [200] * 12)
+        for response in responses:
+            self.assertEqual(response.json()["analysis_data"]["landmark"]["name"], "Eiffel Tower")
+        self.assertLess(self.stubs["vision"].stats()["calls"], 12)
+        health = requests.get(f"{self.service.url}/health", timeout=5).json()
+        self.assertGreater(health["vision_batches"]["google_vision"]["mean_size"], 1)
+
+    def test_landmark_route_and_projection(self):
+        response = self.post("/analyze-landmark?fields=landmark_name,analysis_tier", {"analysis_data": fixtures.ANALYSIS_DATA})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["landmark_name"], "Eiffel Tower")
+        self.assertNotIn("recommendations", body)
+
+    def test_errors(self):
+        self.assertEqual(self.post("/nowhere", {}).status_code, 404)
+        self.assertEqual(requests.get(f"{self.service.url}/analyze-image", timeout=5).status_code, 405)
+        response = requests.post(f"{self.service.url}/analyze-image", data="{not json", timeout=5)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("error", json.loads(response.text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Tests for the /extract-text handler.
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import tracemalloc
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, ensure_src_on_path
+from benchmarks.stubs import STUB_OCR_TEXT, StubUpstreams
+from shared import image_ingest
+from shared.http_client import get_session
+
+try:
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+    ensure_src_on_path()
+    import text_extractor.app as text_app
+except ImportError:
+    text_app = None
+
+
+def make_pdf(kinds, lines=40):
+    """
+    Build a PDF with one page per entry: "text" pages carry embedded text,
+    "scan" pages only an image.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    image = ImageReader(Image.new("RGB", (200, 200), (200, 100, 50)))
+    for number, kind in enumerate(kinds, 1):
+        if kind == "text":
+            for line in range(lines):
+                pdf.drawString(50, 800 - line * 18, f"Page {number} line {line} about the landmarks of Paris")
+        else:
+            pdf.drawImage(image, 50, 300, 400, 400)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+@unittest.skipIf(text_app is None, "pdfplumber, PyPDF2, reportlab or Pillow not installed")
+class TestTextExtractor(unittest.TestCase):
+    """Embedded text is used where present and scanned pages are OCR'd in batches."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        cls.stubs.install_text_extractor(text_app)
+        os.environ["ENVIRONMENT"] = "local"
+        cls.host = cls.stubs["s3"]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        self.stubs["vision"].reset_stats()
+
+    def invoke(self, key):
+        event = {"body": {"document_url": f"{self.host.url}{key}"}}
+        response = text_app.lambda_handler(event, FakeLambdaContext(30000))
+        return response, json.loads(response["body"])
+
+    def test_mixed_pdf_keeps_page_order(self):
+        self.host.objects["/docs/mixed.pdf"] = make_pdf(["text", "scan", "scan", "text", "scan"])
+        response, body = self.invoke("/docs/mixed.pdf")
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(body["document_type"], "pdf")
+        self.assertEqual([page["page"] for page in body["pages"]], [1, 2, 3, 4, 5])
+        self.assertEqual([page["source"] for page in body["pages"]], ["embedded", "ocr", "ocr", "embedded", "ocr"])
+        self.assertIn("Page 1 line 0", body["pages"][0]["text"])
+        self.assertTrue(body["pages"][1]["text"].startswith(STUB_OCR_TEXT))
+        # All three scanned pages fit in one Vision request
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 1)
+
+    def test_scanned_pages_are_batched(self):
+        self.host.objects["/docs/scanned.pdf"] = make_pdf(["scan"] * 12)
+        _, body = self.invoke("/docs/scanned.pdf")
+        self.assertEqual(body["ocr_pages"], 12)
+        self.assertEqual(self.stubs["vision"].stats()["calls"], 3)
+
+    def test_text_pages_stream_before_later_ocr(self):
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+            f.write(make_pdf(["text", "text", "scan"]))
+            f.flush()
+            pages = text_app.iter_pdf_text(f.name)
+            first = next(pages)
+            self.assertEqual(first["source"], "embedded")
+            self.assertEqual(self.stubs["vision"].stats()["calls"], 0)
+            self.assertEqual([page["source"] for page in pages], ["embedded", "ocr"])
+
+    def test_memory_stays_flat(self):
+        peaks = []
+        for page_count in (4, 24):
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as f:
+                f.write(make_pdf(["text"] * page_count, lines=5))
+                f.flush()
+                tracemalloc.start()
+                try:
+                    self.assertEqual(sum(1 for _ in text_app.iter_pdf_text(f.name)), page_count)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+        self.assertLess(peaks[1], peaks[0] * 1.5)
+
+    def test_image_is_sent_inline(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (300, 100), (255, 255, 255)).save(buffer, format="PNG")
+        self.host.objects["/docs/sign.png"] = buffer.getvalue()
+        _, body = self.invoke("/docs/sign.png")
+
+        self.assertEqual(body["document_type"], "image")
+        self.assertEqual(body["pages"][0]["source"], "ocr")
+        self.assertTrue(body["pages"][0]["text"].startswith(STUB_OCR_TEXT))
+
+    def test_missing_document(self):
+        response, body = self.invoke("/docs/missing.pdf")
+        self.assertEqual(response["statusCode"], 400)
+        self.assertIn("404", body["error"])
+
+    def test_internal_document_urls_are_rejected(self):
+        with mock.patch.object(image_ingest, "IMAGE_FETCH_ALLOW_PRIVATE", False):
+            for url in (f"{self.host.url}/docs/mixed.pdf", "http://169.254.169.254/latest/meta-data/",
+                        "http://127.0.0.1:9001/2018-06-01/runtime/invocation/next", "file:///etc/passwd"):
+                with self.subTest(url=url):
+                    response = text_app.lambda_handler({"body": {"document_url": url}}, FakeLambdaContext(30000))
+                    self.assertEqual(response["statusCode"], 400)
+                    self.assertIn("not allowed", json.loads(response["body"])["error"])
+
+    def test_redirects_are_checked(self):
+        class Redirect:
+            status_code = 302
+            headers = {"Location": "http://169.254.169.254/latest/meta-data/"}
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        def resolve_public(host, port, *args, **kwargs):
+            address = "93.184.216.34" if host.endswith(".example.com") else host
+            return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+
+        with mock.patch.object(image_ingest, "IMAGE_FETCH_ALLOW_PRIVATE", False), \
+                mock.patch.object(socket, "getaddrinfo", side_effect=resolve_public), \
+                mock.patch.object(get_session(), "get", return_value=Redirect()) as get:
+            response = text_app.lambda_handler({"body": {"document_url": "https://docs.example.com/guide.pdf"}},
+                                               FakeLambdaContext(30000))
+        self.assertEqual(response["statusCode"], 400)
+        self.assertIn("not allowed", json.loads(response["body"])["error"])
+        get.assert_called_once()
+        self.assertFalse(get.call_args.kwargs["allow_redirects"])
+
+    def test_page_limit(self):
+        self.host.objects["/docs/long.pdf"] = make_pdf(["text"] * 6)
+        original = text_app.DOCUMENT_MAX_PAGES
+        text_app.DOCUMENT_MAX_PAGES = 4
+        try:
+            _, body = self.invoke("/docs/long.pdf")
+        finally:
+            text_app.DOCUMENT_MAX_PAGES = original
+        self.assertEqual(body["page_count"], 4)
+        self.assertIn("incomplete", body["degraded"])
+
+    def test_inline_text_is_truncated_after_extraction(self):
+        self.host.objects["/docs/wordy.pdf"] = make_pdf(["scan"] * 3)
+        original = text_app.MAX_RESPONSE_TEXT_CHARS
+        text_app.MAX_RESPONSE_TEXT_CHARS = 10
+        try:
+            _, body = self.invoke("/docs/wordy.pdf")
+        finally:
+            text_app.MAX_RESPONSE_TEXT_CHARS = original
+
+        # Every page is still extracted; only the inline copy is cut short
+        self.assertEqual(body["page_count"], 3)
+        self.assertEqual(body["ocr_pages"], 3)
+        self.assertTrue(body["truncated"])
+        self.assertEqual(len(body["pages"]), 1)
+        self.assertEqual(body["pages"][0]["text"], STUB_OCR_TEXT[:10])
+        self.assertTrue(body["pages"][0]["truncated"])
+
+    def test_inline_pages(self):
+        pages = [{"page": 1, "text": "a" * 10}, {"page": 2, "text": "b" * 10}]
+        self.assertEqual(text_app.inline_pages(pages, 20), {"pages": pages, "truncated": False})
+        cut = text_app.inline_pages(pages, 15)
+        self.assertTrue(cut["truncated"])
+        self.assertEqual([page["text"] for page in cut["pages"]], ["a" * 10, "b" * 5])
+        self.assertEqual(text_app.inline_pages(pages, 10)["pages"], pages[:1])
+
+
+if __name__ == '__main__':
+    unittest.main()
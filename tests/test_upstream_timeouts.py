@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Tests for latency-driven upstream timeouts and the fast retry.
+"""
+
+import os
+import random
+import sys
+import time
+import unittest
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import api_helpers, metrics
+from shared.circuit_breaker import reset_breakers
+from shared.upstream_timeouts import (
+    QuantileSketch,
+    UpstreamTimeout,
+    get_upstream_timeout,
+    reset_upstream_timeouts,
+    upstream_timeout_stats,
+)
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_relative_accuracy(self):
+        sketch = QuantileSketch(relative_accuracy=0.01, half_life=10 ** 6)
+        values = list(range(1, 10001))
+        random.Random(7).shuffle(values)
+        for value in values:
+            sketch.add(value)
+        for q, expected in ((0.5, 5000), (0.9, 9000), (0.99, 9900)):
+            self.assertAlmostEqual(sketch.quantile(q), expected, delta=expected * 0.011)
+
+    def test_decay_follows_recent_latency(self):
+        sketch = QuantileSketch(half_life=100)
+        for _ in range(500):
+            sketch.add(50)
+        for _ in range(500):
+            sketch.add(400)
+        self.assertAlmostEqual(sketch.quantile(0.5), 400, delta=5)
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+
+class TestUpstreamTimeout(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_ceiling_until_enough_samples(self):
+        tracker = UpstreamTimeout("test", floor=0.05, ceiling=10)
+        self.assertEqual(tracker.timeouts()[1], 10)
+        for _ in range(60):
+            tracker.record(0.1)
+        connect, read = tracker.timeouts()
+        # p99 x 2 of 100 ms samples, within the sketch's 1% error
+        self.assertAlmostEqual(read, 0.2, delta=0.005)
+        self.assertLessEqual(connect, read)
+        gauges = metrics.snapshot()["gauges"]
+        self.assertAlmostEqual(gauges["UpstreamReadTimeout[Upstream=test]"], read * 1000)
+        self.assertIn("UpstreamLatencyP99[Upstream=test]", gauges)
+
+    def test_floor_applies(self):
+        tracker = UpstreamTimeout("test", floor=1.0, ceiling=10)
+        for _ in range(60):
+            tracker.record(0.01)
+        self.assertEqual(tracker.timeouts()[1], 1.0)
+
+    def test_one_fast_retry(self):
+        tracker = UpstreamTimeout("test", floor=0.1, ceiling=5)
+        attempts = []
+
+        def flaky(timeouts):
+            attempts.append(timeouts)
+            if len(attempts) == 1:
+                raise requests.ReadTimeout("stuck")
+            return "ok"
+
+        self.assertEqual(tracker.call(flaky, budget=5), "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(metrics.snapshot()["counters"]["UpstreamTimeoutRetry[Upstream=test]"], 1)
+
+        def stuck(timeouts):
+            attempts.append(timeouts)
+            raise requests.ConnectTimeout("stuck")
+
+        attempts.clear()
+        with self.assertRaises(requests.Timeout):
+            tracker.call(stuck, budget=5)
+        self.assertEqual(len(attempts), 2)
+
+    def test_no_retry_without_budget(self):
+        tracker = UpstreamTimeout("test", floor=1.0, ceiling=5)
+        attempts = []
+
+        def slow_then_stuck(timeouts):
+            attempts.append(timeouts)
+            time.sleep(0.05)
+            raise requests.ReadTimeout("stuck")
+
+        with self.assertRaises(requests.Timeout):
+            tracker.call(slow_then_stuck, budget=0.5)
+        self.assertEqual(len(attempts), 1)
+        # Each attempt's timeouts never exceed what is left of the budget
+        self.assertLessEqual(attempts[0][1], 0.5)
+
+
+class TestAdaptiveWeatherTimeouts(unittest.TestCase):
+    """A hung Google Weather call fails in about twice its normal latency, not 10 s."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+        reset_upstream_timeouts()
+
+    def setUp(self):
+        reset_breakers()
+        reset_upstream_timeouts()
+        api_helpers.WEATHER_CACHE.clear()
+        self.stubs["google_weather"].reset_stats()
+
+    def tearDown(self):
+        self.stubs["google_weather"].profile = UpstreamProfile()
+
+    def test_hung_call_times_out_early(self):
+        tracker = get_upstream_timeout("google_weather")
+        tracker.floor = 0.2
+        for _ in range(60):
+            tracker.record(0.03)
+        self.assertEqual(tracker.timeouts()[1], 0.2)
+
+        self.stubs["google_weather"].profile = UpstreamProfile(hang_ms=1000)
+        start = time.monotonic()
+        weather = api_helpers.get_weather("Paris", "France", coordinates=(48.8584, 2.2945))
+        elapsed = time.monotonic() - start
+
+        self.assertIsNone(weather)
+        self.assertLess(elapsed, 0.9)
+        # The first attempt and its fast retry (the stub counts a call once its hang ends)
+        time.sleep(1.2)
+        self.assertEqual(self.stubs["google_weather"].stats()["calls"], 2)
+        self.assertEqual(upstream_timeout_stats()["google_weather"]["read_timeout"], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the warm-up event path.
+"""
+
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.harness import FakeLambdaContext, load_handlers
+from benchmarks.stubs import StubUpstreams
+from shared import api_helpers, warmup
+from shared.http_client import preconnect
+from shared.warmup import is_warmup_event, run_warmup
+
+
+class TestWarmupHelpers(unittest.TestCase):
+    """Event detection and step reporting."""
+
+    def test_warmup_events(self):
+        self.assertTrue(is_warmup_event({"warmup": True}))
+        self.assertTrue(is_warmup_event({"source": "aws.events", "detail-type": "Scheduled Event"}))
+        self.assertTrue(is_warmup_event({"body": {"warmup": True}}))
+        self.assertFalse(is_warmup_event({"body": '{"image_url": "https://example.com/a.jpg"}'}))
+        self.assertFalse(is_warmup_event(None))
+
+    def test_failing_step_does_not_stop_others(self):
+        def broken():
+            raise RuntimeError("no route")
+
+        report = run_warmup("test", [("broken", broken), ("fine", lambda: {"n": 1})])
+        self.assertFalse(report["steps"]["broken"]["ok"])
+        self.assertEqual(report["steps"]["broken"]["error"], "no route")
+        self.assertEqual(report["steps"]["fine"], {"ok": True, "detail": {"n": 1}, "ms": report["steps"]["fine"]["ms"]})
+        self.assertGreaterEqual(report["total_ms"], 0)
+
+    def test_preconnect_reports_unreachable_origins(self):
+        result = preconnect(["http://127.0.0.1:9/a", "http://127.0.0.1:9/b"], timeout=0.5)
+        self.assertEqual(result, {"http://127.0.0.1:9/": None})
+
+
+class TestWarmupHandlers(unittest.TestCase):
+    """Both handlers answer warm-up pings without processing a request."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+        os.environ["ENVIRONMENT"] = "local"
+        cls.image_app, cls.landmark_app = load_handlers()
+        cls.stubs.install_handlers(cls.image_app, cls.landmark_app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        api_helpers.COUNTRY_INFO_CACHE.clear()
+        for name in ("vision", "restcountries", "bedrock"):
+            self.stubs[name].reset_stats()
+
+    def test_image_processor_warmup(self):
+        with mock.patch.object(warmup, "WARMUP_COUNTRIES", ["France"]):
+            response = self.image_app.lambda_handler({"warmup": True}, FakeLambdaContext(30000))
+        body = json.loads(response["body"])
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertTrue(body["warmup"])
+        self.assertEqual(set(body["steps"]), {"http_pools", "s3_client", "knowledge_base", "country_cache", "weather_cells"})
+        self.assertTrue(all(step["ok"] for step in body["steps"].values()))
+        self.assertTrue(all(ms is not None for ms in body["steps"]["http_pools"]["detail"].values()))
+        self.assertEqual(body["steps"]["country_cache"]["detail"]["fetched"], 1)
+        self.assertIsNotNone(api_helpers.COUNTRY_INFO_CACHE.get("france"))
+        # Warm-up opens a connection to Vision but never asks it to annotate anything
+        self.assertNotIn("landmark_detected", body)
+
+    def test_landmark_analyzer_warmup(self):
+        response = self.landmark_app.lambda_handler({"source": "aws.events"}, FakeLambdaContext(30000))
+        body = json.loads(response["body"])
+
+        self.assertEqual(set(body["steps"]), {"bedrock_client", "s3_client", "knowledge_base"})
+        self.assertEqual(body["steps"]["bedrock_client"]["detail"], self.stubs["bedrock"].url)
+        self.assertEqual(self.stubs["bedrock"].stats()["calls"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Tests for the geohash-bucketed weather cache and hot-cell refresh.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks.stubs import StubUpstreams, UpstreamProfile
+from shared import api_helpers, weather_cache
+from shared.circuit_breaker import reset_breakers
+from shared.weather_cache import CellHeat, decode_geohash, encode_geohash
+
+EIFFEL_TOWER = (48.8584, 2.2945)
+LOUVRE = (48.8606, 2.3376)
+COLOSSEUM = (41.8902, 12.4922)
+SYDNEY_OPERA_HOUSE = (-33.8568, 151.2153)
+
+
+class TestGeohash(unittest.TestCase):
+
+    def test_known_cells(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(encode_geohash(42.605, -5.603, 5), "ezs42")
+
+    def test_decode_returns_cell_centre(self):
+        for lat, lng in (EIFFEL_TOWER, COLOSSEUM, SYDNEY_OPERA_HOUSE):
+            cell = encode_geohash(lat, lng, 5)
+            centre = decode_geohash(cell)
+            self.assertEqual(encode_geohash(*centre, 5), cell)
+            # A precision-5 cell is about 4.9 km wide
+            self.assertAlmostEqual(centre[0], lat, delta=0.03)
+            self.assertAlmostEqual(centre[1], lng, delta=0.03)
+
+    def test_hottest_cells(self):
+        heat = CellHeat(half_life=600)
+        for cell, hits in (("u09tu", 5), ("sr2yk", 2), ("r3gx2", 9)):
+            for _ in range(hits):
+                heat.touch(cell)
+        self.assertEqual([cell for cell, _ in heat.hottest(2)], ["r3gx2", "u09tu"])
+
+    def test_cold_cells_drop_out(self):
+        heat = CellHeat(half_life=600)
+        with mock.patch.object(weather_cache.time, "monotonic", return_value=1000.0):
+            for _ in range(4):
+                heat.touch("u09tu")
+            heat.touch("sr2yk")
+        # One half-life later: 4 hits score 2, one hit 0.5
+        with mock.patch.object(weather_cache.time, "monotonic", return_value=1600.0):
+            self.assertEqual([cell for cell, _ in heat.hottest(5, min_score=0.5)], ["u09tu", "sr2yk"])
+        # Once traffic stops, every cell eventually falls below the threshold
+        with mock.patch.object(weather_cache.time, "monotonic", return_value=1000.0 + 600 * 4):
+            self.assertEqual(heat.hottest(5, min_score=0.5), [])
+
+
+class TestWeatherCache(unittest.TestCase):
+    """Lookups in the same cell share one Google Weather call."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stubs = StubUpstreams().start()
+        cls.stubs.install()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stubs.stop()
+
+    def setUp(self):
+        reset_breakers()
+        api_helpers.WEATHER_CACHE.clear()
+        api_helpers.CELL_HEAT.clear()
+        self.stubs["google_weather"].reset_stats()
+
+    def tearDown(self):
+        self.stubs["google_weather"].profile = UpstreamProfile()
+
+    def weather_calls(self):
+        return self.stubs["google_weather"].stats()["calls"]
+
+    def test_same_cell_is_served_from_cache(self):
+        first = api_helpers.get_weather("Paris", "France", coordinates=EIFFEL_TOWER)
+        second = api_helpers.get_weather("Paris", "France", coordinates=(48.8590, 2.2950))
+
+        self.assertEqual(self.weather_calls(), 1)
+        self.assertEqual(first.geohash, second.geohash)
+        self.assertEqual(first.as_of, second.as_of)
+        self.assertEqual(second.current_temperature, 18.4)
+        # Each response keeps its own coordinates
+        self.assertEqual(second.location["coordinates"], {"lat": 48.8590, "lng": 2.2950})
+        self.assertIsNone(second.stale)
+
+    def test_calls_follow_distinct_cells(self):
+        places = [EIFFEL_TOWER] * 12 + [COLOSSEUM] * 6 + [SYDNEY_OPERA_HOUSE] * 2
+        for coordinates in places:
+            self.assertIsNotNone(api_helpers.get_weather("City", "Country", coordinates=coordinates))
+        self.assertEqual(self.weather_calls(), 3)
+
+    def test_stale_conditions_when_upstream_fails(self):
+        fresh = api_helpers.get_weather("Paris", "France", coordinates=EIFFEL_TOWER)
+        cell = fresh.geohash
+        api_helpers.WEATHER_CACHE.set(cell, api_helpers.WEATHER_CACHE.get(cell), ttl=-1)
+        self.stubs["google_weather"].profile = UpstreamProfile(failure_rate=1.0, failure_status=503)
+
+        stale = api_helpers.get_weather("Paris", "France", coordinates=EIFFEL_TOWER)
+        self.assertTrue(stale.stale)
+        self.assertEqual(stale.as_of, fresh.as_of)
+
+        # Nothing to fall back on in a cell that was never fetched
+        self.assertIsNone(api_helpers.get_weather("Rome", "Italy", coordinates=COLOSSEUM))
+
+    def test_refresh_hot_cells(self):
+        for coordinates in [EIFFEL_TOWER] * 3 + [COLOSSEUM] * 2 + [SYDNEY_OPERA_HOUSE]:
+            api_helpers.get_weather("City", "Country", coordinates=coordinates)
+        self.stubs["google_weather"].reset_stats()
+
+        # Fresh cells are not refetched
+        self.assertEqual(api_helpers.refresh_hot_weather_cells()["refreshed"], 0)
+        with mock.patch.object(weather_cache, "WEATHER_REFRESH_AHEAD", 0):
+            report = api_helpers.refresh_hot_weather_cells(top_n=2)
+        self.assertEqual(report["refreshed"], 2)
+        self.assertEqual(self.weather_calls(), 2)
+
+        # Cells without recent traffic are not kept warm
+        with mock.patch.object(weather_cache, "WEATHER_REFRESH_AHEAD", 0), \
+                mock.patch.object(weather_cache, "WEATHER_HOT_MIN_HEAT", 10):
+            self.assertEqual(api_helpers.refresh_hot_weather_cells()["refreshed"], 0)
+
+    def test_disabled_cache_fetches_every_time(self):
+        with mock.patch.object(api_helpers, "WEATHER_CACHE_TTL", 0):
+            for _ in range(3):
+                weather = api_helpers.get_weather("Paris", "France", coordinates=EIFFEL_TOWER)
+        self.assertEqual(self.weather_calls(), 3)
+        self.assertIsNotNone(weather.as_of)
+
+
+if __name__ == '__main__':
+    unittest.main()
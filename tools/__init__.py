@@ -0,0 +1,3 @@
+"""
+Offline maintenance tools for LambdaTrip data
+"""
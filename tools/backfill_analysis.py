@@ -0,0 +1,412 @@
+"""
+Re-run the landmark analysis over stored intermediate results.
+
+Lists ``landmark_analysis/*_analysis.json`` page by page, reads the objects
+with bounded concurrency and re-analyzes them with the current prompt and
+model, writing each result to a key derived from the source key and the
+prompt version (``landmark_analysis/backfill/<prompt version>/<name>_final.json``).
+Existing outputs are skipped and writes are conditional, so re-running the
+same backfill never pays for or overwrites a result twice.
+
+Two modes:
+
+``invoke``
+    Calls Bedrock directly, rate-limited and concurrent. Progress is saved to
+    a checkpoint file so an interrupted run resumes after the last key it
+    finished; keys that failed are retried first.
+
+``prepare-batch`` / ``collect-batch``
+    Writes a Bedrock batch-inference input file (JSONL) plus a manifest that
+    maps record IDs back to source keys, optionally submits the job, and
+    later turns the job's ``*.jsonl.out`` files into results. Batch inference
+    is billed at half the on-demand price but needs at least 100 records.
+
+Runs against any S3/Bedrock endpoint boto3 is pointed at, including the
+local stubs (``AWS_ENDPOINT_URL_S3`` / ``AWS_ENDPOINT_URL_BEDROCK_RUNTIME``).
+
+Usage:
+    python -m tools.backfill_analysis invoke --bucket lambdatrip-results --rate 2
+    python -m tools.backfill_analysis prepare-batch --bucket lambdatrip-results \\
+        --batch-input s3://lambdatrip-batch/input/backfill.jsonl --submit --role-arn arn:aws:iam::...
+    python -m tools.backfill_analysis collect-batch --bucket lambdatrip-results \\
+        --batch-input s3://lambdatrip-batch/input/backfill.jsonl --batch-output s3://lambdatrip-batch/output/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import landmark_analyzer.app as landmark_app  # noqa: E402
+from shared.bedrock_usage import invoke_model, record_usage, usage_record  # noqa: E402
+from shared.rate_limit import TokenBucket  # noqa: E402
+from tools.build_landmark_kb import is_parsed_analysis  # noqa: E402
+
+SOURCE_PREFIX = "landmark_analysis/"
+SOURCE_SUFFIX = "_analysis.json"
+OUTPUT_PREFIX = "landmark_analysis/backfill/"
+DEFAULT_CHECKPOINT = "backfill_checkpoint.json"
+
+# Bedrock rejects batch jobs with fewer records than this
+BATCH_MIN_RECORDS = 100
+MAX_THROTTLE_RETRIES = 4
+
+
+def output_key(source_key: str, prompt_version: str, output_prefix: str = OUTPUT_PREFIX) -> str:
+    """
+    Deterministic result key for a source object and prompt version
+    """
+    name = os.path.basename(source_key)
+    if name.endswith(SOURCE_SUFFIX):
+        name = name[:-len(SOURCE_SUFFIX)]
+    return f"{output_prefix}{prompt_version}/{name}_final.json"
+
+
+def record_id(source_key: str) -> str:
+    return hashlib.sha256(source_key.encode("utf-8")).hexdigest()[:16]
+
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    if not uri.startswith("s3://"):
+        raise ValueError(f"not an s3:// URI: {uri}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def iter_source_keys(s3, bucket: str, prefix: str = SOURCE_PREFIX,
+                     start_after: Optional[str] = None) -> Iterator[str]:
+    """
+    Intermediate result keys in listing order, one page at a time
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    for page in paginator.paginate(**params):
+        for item in page.get("Contents", []):
+            key = item["Key"]
+            if key.endswith(SOURCE_SUFFIX) and not key.startswith(OUTPUT_PREFIX):
+                yield key
+
+
+def bounded_map(fn: Callable[[str], Any], keys: Iterable[str], concurrency: int) -> Iterator[Tuple[str, Any, Optional[Exception]]]:
+    """
+    Apply ``fn`` to keys on a thread pool with at most ``concurrency`` in
+    flight, yielding ``(key, result, error)`` in input order
+    """
+    window = deque()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill") as executor:
+        for key in keys:
+            window.append((key, executor.submit(fn, key)))
+            if len(window) >= concurrency:
+                yield _settle(*window.popleft())
+        while window:
+            yield _settle(*window.popleft())
+
+
+def _settle(key, future):
+    try:
+        return key, future.result(), None
+    except Exception as e:
+        return key, None, e
+
+
+def read_json(s3, bucket: str, key: str) -> Dict[str, Any]:
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def exists(s3, bucket: str, key: str) -> bool:
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 404:
+            return False
+        raise
+
+
+def write_result(s3, bucket: str, key: str, result: Dict[str, Any], overwrite: bool = False) -> bool:
+    """
+    Store a result unless one is already there; False if it was
+    """
+    params = {"Bucket": bucket, "Key": key, "Body": json.dumps(result, indent=2),
+              "ContentType": "application/json"}
+    if not overwrite:
+        params["IfNoneMatch"] = "*"
+    try:
+        s3.put_object(**params)
+        return True
+    except ClientError as e:
+        if e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 412:
+            return False
+        raise
+
+
+def build_result(analysis_data: Dict[str, Any], response_body: Dict[str, Any], usage: Dict[str, Any],
+                 source_key: str) -> Dict[str, Any]:
+    analysis = landmark_app.parse_bedrock_response(response_body["content"][0]["text"])
+    if not is_parsed_analysis(analysis):
+        # Keep the old result rather than replacing it with a placeholder
+        raise ValueError("Bedrock response could not be parsed")
+    recommendations = landmark_app.generate_recommendations(analysis_data, analysis)
+    result = landmark_app.build_final_result(analysis_data, analysis, recommendations, "bedrock", usage)
+    result["backfill_source"] = source_key
+    return result
+
+
+class Checkpoint:
+    """
+    Resume point for an ``invoke`` run: the last source key finished in
+    listing order, keys that failed, and running counts
+    """
+
+    def __init__(self, path: str, prompt_version: str, model_id: str):
+        self.path = path
+        self.state = {"prompt_version": prompt_version, "model_id": model_id, "last_key": None,
+                      "failed": [], "counts": {"written": 0, "skipped": 0, "failed": 0}}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("prompt_version") == prompt_version and saved.get("model_id") == model_id:
+                self.state = saved
+            else:
+                print(f"Ignoring {path}: it belongs to a backfill of another prompt version or model",
+                      file=sys.stderr)
+
+    @property
+    def last_key(self) -> Optional[str]:
+        return self.state["last_key"]
+
+    def pending_failures(self) -> List[str]:
+        failed, self.state["failed"] = self.state["failed"], []
+        return failed
+
+    def record(self, key: str, outcome: str, in_listing: bool = True) -> None:
+        if not in_listing:
+            # A retried failure is counted again under its new outcome
+            self.state["counts"]["failed"] -= 1
+        self.state["counts"][outcome] += 1
+        if outcome == "failed":
+            self.state["failed"].append(key)
+        if in_listing:
+            self.state["last_key"] = key
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def invoke_with_retries(client, request_body: Dict[str, Any], limiter: TokenBucket):
+    """
+    Rate-limited Bedrock call that backs off on throttling
+    """
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        limiter.acquire()
+        try:
+            return invoke_model(client, landmark_app.BEDROCK_MODEL_ID, request_body,
+                                function="backfill", prompt_version=landmark_app.ANALYSIS_PROMPT_VERSION)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ThrottlingException" or attempt == MAX_THROTTLE_RETRIES:
+                raise
+            delay = 2 ** attempt
+            limiter.pause(delay)
+            time.sleep(delay)
+
+
+def run_invoke(s3, bedrock, bucket: str, prefix: str = SOURCE_PREFIX, concurrency: int = 8,
+               rate: float = 2.0, checkpoint: Optional[Checkpoint] = None, overwrite: bool = False,
+               limit: Optional[int] = None, save_every: int = 25) -> Dict[str, int]:
+    """
+    Re-analyze every intermediate result with on-demand Bedrock calls
+    """
+    prompt_version = landmark_app.ANALYSIS_PROMPT_VERSION
+    checkpoint = checkpoint or Checkpoint("", prompt_version, landmark_app.BEDROCK_MODEL_ID)
+    limiter = TokenBucket(rate, max(rate, 1.0))
+
+    def process(key):
+        target = output_key(key, prompt_version)
+        if not overwrite and exists(s3, bucket, target):
+            return "skipped"
+        analysis_data = read_json(s3, bucket, key)
+        response_body, usage = invoke_with_retries(bedrock, landmark_app.build_bedrock_request(analysis_data), limiter)
+        result = build_result(analysis_data, response_body, usage, key)
+        return "written" if write_result(s3, bucket, target, result, overwrite) else "skipped"
+
+    retries = checkpoint.pending_failures()
+    keys = iter_source_keys(s3, bucket, prefix, checkpoint.last_key)
+    if limit is not None:
+        keys = (key for index, key in enumerate(keys) if index < limit)
+
+    done = 0
+    for key, outcome, error in bounded_map(process, _chain(retries, keys), concurrency):
+        if error is not None:
+            print(f"Failed {key}: {error}", file=sys.stderr)
+            outcome = "failed"
+        checkpoint.record(key, outcome, in_listing=key not in retries)
+        done += 1
+        if done % save_every == 0:
+            checkpoint.save()
+    checkpoint.save()
+    return dict(checkpoint.state["counts"])
+
+
+def _chain(first: List[str], rest: Iterable[str]) -> Iterator[str]:
+    yield from first
+    yield from rest
+
+
+def prepare_batch(s3, bucket: str, batch_input: str, prefix: str = SOURCE_PREFIX, concurrency: int = 8,
+                  overwrite: bool = False, limit: Optional[int] = None) -> int:
+    """
+    Write the batch-inference input file and its manifest; returns the record count
+    """
+    prompt_version = landmark_app.ANALYSIS_PROMPT_VERSION
+
+    def prepare(key):
+        if not overwrite and exists(s3, bucket, output_key(key, prompt_version)):
+            return None
+        return landmark_app.build_bedrock_request(read_json(s3, bucket, key))
+
+    keys = iter_source_keys(s3, bucket, prefix)
+    if limit is not None:
+        keys = (key for index, key in enumerate(keys) if index < limit)
+
+    lines, manifest = [], {"prompt_version": prompt_version, "model_id": landmark_app.BEDROCK_MODEL_ID,
+                           "bucket": bucket, "records": {}}
+    for key, request_body, error in bounded_map(prepare, keys, concurrency):
+        if error is not None:
+            print(f"Skipping {key}: {error}", file=sys.stderr)
+            continue
+        if request_body is None:
+            continue
+        rid = record_id(key)
+        manifest["records"][rid] = key
+        lines.append(json.dumps({"recordId": rid, "modelInput": request_body}))
+
+    input_bucket, input_key = split_s3_uri(batch_input)
+    s3.put_object(Bucket=input_bucket, Key=input_key, Body=("\n".join(lines) + "\n").encode("utf-8"))
+    s3.put_object(Bucket=input_bucket, Key=f"{input_key}.manifest.json", Body=json.dumps(manifest).encode("utf-8"))
+    if len(lines) < BATCH_MIN_RECORDS:
+        print(f"Only {len(lines)} records; Bedrock batch jobs need at least {BATCH_MIN_RECORDS}, "
+              f"use the invoke mode instead", file=sys.stderr)
+    return len(lines)
+
+
+def submit_batch(bedrock_control, job_name: str, role_arn: str, batch_input: str, batch_output: str) -> str:
+    response = bedrock_control.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=role_arn,
+        modelId=landmark_app.BEDROCK_MODEL_ID,
+        inputDataConfig={"s3InputDataConfig": {"s3Uri": batch_input}},
+        outputDataConfig={"s3OutputDataConfig": {"s3Uri": batch_output}},
+    )
+    return response["jobArn"]
+
+
+def collect_batch(s3, bucket: str, batch_input: str, batch_output: str, concurrency: int = 8,
+                  overwrite: bool = False) -> Dict[str, int]:
+    """
+    Turn batch-inference output records into stored results
+    """
+    input_bucket, input_key = split_s3_uri(batch_input)
+    manifest = read_json(s3, input_bucket, f"{input_key}.manifest.json")
+    prompt_version, model_id = manifest["prompt_version"], manifest["model_id"]
+
+    output_bucket, output_prefix = split_s3_uri(batch_output)
+    records = []
+    for page in s3.get_paginator("list_objects_v2").paginate(Bucket=output_bucket, Prefix=output_prefix):
+        for item in page.get("Contents", []):
+            if item["Key"].endswith(".jsonl.out"):
+                body = s3.get_object(Bucket=output_bucket, Key=item["Key"])["Body"].read().decode("utf-8")
+                records.extend(json.loads(line) for line in body.splitlines() if line.strip())
+    by_key = {manifest["records"][record["recordId"]]: record
+              for record in records if record.get("recordId") in manifest["records"]}
+
+    def collect(key):
+        record = by_key[key]
+        if record.get("error") or not record.get("modelOutput"):
+            raise RuntimeError(record.get("error") or "no model output")
+        usage = usage_record(model_id, prompt_version, record["modelOutput"], batch=True)
+        record_usage("backfill", usage)
+        result = build_result(read_json(s3, bucket, key), record["modelOutput"], usage, key)
+        return "written" if write_result(s3, bucket, output_key(key, prompt_version), result, overwrite) else "skipped"
+
+    counts = {"written": 0, "skipped": 0, "failed": 0}
+    for key, outcome, error in bounded_map(collect, sorted(by_key), concurrency):
+        if error is not None:
+            print(f"Failed {key}: {error}", file=sys.stderr)
+            outcome = "failed"
+        counts[outcome] += 1
+    counts["missing"] = len(manifest["records"]) - len(by_key)
+    return counts
+
+
+def main(argv=None) -> int:
+    import boto3
+
+    parser = argparse.ArgumentParser(description="Re-run the landmark analysis over stored intermediate results")
+    parser.add_argument("mode", choices=("invoke", "prepare-batch", "collect-batch"))
+    parser.add_argument("--bucket", default=os.getenv("S3_BUCKET"), help="S3 bucket holding the results")
+    parser.add_argument("--prefix", default=SOURCE_PREFIX)
+    parser.add_argument("--concurrency", type=int, default=8, help="Objects read and processed at once")
+    parser.add_argument("--rate", type=float, default=2.0, help="Bedrock calls per second in invoke mode")
+    parser.add_argument("--limit", type=int, help="Stop after this many source objects")
+    parser.add_argument("--overwrite", action="store_true", help="Replace results that already exist")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file for invoke mode")
+    parser.add_argument("--batch-input", help="s3:// URI of the batch-inference input file")
+    parser.add_argument("--batch-output", help="s3:// URI prefix for batch-inference output")
+    parser.add_argument("--submit", action="store_true", help="Submit the batch job after preparing it")
+    parser.add_argument("--role-arn", help="Service role Bedrock uses to read and write the batch files")
+    parser.add_argument("--job-name", default=f"lambdatrip-backfill-{int(time.time())}")
+    args = parser.parse_args(argv)
+
+    if not args.bucket:
+        parser.error("give --bucket (or set S3_BUCKET)")
+    s3 = boto3.client("s3")
+
+    if args.mode == "invoke":
+        checkpoint = Checkpoint(args.checkpoint, landmark_app.ANALYSIS_PROMPT_VERSION, landmark_app.BEDROCK_MODEL_ID)
+        counts = run_invoke(s3, landmark_app.get_bedrock_client(), args.bucket, args.prefix, args.concurrency,
+                            args.rate, checkpoint, args.overwrite, args.limit)
+        print(f"Backfill {landmark_app.ANALYSIS_PROMPT_VERSION}: {counts}")
+        return 1 if checkpoint.state["failed"] else 0
+
+    if not args.batch_input:
+        parser.error("--batch-input is required for batch modes")
+    if args.mode == "prepare-batch":
+        count = prepare_batch(s3, args.bucket, args.batch_input, args.prefix, args.concurrency,
+                              args.overwrite, args.limit)
+        print(f"Wrote {count} records to {args.batch_input}")
+        if args.submit:
+            if not (args.role_arn and args.batch_output):
+                parser.error("--submit needs --role-arn and --batch-output")
+            job_arn = submit_batch(boto3.client("bedrock"), args.job_name, args.role_arn,
+                                   args.batch_input, args.batch_output)
+            print(f"Submitted {job_arn}")
+        return 0
+
+    if not args.batch_output:
+        parser.error("--batch-output is required for collect-batch")
+    counts = collect_batch(s3, args.bucket, args.batch_input, args.batch_output, args.concurrency, args.overwrite)
+    print(f"Collected batch output: {counts}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
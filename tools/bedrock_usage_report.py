@@ -0,0 +1,138 @@
+"""
+Report Bedrock cost and latency from stored results.
+
+Reads the final landmark (``*_final.json``) and itinerary results the Lambda
+functions wrote to S3, or a local copy of them, and totals the
+``bedrock_usage`` record stored with each one. Results without a Bedrock
+call (knowledge base hits, fallbacks, intermediates) are skipped.
+
+Usage:
+    python -m tools.bedrock_usage_report --from-dir ./results
+    python -m tools.bedrock_usage_report --bucket lambdatrip-results --by model country
+    python -m tools.bedrock_usage_report --from-dir ./results --json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from tools.build_landmark_kb import iter_results_from_dir, iter_results_from_s3
+
+GROUPINGS = ("model", "country", "prompt_version")
+
+
+def result_country(result: Dict[str, Any]) -> str:
+    """
+    Country a stored landmark or itinerary result is about
+    """
+    landmark = result.get("landmark") or {}
+    country = (landmark.get("location") or {}).get("country") or landmark.get("country")
+    if not country:
+        for stop in result.get("stops") or []:
+            country = (stop.get("location") or {}).get("country")
+            if country:
+                break
+    return country or "Unknown"
+
+
+def usage_rows(results: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    """
+    One row per stored result that paid for a Bedrock call
+    """
+    for result in results:
+        usage = result.get("bedrock_usage")
+        if not isinstance(usage, dict) or not usage.get("model_id"):
+            continue
+        yield dict(usage, model=usage["model_id"], country=result_country(result),
+                   prompt_version=usage.get("prompt_version") or "unversioned")
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(rows: Iterable[Dict[str, Any]], group_by: str) -> List[Dict[str, Any]]:
+    """
+    Cost and latency totals per value of ``group_by``, most expensive first
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        groups[row[group_by]].append(row)
+
+    table = []
+    for key, members in groups.items():
+        latencies = sorted(row["latency_ms"] for row in members if row.get("latency_ms") is not None)
+        first_tokens = sorted(row["time_to_first_token_ms"] for row in members
+                              if row.get("time_to_first_token_ms") is not None)
+        costs = [row["cost_usd"] for row in members if row.get("cost_usd") is not None]
+        table.append({
+            group_by: key,
+            "calls": len(members),
+            "input_tokens": sum(row.get("input_tokens") or 0 for row in members),
+            "output_tokens": sum(row.get("output_tokens") or 0 for row in members),
+            "cache_read_input_tokens": sum(row.get("cache_read_input_tokens") or 0 for row in members),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+            "cost_per_call_usd": round(sum(costs) / len(costs), 6) if costs else None,
+            "latency_p50_ms": _percentile(latencies, 50),
+            "latency_p95_ms": _percentile(latencies, 95),
+            "ttft_p50_ms": _percentile(first_tokens, 50),
+        })
+    table.sort(key=lambda row: (-(row["cost_usd"] or 0), -row["calls"]))
+    return table
+
+
+def format_table(table: List[Dict[str, Any]], group_by: str) -> str:
+    columns = [group_by, "calls", "input_tokens", "output_tokens", "cache_read_input_tokens",
+               "cost_usd", "cost_per_call_usd", "latency_p50_ms", "latency_p95_ms", "ttft_p50_ms"]
+    cells = [columns] + [["-" if row[column] is None else str(row[column]) for column in columns] for row in table]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    lines = ["  ".join(value.ljust(widths[i]) if i == 0 else value.rjust(widths[i])
+                       for i, value in enumerate(line)) for line in cells]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report Bedrock cost and latency from stored results")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--bucket", default=os.getenv("S3_BUCKET"), help="S3 bucket holding past results")
+    source.add_argument("--from-dir", help="Read results from a local directory instead of S3")
+    parser.add_argument("--prefix", action="append",
+                        help="S3 prefix to read (repeatable; default landmark_analysis/ and itinerary_analysis/)")
+    parser.add_argument("--by", nargs="+", choices=GROUPINGS, default=list(GROUPINGS))
+    parser.add_argument("--json", action="store_true", help="Print the tables as JSON")
+    args = parser.parse_args(argv)
+
+    if args.from_dir:
+        results = iter_results_from_dir(args.from_dir)
+    elif args.bucket:
+        prefixes = args.prefix or ["landmark_analysis/", "itinerary_analysis/"]
+        results = (result for prefix in prefixes for result in iter_results_from_s3(args.bucket, prefix))
+    else:
+        parser.error("give --bucket (or set S3_BUCKET) or --from-dir")
+
+    rows = list(usage_rows(results))
+    tables = {group_by: summarize(rows, group_by) for group_by in args.by}
+    if args.json:
+        print(json.dumps(tables, indent=2))
+        return 0
+
+    if not rows:
+        print("No results with Bedrock usage found")
+        return 0
+    for group_by, table in tables.items():
+        print(f"By {group_by.replace('_', ' ')} ({len(rows)} calls)")
+        print(format_table(table, group_by))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Build the landmark knowledge base from past results.
+
+Reads the intermediate (``*_analysis.json``) and final (``*_final.json``)
+results the Lambda functions wrote to S3, or a local copy of them, groups
+them by Vision ``mid`` (falling back to normalized landmark name) and keeps
+landmarks seen at least ``--min-samples`` times whose location results
+agree. Coordinates are the median of Vision's, and the newest analysis from
+a full-tier Bedrock call is stored for each landmark.
+
+Usage:
+    python -m tools.build_landmark_kb --bucket lambdatrip-results
+    python -m tools.build_landmark_kb --from-dir ./results --min-samples 2
+    python -m tools.build_landmark_kb --bucket lambdatrip-results --extra curated_landmarks.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, Iterator, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from shared.landmark_kb import (  # noqa: E402
+    ANALYSIS_FIELDS,
+    LANDMARK_KB_PATH,
+    normalize_landmark_name,
+    write_knowledge_base,
+)
+
+DEFAULT_PREFIX = "landmark_analysis/"
+
+# Analyses produced when Bedrock failed or returned unparseable text
+PLACEHOLDER_INSIGHTS = (["Analysis completed successfully"],)
+
+
+def iter_results_from_dir(path: str) -> Iterator[Dict[str, Any]]:
+    for file_path in sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True)):
+        try:
+            with open(file_path) as f:
+                yield json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {file_path}: {e}", file=sys.stderr)
+
+
+def iter_results_from_s3(bucket: str, prefix: str = DEFAULT_PREFIX, s3=None) -> Iterator[Dict[str, Any]]:
+    if s3 is None:
+        import boto3
+        s3 = boto3.client("s3")
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            if not item["Key"].endswith(".json"):
+                continue
+            try:
+                body = s3.get_object(Bucket=bucket, Key=item["Key"])["Body"].read()
+                yield json.loads(body)
+            except Exception as e:
+                print(f"Skipping s3://{bucket}/{item['Key']}: {e}", file=sys.stderr)
+
+
+def is_parsed_analysis(analysis: Any) -> bool:
+    """
+    Whether Bedrock's reply parsed into an analysis rather than a placeholder
+    """
+    if not isinstance(analysis, dict) or not analysis.get("summary"):
+        return False
+    insights = analysis.get("insights")
+    return bool(insights) and insights not in PLACEHOLDER_INSIGHTS
+
+
+def is_real_analysis(result: Dict[str, Any]) -> bool:
+    """
+    Whether a result's analysis came from a successful full-tier Bedrock call.
+    Template, light-tier and fallback analyses, and analyses that were
+    themselves served from the knowledge base, are not taken in.
+    """
+    if result.get("analysis_source") != "bedrock" or result.get("analysis_tier") not in (None, "full"):
+        return False
+    return is_parsed_analysis(result.get("analysis"))
+
+
+def build_entries(results: Iterable[Dict[str, Any]], min_samples: int = 3,
+                  min_agreement: float = 0.6) -> List[Dict[str, Any]]:
+    """
+    Aggregate past results into knowledge base entries
+    """
+    samples = []
+    name_to_mid = {}
+    for result in results:
+        landmark = result.get("landmark") or {}
+        location = landmark.get("location") or {}
+        name = landmark.get("name")
+        if not name or name == "Unknown Landmark" or not location.get("country"):
+            continue
+        normalized = normalize_landmark_name(name)
+        if landmark.get("mid"):
+            name_to_mid[normalized] = landmark["mid"]
+        samples.append((normalized, landmark, location, result))
+
+    groups = defaultdict(list)
+    for normalized, landmark, location, result in samples:
+        mid = landmark.get("mid") or name_to_mid.get(normalized)
+        groups[mid or f"name:{normalized}"].append((landmark, location, result))
+
+    entries = []
+    for group_key, members in groups.items():
+        if len(members) < min_samples:
+            continue
+        places = Counter(
+            (location.get("city"), location.get("country"), location.get("country_code"))
+            for _, location, _ in members
+        )
+        (city, country, country_code), votes = places.most_common(1)[0]
+        if votes / len(members) < min_agreement:
+            print(f"Skipping {group_key}: location results disagree {dict(places)}", file=sys.stderr)
+            continue
+
+        names = Counter(landmark["name"] for landmark, _, _ in members)
+        name = names.most_common(1)[0][0]
+        entry = {
+            "name": name,
+            "mid": None if group_key.startswith("name:") else group_key,
+            "aliases": sorted(alias for alias in names if alias != name),
+            "city": city,
+            "country": country,
+            "country_code": country_code,
+            "samples": len(members),
+        }
+        lats = [location["lat"] for _, location, _ in members if location.get("lat") is not None]
+        lngs = [location["lng"] for _, location, _ in members if location.get("lng") is not None]
+        if lats and lngs:
+            entry["lat"] = round(statistics.median(lats), 6)
+            entry["lng"] = round(statistics.median(lngs), 6)
+
+        analyses = [
+            (result.get("timestamp") or "", result["analysis"])
+            for _, _, result in members if is_real_analysis(result)
+        ]
+        if analyses:
+            latest = max(analyses, key=lambda item: item[0])[1]
+            entry["analysis"] = {field: latest[field] for field in ANALYSIS_FIELDS if field in latest}
+        entries.append(entry)
+
+    return sorted(entries, key=lambda entry: (-entry["samples"], entry["name"]))
+
+
+def merge_entries(entries: List[Dict[str, Any]], extra: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Overlay hand-curated entries on the built ones, matching by mid or name
+    """
+    by_key = {}
+    for entry in entries:
+        by_key[entry.get("mid") or normalize_landmark_name(entry["name"])] = entry
+    for entry in extra:
+        key = entry.get("mid") or normalize_landmark_name(entry["name"])
+        by_key[key] = dict(by_key.get(key, {}), **entry)
+    return list(by_key.values())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the landmark knowledge base from past results")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--bucket", default=os.getenv("S3_BUCKET"), help="S3 bucket holding past results")
+    source.add_argument("--from-dir", help="Read results from a local directory instead of S3")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX)
+    parser.add_argument("--extra", help="JSON list of hand-curated entries to add or override")
+    parser.add_argument("--min-samples", type=int, default=3)
+    parser.add_argument("--min-agreement", type=float, default=0.6,
+                        help="Share of results that must agree on city and country")
+    parser.add_argument("--output", default=LANDMARK_KB_PATH)
+    args = parser.parse_args(argv)
+
+    if args.from_dir:
+        results = iter_results_from_dir(args.from_dir)
+    elif args.bucket:
+        results = iter_results_from_s3(args.bucket, args.prefix)
+    else:
+        parser.error("give --bucket (or set S3_BUCKET) or --from-dir")
+
+    entries = build_entries(results, args.min_samples, args.min_agreement)
+    if args.extra:
+        with open(args.extra) as f:
+            entries = merge_entries(entries, json.load(f))
+
+    count = write_knowledge_base(entries, args.output)
+    with_analysis = sum(1 for entry in entries if entry.get("analysis"))
+    print(f"Wrote {count} landmarks ({with_analysis} with precomputed analysis) to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Compact per-request results into partitioned datasets.
+
+Rolls a day of ``landmark_analysis/*_analysis.json`` and ``*_final.json``
+objects into gzip NDJSON (or Parquet, with pyarrow installed) parts under
+``compacted/<kind>/date=<YYYY-MM-DD>/country=<CC>/`` plus a ``_manifest.json``
+per kind. Works on the results bucket or on a local copy of it, and can
+print a compacted day back out for spot checks.
+
+Usage:
+    python -m tools.compact_results --from-dir ./results --date 2025-03-01
+    python -m tools.compact_results --bucket lambdatrip-results --since 2025-03-01 --until 2025-03-07
+    python -m tools.compact_results --from-dir ./results --date 2025-03-01 --read final --country FR
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(REPO_ROOT, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from shared.compaction import (  # noqa: E402
+    FORMATS,
+    KINDS,
+    LocalStorage,
+    S3Storage,
+    compact_day,
+    iter_compacted,
+)
+
+
+def date_range(since: str, until: str) -> List[str]:
+    start = datetime.strptime(since, "%Y-%m-%d")
+    end = datetime.strptime(until, "%Y-%m-%d")
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1)]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compact per-request results into partitioned datasets")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--bucket", default=os.getenv("S3_BUCKET"), help="S3 bucket holding the results")
+    source.add_argument("--from-dir", help="Local directory laid out like the bucket")
+    parser.add_argument("--date", help="Day to compact (YYYY-MM-DD); default yesterday")
+    parser.add_argument("--since", help="First day of a range to compact")
+    parser.add_argument("--until", help="Last day of a range to compact (default --since)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--max-part-mb", type=float, default=128, help="Uncompressed size at which parts roll over")
+    parser.add_argument("--delete-sources", action="store_true", help="Delete source objects once compacted")
+    parser.add_argument("--read", choices=sorted(set(KINDS.values())),
+                        help="Print a compacted day as NDJSON instead of compacting")
+    parser.add_argument("--country", help="With --read, only this country code")
+    args = parser.parse_args(argv)
+
+    if args.from_dir:
+        storage = LocalStorage(args.from_dir)
+    elif args.bucket:
+        storage = S3Storage(args.bucket)
+    else:
+        parser.error("give --bucket (or set S3_BUCKET) or --from-dir")
+
+    if args.since:
+        dates = date_range(args.since, args.until or args.since)
+    else:
+        dates = [args.date or (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d")]
+
+    if args.read:
+        for date in dates:
+            for result in iter_compacted(storage, args.read, date, country=args.country):
+                print(json.dumps(result))
+        return 0
+
+    for date in dates:
+        manifests = compact_day(storage, date, fmt=args.format, max_part_bytes=int(args.max_part_mb * 1024 * 1024),
+                                delete_sources=args.delete_sources)
+        if not manifests:
+            print(f"{date}: nothing to compact")
+        for kind, manifest in manifests.items():
+            stored = sum(part["stored_bytes"] for part in manifest["parts"])
+            print(f"{date} {kind}: {manifest['records']} records in {len(manifest['parts'])} parts ({stored} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())